@@ -54,6 +54,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/gcf_version.py
 %{python_sitelib}/gcf/gcf_version.pyc
 %{python_sitelib}/gcf/gcf_version.pyo
+%{python_sitelib}/gcf/geni/SecurePoolXMLRPCServer.py
+%{python_sitelib}/gcf/geni/SecurePoolXMLRPCServer.pyc
+%{python_sitelib}/gcf/geni/SecurePoolXMLRPCServer.pyo
 %{python_sitelib}/gcf/geni/SecureThreadedXMLRPCServer.py
 %{python_sitelib}/gcf/geni/SecureThreadedXMLRPCServer.pyc
 %{python_sitelib}/gcf/geni/SecureThreadedXMLRPCServer.pyo
@@ -66,6 +69,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/geni/am/__init__.py
 %{python_sitelib}/gcf/geni/am/__init__.pyc
 %{python_sitelib}/gcf/geni/am/__init__.pyo
+%{python_sitelib}/gcf/geni/am/advertisement.py
+%{python_sitelib}/gcf/geni/am/advertisement.pyc
+%{python_sitelib}/gcf/geni/am/advertisement.pyo
 %{python_sitelib}/gcf/geni/am/aggregate.py
 %{python_sitelib}/gcf/geni/am/aggregate.pyc
 %{python_sitelib}/gcf/geni/am/aggregate.pyo
@@ -246,9 +252,15 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/omnilib/stitch/launcher.py
 %{python_sitelib}/gcf/omnilib/stitch/launcher.pyc
 %{python_sitelib}/gcf/omnilib/stitch/launcher.pyo
+%{python_sitelib}/gcf/omnilib/stitch/localscs.py
+%{python_sitelib}/gcf/omnilib/stitch/localscs.pyc
+%{python_sitelib}/gcf/omnilib/stitch/localscs.pyo
 %{python_sitelib}/gcf/omnilib/stitch/objects.py
 %{python_sitelib}/gcf/omnilib/stitch/objects.pyc
 %{python_sitelib}/gcf/omnilib/stitch/objects.pyo
+%{python_sitelib}/gcf/omnilib/stitch/polling.py
+%{python_sitelib}/gcf/omnilib/stitch/polling.pyc
+%{python_sitelib}/gcf/omnilib/stitch/polling.pyo
 %{python_sitelib}/gcf/omnilib/stitch/scs.py
 %{python_sitelib}/gcf/omnilib/stitch/scs.pyc
 %{python_sitelib}/gcf/omnilib/stitch/scs.pyo
@@ -294,6 +306,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/omnilib/util/omnierror.py
 %{python_sitelib}/gcf/omnilib/util/omnierror.pyc
 %{python_sitelib}/gcf/omnilib/util/omnierror.pyo
+%{python_sitelib}/gcf/omnilib/util/parallel.py
+%{python_sitelib}/gcf/omnilib/util/parallel.pyc
+%{python_sitelib}/gcf/omnilib/util/parallel.pyo
 %{python_sitelib}/gcf/omnilib/util/paths.py
 %{python_sitelib}/gcf/omnilib/util/paths.pyc
 %{python_sitelib}/gcf/omnilib/util/paths.pyo
@@ -334,6 +349,12 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/sfa/trust/rights.py
 %{python_sitelib}/gcf/sfa/trust/rights.pyc
 %{python_sitelib}/gcf/sfa/trust/rights.pyo
+%{python_sitelib}/gcf/sfa/trust/truststore.py
+%{python_sitelib}/gcf/sfa/trust/truststore.pyc
+%{python_sitelib}/gcf/sfa/trust/truststore.pyo
+%{python_sitelib}/gcf/sfa/trust/xmlsig.py
+%{python_sitelib}/gcf/sfa/trust/xmlsig.pyc
+%{python_sitelib}/gcf/sfa/trust/xmlsig.pyo
 %{python_sitelib}/gcf/sfa/util/__init__.py
 %{python_sitelib}/gcf/sfa/util/__init__.pyc
 %{python_sitelib}/gcf/sfa/util/__init__.pyo
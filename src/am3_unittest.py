@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Unit tests of sliver expiration in the AM API v3 reference aggregate:
+the expired sliver reaper thread releases resources, and the cached
+advertisement shows them as available again.
+
+Usage: python am3_unittest.py [-v]"""
+
+import datetime
+import shutil
+import tempfile
+import time
+import unittest
+
+from gcf.geni.am import am3
+
+SLICE_URN = "urn:publicid:IDN+geni:gpo:gcf+slice+expiry"
+USER_URN = "urn:publicid:IDN+geni:gpo:gcf+user+expiry"
+
+class SliverExpiryTest(unittest.TestCase):
+
+    def setUp(self):
+        trust_roots_dir = tempfile.mkdtemp()
+        try:
+            self.ram = am3.ReferenceAggregateManager(trust_roots_dir,
+                                                     am3.RESOURCE_NAMESPACE,
+                                                     "https://localhost:8001/")
+        finally:
+            shutil.rmtree(trust_roots_dir)
+
+    def tearDown(self):
+        self.ram.stop_reaper()
+
+    def allocate(self, seconds):
+        '''Allocate half the resources as Allocate does, expiring
+        after the given number of seconds. Return the resources.'''
+        ram = self.ram
+        with ram._lock:
+            now = datetime.datetime.utcnow()
+            expiration = now + datetime.timedelta(seconds=seconds)
+            resources = ram.resources(available=True)
+            resources = resources[:len(resources) / 2]
+            newslice = am3.Slice(SLICE_URN)
+            for resource in resources:
+                resource.available = False
+                sliver = newslice.add_resource(resource)
+                sliver.setExpiration(expiration)
+                sliver.setStartTime(now)
+                sliver.setEndTime(expiration)
+                sliver.setAllocationState(am3.STATE_GENI_ALLOCATED)
+                ram._schedule_expiration(sliver)
+            ram._agg.allocate(SLICE_URN, resources)
+            ram._agg.allocate(USER_URN, resources)
+            ram._slices[SLICE_URN] = newslice
+        return resources
+
+    def wait_for_expiry(self, timeout=10):
+        deadline = time.time() + timeout
+        while self.ram._slices and time.time() < deadline:
+            time.sleep(0.1)
+
+    def test_expired_resources_advertised(self):
+        ram = self.ram
+        full_before = ram._advertisement.get()
+        available_before = ram._advertisement.get(available=True)
+        resources = self.allocate(1)
+        self.assertTrue(len(resources) > 0)
+        self.assertNotEqual(ram._advertisement.get(available=True),
+                            available_before)
+        # Let the reaper thread expire the slivers
+        self.wait_for_expiry()
+        self.assertEqual(ram._slices, {})
+        self.assertEqual(ram._agg.available_count(), len(ram._agg.resources))
+        self.assertEqual(len(ram.resources(available=True)),
+                         len(ram._agg.resources))
+        self.assertEqual(ram._advertisement.get(available=True),
+                         available_before)
+        self.assertEqual(ram._advertisement.get(), full_before)
+
+    def test_expired_before_call(self):
+        # Slivers that are due are expired at the start of a call,
+        # whether or not the reaper has run
+        ram = self.ram
+        ram.stop_reaper()
+        self.allocate(0)
+        ram.expire_slivers()
+        self.assertEqual(ram._slices, {})
+        self.assertEqual(ram._agg.available_count(), len(ram._agg.resources))
+
+    def test_stop_reaper(self):
+        self.assertTrue(self.ram._reaper.isAlive())
+        self.ram.stop_reaper()
+        self.assertFalse(self.ram._reaper.isAlive())
+        # Stopping again is harmless
+        self.ram.stop_reaper()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of the ABAC authorizer: time loading rule sets and making
+authorization decisions as the conditional assertions and policies grow.
+Decisions are timed from the bindings on: binders (and parsing the
+caller's certificate and credentials) are not included.
+
+Usage: PYTHONPATH=src python src/benchmarks/abac_authorizer_benchmark.py [options]"""
+
+import json
+import logging
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from gcf.geni.auth.abac_authorizer import ABAC_Authorizer
+
+# Rules for the benchmark: 'clauses' conditional assertions, of which only
+# the last one holds for the caller, and a chain of 'policies' policies
+# that must all be traversed to prove the query
+def benchmark_rules(clauses, policies):
+    conditional_assertions = \
+        [{"condition" : "'$CALLER_AUTHORITY' == 'AUTH_%d' and $HOUR >= 0" % i,
+          "assertion" : "ME.MEMBER_%d<-$CALLER" % i} \
+             for i in range(clauses)]
+    chain = ["ME.ROLE_%d<-ME.ROLE_%d" % (i, i+1) for i in range(policies)]
+    chain.append("ME.ROLE_%d<-ME.MEMBER_%d" % (policies, clauses - 1))
+    # Dead ends off the chain the search must give up on
+    dead_ends = ["ME.ROLE_%d<-ME.OTHER_%d" % (i, i) for i in range(policies)]
+    return {"conditional_assertions" : conditional_assertions,
+            "policies" : dead_ends + chain,
+            "queries" : [{"statement" : "ME.ROLE_0<-$CALLER",
+                          "is_positive" : True,
+                          "message" : "Not a member"}]}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/abac_authorizer_benchmark.py [options]")
+    parser.add_option("--calls", type="int", default=200,
+                      help="Decisions per rule set [default: %default]")
+    opts, args = parser.parse_args(argv)
+
+    logging.getLogger('gcf.abac_auth').setLevel(logging.WARN)
+    bindings = {"$CALLER" : "CALLER", "$HOUR" : "12"}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print "%8s %8s %12s %12s" % ("clauses", "policies", "load ms", "decision ms")
+        for clauses, policies in [(10, 10), (100, 10), (1000, 10),
+                                  (10, 100), (10, 1000), (1000, 1000)]:
+            rules_file = os.path.join(tmpdir, "rules_%d_%d.json" % \
+                                          (clauses, policies))
+            open(rules_file, 'w').write(json.dumps(\
+                    benchmark_rules(clauses, policies)))
+            policy_map_file = os.path.join(tmpdir, "policy_map.json")
+            open(policy_map_file, 'w').write(json.dumps(\
+                    {"default" : [rules_file]}))
+            authorizer_opts = optparse.Values()
+            authorizer_opts.authorizer_policy_map_file = policy_map_file
+            authorizer_opts.authorizer_policy_reload_interval = 0
+            start = time.time()
+            authorizer = ABAC_Authorizer(None, authorizer_opts)
+            load_time = time.time() - start
+            rules = authorizer._rule_set_manager.get_rule_sets()[0]
+            bindings["$CALLER_AUTHORITY"] = "AUTH_%d" % (clauses - 1)
+            start = time.time()
+            for i in range(opts.calls):
+                success, msg = authorizer._decide(bindings, [], rules)
+                if not success:
+                    raise Exception("Benchmark query not proven: %s" % msg)
+            decision_time = (time.time() - start) / opts.calls
+            print "%8d %8d %12.2f %12.3f" % (clauses, policies,
+                                             load_time * 1000,
+                                             decision_time * 1000)
+    finally:
+        shutil.rmtree(tmpdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of the reference aggregates' resource catalog (Aggregate):
+allocate, deallocate, and list the available resources, compared with
+scanning the whole catalog.
+
+Usage: PYTHONPATH=src python src/benchmarks/aggregate_benchmark.py [options]"""
+
+import optparse
+import sys
+import time
+
+from gcf.geni.am.aggregate import Aggregate
+from gcf.geni.am.resource import Resource
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/aggregate_benchmark.py [options]")
+    parser.add_option("--resources", type="int", default=100000,
+                      help="Number of resources in the catalog [default: %default]")
+    parser.add_option("--slices", type="int", default=1000,
+                      help="Number of slices to allocate [default: %default]")
+    parser.add_option("--per-slice", type="int", default=10,
+                      help="Resources allocated to each slice [default: %default]")
+    opts, args = parser.parse_args(argv)
+
+    agg = Aggregate()
+    agg.add_resources([Resource(i, "fakevm") for i in xrange(opts.resources)])
+    allocations = []
+    start = time.time()
+    for s in xrange(opts.slices):
+        first = s * opts.per_slice
+        rs = agg.resources[first:first + opts.per_slice]
+        agg.allocate("slice%d" % s, rs)
+        agg.allocate("user%d" % (s % 10), rs)
+        allocations.append(rs)
+    alloc_time = time.time() - start
+
+    start = time.time()
+    for i in xrange(100):
+        available = agg.catalog(available=True)
+    catalog_time = (time.time() - start) / 100
+
+    # The equivalent linear filter over the whole catalog
+    allocated = set()
+    for rs in allocations:
+        allocated.update([r.id for r in rs])
+    start = time.time()
+    for i in xrange(100):
+        scanned = [r for r in agg.resources if r.id not in allocated]
+    scan_time = (time.time() - start) / 100
+    assert len(available) == len(scanned)
+
+    start = time.time()
+    for rs in allocations:
+        # Deallocate each resource from whatever containers hold it
+        agg.deallocate(None, rs)
+    dealloc_time = time.time() - start
+    assert agg.available_count() == opts.resources
+    assert not agg.containers
+
+    count = opts.slices * opts.per_slice
+    print "%d resources, %d slices of %d" % (opts.resources, opts.slices, opts.per_slice)
+    print "allocate:   %8.4f ms per resource" % (alloc_time * 1000 / count)
+    print "deallocate: %8.4f ms per resource" % (dealloc_time * 1000 / count)
+    print "available:  %8.3f ms indexed, %8.3f ms scanning the catalog" % (catalog_time * 1000, scan_time * 1000)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of sliver expiration in the AM API v3 reference aggregate:
+find the expired slivers among many, by scanning every sliver (as
+expire_slivers used to on every call) and by SliverExpirationQueue.
+
+Usage: PYTHONPATH=src python src/benchmarks/am3_benchmark.py [options]"""
+
+import datetime
+import optparse
+import random
+import sys
+import time
+
+from gcf.geni.am.aggregate import Aggregate
+from gcf.geni.am.am3 import Slice, SliverExpirationQueue
+from gcf.geni.am.fakevm import FakeVM
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/am3_benchmark.py [options]")
+    parser.add_option("--slivers", type="int", default=10000,
+                      help="Number of slivers (default %default)")
+    parser.add_option("--slices", type="int", default=100,
+                      help="Number of slices holding the slivers (default %default)")
+    parser.add_option("--calls", type="int", default=1000,
+                      help="Number of API calls to time (default %default)")
+    options, args = parser.parse_args(argv)
+
+    agg = Aggregate()
+    now = datetime.datetime.utcnow()
+    slices = [Slice("urn:publicid:IDN+geni:gpo:gcf+slice+bench%d" % i) for i in range(options.slices)]
+    queue = SliverExpirationQueue()
+    slivers = list()
+    for i in range(options.slivers):
+        sliver = slices[i % len(slices)].add_resource(FakeVM(agg))
+        sliver.setExpiration(now + datetime.timedelta(seconds=random.randint(60, 7 * 24 * 60 * 60)))
+        queue.schedule(sliver)
+        slivers.append(sliver)
+
+    # At the start of each API call, with nothing yet expired
+    start = time.time()
+    for i in range(options.calls):
+        expired = [s for slyce in slices for s in slyce.slivers() if s.expiration() < now]
+    scan_time = (time.time() - start) / options.calls
+    start = time.time()
+    for i in range(options.calls):
+        expired = queue.pop_expired(now)
+    queue_time = (time.time() - start) / options.calls
+    print "%d slivers: full scan %.3f ms per call, expiration queue %.4f ms per call" % \
+        (options.slivers, scan_time * 1000, queue_time * 1000)
+
+    # Renew 10% of the slivers, then expire everything due in the next day
+    start = time.time()
+    for sliver in random.sample(slivers, len(slivers) / 10):
+        sliver.setExpiration(sliver.expiration() + datetime.timedelta(days=1))
+        queue.schedule(sliver)
+    renew_time = time.time() - start
+    later = now + datetime.timedelta(days=1)
+    start = time.time()
+    expired = [s for slyce in slices for s in slyce.slivers() if s.expiration() < later]
+    scan_time = time.time() - start
+    start = time.time()
+    queue_expired = queue.pop_expired(later)
+    queue_time = time.time() - start
+    print "Renewed %d slivers in %.1f ms. Expiring %d (full scan found %d): full scan %.2f ms, expiration queue %.2f ms" % \
+        (len(slivers) / 10, renew_time * 1000, len(queue_expired), len(expired), scan_time * 1000, queue_time * 1000)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
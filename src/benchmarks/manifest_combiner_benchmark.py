@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of combining stitching manifests: combine the manifests of
+synthetic aggregates, each with many nodes in pairs joined by links and
+a stitched link to the next aggregate.
+
+Usage: PYTHONPATH=src python src/benchmarks/manifest_combiner_benchmark.py [options]"""
+
+import optparse
+import sys
+import time
+from xml.dom.minidom import parseString, Node
+
+from gcf.omnilib.stitch import defs
+from gcf.omnilib.stitch.ManifestRSpecCombiner import combineManifestRSpecs, SLIVER_ID
+
+# Synthetic aggregates and RSpecs for timing combineManifestRSpecs
+class BenchHopLink(object):
+    def __init__(self, urn):
+        self.urn = urn
+        self.vlan_suggested_manifest = "100"
+        self.vlan_suggested_request = "any"
+        self.vlan_range_request = "100-200"
+        self.ofAMUrl = None
+        self.controllerUrl = None
+
+class BenchPath(object):
+    def __init__(self, path_id):
+        self.id = path_id
+
+class BenchHop(object):
+    def __init__(self, hop_id, path, aggregate, link_urn):
+        self._id = hop_id
+        self.path = path
+        self.aggregate = aggregate
+        self._hop_link = BenchHopLink(link_urn)
+        self.globalId = None
+        self.import_vlans_from = None
+        self.vlans_unavailable = []
+
+class BenchAggregate(object):
+    def __init__(self, num):
+        self.urn = "urn:publicid:IDN+am%d.example.net+authority+cm" % num
+        self.urn_syns = [self.urn, "urn:publicid:IDN+am%d.example.net+authority+am" % num]
+        self.url = "https://am%d.example.net:12346" % num
+        self.nick = "am%d" % num
+        self.api_version = 2
+        self.userRequested = True
+        self.manifestDom = None
+        self.requestDom = None
+        self.hops = []
+        self._hops = self.hops
+        self.dcn = False
+        self.isEG = False
+        self.dependsOn = []
+        self.pgLogUrl = None
+        self.lastError = None
+
+    def __str__(self):
+        return "<Aggregate %s>" % self.urn
+
+def benchRSpecs(numAMs, numNodes):
+    '''Return the aggregates (with manifest DOMs) and the request DOM to combine.
+    Each aggregate has numNodes nodes in pairs joined by links, and a stitched
+    link and path with one hop at each end to the next aggregate.'''
+    ams = []
+    reqNodes = []
+    reqLinks = []
+    reqPaths = []
+    manNodes = {}
+    manLinks = {}
+    manPaths = {}
+    def hopXml(path_id, hop_id, am, manifest):
+        vlan = manifest and "100" or "any"
+        return '<hop id="%s"><link id="%s+interface+%s"><suggestedVLANRange>%s</suggestedVLANRange></link></hop>' % (hop_id, am.urn[:am.urn.find('+authority')], path_id, vlan)
+    def nodeXml(am, cid, manifest):
+        sliver = manifest and ' sliver_id="%s+sliver+%s"' % (am.urn[:am.urn.find('+authority')], cid) or ''
+        return '<node client_id="%s" component_manager_id="%s"%s><interface client_id="%s:if0"%s/></node>' % (cid, am.urn, sliver, cid, sliver)
+    def linkXml(cid, ends, manifest):
+        xml = '<link client_id="%s"%s>' % (cid, manifest and ' vlantag="100" sliver_id="urn:publicid:IDN+example.net+sliver+%s"' % cid or '')
+        for (am, node) in ends:
+            xml += '<component_manager name="%s"/>' % am.urn
+        for (am, node) in ends:
+            xml += '<interface_ref client_id="%s:if0"%s/>' % (node, manifest and ' sliver_id="%s+sliver+%s:if0"' % (am.urn[:am.urn.find('+authority')], node) or '')
+        return xml + '</link>'
+    for i in range(numAMs):
+        am = BenchAggregate(i)
+        ams.append(am)
+        manNodes[am] = []
+        manLinks[am] = []
+        manPaths[am] = []
+        for j in range(numNodes):
+            cid = "am%d-node%d" % (i, j)
+            reqNodes.append(nodeXml(am, cid, False))
+            manNodes[am].append(nodeXml(am, cid, True))
+        for j in range(0, numNodes - 1, 2):
+            cid = "am%d-link%d" % (i, j)
+            ends = [(am, "am%d-node%d" % (i, j)), (am, "am%d-node%d" % (i, j + 1))]
+            reqLinks.append(linkXml(cid, ends, False))
+            manLinks[am].append(linkXml(cid, ends, True))
+    for i in range(numAMs - 1):
+        (am1, am2) = (ams[i], ams[i + 1])
+        cid = "stitch%d" % i
+        ends = [(am1, "am%d-node0" % i), (am2, "am%d-node%d" % (i + 1, numNodes - 1))]
+        reqLinks.append(linkXml(cid, ends, False))
+        path = BenchPath(cid)
+        reqPath = '<path id="%s">' % cid
+        for (hop_id, am) in (("1", am1), ("2", am2)):
+            manLinks[am].append(linkXml(cid, ends, True))
+            am.hops.append(BenchHop(hop_id, path, am, "%s+interface+%s" % (am.urn[:am.urn.find('+authority')], cid)))
+            reqPath += hopXml(cid, hop_id, am, False)
+            manPaths[am].append('<path id="%s">%s%s</path>' % (cid, hopXml(cid, "1", am1, am == am1), hopXml(cid, "2", am2, am == am2)))
+        reqPaths.append(reqPath + '</path>')
+    rspec = '<rspec type="%s">%s%s<stitching lastUpdateTime="now">%s</stitching></rspec>'
+    for am in ams:
+        am.manifestDom = parseString(rspec % ("manifest", "".join(manNodes[am]), "".join(manLinks[am]), "".join(manPaths[am])))
+    template = parseString(rspec % ("request", "".join(reqNodes), "".join(reqLinks), "".join(reqPaths)))
+    return (ams, template)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/manifest_combiner_benchmark.py [options]")
+    parser.add_option("--aggregates", type="int", default=10,
+                      help="Number of aggregate manifests to combine [default: %default]")
+    parser.add_option("--nodes", type="int", default=500,
+                      help="Nodes in each aggregate manifest [default: %default]")
+    parser.add_option("--runs", type="int", default=3,
+                      help="Number of times to combine [default: %default]")
+    opts, args = parser.parse_args(argv)
+
+    times = []
+    for run in range(opts.runs):
+        (ams, template) = benchRSpecs(opts.aggregates, opts.nodes)
+        start = time.time()
+        combined = combineManifestRSpecs(ams, template)
+        times.append(time.time() - start)
+    root = combined.documentElement
+    nodes = [n for n in root.childNodes if n.nodeType == Node.ELEMENT_NODE and n.localName == defs.NODE_TAG and n.hasAttribute(SLIVER_ID)]
+    links = [l for l in root.childNodes if l.nodeType == Node.ELEMENT_NODE and l.localName == defs.LINK_TAG and l.hasAttribute(SLIVER_ID)]
+    print "Combined %d manifests of %d nodes: %d of %d nodes and %d of %d links from manifests" % (opts.aggregates, opts.nodes, len(nodes), opts.aggregates * opts.nodes, len(links), opts.aggregates * (opts.nodes / 2) + opts.aggregates - 1)
+    print "Best of %d: %.1f ms" % (opts.runs, min(times) * 1000)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
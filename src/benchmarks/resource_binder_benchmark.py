@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of the MAX resource bindings of the ABAC authorizer, computed
+by a sweep line over sliver start and end times, for many random slivers.
+(resource_binder_unittest.py checks them against the old computation.)
+
+Usage: PYTHONPATH=src python src/benchmarks/resource_binder_benchmark.py [options]"""
+
+import datetime
+import optparse
+import random
+import sys
+import time
+
+from gcf.geni.auth.resource_binder import MAX_ResourceMeasurementState
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/resource_binder_benchmark.py [options]")
+    parser.add_option("--slivers", type="int", default=50000,
+                      help="Slivers to benchmark [default: %default]")
+    opts, args = parser.parse_args(argv)
+
+    now = datetime.datetime.utcnow()
+    # Random slivers over a year, each up to a quarter of a year long
+    hours = 24 * 365
+    entries = []
+    for i in range(opts.slivers):
+        entry_start = random.randint(0, hours)
+        entry_end = entry_start + random.randint(0, hours / 4 + 1)
+        entries.append((now + datetime.timedelta(hours=entry_start),
+                        now + datetime.timedelta(hours=entry_end),
+                        random.randint(1, 4)))
+    start = time.time()
+    state = MAX_ResourceMeasurementState('USER', 'NODE')
+    for entry_start, entry_end, value in entries:
+        state.update(entry_start, entry_end, value, None)
+    bindings = state.getBindings()
+    sweep_time = time.time() - start
+    print "%6d slivers: sweep %8.2f ms %s" % \
+        (opts.slivers, sweep_time * 1000, bindings)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
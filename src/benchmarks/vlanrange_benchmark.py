@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of VLANRange: replay VLAN negotiation traces like the
+stitcher does, using VLANRange (sorted intervals of tags) and using
+sets of every tag, as VLANRange did before.
+
+Usage: PYTHONPATH=src python src/benchmarks/vlanrange_benchmark.py [options]"""
+
+import optparse
+import random
+import sys
+import time
+
+from gcf.omnilib.stitch.VLANRange import VLANRange
+
+def setToString( tags ):
+    # The formatting the set based VLANRange did: sort all the tags
+    # and re-derive the ranges.
+    out = []
+    low = None
+    high = None
+    for tag in sorted(tags):
+        if low is not None and tag == high+1:
+            high = tag
+            continue
+        if low is not None:
+            out.append((low, high))
+        low = tag
+        high = tag
+    if low is not None:
+        out.append((low, high))
+    return ','.join([('%d-%d' % (l, h)) if h > l+1 else (('%d,%d' % (l, h)) if h > l else str(l)) for (l, h) in out])
+
+def negotiate( makeRange, toString, lowest, traces, hops, rounds, seed=0 ):
+    '''Replay hop by hop VLAN negotiations like the stitcher does:
+    each hop's range is its SCS range less its unavailable tags,
+    intersected with the range of the hop it imports VLANs from.
+    The suggested tag must be in the range; on failure the suggested
+    tag becomes unavailable. makeRange, toString and lowest convert from
+    and to a string and find the lowest tag of a range.
+    Returns the number of set operations done.'''
+    rnd = random.Random(seed)
+    scsRanges = ["any", "2-4094", "3700-3800", "1000-2000,2500-2600,3000-3100",
+                 "100-200,300-1200,3747-3749", "1-4094"]
+    ops = 0
+    for trace in xrange(traces):
+        scs = [makeRange(rnd.choice(scsRanges)) for hop in xrange(hops)]
+        unavailable = [makeRange("") for hop in xrange(hops)]
+        anyRange = makeRange("any")
+        for rnd_ in xrange(rounds):
+            previous = None
+            for hop in xrange(hops):
+                hopRange = scs[hop] - unavailable[hop]
+                if previous is not None:
+                    hopRange = hopRange & previous
+                ops += 2
+                if len(hopRange) == 0:
+                    break
+                suggested = makeRange(str(lowest(hopRange)))
+                ops += 1
+                if not (suggested == anyRange or suggested <= hopRange):
+                    raise AssertionError("suggested not in range")
+                # Format the request, as when writing the request RSpec
+                toString(hopRange)
+                toString(suggested)
+                ops += 3
+                if rnd.random() < 0.3:
+                    # VLAN unavailable at this hop: don't use this tag again
+                    unavailable[hop] = unavailable[hop] | suggested
+                    ops += 1
+                previous = hopRange
+    return ops
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/vlanrange_benchmark.py [options]")
+    parser.add_option("--traces", type="int", default=200,
+                      help="Number of negotiation traces [default: %default]")
+    parser.add_option("--hops", type="int", default=8,
+                      help="Hops per path [default: %default]")
+    parser.add_option("--rounds", type="int", default=10,
+                      help="Negotiation rounds per trace [default: %default]")
+    opts, args = parser.parse_args(argv)
+
+    start = time.time()
+    ops = negotiate(VLANRange.fromString, str, lambda r: r.intervals()[0][0], opts.traces, opts.hops, opts.rounds)
+    rangeTime = time.time() - start
+    start = time.time()
+    negotiate(lambda s: set(VLANRange.fromString(s)), setToString, min, opts.traces, opts.hops, opts.rounds)
+    setTime = time.time() - start
+    print "%d traces of %d hops and %d rounds: %d operations" % (opts.traces, opts.hops, opts.rounds, ops)
+    print "VLANRange:   %8.2f ms (%.4f ms per operation)" % (rangeTime * 1000, rangeTime * 1000 / ops)
+    print "set of tags: %8.2f ms (%.4f ms per operation)" % (setTime * 1000, setTime * 1000 / ops)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Benchmark of credential signature verification: time verifying each
+credential (for example 1, 3 and 5 deep delegation chains, as written by
+xmlsig_unittest.py --write-credentials) using each signature backend.
+
+Usage: PYTHONPATH=src python src/benchmarks/xmlsig_benchmark.py
+         --trusted_roots_directory DIR [options] cred_file ..."""
+
+import optparse
+import os
+import sys
+import time
+
+from gcf.sfa.trust.credential import Credential
+from gcf.sfa.trust.xmlsig import SIGNATURE_VERIFIERS, set_signature_verifier
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="PYTHONPATH=src python src/benchmarks/xmlsig_benchmark.py [options] cred_file ...\n" +
+                                   "Time verifying each credential (for example 1, 3 and 5 deep delegation chains) using each signature backend")
+    parser.add_option('--trusted_roots_directory',
+                      help='Directory of trusted root certs for verifying')
+    parser.add_option('--iterations', type='int', default=20,
+                      help='Number of times to verify each credential (default %default)')
+    options, args = parser.parse_args(argv)
+    if not options.trusted_roots_directory or len(args) == 0:
+        parser.error("Supply --trusted_roots_directory and at least one credential file")
+
+    trusted = [os.path.join(options.trusted_roots_directory, f) for f in os.listdir(options.trusted_roots_directory)]
+    for name in sorted(SIGNATURE_VERIFIERS.keys()):
+        set_signature_verifier(name)
+        for cred_file in args:
+            cred = Credential(filename=cred_file)
+            depth = len(cred.get_credential_list())
+            start = time.time()
+            for i in range(options.iterations):
+                cred.verify(trusted)
+            elapsed = (time.time() - start) / options.iterations
+            print "%-8s %s (delegation depth %d): %.2f ms per verify" % (name, cred_file, depth, elapsed * 1000)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
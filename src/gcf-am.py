@@ -46,6 +46,7 @@ import gcf.geni.am
 import gcf.geni.am.am2
 import gcf.geni.am.am3
 from gcf.geni.config import read_config
+from gcf.sfa.trust.xmlsig import set_signature_verifier
 from gcf.geni.auth.util import getInstanceFromClassname
 
 
@@ -72,6 +73,14 @@ def parse_args(argv):
                       help="AM API Version", default=2)
     parser.add_option("-D", "--delegate", metavar="DELEGATE",
                       help="Classname of aggregate delegate to instantiate (if none, reference implementation is used)")
+    parser.add_option("--workers", type=int, metavar="N",
+                      help="Handle requests using a pool of N worker threads (AM API v2 and v3; default handles one request at a time)")
+    parser.add_option("--request-queue", dest="request_queue", type=int, metavar="N",
+                      help="With --workers, the most requests that may wait for a worker before new requests get a BUSY reply (default 50)")
+    parser.add_option("--request-timeout", dest="request_timeout", type=int, metavar="SECONDS",
+                      help="With --workers, the longest a request may wait for a worker or stall reading or writing (default 300)")
+    parser.add_option("--authorization-cache-ttl", dest="authorization_cache_ttl", type=int, metavar="SECONDS",
+                      help="Reuse authorization decisions for repeated read-only calls (ListResources, Describe, Status) for this long (AM API v2 and v3; default is not to reuse them)")
     return parser.parse_args()
 
 def getAbsPath(path):
@@ -111,6 +120,18 @@ def main(argv=None):
     if getattr(opts,'rootcadir') is None:
         setattr(opts,'rootcadir',config['global']['rootcadir'])        
 
+    # Verify credential signatures using xmlsec1 (default) or natively
+    try:
+        set_signature_verifier(config['global'].get('signature_verifier'))
+    except ValueError, e:
+        sys.exit(str(e))
+
+    # Config file values are strings
+    for key in ('workers', 'request_queue', 'request_timeout',
+                'authorization_cache_ttl'):
+        if getattr(opts, key) is not None:
+            setattr(opts, key, int(getattr(opts, key)))
+
     if opts.rootcadir is None:
         sys.exit('Missing path to trusted root certificate directory (-r argument)')
     
@@ -190,7 +211,11 @@ def main(argv=None):
                                                      base_name=config['global']['base_name'], 
                                                      authorizer=authorizer,
                                                      resource_manager=resource_manager,
-                                                     delegate=delegate)
+                                                     delegate=delegate,
+                                                     workers=opts.workers,
+                                                     request_queue=opts.request_queue,
+                                                     request_timeout=opts.request_timeout,
+                                                     authorization_cache_ttl=opts.authorization_cache_ttl)
     elif opts.api_version == 3:
         ams = gcf.geni.am.am3.AggregateManagerServer((opts.host, int(opts.port)),
                                                      keyfile=keyfile,
@@ -200,7 +225,11 @@ def main(argv=None):
                                                      base_name=config['global']['base_name'],
                                                      authorizer=authorizer,
                                                      resource_manager=resource_manager,
-                                                     delegate=delegate)
+                                                     delegate=delegate,
+                                                     workers=opts.workers,
+                                                     request_queue=opts.request_queue,
+                                                     request_timeout=opts.request_timeout,
+                                                     authorization_cache_ttl=opts.authorization_cache_ttl)
     else:
         msg = "Unknown API version: %d. Valid choices are \"1\", \"2\", or \"3\""
         sys.exit(msg % (opts.api_version))
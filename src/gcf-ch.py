@@ -43,6 +43,7 @@ import os
 
 from gcf import geni
 from gcf.geni.config import read_config
+from gcf.sfa.trust.xmlsig import set_signature_verifier
 
 config = None
 
@@ -114,6 +115,12 @@ def parse_args(argv):
                       help="User credential lifetime in seconds (default %d)" % geni.ch.USER_CRED_LIFE)
     parser.add_option("--slice_duration", default=geni.ch.SLICE_CRED_LIFE, metavar="SECONDS",
                       help="Slice lifetime in seconds (default %d)" % geni.ch.SLICE_CRED_LIFE)
+    parser.add_option("--workers", type=int, metavar="N",
+                      help="Handle requests using a pool of N worker threads (default starts a new thread per request)")
+    parser.add_option("--request-queue", dest="request_queue", type=int, metavar="N",
+                      help="With --workers, the most requests that may wait for a worker before new requests get a BUSY reply (default 50)")
+    parser.add_option("--request-timeout", dest="request_timeout", type=int, metavar="SECONDS",
+                      help="With --workers, the longest a request may wait for a worker or stall reading or writing (default 300)")
     return parser.parse_args()
 
 def main(argv=None): 
@@ -145,7 +152,20 @@ def main(argv=None):
             setattr(opts,key,val)
     if getattr(opts,'rootcadir') is None:
         setattr(opts,'rootcadir',config['global']['rootcadir'])        
+
+    # Verify credential signatures using xmlsec1 (default) or natively
+    try:
+        set_signature_verifier(config['global'].get('signature_verifier'))
+    except ValueError, e:
+        sys.exit(str(e))
+    # Config file values are strings
+    for key in ('workers', 'request_queue', 'request_timeout'):
+        if getattr(opts, key) is not None:
+            setattr(opts, key, int(getattr(opts, key)))
     config['debug'] = opts.debug
+    config['workers'] = opts.workers
+    config['request_queue'] = opts.request_queue
+    config['request_timeout'] = opts.request_timeout
 
     ch = CommandHandler()        
     if hasattr(ch, handler):
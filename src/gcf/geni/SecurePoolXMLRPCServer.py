@@ -0,0 +1,172 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+"""A version of SecureXMLRPCServer that handles requests on a fixed
+size pool of worker threads.
+
+Accepted connections wait in a bounded queue for a free worker. When
+the queue is full (or a connection waited longer than the request
+timeout), the client immediately gets the AM API BUSY (14) reply, so
+that clients like Omni back off and retry. Busy replies to a full queue
+are sent from short-lived threads, so they never hold up accepting
+connections.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import Queue
+import threading
+import time
+
+from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler
+
+from .SecureXMLRPCServer import SecureXMLRPCServer
+from .SecureThreadedXMLRPCServer import SecureThreadedXMLRPCRequestHandler
+
+# AM API error code signaling the server is busy and the call should be retried
+BUSY = 14
+
+class BusyXMLRPCRequestHandler(SimpleXMLRPCRequestHandler):
+    """A request handler that answers any XMLRPC call with the AM API
+    BUSY return struct, without calling the server's methods."""
+
+    # Don't let a slow client hold up the thread sending the reply
+    timeout = 5
+
+    def _dispatch(self, method, params):
+        return dict(code=dict(geni_code=BUSY, am_type='gcf'),
+                    value="",
+                    output="Server busy: too many requests (%s). Try again later." % method)
+
+    def log_message(self, format, *args):
+        self.server.logger.debug("Busy reply to %s: %s", self.client_address[0], format % args)
+
+class SecurePoolXMLRPCServer(SecureXMLRPCServer):
+    """An extension to SecureXMLRPCServer that handles each request on
+    one of a fixed number of worker threads, with a bounded queue of
+    waiting requests."""
+
+    DEFAULT_WORKERS = 10
+    DEFAULT_QUEUE_SIZE = 50
+    DEFAULT_REQUEST_TIMEOUT = 300 # seconds
+    # Busy replies being sent at once to a full queue; beyond this,
+    # further connections are closed without a reply
+    MAX_BUSY_REPLIES = 20
+
+    def __init__(self, addr, requestHandler=SecureThreadedXMLRPCRequestHandler,
+                 logRequests=False, allow_none=False, encoding=None,
+                 bind_and_activate=True, keyfile=None, certfile=None,
+                 ca_certs=None, workers=None, queue_size=None,
+                 request_timeout=None):
+        SecureXMLRPCServer.__init__(self, addr, requestHandler=requestHandler, \
+                                        logRequests=logRequests, allow_none=allow_none, \
+                                        encoding=encoding, \
+                                        bind_and_activate=bind_and_activate, \
+                                        keyfile=keyfile, certfile=certfile, ca_certs=ca_certs)
+        self.logger = logging.getLogger('gcf.xmlrpcserver')
+        if not workers:
+            workers = self.DEFAULT_WORKERS
+        if not queue_size:
+            queue_size = self.DEFAULT_QUEUE_SIZE
+        if not request_timeout:
+            request_timeout = self.DEFAULT_REQUEST_TIMEOUT
+        self.request_timeout = int(request_timeout)
+        self._requests = Queue.Queue(int(queue_size))
+        self._busy_replies = threading.BoundedSemaphore(self.MAX_BUSY_REPLIES)
+        self._workers = []
+        for i in range(int(workers)):
+            worker = threading.Thread(target=self._process_requests,
+                                      name="xmlrpc-worker-%d" % i)
+            worker.setDaemon(True)
+            worker.start()
+            self._workers.append(worker)
+        self.logger.info("Handling requests with %d worker threads, at most %d waiting requests, %d second request timeout",
+                         len(self._workers), int(queue_size), self.request_timeout)
+
+    def process_request(self, request, client_address):
+        """Queue the request for a worker thread, or reply BUSY if
+        too many requests are already waiting."""
+        try:
+            self._requests.put_nowait((request, client_address, time.time()))
+        except Queue.Full:
+            if not self._busy_replies.acquire(False):
+                self.logger.info("Request queue full: closing connection from %s", client_address[0])
+                self._close(request)
+                return
+            self.logger.info("Request queue full: busy reply to %s", client_address[0])
+            replier = threading.Thread(target=self._reply_busy_in_thread,
+                                       args=(request, client_address),
+                                       name="xmlrpc-busy-reply")
+            replier.setDaemon(True)
+            try:
+                replier.start()
+            except:
+                # The server's handle_error closes the request
+                self._busy_replies.release()
+                raise
+
+    def _process_requests(self):
+        """Worker thread: handle queued requests forever"""
+        while True:
+            (request, client_address, queued) = self._requests.get()
+            try:
+                if time.time() - queued > self.request_timeout:
+                    self.logger.info("Request from %s waited over %d seconds: busy reply",
+                                     client_address[0], self.request_timeout)
+                    self._reply_busy(request, client_address)
+                    continue
+                # Don't let a stalled client hold a worker forever
+                request.settimeout(self.request_timeout)
+                try:
+                    self.finish_request(request, client_address)
+                except:
+                    self.handle_error(request, client_address)
+                self._close(request)
+            except:
+                self.logger.exception("Error handling request from %s", client_address[0])
+
+    def _reply_busy_in_thread(self, request, client_address):
+        """Busy reply thread: reply, then let another busy reply start"""
+        try:
+            self._reply_busy(request, client_address)
+        finally:
+            self._busy_replies.release()
+
+    def _reply_busy(self, request, client_address):
+        try:
+            BusyXMLRPCRequestHandler(request, client_address, self)
+        except:
+            self.logger.debug("Failed to send busy reply to %s", client_address[0])
+        self._close(request)
+
+    def _close(self, request):
+        # shutdown_request is new in python 2.7
+        if hasattr(self, 'shutdown_request'):
+            self.shutdown_request(request)
+        else:
+            self.close_request(request)
+
+    # Threaded version of get_pem_cert: pull from
+    # request_specific_info (per thread)
+    def get_pem_cert(self):
+        return SecureThreadedXMLRPCRequestHandler.get_pem_cert()
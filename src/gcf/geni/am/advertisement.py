@@ -0,0 +1,102 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+"""
+A cache of the advertisement RSpec of a reference aggregate.
+"""
+
+from __future__ import absolute_import
+
+import base64
+import threading
+import zlib
+
+class AdvertisementCache(object):
+    """The advertisement RSpec of an Aggregate, in its full and
+    available-only variants, raw and compressed (zlib then base64,
+    as for geni_compressed).
+
+    Each document is built once and served until the aggregate's
+    generation changes (see Aggregate.generation), which happens when
+    resources are added, allocated or deallocated. Rebuilding reuses the
+    XML of every resource whose availability did not change.
+    Documents are built under a lock and replaced whole, so concurrent
+    callers only ever see a complete document.
+    """
+
+    def __init__(self, aggregate, header, resource, footer):
+        """header, resource and footer are the functions returning
+        the advertisement header, the XML for one resource, and the
+        advertisement footer."""
+        self._aggregate = aggregate
+        self._header = header
+        self._resource = resource
+        self._footer = footer
+        self._lock = threading.RLock()
+        self._documents = {} # (available, compressed) -> (generation, doc)
+        self._fragments = {} # resource id -> (available, xml)
+
+    def invalidate(self):
+        """Forget all cached XML, for example because the advertisement
+        format changed."""
+        with self._lock:
+            self._documents = {}
+            self._fragments = {}
+
+    def get(self, available=False, compressed=False):
+        """Return the advertisement, only listing available resources
+        if available is True, and compressed if compressed is True."""
+        key = (bool(available), bool(compressed))
+        with self._lock:
+            # Read the generation before building, so that a change
+            # made while building forces a rebuild on the next call
+            generation = self._aggregate.generation
+            entry = self._documents.get(key)
+            if entry is not None and entry[0] == generation:
+                return entry[1]
+            if compressed:
+                doc = base64.b64encode(zlib.compress(self.get(available)))
+            else:
+                doc = self._build(available)
+            self._documents[key] = (generation, doc)
+            return doc
+
+    def _build(self, available):
+        if available:
+            resources = self._aggregate.catalog(None, available=True)
+        else:
+            resources = self._aggregate.catalog(None)
+        parts = [self._header()]
+        for r in resources:
+            parts.append(self._fragment(r))
+        parts.append(self._footer())
+        return ''.join(parts)
+
+    def _fragment(self, resource):
+        # The XML for one resource, re-rendered only when its
+        # availability changed
+        cached = self._fragments.get(resource.id)
+        if cached is not None and cached[0] == resource.available:
+            return cached[1]
+        xml = self._resource(resource)
+        self._fragments[resource.id] = (resource.available, xml)
+        return xml
@@ -26,28 +26,114 @@ from __future__ import absolute_import
 from .resource import Resource
 
 class Aggregate(object):
+    """The catalog of resources managed by an aggregate, and the
+    containers (slices, users) they are allocated to.
+
+    Resources are indexed by id. The aggregate keeps the containers
+    of each resource and the set of unallocated resources, so that
+    allocate, deallocate and catalog only touch the resources involved.
+    A resource is available when it is not allocated to any container.
+
+    generation is incremented whenever resources are added, allocated
+    or deallocated, so that views of the catalog (like the advertisement,
+    see AdvertisementCache) know when to rebuild.
+    """
 
     def __init__(self):
         self.resources = []
         self.containers = {} # of resources, not slivers
+        # Indexes
+        self._by_id = {} # resource id -> resource
+        self._position = {} # resource id -> index in self.resources
+        self._container_of = {} # resource id -> set of containers
+        self._available = {} # resource id -> resource, unallocated
+        self.generation = 0
 
     def add_resources(self, resources):
-        self.resources.extend(resources)
+        self.generation += 1
+        for r in resources:
+            if self._by_id.has_key(r.id):
+                continue
+            self._by_id[r.id] = r
+            self._position[r.id] = len(self.resources)
+            self.resources.append(r)
+            if not self._container_of.has_key(r.id):
+                self._available[r.id] = r
+
+    def _ordered(self, resources):
+        # Return the resources in catalog order
+        position = self._position
+        return sorted(resources, key=lambda r: position.get(r.id, -1))
+
+    def _ordered_by_id(self, resources):
+        # Return the resources of a dictionary of resource id -> resource
+        # in catalog order. Sorting costs about four times as much per
+        # resource as a pass over the catalog, so once the resources are
+        # a quarter of the catalog, pick them out of it instead.
+        if len(resources) * 4 > len(self.resources):
+            return [r for r in self.resources if r.id in resources]
+        return self._ordered(resources.values())
 
-    def catalog(self, container=None):
+    def find(self, rid):
+        """Return the resource with the given id, or None."""
+        return self._by_id.get(rid)
+
+    def catalog(self, container=None, available=None):
+        """Return the resources in the given container, or all
+        resources if no container is given. If available is not None,
+        it is interpreted as boolean and only resources whose
+        availability matches are returned.
+        """
         if container:
             if container in self.containers:
-                return self.containers[container]
+                result = self._ordered_by_id(self.containers[container])
             else:
                 return []
-        else:
+        elif available is None:
             return self.resources
+        elif available:
+            return self._ordered_by_id(self._available)
+        else:
+            return self._ordered([self._by_id[rid]
+                                  for rid in self._container_of
+                                  if self._by_id.has_key(rid)])
+        if available is not None:
+            result = [r for r in result
+                      if self._container_of.has_key(r.id) is not bool(available)]
+        return result
+
+    def available_count(self):
+        """Return the number of unallocated resources."""
+        return len(self._available)
 
     def allocate(self, container, resources):
         if container not in self.containers:
-            self.containers[container] = []
+            self.containers[container] = {}
+        contents = self.containers[container]
+        self.generation += 1
         for r in resources:
-            self.containers[container].append(r)
+            contents[r.id] = r
+            if not self._container_of.has_key(r.id):
+                self._container_of[r.id] = set()
+                self._available.pop(r.id, None)
+            self._container_of[r.id].add(container)
+
+    def _remove(self, container, r):
+        # Remove resource r from the container, making it available
+        # if it is no longer in any container
+        self.generation += 1
+        contents = self.containers.get(container)
+        if contents is not None and contents.has_key(r.id):
+            del contents[r.id]
+            if not contents:
+                del self.containers[container]
+        holders = self._container_of.get(r.id)
+        if holders is not None:
+            holders.discard(container)
+            if not holders:
+                del self._container_of[r.id]
+                if self._by_id.has_key(r.id):
+                    self._available[r.id] = self._by_id[r.id]
 
     def deallocate(self, container, resources):
         if container and not self.containers.has_key(container):
@@ -57,28 +143,20 @@ class Aggregate(object):
         if container and resources:
             # deallocate the given resources from the container
             for r in resources:
-                self.containers[container].remove(r)
+                self._remove(container, r)
         elif container:
             # deallocate all the resources in the container
-            container_resources = list(self.containers[container])
-            for r in container_resources:
-                self.containers[container].remove(r)
+            for r in self.containers[container].values():
+                self._remove(container, r)
         elif resources:
-            # deallocate the resources from their container
+            # deallocate the resources from their containers
             for r in resources:
-                for c in self.containers.values():
-                    if r in c:
-                        c.remove(r)
-        # Finally, check if container is empty. If so, delete it.
-        # Note cache the keys because we will be modifying the dict
-        # inside the loop
-        allkeys = self.containers.keys()
-        for k in allkeys:
-            if not self.containers[k]:
-                del self.containers[k]
+                for c in list(self._container_of.get(r.id, ())):
+                    self._remove(c, r)
+        # Empty containers are deleted by _remove
 
     def stop(self, container):
         # Mark the resources as 'SHUTDOWN'
         if container in self.containers:
-            for r in self.containers[container]:
+            for r in self.containers[container].values():
                 r.status = Resource.STATUS_SHUTDOWN
@@ -41,20 +41,24 @@ import dateutil.parser
 import logging
 import os
 import string
+import threading
 import uuid
 import xml.dom.minidom as minidom
 import xmlrpclib
 import zlib
 
 from .resource import Resource
+from .advertisement import AdvertisementCache
 from .aggregate import Aggregate
 from .fakevm import FakeVM
+from .locking import synchronized
 from ... import geni
 from ..util.urn_util import publicid_to_urn, URN
 from ..util.tz_util import tzd
 from ..SecureXMLRPCServer import SecureXMLRPCServer
+from ..SecurePoolXMLRPCServer import SecurePoolXMLRPCServer
 from ..auth.base_authorizer import *
-from .am_method_context import AMMethodContext
+from .am_method_context import AMMethodContext, AuthorizationCache
 from ...gcf_version import GCF_VERSION
 
 # See sfa/trust/rights.py
@@ -127,9 +131,13 @@ class ReferenceAggregateManager(object):
         self._url = url
         self._api_version = 2
         self._am_type = "gcf"
+        self._lock = threading.RLock()
         self._slices = dict()
         self._agg = Aggregate()
         self._agg.add_resources([FakeVM(self._agg) for _ in range(3)])
+        self._advertisement = AdvertisementCache(self._agg, self.advert_header,
+                                                 self.advert_resource,
+                                                 self.advert_footer)
         self._cred_verifier = geni.CredentialVerifier(root_cert)
         self._urn_authority = urn_authority
         self._my_urn = publicid_to_urn("%s %s %s" % (self._urn_authority, 'authority', 'am'))
@@ -169,6 +177,7 @@ class ReferenceAggregateManager(object):
     # must give the caller required permissions.
     # The semantics of the API are unclear on this point, so
     # this is just the current implementation
+    @synchronized
     def ListResources(self, credentials, options):
         '''Return an RSpec of resources managed at this AM.
         If a geni_slice_urn
@@ -242,19 +251,18 @@ class ReferenceAggregateManager(object):
                 # return an empty rspec
                 return self._no_such_slice(slice_urn)
         else:
-            all_resources = self._agg.catalog(None)
             available = 'geni_available' in options and options['geni_available']
-            resource_xml = ""
-            for r in all_resources:
-                if available and not r.available:
-                    continue
-                resource_xml = resource_xml + self.advert_resource(r)
-            result = self.advert_header() + resource_xml + self.advert_footer()
+            result = self._advertisement.get(available)
         self.logger.debug("Result is now \"%s\"", result)
         # Optionally compress the result
         if 'geni_compressed' in options and options['geni_compressed']:
             try:
-                result = base64.b64encode(zlib.compress(result))
+                if 'geni_slice_urn' in options:
+                    result = base64.b64encode(zlib.compress(result))
+                else:
+                    # The advertisement is cached already compressed
+                    result = self._advertisement.get(available,
+                                                     compressed=True)
             except Exception, exc:
                 import traceback
                 self.logger.error("Error compressing and encoding resource list: %s", traceback.format_exc())
@@ -270,6 +278,7 @@ class ReferenceAggregateManager(object):
     # must give the caller required permissions.
     # The semantics of the API are unclear on this point, so
     # this is just the current implementation
+    @synchronized
     def CreateSliver(self, slice_urn, credentials, rspec, users, options):
         """Create a sliver with the given URN from the resources in
         the given RSpec.
@@ -321,11 +330,10 @@ class ReferenceAggregateManager(object):
         # EG if both V1 and V2 are supported, and the user gives V2 request,
         # then you must return a V2 request and not V1
 
-        allresources = self._agg.catalog()
+        allresources = self._agg.catalog(available=True)
         allrdict = dict()
         for r in allresources:
-            if r.available:
-                allrdict[r.id] = r
+            allrdict[r.id] = r
 
         # Note: This only handles unbound nodes. Any attempt by the client
         # to specify a node is ignored.
@@ -352,12 +360,12 @@ class ReferenceAggregateManager(object):
                 expiration = credexp
 
         newslice = Slice(slice_urn, expiration)
-        self._agg.allocate(slice_urn, resources.values())
-        self._agg.allocate(user_urn, resources.values())
         for cid, r in resources.items():
             newslice.resources[cid] = r.id
             r.status = Resource.STATUS_READY
             r.available = False
+        self._agg.allocate(slice_urn, resources.values())
+        self._agg.allocate(user_urn, resources.values())
         self._slices[slice_urn] = newslice
 
         self.logger.info("Created new slice %s" % slice_urn)
@@ -373,6 +381,7 @@ class ReferenceAggregateManager(object):
     # must give the caller required permissions.
     # The semantics of the API are unclear on this point, so
     # this is just the current implementation
+    @synchronized
     def DeleteSliver(self, slice_urn, credentials, options):
         '''Stop and completely delete the named sliver, and return True.'''
         self.logger.info('DeleteSliver(%r)' % (slice_urn))
@@ -396,10 +405,6 @@ class ReferenceAggregateManager(object):
         except Exception, e:
             raise xmlrpclib.Fault('Insufficient privileges', str(e))
 
-        # Grab the user_urn
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
-
-
         # If we get here, the credentials give the caller
         # all needed privileges to act on the given target.
         if slice_urn in self._slices:
@@ -413,8 +418,9 @@ class ReferenceAggregateManager(object):
             for r in resources:
                 r.reset()
 
-            self._agg.deallocate(slice_urn, None)
-            self._agg.deallocate(user_urn, None)
+            # Release the resources from every container holding them
+            # (the slice, and whichever user allocated them)
+            self._agg.deallocate(None, resources)
             del self._slices[slice_urn]
             self.logger.info("Sliver %r deleted" % slice_urn)
             return self.successResult(True)
@@ -423,6 +429,7 @@ class ReferenceAggregateManager(object):
 
 
 
+    @synchronized
     def SliverStatus(self, slice_urn, credentials, options):
         '''Report as much as is known about the status of the resources
         in the sliver. The AM may not know.
@@ -470,18 +477,18 @@ class ReferenceAggregateManager(object):
             for cid, sliver_uuid in theSlice.resources.items():
                 resource = None
                 sliver_urn = None
-                for res in self._agg.resources:
-                    if res.id == sliver_uuid:
-                        self.logger.debug('Resource = %s', str(res))
-                        resources.append(res)
-                        sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
-                        # Gather the status of all the resources
-                        # in the sliver. This could be actually
-                        # communicating with the resources, or simply
-                        # reporting the state of initialized, started, stopped, ...
-                        res_status.append(dict(geni_urn=sliver_urn,
-                                               geni_status=res.status,
-                                               geni_error=''))
+                res = self._agg.find(sliver_uuid)
+                if res is not None:
+                    self.logger.debug('Resource = %s', str(res))
+                    resources.append(res)
+                    sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
+                    # Gather the status of all the resources
+                    # in the sliver. This could be actually
+                    # communicating with the resources, or simply
+                    # reporting the state of initialized, started, stopped, ...
+                    res_status.append(dict(geni_urn=sliver_urn,
+                                           geni_status=res.status,
+                                           geni_error=''))
             self.logger.info("Calculated and returning slice %s status", slice_urn)
             result = dict(geni_urn=slice_urn,
                           geni_status=theSlice.status(resources),
@@ -495,6 +502,7 @@ class ReferenceAggregateManager(object):
         else:
             return self._no_such_slice(slice_urn)
 
+    @synchronized
     def RenewSliver(self, slice_urn, credentials, expiration_time, options):
         '''Renew the local sliver that is part of the named Slice
         until the given expiration time (in UTC with a TZ per RFC3339).
@@ -548,6 +556,7 @@ class ReferenceAggregateManager(object):
         else:
             return self._no_such_slice(slice_urn)
 
+    @synchronized
     def Shutdown(self, slice_urn, credentials, options):
         '''For Management Authority / operator use: shut down a badly
         behaving sliver, without deleting it to allow for forensics.'''
@@ -672,10 +681,10 @@ class ReferenceAggregateManager(object):
         for cid, res_uuid in self._slices[slice_urn].resources.items():
             resource = None
             sliver_urn = None
-            for res in self._agg.resources:
-                if res.id == res_uuid:
-                    sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
-                    resource_urn = res.urn(self._urn_authority)
+            res = self._agg.find(res_uuid)
+            if res is not None:
+                sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
+                resource_urn = res.urn(self._urn_authority)
             result = result + tmpl % (cid, resource_urn, self._my_urn, sliver_urn)
         return result
 
@@ -710,12 +719,22 @@ class AggregateManager(object):
     """
 
     def __init__(self, trust_roots_dir, delegate, authorizer=None,
-                 resource_manager=None):
+                 resource_manager=None, authorization_cache_ttl=None):
         self._trust_roots_dir = trust_roots_dir
         self._delegate = delegate
         self.logger = logging.getLogger('gcf.am2')
         self.authorizer = authorizer
         self.resource_manager = resource_manager
+        # Remember recent authorizations of read-only calls, if asked to
+        self.authorization_cache = None
+        if authorizer is not None and authorization_cache_ttl:
+            self.authorization_cache = \
+                AuthorizationCache(self.logger, authorization_cache_ttl)
+            # Forget them when the authorizer's policies change.
+            # A remote authorizer is an XMLRPC proxy and can't tell us.
+            if isinstance(authorizer, Base_Authorizer):
+                authorizer.add_policy_listener(
+                    self.authorization_cache.invalidate)
 
     def _exception_result(self, exception):
         output = str(exception)
@@ -854,7 +873,8 @@ class AggregateManagerServer(object):
                  trust_roots_dir=None,
                  ca_certs=None, base_name=None,
                  authorizer=None, resource_manager=None,
-                 delegate=None):
+                 delegate=None, workers=None, request_queue=None,
+                 request_timeout=None, authorization_cache_ttl=None):
         # ca_certs arg here must be a file of concatenated certs
         if ca_certs is None:
             raise Exception('Missing CA Certs')
@@ -867,10 +887,19 @@ class AggregateManagerServer(object):
             delegate = ReferenceAggregateManager(trust_roots_dir, base_name, 
                                                  server_url)
         # FIXME: set logRequests=true if --debug
-        self._server = SecureXMLRPCServer(addr, keyfile=keyfile,
-                                          certfile=certfile, ca_certs=ca_certs)
+        if workers:
+            # Handle requests on a bounded pool of worker threads
+            self._server = SecurePoolXMLRPCServer(addr, keyfile=keyfile,
+                                                  certfile=certfile, ca_certs=ca_certs,
+                                                  workers=workers,
+                                                  queue_size=request_queue,
+                                                  request_timeout=request_timeout)
+        else:
+            self._server = SecureXMLRPCServer(addr, keyfile=keyfile,
+                                              certfile=certfile, ca_certs=ca_certs)
         aggregate_manager = AggregateManager(trust_roots_dir, delegate, 
-                                             authorizer, resource_manager)
+                                             authorizer, resource_manager,
+                                             authorization_cache_ttl)
         self._server.register_instance(aggregate_manager)
         # Set the server on the delegate so it can access the
         # client certificate.
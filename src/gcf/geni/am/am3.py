@@ -35,25 +35,32 @@ The GENI AM API is defined in the AggregateManager class.
 
 from __future__ import absolute_import
 
+import atexit
 import base64
 import collections
 import datetime
 import dateutil.parser
+import heapq
+import itertools
 import logging
 import os
+import threading
 import traceback
 import uuid
 import xml.dom.minidom as minidom
 import xmlrpclib
 import zlib
 
+from .advertisement import AdvertisementCache
 from .aggregate import Aggregate
 from .fakevm import FakeVM
+from .locking import synchronized
 from ... import geni
 from ..util.tz_util import tzd
 from ..util.urn_util import publicid_to_urn
 from ..util import urn_util as urn
 from ..SecureXMLRPCServer import SecureXMLRPCServer
+from ..SecurePoolXMLRPCServer import SecurePoolXMLRPCServer
 
 from ...sfa.trust.credential import Credential
 from ...sfa.trust.abac_credential import ABACCredential
@@ -62,7 +69,8 @@ from ...gcf_version import GCF_VERSION
 from ...omnilib.util import credparsing as credutils
 
 from ..auth.base_authorizer import *
-from .am_method_context import AMMethodContext
+from ..auth.abac_resource_manager import Allocation_Ledger
+from .am_method_context import AMMethodContext, AuthorizationCache
 from .api_error_exception import ApiErrorException
 
 # See sfa/trust/rights.py
@@ -93,6 +101,9 @@ REFAM_MAXLEASE_MINUTES = 7 * 24 * 60
 # Expiration on Allocated resources is 10 minutes.
 ALLOCATE_EXPIRATION_SECONDS = 10 * 60
 
+# The expired sliver reaper thread checks at least this often
+REAPER_MAX_SLEEP_SECONDS = 60
+
 # GENI Allocation States
 STATE_GENI_UNALLOCATED = 'geni_unallocated'
 STATE_GENI_ALLOCATED = 'geni_allocated'
@@ -272,6 +283,65 @@ class Slice(object):
         return self._shutdown
 
 
+class SliverExpirationQueue(object):
+    """Slivers ordered by expiration time, so expired slivers can be
+    found without looking at every sliver.
+    Entries are not removed when a sliver is renewed or deleted. Instead
+    they are skipped when they no longer match the sliver, and dropped
+    when there are more of them than live entries."""
+
+    def __init__(self):
+        self._heap = list() # (expiration, sequence number, sliver)
+        self._expirations = dict() # sliver -> expiration of its live heap entry
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._expirations)
+
+    def schedule(self, sliver):
+        """Add the sliver at its current expiration, replacing any earlier entry"""
+        expiration = sliver.expiration()
+        if expiration is None:
+            self.remove(sliver)
+            return
+        if self._expirations.get(sliver) == expiration:
+            return
+        self._expirations[sliver] = expiration
+        heapq.heappush(self._heap, (expiration, self._counter.next(), sliver))
+        self._compact()
+
+    def remove(self, sliver):
+        """Forget the given (deleted) sliver"""
+        if self._expirations.pop(sliver, None) is not None:
+            self._compact()
+
+    def _is_live(self, entry):
+        return self._expirations.get(entry[2]) == entry[0]
+
+    def _compact(self):
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._expirations):
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def next_expiration(self):
+        """Return the earliest expiration time, or None if there are no slivers"""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        if self._heap:
+            return self._heap[0][0]
+        return None
+
+    def pop_expired(self, now):
+        """Remove and return the slivers that expired before now, earliest first"""
+        expired = list()
+        while self._heap and self._heap[0][0] < now:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                del self._expirations[entry[2]]
+                expired.append(entry[2])
+        return expired
+
+
 class ReferenceAggregateManager(object):
     '''A reference Aggregate Manager that manages fake resources.'''
 
@@ -286,11 +356,27 @@ class ReferenceAggregateManager(object):
         self._slices = dict()
         self._agg = Aggregate()
         self._agg.add_resources([FakeVM(self._agg) for _ in range(20)])
+        self._advertisement = AdvertisementCache(self._agg, self.advert_header,
+                                                 self.advert_resource,
+                                                 self.advert_footer)
         self._my_urn = publicid_to_urn("%s %s %s" % (self._urn_authority, 'authority', 'am'))
         self.max_lease = datetime.timedelta(minutes=REFAM_MAXLEASE_MINUTES)
         self.max_alloc = datetime.timedelta(seconds=ALLOCATE_EXPIRATION_SECONDS)
         self.logger = logging.getLogger('gcf.am3')
         self.logger.info("Running %s AM v%d code version %s", self._am_type, self._api_version, GCF_VERSION)
+        # Expire slivers in the background, soonest expiration first
+        self._lock = threading.RLock()
+        self._expirations = SliverExpirationQueue()
+        self._reaper_wakeup = threading.Event()
+        self._reaper_stop = threading.Event()
+        # Current slivers by slice and user, for quota policies
+        self._allocation_ledger = Allocation_Ledger()
+        self._reaper = threading.Thread(target=self._reap_expired_slivers,
+                                        name="sliver-reaper")
+        self._reaper.setDaemon(True)
+        self._reaper.start()
+        # Stop the reaper before the interpreter tears down modules
+        atexit.register(self.stop_reaper)
 
     def GetVersion(self, options):
         '''Specify version information about this AM. That could
@@ -328,6 +414,7 @@ class ReferenceAggregateManager(object):
     # must give the caller required permissions.
     # The semantics of the API are unclear on this point, so
     # this is just the current implementation
+    @synchronized
     def ListResources(self, credentials, options):
         '''Return an RSpec of resources managed at this AM.
         If geni_available is specified in the options,
@@ -398,27 +485,23 @@ class ReferenceAggregateManager(object):
 #                # return an empty rspec
 #                return self._no_such_slice(slice_urn)
 #        else:
-        all_resources = self._agg.catalog(None)
         available = 'geni_available' in options and options['geni_available']
-        resource_xml = ""
-        for r in all_resources:
-            if available and not r.available:
-                continue
-            resource_xml = resource_xml + self.advert_resource(r)
-        result = self.advert_header() + resource_xml + self.advert_footer()
-        # Optionally compress the result
+        # The advertisement is cached, optionally compressed
         if 'geni_compressed' in options and options['geni_compressed']:
             try:
-                result = base64.b64encode(zlib.compress(result))
+                result = self._advertisement.get(available, compressed=True)
             except Exception, exc:
                 self.logger.error("Error compressing and encoding resource list: %s", traceback.format_exc())
                 raise Exception("Server error compressing resource list", exc)
+        else:
+            result = self._advertisement.get(available)
         return self.successResult(result)
 
     # The list of credentials are options - some single cred
     # must give the caller required permissions.
     # The semantics of the API are unclear on this point, so
     # this is just the current implementation
+    @synchronized
     def Allocate(self, slice_urn, credentials, rspec, options):
         """Allocate slivers to the given slice according to the given RSpec.
         Return an RSpec of the actually allocated resources.
@@ -474,7 +557,6 @@ class ReferenceAggregateManager(object):
             client_id = elem.getAttribute('client_id')
             resource = available.pop(0)
             resource.external_id = client_id
-            resource.available = False
             resources.append(resource)
 
         # determine max expiration time from credentials
@@ -534,11 +616,16 @@ class ReferenceAggregateManager(object):
             newslice = Slice(slice_urn)
 
         for resource in resources:
+            resource.available = False
             sliver = newslice.add_resource(resource)
             sliver.setExpiration(expiration)
             sliver.setStartTime(start_time)
             sliver.setEndTime(end_time)
             sliver.setAllocationState(STATE_GENI_ALLOCATED)
+            self._schedule_expiration(sliver)
+            self._allocation_ledger.add_sliver(sliver.urn(), slice_urn, 
+                                               user_urn, start_time, end_time,
+                                               {'NODE' : 1})
         self._agg.allocate(slice_urn, newslice.resources())
         self._agg.allocate(user_urn, newslice.resources())
         self._slices[slice_urn] = newslice
@@ -554,6 +641,7 @@ class ReferenceAggregateManager(object):
                       geni_slivers=[s.status() for s in newslice.slivers()])
         return self.successResult(result)
 
+    @synchronized
     def Provision(self, urns, credentials, options):
         """Allocate slivers to the given slice according to the given RSpec.
         Return an RSpec of the actually allocated resources.
@@ -620,12 +708,16 @@ class ReferenceAggregateManager(object):
             expiration = min(sliver.endTime(), max_expiration)
             sliver.setEndTime(expiration)
             sliver.setExpiration(expiration)
+            self._schedule_expiration(sliver)
+            self._allocation_ledger.update_sliver(sliver.urn(),
+                                                  end_time=expiration)
             sliver.setAllocationState(STATE_GENI_PROVISIONED)
             sliver.setOperationalState(OPSTATE_GENI_NOT_READY)
         result = dict(geni_rspec=self.manifest_rspec(the_slice.urn),
                       geni_slivers=[s.status() for s in slivers])
         return self.successResult(result)
 
+    @synchronized
     def Delete(self, urns, credentials, options):
         """Stop and completely delete the named slivers and/or slice.
         """
@@ -637,9 +729,6 @@ class ReferenceAggregateManager(object):
 
         self.getVerifiedCredentials(the_slice.urn, credentials, options, privileges)
 
-        # Grab the user_urn
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
-
         # If we get here, the credentials give the caller
         # all needed privileges to act on the given target.
         if the_slice.isShutdown():
@@ -648,18 +737,22 @@ class ReferenceAggregateManager(object):
             return self.errorResult(AM_API.UNAVAILABLE,
                                     ("Unavailable: Slice %s is unavailable."
                                      % (the_slice.urn)))
+        # Release the resources from every container holding them
+        # (the slice, and whichever user allocated them)
         resources = [sliver.resource() for sliver in slivers]
-        self._agg.deallocate(the_slice.urn, resources)
-        self._agg.deallocate(user_urn, resources)
+        self._agg.deallocate(None, resources)
         for sliver in slivers:
             slyce = sliver.slice()
             slyce.delete_sliver(sliver)
+            self._expirations.remove(sliver)
+            self._allocation_ledger.remove_sliver(sliver.urn())
             # If slice is now empty, delete it.
             if not slyce.slivers():
                 self.logger.debug("Deleting empty slice %r", slyce.urn)
                 del self._slices[slyce.urn]
         return self.successResult([s.status() for s in slivers])
 
+    @synchronized
     def PerformOperationalAction(self, urns, credentials, action, options):
         """Peform the specified action on the set of objects specified by
         urns.
@@ -736,6 +829,7 @@ class ReferenceAggregateManager(object):
                                    for s in slivers])
 
 
+    @synchronized
     def Status(self, urns, credentials, options):
         '''Report as much as is known about the status of the resources
         in the sliver. The AM may not know.
@@ -766,6 +860,7 @@ class ReferenceAggregateManager(object):
                       geni_slivers=[s.status() for s in slivers])
         return self.successResult(result)
 
+    @synchronized
     def Describe(self, urns, credentials, options):
         """Generate a manifest RSpec for the given resources.
         """
@@ -833,6 +928,7 @@ class ReferenceAggregateManager(object):
                      geni_slivers=[s.status() for s in slivers])
         return self.successResult(value)
 
+    @synchronized
     def Renew(self, urns, credentials, expiration_time, options):
         '''Renew the local sliver that is part of the named Slice
         until the given expiration time (in UTC with a TZ per RFC3339).
@@ -884,10 +980,14 @@ class ReferenceAggregateManager(object):
                 sliver.setExpiration(requested)
                 end_time = max(sliver.endTime(), requested)
                 sliver.setEndTime(end_time)
+                self._schedule_expiration(sliver)
+                self._allocation_ledger.update_sliver(sliver.urn(),
+                                                      end_time=end_time)
 
         geni_slivers = [s.status() for s in slivers]
         return self.successResult(geni_slivers)
 
+    @synchronized
     def Shutdown(self, slice_urn, credentials, options):
         '''For Management Authority / operator use: shut down a badly
         behaving sliver, without deleting it to allow for forensics.'''
@@ -1061,10 +1161,7 @@ class ReferenceAggregateManager(object):
         it is interpreted as boolean and only resources whose availability
         matches will be included in the returned list.
         """
-        result = self._agg.catalog()
-        if available is not None:
-            result = [r for r in result if r.available is available]
-        return result
+        return self._agg.catalog(available=available)
 
     def rfc3339format(self, dt):
         """Return a string representing the given datetime in rfc3339 format.
@@ -1075,28 +1172,72 @@ class ReferenceAggregateManager(object):
         return time_with_tz.isoformat()
 
     def expire_slivers(self):
-        """Look for expired slivers and clean them up. Ultimately this
-        should be run by a daemon, but until then, it is called at the
-        beginning of all methods.
+        """Clean up expired slivers. Only slivers that are due are
+        looked at (see SliverExpirationQueue). This is run by the
+        reaper thread, and also at the beginning of all methods so they
+        never see a sliver that has just expired.
         """
-        expired = list()
-        now = datetime.datetime.utcnow()
-        for slyce in self._slices.values():
-            for sliver in slyce.slivers():
-                self.logger.debug('Checking sliver %s (expiration = %r) at %r',
+        with self._lock:
+            now = datetime.datetime.utcnow()
+            expired = self._expirations.pop_expired(now)
+            if not expired:
+                return
+            self.logger.info('Expiring %d slivers', len(expired))
+            for sliver in expired:
+                self.logger.debug('Expiring sliver %s (expiration = %r) at %r',
                                   sliver.urn(), sliver.expiration(), now)
-                if sliver.expiration() < now:
-                    self.logger.debug('Expring sliver %s (expiration = %r) at %r',
-                                      sliver.urn(), sliver.expiration(), now)
-                    expired.append(sliver)
-        self.logger.info('Expiring %d slivers', len(expired))
-        for sliver in expired:
-            slyce = sliver.slice()
-            slyce.delete_sliver(sliver)
-            # If slice is now empty, delete it.
-            if not slyce.slivers():
-                self.logger.debug("Deleting empty slice %r", slyce.urn)
-                del self._slices[slyce.urn]
+                slyce = sliver.slice()
+                if sliver not in slyce.slivers():
+                    continue
+                # Release the resource from the slice and from the user
+                # that allocated it (every container holding it), as
+                # Delete does, so that it is available again
+                resource = sliver.resource()
+                self._agg.deallocate(slyce.urn, [resource])
+                self._agg.deallocate(None, [resource])
+                slyce.delete_sliver(sliver)
+                self._allocation_ledger.remove_sliver(sliver.urn())
+                # If slice is now empty, delete it.
+                if not slyce.slivers() and self._slices.get(slyce.urn) is slyce:
+                    self.logger.debug("Deleting empty slice %r", slyce.urn)
+                    del self._slices[slyce.urn]
+
+    def _schedule_expiration(self, sliver):
+        """Note the (new) expiration time of this sliver for the reaper"""
+        with self._lock:
+            next_expiration = self._expirations.next_expiration()
+            self._expirations.schedule(sliver)
+            if next_expiration is None or sliver.expiration() < next_expiration:
+                # Reaper may be sleeping past this new expiration
+                self._reaper_wakeup.set()
+
+    def stop_reaper(self):
+        """Stop the expired sliver reaper thread and wait for it to exit"""
+        self._reaper_stop.set()
+        self._reaper_wakeup.set()
+        if self._reaper is not threading.currentThread():
+            self._reaper.join(REAPER_MAX_SLEEP_SECONDS)
+
+    def _reap_expired_slivers(self):
+        """Reaper thread: expire slivers as they come due, until stopped"""
+        while True:
+            # Stopping sets the wakeup after the stop, so checking
+            # after clearing the wakeup never misses a stop
+            self._reaper_wakeup.clear()
+            if self._reaper_stop.isSet():
+                return
+            try:
+                self.expire_slivers()
+                with self._lock:
+                    next_expiration = self._expirations.next_expiration()
+                sleep = REAPER_MAX_SLEEP_SECONDS
+                if next_expiration is not None:
+                    delta = next_expiration - datetime.datetime.utcnow()
+                    sleep = min(sleep, max(0.1, delta.days * 86400 + delta.seconds + delta.microseconds / 1e6))
+                self._reaper_wakeup.wait(sleep)
+            except Exception:
+                self.logger.exception("Error expiring slivers")
+                self._reaper_stop.wait(REAPER_MAX_SLEEP_SECONDS)
 
     def decode_urns(self, urns, **kwargs):
         """Several methods need to map URNs to slivers and/or deduce
@@ -1184,12 +1325,22 @@ class AggregateManager(object):
     """
 
     def __init__(self, trust_roots_dir, delegate, authorizer=None,
-                 resource_manager=None):
+                 resource_manager=None, authorization_cache_ttl=None):
         self._trust_roots_dir = trust_roots_dir
         self._delegate = delegate
         self.logger = logging.getLogger('gcf.am3')
         self.authorizer = authorizer
         self.resource_manager = resource_manager
+        # Remember recent authorizations of read-only calls, if asked to
+        self.authorization_cache = None
+        if authorizer is not None and authorization_cache_ttl:
+            self.authorization_cache = \
+                AuthorizationCache(self.logger, authorization_cache_ttl)
+            # Forget them when the authorizer's policies change.
+            # A remote authorizer is an XMLRPC proxy and can't tell us.
+            if isinstance(authorizer, Base_Authorizer):
+                authorizer.add_policy_listener(
+                    self.authorization_cache.invalidate)
 
     def _exception_result(self, exception):
         output = str(exception)
@@ -1386,7 +1537,8 @@ class AggregateManagerServer(object):
                  trust_roots_dir=None,
                  ca_certs=None, base_name=None,
                  authorizer=None, resource_manager=None,
-                 delegate=None):
+                 delegate=None, workers=None, request_queue=None,
+                 request_timeout=None, authorization_cache_ttl=None):
         # ca_certs arg here must be a file of concatenated certs
         if ca_certs is None:
             raise Exception('Missing CA Certs')
@@ -1401,11 +1553,21 @@ class AggregateManagerServer(object):
 
         # FIXED: set logRequests=true if --debug
         logRequest=logging.getLogger().getEffectiveLevel()==logging.DEBUG
-        self._server = SecureXMLRPCServer(addr, keyfile=keyfile,
-                                          certfile=certfile, ca_certs=ca_certs, 
-                                          logRequests=logRequest)
+        if workers:
+            # Handle requests on a bounded pool of worker threads
+            self._server = SecurePoolXMLRPCServer(addr, keyfile=keyfile,
+                                                  certfile=certfile, ca_certs=ca_certs,
+                                                  logRequests=logRequest,
+                                                  workers=workers,
+                                                  queue_size=request_queue,
+                                                  request_timeout=request_timeout)
+        else:
+            self._server = SecureXMLRPCServer(addr, keyfile=keyfile,
+                                              certfile=certfile, ca_certs=ca_certs,
+                                              logRequests=logRequest)
         aggregate_manager = AggregateManager(trust_roots_dir, delegate, 
-                                             authorizer, resource_manager)
+                                             authorizer, resource_manager,
+                                             authorization_cache_ttl)
         self._server.register_instance(aggregate_manager)
         # Set the server on the delegate so it can access the
         # client certificate.
@@ -23,13 +23,19 @@
 
 from __future__ import absolute_import
 
+import copy
+import hashlib
+import json
 import os
+import threading
+import time
 import traceback
 
 from ...sfa.trust.gid import GID
 from ...sfa.trust.credential import Credential
 from ...sfa.trust.certificate import Certificate
 from ...sfa.trust.abac_credential import ABACCredential
+from ..auth.base_authorizer import AM_Methods
 from ..util.speaksfor_util import determine_speaks_for
 from ..SecureThreadedXMLRPCServer import SecureThreadedXMLRPCRequestHandler
 from .api_error_exception import ApiErrorException
@@ -59,7 +65,15 @@ class AMMethodContext:
         self._options = options
 #        self._caller_cert = self._aggregate_manager._delegate._server.pem_cert
         self._caller_cert = aggregate_manager._delegate._server.get_pem_cert()
-        self._caller_urn = GID(string=self._caller_cert).get_urn()
+        self._authorization_cache = \
+            getattr(aggregate_manager, 'authorization_cache', None)
+        self._caller_gid = None
+        if self._authorization_cache is not None:
+            self._caller_urn = \
+                self._authorization_cache.get_caller_urn(self._caller_cert)
+        else:
+            self._caller_gid = GID(string=self._caller_cert)
+            self._caller_urn = self._caller_gid.get_urn()
         self._is_v3 = is_v3
         self._resource_bindings = resource_bindings
         self._result = None
@@ -73,6 +87,10 @@ class AMMethodContext:
                                    self._args, self._options))
             credentials = self._credentials
 
+            # Reuse a recent decision for the same read-only call
+            cache_key = self._authorization_cache_key()
+            if cache_key is not None and self._use_cached_decision(cache_key):
+                return self
 
             # Possibly modify args and options
             if self._authorizer is not None:
@@ -84,7 +102,9 @@ class AMMethodContext:
 #                                      (self._args, self._options))
 
             # Change client cert if valid speaks-for invocation
-            caller_gid = GID(string=self._caller_cert)
+            caller_gid = self._caller_gid
+            if caller_gid is None:
+                caller_gid = GID(string=self._caller_cert)
             new_caller_gid = determine_speaks_for(self._logger,
                                                    credentials,
                                                    caller_gid,
@@ -129,6 +149,12 @@ class AMMethodContext:
                                            credentials, self._args, 
                                            self._options,
                                            requested_allocation_state)
+
+            if cache_key is not None:
+                self._authorization_cache.store(cache_key,
+                                                (self._caller_cert,
+                                                 self._caller_urn,
+                                                 self._args, self._options))
         except ApiErrorException, e:
             self._result = self._api_error(e);
         except Exception, e:
@@ -136,6 +162,41 @@ class AMMethodContext:
         finally:
             return self
 
+    # Return the key of this call in the authorization cache,
+    # or None if its decision can't be cached
+    def _authorization_cache_key(self):
+        cache = self._authorization_cache
+        if cache is None or not cache.is_cacheable(self._method_name):
+            return None
+        allocation_generation = None
+        if self._resource_manager:
+            allocation_generation = \
+                self._resource_manager.get_allocation_generation(\
+                self._aggregate_manager)
+        if allocation_generation is None:
+            # The reference aggregates count changes to their catalog
+            agg = getattr(self._aggregate_manager._delegate, '_agg', None)
+            if agg is not None:
+                allocation_generation = agg.generation
+        # Without a way to tell when allocations change, don't cache
+        if allocation_generation is None:
+            return None
+        return cache.make_key(self._method_name, self._caller_cert,
+                              self._credentials, self._args, self._options,
+                              allocation_generation)
+
+    # Take the caller, arguments and options of a cached decision
+    # Return True if there was one
+    def _use_cached_decision(self, cache_key):
+        cached = self._authorization_cache.lookup(cache_key)
+        if cached is None:
+            return False
+        self._caller_cert, self._caller_urn, self._args, self._options = \
+            cached
+        self._logger.debug("Authorization of %s for %s from cache" % \
+                               (self._method_name, self._caller_urn))
+        return True
+
     # Determine if this is a speaks-for invocation and if so,
     # return the cert of the spoken-for entity
 
@@ -160,6 +221,11 @@ class AMMethodContext:
             self._logger.error("Generic Error in %s" % self._method_name)
             self._handleError(value)
 
+        # The call may have changed the allocation state
+        if self._authorization_cache is not None and \
+                not self._authorization_cache.is_cacheable(self._method_name):
+            self._authorization_cache.invalidate()
+
         self._logger.info("Result from %s: %s", self._method_name, 
                           self._result)
 
@@ -196,6 +262,124 @@ class AMMethodContext:
                     output=exception.output)
 
 
+class AuthorizationCache:
+    """Remembers successful authorization decisions of read-only AM API
+    calls for a short time, so that a tool polling Status (say) doesn't
+    have the caller's certificate and credentials checked on every call.
+
+    A decision is keyed by the method, a digest of the caller's
+    certificate, digests of the credentials, the arguments and options,
+    the aggregate's allocation generation (which changes when slivers
+    are allocated, renewed, deleted or expire) and the number of
+    invalidations so far. It holds the caller (after speaks-for),
+    arguments and options that the authorized call went on with.
+    Decisions last ttl seconds, and are all dropped when a call that may
+    change the allocation state (Allocate, Delete...) completes or the
+    authorizer's policies are reloaded. A
+    decision made while the generation changed or an invalidation
+    happened is stored under a key no later call will have.
+    Failed authorizations are not remembered.
+
+    The hit rate is logged every STATS_INTERVAL lookups.
+    """
+
+    MAX_ENTRIES = 1000
+    STATS_INTERVAL = 100
+
+    READ_ONLY_METHODS = (AM_Methods.LIST_RESOURCES_V2,
+                         AM_Methods.LIST_RESOURCES_FOR_SLICE_V2,
+                         AM_Methods.SLIVER_STATUS_V2,
+                         AM_Methods.LIST_RESOURCES_V3,
+                         AM_Methods.DESCRIBE_V3,
+                         AM_Methods.STATUS_V3)
+
+    def __init__(self, logger, ttl, max_entries=None):
+        self._logger = logger
+        if max_entries is None:
+            max_entries = self.MAX_ENTRIES
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {} # key -> (expiration, value)
+        self._caller_urns = {} # caller cert digest -> URN
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def is_cacheable(self, method_name):
+        return method_name in self.READ_ONLY_METHODS
+
+    @staticmethod
+    def _digest(value):
+        if not isinstance(value, basestring):
+            # XMLRPC values: dicts, lists, strings, numbers, DateTime...
+            value = json.dumps(value, sort_keys=True, default=str)
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        return hashlib.sha1(value).hexdigest()
+
+    def make_key(self, method_name, caller_cert, credentials, args, options,
+                 allocation_generation):
+        return (self.invalidations, allocation_generation,
+                method_name, self._digest(caller_cert),
+                tuple([self._digest(c) for c in credentials]),
+                self._digest(args), self._digest(options))
+
+    # Return the URN of the caller's certificate, parsing it only once
+    def get_caller_urn(self, caller_cert):
+        digest = self._digest(caller_cert)
+        with self._lock:
+            if digest in self._caller_urns:
+                return self._caller_urns[digest]
+        caller_urn = GID(string=caller_cert).get_urn()
+        with self._lock:
+            if len(self._caller_urns) >= self.max_entries:
+                self._caller_urns.clear()
+            self._caller_urns[digest] = caller_urn
+        return caller_urn
+
+    # Return a copy of the remembered value, or None
+    def lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            lookups = self.hits + self.misses
+            if lookups % self.STATS_INTERVAL == 0:
+                self._logger.info("Authorization cache: %d hits in %d lookups (%.1f%%), %d entries, %d invalidations" % \
+                                      (self.hits, lookups,
+                                       100.0 * self.hits / lookups,
+                                       len(self._entries),
+                                       self.invalidations))
+            if entry is None:
+                return None
+            return copy.deepcopy(entry[1])
+
+    def store(self, key, value):
+        if self.ttl <= 0:
+            return
+        value = copy.deepcopy(value)
+        now = time.time()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                for k, entry in self._entries.items():
+                    if entry[0] < now:
+                        del self._entries[k]
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
 def isGeniCred(cred):
     """Filter (for use with filter()) to yield all 'geni_sfa' credentials 
     regardless of version.
@@ -24,8 +24,16 @@
 from __future__ import absolute_import
 
 import gcf
+import hashlib
 import json
+import keyword
 import logging
+import os
+import re
+import threading
+import time
+import tokenize
+from StringIO import StringIO
 from .base_authorizer import *
 from ...sfa.trust.credential_factory import CredentialFactory
 from ...sfa.trust.credential import Credential
@@ -61,40 +69,31 @@ class ABAC_Authorizer(Base_Authorizer):
 
         policy_map_file = opts.authorizer_policy_map_file
 
-        policy_map_raw = open(policy_map_file).read()
-        policy_map = json.loads(policy_map_raw)
+        # Seconds between checks for changed policy files (0 = never)
+        reload_interval = None
+        if hasattr(opts, 'authorizer_policy_reload_interval') and \
+                opts.authorizer_policy_reload_interval is not None:
+            reload_interval = int(opts.authorizer_policy_reload_interval)
 
-        if "default" not in policy_map:
-            raise Exception("No default specified in authorizer policy map file: %s" %\
-                                policy_map_file)
+        self._rule_set_manager = \
+            ABAC_Rule_Set_Manager(policy_map_file, self._root_cert, 
+                                  self._logger, reload_interval)
 
-        self._AUTHORITY_SPECIFIC_RULES = {}
-        for label, filenames in policy_map.items():
-            rules = self.generate_rules(label, filenames)
-#            rules.dump()
-            if label == 'default' : 
-                self._DEFAULT_RULES = rules
-            else:
-                self._AUTHORITY_SPECIFIC_RULES[label] = rules
-
-    # Generate a rule set (identities, biners, constants
-    # conditional_assertions, policies, queries)
-    # from a set of files. These are ordered and thus later files add to or
-    # replace previous entries
-    def generate_rules(self, label, filenames):
-        rule_set = ABAC_Authorizer_Rule_Set(label, self._root_cert)
-        for filename in filenames:
-            rule_set.parse(filename)
-        return rule_set
+    # The policies change when the rule set manager reloads them
+    def add_policy_listener(self, listener):
+        self._rule_set_manager.add_reload_listener(listener)
 
     # Find the correct set of rules for the given caller based on authority
+    # The rule sets are those last loaded, even if a reload is under way
     def lookup_rules_for_caller(self, caller):
         caller_urn = gid.GID(string=caller).get_urn()
         caller_authority = convert_user_urn_to_authority_urn(caller_urn)
         caller_authority_name = caller_authority.split('+')[1]
-        rules = self._DEFAULT_RULES
-        if caller_authority_name in self._AUTHORITY_SPECIFIC_RULES:
-            rules = self._AUTHORITY_SPECIFIC_RULES[caller_authority_name]
+        default_rules, authority_specific_rules = \
+            self._rule_set_manager.get_rule_sets()
+        rules = default_rules
+        if caller_authority_name in authority_specific_rules:
+            rules = authority_specific_rules[caller_authority_name]
         self._logger.debug("Rules for %s : %s" % (caller_urn, rules.getLabel()))
         return rules
 
@@ -119,29 +118,40 @@ class ABAC_Authorizer(Base_Authorizer):
                                            requested_allocation_state, rules)
 
         # Add 'constants' to bindings
-        bindings = dict(bindings.items() + rules.getConstants().items())
+        bindings = ABAC_Bindings(bindings.items() + \
+                                     rules.getConstants().items())
 
 #        self._logger.info("BINDINGS = %s" % bindings)
 
-        assertions = self._generate_assertions(bindings, rules)
-
         credential_assertions = \
             self._generate_credential_assertions(caller, creds, bindings, rules)
 
-        fixed_policies = rules.getPolicies()
-
-        assertions = \
-            assertions + credential_assertions + fixed_policies
-
-#        self._logger.info("ASSERTIONS = %s" % assertions)
-
-        success, msg = self._evaluate_queries(bindings, assertions, rules)
+        success, msg = self._decide(bindings, credential_assertions, rules)
 
         del key_id_name_map[caller_keyid]
 
         if not success:
             raise Exception(msg)
 
+    # Given the bindings for a request and the assertions from its
+    # credentials, generate the conditional assertions and evaluate the queries
+    # Return success, failure_message
+    def _decide(self, bindings, credential_assertions, rules):
+        if not isinstance(bindings, ABAC_Bindings):
+            bindings = ABAC_Bindings(bindings)
+        # Python values of the bindings used in conditions, for this request
+        values = {}
+
+        assertions = self._generate_assertions(bindings, rules, values)
+
+        # The fixed policies are already in the rule set's proof graph
+        graph = ABAC_Proof_Graph(assertions + credential_assertions,
+                                 rules.getPolicyGraph())
+
+#        self._logger.info("ASSERTIONS = %s" % assertions)
+
+        return self._evaluate_queries(bindings, graph, rules, values)
+
     # Get each binder to generate bindings
     def _generate_bindings(self, method, caller, creds, args, opts,
                            requested_state, rules):
@@ -156,35 +166,21 @@ class ABAC_Authorizer(Base_Authorizer):
     # For each conditional assertion, evaluate the condition
     # If true and if the associated assertion is completely bound,
     # generate the assertion
-    def _generate_assertions(self, bindings, rules):
+    # The conditions and assertions were compiled when the rules were parsed
+    def _generate_assertions(self, bindings, rules, values):
         assertions = []
-        conditional_assertions = rules.getConditionalAssertions()
-
-        # Handle old format of policies that are list of condition/assertion
-        # rather than list of precondition/exclusive and then a list
-        # of condition/assertion clauses
-        if len(conditional_assertions) > 0 and \
-                'precondition' not in conditional_assertions[0]:
-            conditional_assertions = [{'precondition' : 'True',
-                                      'clauses' : conditional_assertions}]
-
-        for clause_set in conditional_assertions:
-            precondition = clause_set['precondition']
-            bound_precondition = self._bind_expression(precondition, bindings)
-            if self._has_unbound_variables(bound_precondition): continue
-            if not eval(bound_precondition): continue
-            exclusive = 'exclusive' in clause_set and clause_set['exclusive']
-            clauses = clause_set['clauses']
-            for ca in clauses:
-                condition = ca['condition']
-                assertion = ca['assertion']
-                bound_condition = self._bind_expression(condition, bindings)
-                if self._has_unbound_variables(bound_condition): continue
-                self._logger.info("EVAL : %s" % bound_condition)
-                if not eval(bound_condition): continue
-                bound_assertion = self._bind_expression(assertion, bindings)
-                if self._has_unbound_variables(bound_assertion): continue
-                assertions.append(bound_assertion)
+        log_eval = self._logger.isEnabledFor(logging.INFO)
+        for precondition, exclusive, clauses in \
+                rules.getCompiledConditionalAssertions():
+            if not precondition.is_bound(bindings): continue
+            if not precondition.evaluate(bindings, values): continue
+            for condition, assertion in clauses:
+                if not condition.is_bound(bindings): continue
+                if log_eval:
+                    self._logger.info("EVAL : %s" % condition.bind(bindings))
+                if not condition.evaluate(bindings, values): continue
+                if not assertion.is_bound(bindings): continue
+                assertions.append(assertion.bind(bindings))
             # If this is an exclusive clause set whose precondition matched
             # Don't look at any other clause sets
             if exclusive: break 
@@ -212,30 +208,30 @@ class ABAC_Authorizer(Base_Authorizer):
             else:
                 assertion = "%s.%s<-%s" % (head_principal_name, head_role, 
                                               tail_principal_name)
-            bound_assertion = self._bind_expression(assertion, bindings)
+            bound_assertion = ABAC_Template(assertion).bind(bindings)
             assertions.append(bound_assertion)
 
         return assertions
 
     # Determine if all positive queries are proven and no negative
     # query is proven
-    def _evaluate_queries(self, bindings, assertions, rules):
+    def _evaluate_queries(self, bindings, graph, rules, values):
 
         messages = []
 
         all_positive_proved = True
-        for q in rules.getPositiveQueries():
+        for q in rules.getCompiledPositiveQueries():
             evaluated, proven, msg = \
-                self._evaluate_query(bindings, assertions, q, rules)
+                self._evaluate_query(bindings, graph, q, values)
             if not evaluated: continue
             if not proven:
                 all_positive_proved = False
                 messages.append(msg)
 
         all_negative_disproved = True
-        for q in rules.getNegativeQueries():
+        for q in rules.getCompiledNegativeQueries():
             evaluated, proven, msg = \
-                self._evaluate_query(bindings, assertions, q, rules)
+                self._evaluate_query(bindings, graph, q, values)
             if not evaluated: continue
             if proven:
                 all_negative_disproved = False
@@ -244,98 +240,42 @@ class ABAC_Authorizer(Base_Authorizer):
         result = (all_positive_proved and all_negative_disproved)
         return result, ", ".join(messages)
 
-    # Evaluate a single query
+    # Evaluate a single compiled query (statement, condition, message)
     # If there is a condition, it must be true to considered
     # Return evaluated, evaluation, failure_message
-    def _evaluate_query(self, bindings, assertions, query, rules):
+    def _evaluate_query(self, bindings, graph, query, values):
+        statement, condition, msg = query
         # If there is a condition on this query, only evaluate if 
         # condition is satisfied
-        if query in rules.getQueryConditionMap():
-            condition = rules.getQueryConditionMap()[query]
-            bound_condition = self._bind_expression(condition, bindings)
-            if self._has_unbound_variables(bound_condition):
+        if condition:
+            if not condition.is_bound(bindings):
                 raise Exception("Illegal query condition: unbound variable %s"\
-                                    % bound_condition)
-            if not eval(bound_condition): 
+                                    % condition.bind(bindings))
+            if not condition.evaluate(bindings, values):
                 return False, False, ""
 
         # If no condition or condition  succeeded, evaluate bound query
-        bound_q = self._bind_expression(query, bindings)
-        if self._has_unbound_variables(bound_q): 
-            raise Exception("Illegal query: unbound variable %s" % bound_q)
+        if not statement.is_bound(bindings):
+            raise Exception("Illegal query: unbound variable %s" % \
+                                statement.bind(bindings))
 
-        evaluation = self._prove_query(bound_q, assertions)
-        msg = rules.getQueryMessageMap()[query]
+        evaluation = self._prove_query(statement.bind(bindings), graph)
         return True, evaluation, msg
 
+    # Prove (or fail to prove) an ABAC query based on a graph of assertions
+    # by searching for a path from the query LHS to the query RHS
+    def _prove_query(self, query, graph):
 
-    # Replace bindings ($VAR) with bound value
-    def _bind_expression(self, expr, bindings):
-        for binding, value in bindings.items():
-            if expr.find(binding) > -1:
-                expr = expr.replace(binding, value)
-        return expr
-
-    # Are there any unbound variables in expression?
-    def _has_unbound_variables(self, expr):
-        return expr.find("$") > -1
+        query_lhs, query_rhs = ABAC_Proof_Graph.parse_assertion(query)
 
-
-    # Prove (or fail to prove) an ABAC query based on a set of assertions
-    # We use a simple recursive chaining to see if we can find a path
-    # from the query LHS to the query RHS
-    def _prove_query(self, query, assertions):
-
-        query_parts = query.split('<-')
-        query_lhs = query_parts[0].strip()
-        query_rhs = query_parts[1].strip()
-
-        parsed_assertions = {}
-        for assertion in assertions:
-            assertion_parts = assertion.split('<-')
-            assert_lhs = assertion_parts[0].strip()
-            assert_rhs = assertion_parts[1].strip()
-            if assert_lhs not in parsed_assertions:
-                parsed_assertions[assert_lhs] = []
-            assertion_info = {'rhs' : assert_rhs, 'assertion' : assertion}
-            parsed_assertions[assert_lhs].append(assertion_info)
-
-        result, chain = \
-            self._prove_query_internal(query_lhs, query_rhs, parsed_assertions)
+        chain = graph.prove(query_lhs, query_rhs)
+        result = chain is not None
 
         self._logger.info("QUERY (%s) : %s" % (result, query))
         if result:
             self._logger.info("PROOF_CHAIN : %s" % chain)
         return result
 
-    # Internal method supporting _prove_query as a recursive call
-    # Return the proof chain if success
-    def _prove_query_internal(self, lhs, target, parsed_assertions):
-        if lhs not in parsed_assertions: return False, None
-
-        found_direct_link = False
-        for pa in parsed_assertions[lhs]:
-            rhs = pa['rhs']
-            assertion = pa['assertion']
-            if rhs == target:
-                found_direct_link = True
-                break
-        if found_direct_link:
-            return True, [assertion]
-
-
-        found_indrect_link = False
-        for pa in parsed_assertions[lhs]:
-            new_lhs = pa['rhs']
-            assertion = pa['assertion']
-            result, chain = \
-                self._prove_query_internal(new_lhs, target, parsed_assertions)
-            if result:
-                new_chain = list(chain)
-                new_chain.insert(0, assertion)
-                return True, new_chain
-        return False, None
-
     # Compute keyid from a cert
     @staticmethod
     def _compute_keyid(cert_string=None, cert_filename=None):
@@ -355,13 +295,388 @@ class ABAC_Authorizer(Base_Authorizer):
         else:
             return arguments, options
 
+# A variable in a rule, e.g. $CALLER or $SLICE_URN
+ABAC_VARIABLE_PATTERN = re.compile(r'\$[A-Za-z_][A-Za-z0-9_]*')
+_VARIABLE_KEY_PATTERN = re.compile(r'\$[A-Za-z_][A-Za-z0-9_]*$')
+
+# Prefix of the python names standing for variables in compiled conditions
+_VARIABLE_NAME_PREFIX = '_abac_var_'
+_VARIABLE_NAME_PATTERN = re.compile(_VARIABLE_NAME_PREFIX + r'([A-Za-z0-9_]*)')
+
+# The bindings of names to values for one request, which notes
+# the bindings whose names are not $VARIABLEs 
+# (e.g. constants like QUOTA_AUTHORITY_VM_TOTAL).
+class ABAC_Bindings(dict):
+
+    def __init__(self, bindings):
+        dict.__init__(self, bindings)
+        self.textual = [(name, value) for name, value in self.iteritems() \
+                            if not _VARIABLE_KEY_PATTERN.match(name)]
+
+# Return the bindings whose names are not $VARIABLEs that appear in the text.
+# These are replaced wherever they appear in the text, as plain text.
+def _textual_bindings(text, bindings):
+    textual = getattr(bindings, 'textual', None)
+    if textual is None:
+        textual = ABAC_Bindings(bindings).textual
+    if not textual: return textual
+    return [(name, value) for name, value in textual if name in text]
+
+# Is the string a single python atom (a name, number or string literal, 
+# or something in brackets), whose value is the same whether or not
+# it is put in parentheses?
+def _is_python_atom(expression):
+    try:
+        tokens = [token for token in \
+                      tokenize.generate_tokens(StringIO(expression).readline) \
+                      if token[0] not in (tokenize.NEWLINE, tokenize.NL,
+                                          tokenize.ENDMARKER)]
+    except tokenize.TokenError:
+        return False
+    if len(tokens) == 1:
+        token_type, token_string = tokens[0][0], tokens[0][1]
+        return token_type in (tokenize.NUMBER, tokenize.STRING) or \
+            (token_type == tokenize.NAME and not keyword.iskeyword(token_string))
+    if len(tokens) < 2 or tokens[0][1] not in ('(', '[', '{'):
+        return False
+    depth = 0
+    for index, token in enumerate(tokens):
+        if token[1] in ('(', '[', '{'):
+            depth += 1
+        elif token[1] in (')', ']', '}'):
+            depth -= 1
+            if depth == 0 and index != len(tokens) - 1:
+                return False
+    return depth == 0
+
+# A string from a rule (assertion, query or condition) with $VARIABLEs, 
+# whose variables are found once, when the rules are parsed.
+# A variable is replaced by its bound value. Any binding whose name is not
+# a $VARIABLE is replaced by its value wherever its name appears. 
+# The string is bound if, once so replaced, it has no '$'.
+class ABAC_Template:
+
+    def __init__(self, text):
+        self._text = text
+        self._variables = set(ABAC_VARIABLE_PATTERN.findall(text))
+        # A '$' that does not start a variable can never be bound
+        self._stray_dollar = ABAC_VARIABLE_PATTERN.sub('', text).find('$') > -1
+
+    # Are all the variables in the string bound?
+    def is_bound(self, bindings):
+        if _textual_bindings(self._text, bindings):
+            return self.bind(bindings).find('$') == -1
+        if self._stray_dollar: return False
+        for variable in self._variables:
+            if variable not in bindings: return False
+            if bindings[variable].find('$') > -1: return False
+        return True
+
+    # Return the string with its bound variables replaced by their values
+    def bind(self, bindings):
+        text = self._text
+        if self._variables:
+            text = ABAC_VARIABLE_PATTERN.sub(\
+                lambda m: bindings.get(m.group(0), m.group(0)), text)
+        for name, value in _textual_bindings(self._text, bindings):
+            text = text.replace(name, value)
+        return text
+
+    def __str__(self):
+        return self._text
+
+# A python expression from a rule (a condition or precondition) with 
+# $VARIABLEs, compiled once when the rules are parsed.
+# A variable inside a string literal (e.g. '$CALLER') is replaced by
+# its bound value in that string. A variable outside a string literal
+# (e.g. $HOUR < 6) whose bound value is a single python atom (e.g. '6', 
+# or a list) stands for that value, evaluated once per request.
+# Otherwise (or if the expression does not compile, or uses a binding 
+# whose name is not a $VARIABLE) the bound string is evaluated instead.
+class ABAC_Condition(ABAC_Template):
+
+    def __init__(self, text):
+        ABAC_Template.__init__(self, text)
+        self._code = None
+        self._bare_variables = set() # Variables outside string literals
+        self._string_templates = {} # Name => ABAC_Template of a string literal
+        try:
+            self._compile()
+        except (SyntaxError, tokenize.TokenError):
+            self._code = None
+
+    # Replace variables by python names, and string literals holding
+    # variables by names of their bound values, and compile the result
+    # Raise SyntaxError if a variable is run together with a name or
+    # number (e.g. $X$Y), which only binding the text can handle
+    def _compile(self):
+        source = ABAC_VARIABLE_PATTERN.sub(\
+            lambda m: _VARIABLE_NAME_PREFIX + m.group(0)[1:], self._text)
+        tokens = []
+        previous = None
+        for token in tokenize.generate_tokens(StringIO(source).readline):
+            token_type, token_string = token[0], token[1]
+            if token_type == tokenize.NAME and \
+                    token_string.find(_VARIABLE_NAME_PREFIX) > -1:
+                if not token_string.startswith(_VARIABLE_NAME_PREFIX) or \
+                        token_string.count(_VARIABLE_NAME_PREFIX) > 1 or \
+                        (previous is not None and previous[3] == token[2] and \
+                             previous[0] in (tokenize.NAME, tokenize.NUMBER,
+                                             tokenize.STRING)):
+                    raise SyntaxError("Variable run together in %s" % \
+                                          self._text)
+                self._bare_variables.add('$' + \
+                    token_string[len(_VARIABLE_NAME_PREFIX):])
+            elif token_type == tokenize.STRING and \
+                    token_string.find(_VARIABLE_NAME_PREFIX) > -1:
+                literal = _VARIABLE_NAME_PATTERN.sub(r'$\1', eval(token_string))
+                name = '_abac_string_%d' % len(self._string_templates)
+                self._string_templates[name] = ABAC_Template(literal)
+                token_type, token_string = tokenize.NAME, name
+            elif previous is not None and previous[0] == tokenize.NAME and \
+                    previous[1].startswith(_VARIABLE_NAME_PREFIX) and \
+                    previous[3] == token[2] and \
+                    token_type in (tokenize.NAME, tokenize.NUMBER):
+                raise SyntaxError("Variable run together in %s" % self._text)
+            tokens.append((token_type, token_string))
+            previous = token
+        self._code = compile(tokenize.untokenize(tokens).strip(), 
+                             '<condition>', 'eval')
+
+    # Evaluate the expression with the given bindings, which must be bound
+    # values holds the python values of bound atoms (None for other bound
+    # values), computed at most once per request
+    def evaluate(self, bindings, values):
+        if self._code is None or _textual_bindings(self._text, bindings):
+            return eval(self.bind(bindings))
+        namespace = {}
+        for variable in self._bare_variables:
+            if variable not in values:
+                values[variable] = None
+                if _is_python_atom(bindings[variable]):
+                    try:
+                        values[variable] = (eval(bindings[variable]),)
+                    except Exception:
+                        pass
+            if values[variable] is None:
+                # Only meaningful as part of the whole expression
+                return eval(self.bind(bindings))
+            namespace[_VARIABLE_NAME_PREFIX + variable[1:]] = \
+                values[variable][0]
+        for name, template in self._string_templates.items():
+            namespace[name] = template.bind(bindings)
+        return eval(self._code, globals(), namespace)
+
+# ABAC assertions (head<-tail) indexed by head, for proving queries
+# Holds the assertions for one request on top of a fixed graph 
+# of the rule set's policies (a dictionary of head => [(tail, assertion)]).
+# Remembers, for each target, the heads and tails that cannot reach it.
+class ABAC_Proof_Graph:
+
+    def __init__(self, assertions, base_graph=None):
+        self._graph = {}
+        for assertion in assertions:
+            ABAC_Proof_Graph.add_assertion(self._graph, assertion)
+        self._base_graph = base_graph or {}
+        self._unreachable = {} # target => set of heads/tails
+
+    # Split an assertion (or query) into its head and tail
+    @staticmethod
+    def parse_assertion(assertion):
+        assertion_parts = assertion.split('<-')
+        return assertion_parts[0].strip(), assertion_parts[1].strip()
+
+    # Add an assertion to a dictionary of head => [(tail, assertion)]
+    @staticmethod
+    def add_assertion(graph, assertion):
+        lhs, rhs = ABAC_Proof_Graph.parse_assertion(assertion)
+        if lhs not in graph:
+            graph[lhs] = []
+        graph[lhs].append((rhs, assertion))
+
+    def _links(self, lhs):
+        return self._graph.get(lhs, []) + self._base_graph.get(lhs, [])
+
+    # Return the chain of assertions leading from lhs to target, or None
+    # A depth first search, taking direct links to the target first
+    def prove(self, lhs, target):
+        unreachable = self._unreachable.setdefault(target, set())
+        if lhs in unreachable: return None
+        visited = set()
+        chain = [] # Assertions leading to the last node on the stack
+        stack = [] # Iterators over the links of the nodes being searched
+        node = lhs
+        while node is not None:
+            visited.add(node)
+            links = self._links(node)
+            for rhs, assertion in links:
+                if rhs == target:
+                    return chain + [assertion]
+            stack.append(iter(links))
+            node = None
+            while stack and node is None:
+                for rhs, assertion in stack[-1]:
+                    if rhs not in visited and rhs not in unreachable:
+                        node = rhs
+                        chain.append(assertion)
+                        break
+                else:
+                    stack.pop()
+                    if chain: chain.pop()
+        # Nothing we visited can reach the target
+        unreachable.update(visited)
+        return None
+
+# Loads the rule sets of an authorizer policy map file: 
+# the default rule set and a rule set per authority.
+# Every reload_interval seconds, a background thread checks whether the
+# policy map file, any of its rule files or any identity cert file 
+# changed, and if so builds new rule sets and swaps them in at once.
+# Authorization keeps using the previous rule sets in the meantime,
+# or if the new rules fail to load.
+# Unchanged rule files are not re-read, conditions already compiled
+# are reused, and identity keyids are remembered by cert file digest.
+class ABAC_Rule_Set_Manager:
+
+    DEFAULT_RELOAD_INTERVAL = 10 # seconds
+
+    def __init__(self, policy_map_file, root_cert, logger, 
+                 reload_interval=None):
+        self._policy_map_file = policy_map_file
+        self._root_cert = root_cert
+        self._logger = logger
+        if reload_interval is None:
+            reload_interval = self.DEFAULT_RELOAD_INTERVAL
+        self._reload_interval = reload_interval
+        self._reload_lock = threading.Lock()
+        self._rule_files = {} # filename => (file fingerprint, raw rules)
+        self._keyids = {} # cert file digest => keyid
+        self._compiled_conditions = {} # condition string => ABAC_Condition
+        self._watched_files = []
+        self._fingerprint = None
+        self._rule_sets = None # (default rule set, {authority : rule set})
+        self._reload_listeners = []
+
+        # The first load must succeed
+        self.reload()
+
+        if self._reload_interval > 0:
+            watcher = threading.Thread(target=self._watch_policy_files,
+                                       name="abac-policy-watcher")
+            watcher.setDaemon(True)
+            watcher.start()
+
+    # Return the current (default rule set, {authority : rule set})
+    def get_rule_sets(self):
+        return self._rule_sets
+
+    # Call listener() after each reload swaps in new rule sets
+    def add_reload_listener(self, listener):
+        self._reload_listeners.append(listener)
+
+    # Load the rule sets of the policy map and swap them in
+    def reload(self):
+        with self._reload_lock:
+            policy_map = json.loads(open(self._policy_map_file).read())
+
+            if "default" not in policy_map:
+                raise Exception("No default specified in authorizer policy map file: %s" %\
+                                    self._policy_map_file)
+
+            watched_files = [self._policy_map_file]
+            default_rules = None
+            authority_specific_rules = {}
+            for label, filenames in policy_map.items():
+                rules = ABAC_Authorizer_Rule_Set(label, self._root_cert,
+                                                 self._compiled_conditions,
+                                                 self._lookup_keyid)
+                for filename in filenames:
+                    raw_rules = self._read_rule_file(filename)
+                    rules.add_rules(raw_rules)
+                    watched_files.append(filename)
+                    if 'identities' in raw_rules:
+                        watched_files.extend(raw_rules['identities'].values())
+                rules.compile()
+#                rules.dump()
+                if label == 'default':
+                    default_rules = rules
+                else:
+                    authority_specific_rules[label] = rules
+
+            # Forget rule files no longer in the policy map
+            for filename in self._rule_files.keys():
+                if filename not in watched_files:
+                    del self._rule_files[filename]
+
+            self._watched_files = watched_files
+            self._fingerprint = self._policy_fingerprint()
+            self._rule_sets = (default_rules, authority_specific_rules)
+            for listener in self._reload_listeners:
+                listener()
+
+    # Return the raw rules of a rule file, reading it only if it changed
+    def _read_rule_file(self, filename):
+        fingerprint = self._file_fingerprint(filename)
+        if filename in self._rule_files and \
+                self._rule_files[filename][0] == fingerprint:
+            return self._rule_files[filename][1]
+        raw_rules = json.loads(open(filename).read())
+        self._rule_files[filename] = (fingerprint, raw_rules)
+        return raw_rules
+
+    # Return the keyid of an identity cert file, computing it only
+    # for new cert contents
+    def _lookup_keyid(self, cert_filename):
+        cert_string = open(cert_filename).read()
+        digest = hashlib.sha1(cert_string).hexdigest()
+        if digest not in self._keyids:
+            self._keyids[digest] = \
+                ABAC_Authorizer._compute_keyid(cert_string=cert_string)
+        return self._keyids[digest]
+
+    @staticmethod
+    def _file_fingerprint(filename):
+        try:
+            st = os.stat(filename)
+            return "%s %d %r" % (filename, st.st_size, st.st_mtime)
+        except OSError:
+            return filename
+
+    # Digest of the name, size and modification time of the watched files
+    def _policy_fingerprint(self):
+        h = hashlib.sha1()
+        for filename in self._watched_files:
+            h.update(self._file_fingerprint(filename))
+        return h.hexdigest()
+
+    # Reload the rule sets when any watched file changes
+    def _watch_policy_files(self):
+        while True:
+            time.sleep(self._reload_interval)
+            try:
+                if self._policy_fingerprint() == self._fingerprint:
+                    continue
+                self._logger.info("Authorizer policy files changed: reloading %s" % \
+                                      self._policy_map_file)
+                self.reload()
+            except Exception, e:
+                # Keep the previous rule sets
+                self._logger.error("Failed to reload authorizer policies from %s: %s" % \
+                                       (self._policy_map_file, e))
+                # Don't retry until the files change again
+                self._fingerprint = self._policy_fingerprint()
+
 # Class to hold the rules to be invoked for members of a given authority
 # We have per-authority rule sets and a default rule set
 class ABAC_Authorizer_Rule_Set:
 
-    def __init__(self, label, root_cert):
+    # compiled_conditions and keyid_lookup may be shared among rule sets
+    # (see ABAC_Rule_Set_Manager)
+    def __init__(self, label, root_cert, compiled_conditions=None,
+                 keyid_lookup=None):
         self._label = label
         self._root_cert = root_cert
+        self._keyid_lookup = keyid_lookup
         self._identities = {}
         self._binders = []
         self._constants = {}
@@ -374,13 +689,27 @@ class ABAC_Authorizer_Rule_Set:
         self._query_condition_map = {}
         self._keyid_name_map = {}
 
+        # Rules compiled for evaluation, see compile
+        if compiled_conditions is None:
+            compiled_conditions = {}
+        self._compiled_conditions = compiled_conditions # Condition string => ABAC_Condition
+        self._compiled_conditional_assertions = []
+        self._compiled_positive_queries = []
+        self._compiled_negative_queries = []
+        self._policy_graph = {}
+
     # Parse rule content from a file and add to existing rule content (if any)
     # That is, we may parse multiple files in sequence, thus adding to lists
     # and adding/replacing elements in dictionaries
     def parse(self, filename):
         data = open(filename).read()
         raw_rules = json.loads(data)
+        self.add_rules(raw_rules)
+        self.compile()
 
+    # Add the rules parsed from a file to existing rule content
+    # The rules must be compiled before they are used
+    def add_rules(self, raw_rules):
         if 'binders' in raw_rules:
             for b in raw_rules['binders']:
                 binder = self._initialize_binder(b)
@@ -417,10 +746,64 @@ class ABAC_Authorizer_Rule_Set:
 
         if 'identities' in raw_rules:
             for id_name, id_pem in raw_rules['identities'].items():
-                id_keyid = ABAC_Authorizer._compute_keyid(cert_filename=id_pem)
+                if self._keyid_lookup:
+                    id_keyid = self._keyid_lookup(id_pem)
+                else:
+                    id_keyid = \
+                        ABAC_Authorizer._compute_keyid(cert_filename=id_pem)
                 if id_keyid:
                     self._keyid_name_map[id_keyid] = id_name
 
+    # Compile the rules parsed so far, so each request only binds variables:
+    # conditions into python code, assertions and queries into templates,
+    # and the fixed policies into a graph for proving queries
+    def compile(self):
+        conditional_assertions = self._conditional_assertions
+
+        # Handle old format of policies that are list of condition/assertion
+        # rather than list of precondition/exclusive and then a list
+        # of condition/assertion clauses
+        if len(conditional_assertions) > 0 and \
+                'precondition' not in conditional_assertions[0]:
+            conditional_assertions = [{'precondition' : 'True',
+                                      'clauses' : conditional_assertions}]
+
+        compiled_conditional_assertions = []
+        for clause_set in conditional_assertions:
+            precondition = \
+                self._compile_condition(clause_set['precondition'])
+            exclusive = 'exclusive' in clause_set and clause_set['exclusive']
+            clauses = [(self._compile_condition(ca['condition']), 
+                        ABAC_Template(ca['assertion'])) \
+                           for ca in clause_set['clauses']]
+            compiled_conditional_assertions.append(\
+                (precondition, exclusive, clauses))
+        self._compiled_conditional_assertions = compiled_conditional_assertions
+
+        self._compiled_positive_queries = \
+            [self._compile_query(q) for q in self._positive_queries]
+        self._compiled_negative_queries = \
+            [self._compile_query(q) for q in self._negative_queries]
+
+        policy_graph = {}
+        for policy in self._policies:
+            ABAC_Proof_Graph.add_assertion(policy_graph, policy)
+        self._policy_graph = policy_graph
+
+    def _compile_condition(self, condition):
+        if condition not in self._compiled_conditions:
+            self._compiled_conditions[condition] = ABAC_Condition(condition)
+        return self._compiled_conditions[condition]
+
+    # Return (statement template, compiled condition or None, message)
+    def _compile_query(self, statement):
+        condition = None
+        if statement in self._query_condition_map:
+            condition = \
+                self._compile_condition(self._query_condition_map[statement])
+        return (ABAC_Template(statement), condition, 
+                self._query_message_map[statement])
+
     # Dump contents to stdout
     def dump(self):
         print "RULE SET : %s" % self._label
@@ -469,3 +852,10 @@ class ABAC_Authorizer_Rule_Set:
     def getQueryMessageMap(self): return self._query_message_map
     def getQueryConditionMap(self): return self._query_condition_map
     def getKeyIdNameMap(self) : return self._keyid_name_map
+    def getCompiledConditionalAssertions(self):
+        return self._compiled_conditional_assertions
+    def getCompiledPositiveQueries(self):
+        return self._compiled_positive_queries
+    def getCompiledNegativeQueries(self):
+        return self._compiled_negative_queries
+    def getPolicyGraph(self): return self._policy_graph
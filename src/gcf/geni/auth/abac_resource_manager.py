@@ -25,6 +25,7 @@ from __future__ import absolute_import
 
 import datetime
 import dateutil.parser
+import threading
 import types
 import xml.dom.minidom
 
@@ -32,6 +33,101 @@ from ...sfa.trust import gid
 from ...sfa.trust import credential
 from ..util.tz_util import tzd
 from .base_authorizer import AM_Methods, V2_Methods
+from .util import convert_slice_urn_to_project_urn, \
+    convert_user_urn_to_authority_urn
+
+# Ledger of the current slivers at an aggregate, for quota policies.
+# The aggregate updates it as slivers are allocated, renewed and deleted.
+# Slivers are indexed by the slice, user, project and authority they
+# count against, so the slivers relevant to a call are found without
+# looking at every sliver of the aggregate.
+# Sliver info entries are as from get_requested_allocation_state, with
+# native (naive UTC) datetimes for start_time and end_time.
+# generation changes whenever the ledger does.
+class Allocation_Ledger:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slivers = {} # sliver_urn => sliver info
+        self._index = {} # (context type, context urn) => set of sliver_urns
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._slivers)
+
+    # Return the (context type, context urn) keys a sliver counts against
+    @staticmethod
+    def _context_keys(slice_urn, user_urn):
+        keys = []
+        if slice_urn:
+            keys.append(('SLICE', slice_urn))
+            project_urn = convert_slice_urn_to_project_urn(slice_urn)
+            if project_urn:
+                keys.append(('PROJECT', project_urn))
+        if user_urn:
+            keys.append(('USER', user_urn))
+            keys.append(('AUTHORITY', 
+                         convert_user_urn_to_authority_urn(user_urn)))
+        return keys
+
+    # Record a new sliver, allocated by the given user
+    def add_sliver(self, sliver_urn, slice_urn, user_urn, 
+                   start_time, end_time, measurements):
+        entry = {'sliver_urn' : sliver_urn,
+                 'slice_urn' : slice_urn,
+                 'user_urn' : user_urn,
+                 'start_time' : start_time,
+                 'end_time' : end_time,
+                 'measurements' : measurements}
+        with self._lock:
+            self._remove_sliver(sliver_urn)
+            self._slivers[sliver_urn] = entry
+            for key in self._context_keys(slice_urn, user_urn):
+                if key not in self._index:
+                    self._index[key] = set()
+                self._index[key].add(sliver_urn)
+            self.generation += 1
+
+    # Change the start and/or end time of a sliver (e.g. on renew)
+    def update_sliver(self, sliver_urn, start_time=None, end_time=None):
+        with self._lock:
+            if sliver_urn not in self._slivers: return
+            entry = self._slivers[sliver_urn]
+            if start_time is not None:
+                entry['start_time'] = start_time
+            if end_time is not None:
+                entry['end_time'] = end_time
+            self.generation += 1
+
+    # Forget a deleted or expired sliver
+    def remove_sliver(self, sliver_urn):
+        with self._lock:
+            if self._remove_sliver(sliver_urn):
+                self.generation += 1
+
+    def _remove_sliver(self, sliver_urn):
+        if sliver_urn not in self._slivers: return False
+        entry = self._slivers.pop(sliver_urn)
+        for key in self._context_keys(entry['slice_urn'], entry['user_urn']):
+            if key in self._index:
+                self._index[key].discard(sliver_urn)
+                if not self._index[key]:
+                    del self._index[key]
+        return True
+
+    # Return copies of the sliver info of the slivers that count against
+    # the given slice (or its project) or user (or its authority)
+    def get_slivers(self, slice_urn=None, user_urn=None):
+        sliver_urns = set()
+        with self._lock:
+            for key in self._context_keys(slice_urn, user_urn):
+                if key in self._index:
+                    sliver_urns.update(self._index[key])
+            slivers = [dict(self._slivers[sliver_urn]) \
+                           for sliver_urn in sliver_urns]
+        for sliver_info in slivers:
+            sliver_info['measurements'] = dict(sliver_info['measurements'])
+        return slivers
 
 # Class to provide requested resource states
 # so that the authorizer can enforce resource quota policies
@@ -56,6 +152,12 @@ class Base_Resource_Manager:
                                        arguments, options,  creds):
         return []
 
+    # Return a value that changes whenever slivers are allocated or
+    # deallocated at the aggregate, or None if unknown.
+    # Cached authorization decisions are only used while it stays the same
+    def get_allocation_generation(self, aggregate_manager):
+        return None
+
 # Class for a Resource Manager for the GCF AM
 # We only compute a single metric, i.e. NODE (the number of nodes allocated)
 class GCFAM_Resource_Manager(Base_Resource_Manager):
@@ -63,6 +165,18 @@ class GCFAM_Resource_Manager(Base_Resource_Manager):
     def __init__(self):
         Base_Resource_Manager.__init__(self)
 
+    # The reference aggregates count changes to their allocation ledger
+    # or else to their resource catalog
+    def get_allocation_generation(self, aggregate_manager):
+        amd = aggregate_manager._delegate
+        ledger = getattr(amd, '_allocation_ledger', None)
+        if ledger is not None:
+            return ledger.generation
+        agg = getattr(amd, '_agg', None)
+        if agg is None:
+            return None
+        return agg.generation
+
     # Return combindation of current and requested allocations
     def get_requested_allocation_state(self, aggregate_manager, method_name,
                                        arguments, options, credentials):
@@ -105,8 +219,6 @@ class GCFAM_Resource_Manager(Base_Resource_Manager):
             if "geni_extend_alap" in options:
                 requested = min(expiration, requested)
 
-            requested = str(requested)
-
             # go over all slivers in curr_allocations and change end time
             # of those we're trying to change 
             # (slivers of slice or specific slivers)
@@ -128,13 +240,30 @@ class GCFAM_Resource_Manager(Base_Resource_Manager):
             return []
 
 
-    # Get all current slivers and return them in proper format
+    # Get current slivers and return them in proper format
+    # If the aggregate keeps an allocation ledger, only the slivers
+    # of the caller, the slice and their authority and project are returned
+    # (the only ones that count towards quotas in the call's context)
     def get_current_allocations(self, aggregate_manager,
                                 arguments, method_name, options, creds):
 
+        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
+        ledger = getattr(aggregate_manager._delegate, 
+                         '_allocation_ledger', None)
+        if ledger is not None:
+            slice_urn = None
+            if 'slice_urn' in arguments:
+                slice_urn = arguments['slice_urn']
+            elif 'urns' in arguments:
+                # Renew_V3 names the slice or its slivers in urns
+                the_slice, slivers = \
+                    aggregate_manager._delegate.decode_urns(arguments['urns'])
+                if the_slice is not None:
+                    slice_urn = the_slice.urn
+            return ledger.get_slivers(slice_urn, user_urn)
+
         sliver_info = []
         slices = aggregate_manager._delegate._slices
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
 
         for slice_urn, slice_obj in slices.items():
             self.add_sliver_info_for_slice(slice_obj, sliver_info, 
@@ -152,8 +281,8 @@ class GCFAM_Resource_Manager(Base_Resource_Manager):
                 entry = {'sliver_urn' : sliver_urn,
                          'slice_urn' : slice_urn,
                          'user_urn' : user_urn,
-                         'start_time' : str(datetime.datetime.utcnow()),
-                         'end_time' : str(slice_obj.expiration),
+                         'start_time' : datetime.datetime.utcnow(),
+                         'end_time' : slice_obj.expiration,
                          'measurements' : {'NODE' : 1}}
                 sliver_info.append(entry)
         else:
@@ -161,8 +290,8 @@ class GCFAM_Resource_Manager(Base_Resource_Manager):
                 entry = {'sliver_urn' : sliver.urn(),
                          'slice_urn' : slice_urn,
                          'user_urn' : user_urn,
-                         'start_time' : str(sliver.startTime()),
-                         'end_time' : str(sliver.endTime()),
+                         'start_time' : sliver.startTime(),
+                         'end_time' : sliver.endTime(),
                          'measurements' : {'NODE' : 1}}
                 sliver_info.append(entry)
 
@@ -199,8 +328,8 @@ class GCFAM_Resource_Manager(Base_Resource_Manager):
                 entry = {'sliver_urn' : 'not_set_yet',
                          'slice_urn' : slice_urn,
                          'user_urn' : user_urn,
-                         'start_time' : str(start_time),
-                         'end_time' : str(end_time),
+                         'start_time' : start_time,
+                         'end_time' : end_time,
                          'measurements' : {'NODE' : 1}}
                 sliver_info.append(entry)
 
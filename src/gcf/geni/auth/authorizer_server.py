@@ -42,6 +42,8 @@ def parse_args(argv):
     parser.add_option("--port", help="Port number for server")
     parser.add_option("--authorizer_policy_map_file", 
                       help="JSON policy map file")
+    parser.add_option("--authorizer_policy_reload_interval", type=int,
+                      help="Seconds between checks for changed policy files (0 = never reload; default 10)")
     parser.add_option("--authorizer", 
                       help="class name for authorizer", 
                       default="gcf.geni.auth.abac_authorizer.ABAC_Authorizer")
@@ -89,6 +89,12 @@ class Base_Authorizer(object):
                                   (method, caller_urn, len(creds), \
                                        args.keys(), opts.keys()))
 
+    # Call listener() whenever the policies behind authorize change,
+    # so that callers may drop decisions they remember.
+    # The base authorizer's policies never change.
+    def add_policy_listener(self, listener):
+        pass
+
     # Validate that the given set of arguments and options are
     # appropriate for this method
     # Raise an exception if not, or 
@@ -27,6 +27,7 @@ from .util import *
 from .binders import Base_Binder
 from ...sfa.trust import gid
 
+import bisect
 import dateutil.parser
 
 # A class to compute resource bindings from a set of 
@@ -79,8 +80,13 @@ class Resource_Binder(Base_Binder):
         user_urn = sliver_info['user_urn']
         project_urn = None
         authority_urn = None
-        start_time = dateutil.parser.parse(sliver_info['start_time'])
-        end_time = dateutil.parser.parse(sliver_info['end_time'])
+        start_time = sliver_info['start_time']
+        end_time = sliver_info['end_time']
+        # Resource managers may give times as strings
+        if isinstance(start_time, basestring):
+            start_time = dateutil.parser.parse(start_time)
+        if isinstance(end_time, basestring):
+            end_time = dateutil.parser.parse(end_time)
         measurements = sliver_info['measurements']
 
         if slice_urn:
@@ -234,53 +240,88 @@ class HOURS_ResourceMeasurementState(Base_ResourceMeasurementState):
 class MAX_ResourceMeasurementState(Base_ResourceMeasurementState):
     def __init__(self, urn_type, meas_type):
         Base_ResourceMeasurementState.__init__(self, urn_type, meas_type)
-        # Maintain list of times
-        self._times = set()
-
         # Maintain list of [value, start, end] tuples
         self._entries = []
+        self._profile = None
 
     def update(self, start_time, end_time, value, sliver_info):
-        # Register times
-        self._times.add(start_time)
-        self._times.add(end_time)
-
         # Registry entry for later 'MAX' calculation
         self._entries.append((start_time, end_time, value))
+        self._profile = None
 
+    # Return the Resource_Usage_Profile of the entries so far
+    def getProfile(self):
+        if self._profile is None:
+            self._profile = Resource_Usage_Profile(self._entries)
+        return self._profile
 
-    def getBindings(self):
-
-        # Get a sorted list of all the start/end times
-        time_boundaries = [tm for tm in self._times]
-        time_boundaries.sort()
-
-        # Collect totals for each window [i:i+1] in bin [i]
-        totals = [0 for i in range(len(time_boundaries)-1)]
-
-        # For each entry, add the value to the right bins if
-        # entry overlaps the time window of that bin
-        # In so doing, compute max_total
-        #
-        # Note: we treat start_time as first included time
-        # end_times as NON-included time
-        max_total = 0
-        for entry in self._entries:
-            entry_start = entry[0]
-            entry_end = entry[1]
-            value = entry[2]
-            for i in range(len(totals)):
-                boundary_start = time_boundaries[i]
-                boundary_end = time_boundaries[i+1]
-                no_overlap =  entry_start >= boundary_end or \
-                    entry_end <= boundary_start;
-                if not no_overlap:
-                    totals[i] = totals[i] + value
-                    max_total = max(totals[i], max_total)
+    # Maximum total of simultaneous values in the window [start, end)
+    def getMaxInWindow(self, window_start, window_end):
+        return self.getProfile().max_in_window(window_start, window_end)
 
+    def getBindings(self):
+        max_total = self.getProfile().max_total()
         max_key = "$%s_%s_%s" % (self._urn_type, self._meas_type, 'MAX')
         return {max_key : str(max_total) }
 
+# The total of (start, end, value) entries over time: a step function
+# computed by sorting the entry start and end times (a sweep line).
+# Note: we treat start_time as first included time
+# end_times as NON-included time. Entries that don't end after
+# they start are ignored.
+# The steps are kept in a segment tree to find the maximum total
+# over any window of time.
+class Resource_Usage_Profile:
+    def __init__(self, entries):
+        changes = {} # time => change of the total at that time
+        for entry_start, entry_end, value in entries:
+            if not entry_start < entry_end: continue
+            changes[entry_start] = changes.get(entry_start, 0) + value
+            changes[entry_end] = changes.get(entry_end, 0) - value
+
+        # Total from times[i] up to times[i+1]
+        self._times = sorted(changes.keys())
+        self._totals = []
+        total = 0
+        for tm in self._times:
+            total = total + changes[tm]
+            self._totals.append(total)
+
+        # Segment tree of maximum totals: leaves at [size, 2*size)
+        self._size = 1
+        while self._size < len(self._totals):
+            self._size = self._size * 2
+        self._tree = [0] * (2 * self._size)
+        self._tree[self._size:self._size + len(self._totals)] = self._totals
+        for i in range(self._size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2*i], self._tree[2*i+1])
+
+    # Maximum total at any time (0 if there are no entries)
+    def max_total(self):
+        return max(self._tree[1], 0)
+
+    # Maximum total at any time in the window [start, end)
+    # (0 if there are no entries in the window)
+    def max_in_window(self, window_start, window_end):
+        if not window_start < window_end: return 0
+        # Steps overlapping the window: the one in effect at window_start
+        # through the last one starting before window_end
+        first = max(bisect.bisect_right(self._times, window_start) - 1, 0)
+        last = bisect.bisect_left(self._times, window_end)
+        max_total = 0
+        low = first + self._size
+        high = last + self._size
+        while low < high:
+            if low & 1:
+                max_total = max(max_total, self._tree[low])
+                low = low + 1
+            if high & 1:
+                high = high - 1
+                max_total = max(max_total, self._tree[high])
+            low = low / 2
+            high = high / 2
+        return max_total
+
 # ResourceMeasurementState sub-Class to compute the 
 # number of slices at which a user has slivers
 class User_Slice_ResourceMeasurementState(Base_ResourceMeasurementState):
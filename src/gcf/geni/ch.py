@@ -38,6 +38,7 @@ import dateutil.parser
 
 from .SecureXMLRPCServer import SecureXMLRPCServer
 from .SecureThreadedXMLRPCServer import SecureThreadedXMLRPCServer, SecureThreadedXMLRPCRequestHandler
+from .SecurePoolXMLRPCServer import SecurePoolXMLRPCServer
 from .util import cred_util
 from .util import cert_util
 from .util.tz_util import tzd
@@ -209,7 +210,16 @@ class Clearinghouse(object):
         debug = False
         if self.config.has_key('debug'):
             debug = self.config['debug']
-        if THREADED:
+        if THREADED and self.config.get('workers'):
+            # Handle requests on a bounded pool of worker threads
+            return SecurePoolXMLRPCServer(addr, logRequests=debug, \
+                                              keyfile=keyfile, \
+                                              certfile=certfile, \
+                                              ca_certs=ca_certs, \
+                                              workers=self.config['workers'], \
+                                              queue_size=self.config.get('request_queue'), \
+                                              request_timeout=self.config.get('request_timeout'))
+        elif THREADED:
             return SecureThreadedXMLRPCServer(addr, logRequests=debug, \
                                                   keyfile=keyfile, \
                                                   certfile=certfile, \
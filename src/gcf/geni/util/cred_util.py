@@ -32,6 +32,8 @@ import xmlrpclib
 import sys
 import datetime
 import dateutil
+import hashlib
+import threading
 
 from ...sfa.trust import credential as cred
 from ...sfa.trust import gid
@@ -40,6 +42,7 @@ from ...sfa.util.xrn import hrn_authfor_hrn
 from ...sfa.trust.credential_factory import CredentialFactory
 from ...sfa.trust.abac_credential import ABACCredential
 from ...sfa.trust.certificate import Certificate
+from ...sfa.trust.truststore import TrustStore
 
 from .speaksfor_util import determine_speaks_for
 
@@ -56,20 +59,122 @@ def naiveUTC(dt):
         dt = dt.replace(tzinfo=None)
     return dt
 
+def _cert_expiration(cert):
+    '''Return the notAfter time of the given Certificate as a naive UTC datetime, or None'''
+    try:
+        notAfter = cert.cert.get_notAfter()
+        return datetime.datetime.strptime(notAfter[:14], "%Y%m%d%H%M%S")
+    except Exception:
+        return None
+
+def earliest_expiration(credential):
+    '''Return the earliest expiration (naive UTC) of the given credential,
+    any parent (delegated from) credentials, and all the certificates
+    (and their parent certificates) of the callers, targets and signers
+    of those credentials.'''
+    expirations = []
+    certs = []
+    for cur_cred in credential.get_credential_list():
+        expirations.append(naiveUTC(cur_cred.get_expiration()))
+        certs.append(cur_cred.get_gid_caller())
+        certs.append(cur_cred.get_gid_object())
+        if cur_cred.get_signature() is not None:
+            certs.append(cur_cred.get_signature().get_issuer_gid())
+    for cert in certs:
+        while cert is not None:
+            exp = _cert_expiration(cert)
+            if exp is not None:
+                expirations.append(exp)
+            cert = cert.get_parent()
+    return min(expirations)
+
+class VerifiedCredentialCache(object):
+    '''Bounded least recently used cache of credentials that verified
+    successfully against a given set of trusted roots.
+    Keys are a digest of the credential XML plus a fingerprint of the trusted roots.
+    Entries are dropped when they reach the earliest expiration of the credential
+    or any certificate in its chain.
+    Counts hits and misses for monitoring (see get_stats).'''
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = dict() # key -> [expiration, last use counter]
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(cred_xml, roots_fingerprint):
+        '''Key for the given credential XML string verified against the given trusted roots'''
+        if isinstance(cred_xml, unicode):
+            cred_xml = cred_xml.encode('utf-8')
+        return (hashlib.sha256(cred_xml).hexdigest(), roots_fingerprint)
+
+    def lookup(self, key):
+        '''Return True if the credential with this key verified previously and has not since expired.'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= datetime.datetime.utcnow():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False
+            self._counter += 1
+            entry[1] = self._counter
+            self.hits += 1
+            return True
+
+    def add(self, key, expiration):
+        '''Remember that the credential with this key verified, until the given expiration'''
+        if expiration is None or expiration <= datetime.datetime.utcnow():
+            return
+        with self._lock:
+            if not self._entries.has_key(key) and len(self._entries) >= self.max_entries:
+                # Evict the least recently used entry
+                oldest = min(self._entries.iterkeys(), key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+                self.evictions += 1
+            self._counter += 1
+            self._entries[key] = [expiration, self._counter]
+
+    def clear(self):
+        '''Forget all verified credentials'''
+        with self._lock:
+            self._entries = dict()
+
+    def get_stats(self):
+        '''Return a dictionary of cache size, hits, misses and evictions'''
+        with self._lock:
+            return dict(size=len(self._entries), hits=self.hits,
+                        misses=self.misses, evictions=self.evictions)
+
 class CredentialVerifier(object):
     """Utilities to verify signed credentials from a given set of 
     root certificates. Will compare target and source URNs, and privileges.
-    See verify and verify_from_strings methods in particular."""
+    See verify and verify_from_strings methods in particular.
+    Credentials that verify are remembered (see VerifiedCredentialCache)
+    until they expire or the trusted roots change."""
 
     CATEDCERTSFNAME = 'CATedCACerts.pem'
 
     # root_cert_fileordir is a trusted root cert file or directory of
     # trusted roots for verifying credentials
-    def __init__(self, root_cert_fileordir):
+    def __init__(self, root_cert_fileordir, cache_size=1000):
         self.logger = logging.getLogger('cred-verifier')
         if root_cert_fileordir is None:
             raise Exception("Missing Root certs argument")
-        elif os.path.isdir(root_cert_fileordir):
+        self.root_cert_fileordir = root_cert_fileordir
+        self.verified_cache = VerifiedCredentialCache(cache_size)
+        self._load_root_cert_files()
+
+    def _load_root_cert_files(self):
+        '''Find the trusted root cert files, and note their fingerprint
+        so we can tell when they change.'''
+        root_cert_fileordir = self.root_cert_fileordir
+        if os.path.isdir(root_cert_fileordir):
             files = os.listdir(root_cert_fileordir)
             self.root_cert_files = []
             for file in files:
@@ -83,6 +188,66 @@ class CredentialVerifier(object):
             self.root_cert_files = [root_cert_fileordir]
         else:
             raise Exception("Couldn't find Root certs in %s" % root_cert_fileordir)
+        # Preload and index the trusted roots for verifying cert chains
+        self.trust_store = TrustStore(root_cert_fileordir,
+                                      ignore_files=[CredentialVerifier.CATEDCERTSFNAME])
+        self.roots_fingerprint = self._roots_fingerprint()
+
+    def _roots_fingerprint(self):
+        '''Digest of the trusted roots location and the name, size and
+        modification time of each trusted root cert file.'''
+        h = hashlib.sha1()
+        try:
+            h.update("%s %r" % (self.root_cert_fileordir, os.path.getmtime(self.root_cert_fileordir)))
+        except OSError:
+            pass
+        for f in sorted(self.root_cert_files):
+            try:
+                st = os.stat(f)
+                h.update("%s %d %r" % (f, st.st_size, st.st_mtime))
+            except OSError:
+                h.update(f)
+        return h.hexdigest()
+
+    def check_trusted_roots(self):
+        '''If the trusted roots changed since we loaded them, reload them
+        and forget all previously verified credentials.'''
+        try:
+            changed = (self._roots_fingerprint() != self.roots_fingerprint)
+        except Exception:
+            changed = True
+        if changed:
+            self.logger.info("Trusted roots in %s changed: reloading and clearing verified credential cache", self.root_cert_fileordir)
+            self.invalidate_cache()
+            self._load_root_cert_files()
+
+    def invalidate_cache(self):
+        '''Forget all previously verified credentials'''
+        self.verified_cache.clear()
+
+    def get_cache_stats(self):
+        '''Return a dictionary of verified credential cache size, hits, misses and evictions'''
+        return self.verified_cache.get_stats()
+
+    def _verify_signatures(self, cred):
+        '''Verify the signatures and certificate chains of the given credential,
+        using the verified credential cache. Return True if it verified,
+        else False or raise an Exception (as Credential.verify).'''
+        key = None
+        try:
+            key = VerifiedCredentialCache.make_key(cred.get_xml(), self.roots_fingerprint)
+        except Exception, exc:
+            self.logger.debug("Cannot cache verification of credential: %s", exc)
+        if key is not None and self.verified_cache.lookup(key):
+            return True
+        if not cred.verify(self.trust_store):
+            return False
+        if key is not None:
+            try:
+                self.verified_cache.add(key, earliest_expiration(cred))
+            except Exception, exc:
+                self.logger.debug("Failed to cache verified credential: %s", exc)
+        return True
 
 
     @classmethod
@@ -134,9 +299,8 @@ class CredentialVerifier(object):
 
     # Get the GID of the caller, substituting the real user if this is a 'speaks-for' invocation
     def get_caller_gid(self, gid_string, cred_strings, options=None):
-        root_certs = \
-            [Certificate(filename=root_cert_file) \
-                 for root_cert_file in self.root_cert_files]
+        self.check_trusted_roots()
+        root_certs = self.trust_store
 
         caller_gid = gid.GID(string=gid_string)
 
@@ -250,6 +414,7 @@ class CredentialVerifier(object):
         # The semantics of the list of credentials is under specified.
 
         self.logger.debug('Verifying privileges')
+        self.check_trusted_roots()
         result = list()
         failure = ""
         tried_creds = ""
@@ -292,7 +457,7 @@ class CredentialVerifier(object):
                 continue
 
             try:
-                if not cred.verify(self.root_cert_files):
+                if not self._verify_signatures(cred):
                     failure = "Couldn't validate credential for caller %s with target %s with any of %d known root certs" % (cred.get_gid_caller().get_urn(), cred.get_gid_object().get_urn(), len(self.root_cert_files))
                     continue
             except Exception, exc:
@@ -302,6 +467,7 @@ class CredentialVerifier(object):
             # If got here it verified
             result.append(cred)
 
+        self.logger.debug("Verified credential cache: %s", self.get_cache_stats())
         if result and result != list():
             # At least one credential verified ok and was added to the list
             # return that list
@@ -51,12 +51,14 @@ try:
     from ...sfa.trust.credential import Credential, signature_template, HAVELXML
     from ...sfa.trust.credential_factory import CredentialFactory
     from ...sfa.trust.gid import GID
+    from ...sfa.trust.xmlsig import get_signature_verifier
 except:
     from gcf.sfa.trust.abac_credential import ABACCredential, ABACElement
     from gcf.sfa.trust.certificate import Certificate
     from gcf.sfa.trust.credential import Credential, signature_template, HAVELXML
     from gcf.sfa.trust.credential_factory import CredentialFactory
     from gcf.sfa.trust.gid import GID
+    from gcf.sfa.trust.xmlsig import get_signature_verifier
 
 # Routine to validate that a speaks-for credential 
 # says what it claims to say:
@@ -179,29 +181,14 @@ def verify_speaks_for(cred, tool_gid, speaking_for_urn, \
     principal_keyid = head.get_principal_keyid()
     role = head.get_role()
 
-    # Credential must pass xmlsec1 verify
-    cred_file = write_to_tempfile(cred.save_to_string())
-    cert_args = []
+    # Credential must pass signature verification (xmlsec1 or native)
+    trusted_root_files = []
     if trusted_roots:
-        for x in trusted_roots:
-            cert_args += ['--trusted-pem', x.filename]
-    # FIXME: Why do we not need to specify the --node-id option as credential.py does?
-    xmlsec1_args = [cred.xmlsec_path, '--verify'] + cert_args + [ cred_file]
-    output = run_subprocess(xmlsec1_args, stdout=None, stderr=subprocess.PIPE)
-    os.unlink(cred_file)
-    if output != 0:
-        # FIXME
-        # xmlsec errors have a msg= which is the interesting bit.
-        # But does this go to stderr or stdout? Do we have it here?
-        mstart = verified.find("msg=")
-        msg = ""
-        if mstart > -1 and len(verified) > 4:
-            mstart = mstart + 4
-            mend = verified.find('\\', mstart)
-            msg = verified[mstart:mend]
-        if msg == "":
-            msg = output
-        return False, None, "ABAC credential failed to xmlsec1 verify: %s" % msg
+        trusted_root_files = [x.filename for x in trusted_roots]
+    error = get_signature_verifier().verify(cred.save_to_string(), None,
+                                            trusted_root_files, trusted_roots)
+    if error is not None:
+        return False, None, "ABAC credential failed to verify: %s" % error
 
     # Must say U.speaks_for(U)<-T
     if user_keyid != principal_keyid or \
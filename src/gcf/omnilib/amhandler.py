@@ -30,7 +30,7 @@ Omni AM API Call Handler
 Handle calls to AM API functions
 """
 
-from copy import copy
+from copy import copy, deepcopy
 import datetime
 import dateutil.parser
 import json
@@ -39,8 +39,17 @@ import os
 import pprint
 import re
 import string
+import sys
+import tempfile
+import threading
 import zlib
 
+try:
+    import fcntl
+except ImportError:
+    # No file locking (eg on Windows): concurrent Omni runs may overwrite each others GetVersion cache entries
+    fcntl = None
+
 from .util import OmniError, NoSliceCredError, RefusedError, naiveUTC, AMAPIError
 from .util.dossl import _do_ssl
 from .util.abac import get_abac_creds, save_abac_creds, save_proof, is_ABAC_framework
@@ -51,6 +60,7 @@ from .util.handler_utils import _listaggregates, validate_url, _get_slice_cred,
     _getRSpecOutput, _writeRSpec, _printResults, _load_cred, _lookupAggNick, \
     expires_from_rspec, expires_from_status
 from .util.json_encoding import DateTimeAwareJSONEncoder, DateTimeAwareJSONDecoder
+from .util.parallel import ThreadLogCapture, replay_log_records, run_in_parallel, SerializedCalls
 from .xmlrpc import client as xmlrpcclient
 from .util.files import *
 from .util.credparsing import *
@@ -67,6 +77,7 @@ class BadClientException(Exception):
 
 class AMCallHandler(object):
     '''Dispatch AM API calls to aggregates'''
+
     def __init__(self, framework, config, opts):
         self.framework = framework
         self.logger = config['logger']
@@ -74,7 +85,9 @@ class AMCallHandler(object):
         self.config = config
         self.opts = opts # command line options as parsed
         self.GetVersionCache = None # The cache of GetVersion info in memory
+        self.GetVersionCacheDirty = set() # URLs of AMs whose GetVersion cache entry changed since it was saved
         self.clients = None # XMLRPC clients for talking to AMs
+        self.cacheLock = threading.RLock() # Protects the GetVersion cache when calling AMs in parallel
         if self.opts.abac:
             aconf = self.config['selected_framework']
             if 'abac' in aconf and 'abac_log' in aconf:
@@ -403,7 +416,7 @@ class AMCallHandler(object):
         if not self.opts.noGetVersionCache:
             cachedVersion = self._get_cached_getversion(client)
         # FIXME: What if cached entry had an error? Should I retry then?
-        if self.opts.noGetVersionCache or cachedVersion is None or (self.opts.GetVersionCacheOldestDate and cachedVersion['timestamp'] < self.opts.GetVersionCacheOldestDate):
+        if self.opts.noGetVersionCache or cachedVersion is None or self._is_getversion_cache_expired(cachedVersion):
             self.logger.debug("Actually calling GetVersion")
             if self.opts.noGetVersionCache:
                 self.logger.debug(" ... opts.noGetVersionCache set")
@@ -468,9 +481,14 @@ class AMCallHandler(object):
             return ""
 
     def _save_getversion_cache(self):
-        '''Write GetVersionCache object to file as JSON (creating it and directories if needed)'''
+        '''Write changed GetVersionCache entries to file as JSON (creating it and directories if needed).
+        The file is locked while it is re-read, merged with our changes and replaced,
+        so concurrent Omni runs add to rather than overwrite each others entries.
+        The new contents are written to a temporary file that is renamed into place,
+        so readers never see a partial file.'''
         #client url->
         #      timestamp (a datetime.datetime)
+        #      ttl (seconds the entry is good for after timestamp)
         #      version struct, including code/value/etc as appropriate
         #      urn
         #      url
@@ -478,16 +496,63 @@ class AMCallHandler(object):
         if self.opts.noCacheFiles:
             self.logger.debug("Per option noCacheFiles, not saving GetVersion cache")
             return
-        fdir = os.path.dirname(self.opts.getversionCacheName)
-        if fdir and fdir != "":
-            if not os.path.exists(fdir):
-                os.makedirs(fdir)
-        try:
-            with open(self.opts.getversionCacheName, 'w') as f:
-                json.dump(self.GetVersionCache, f, cls=DateTimeAwareJSONEncoder)
-            self.logger.debug("Wrote GetVersionCache to %s", self.opts.getversionCacheName)
-        except Exception, e:
-            self.logger.error("Failed to write GetVersion cache: %s", e)
+        with self.cacheLock:
+            if not self.GetVersionCacheDirty or self.GetVersionCache is None:
+                return
+            fname = self.opts.getversionCacheName
+            fdir = os.path.dirname(fname)
+            if fdir and fdir != "":
+                if not os.path.exists(fdir):
+                    os.makedirs(fdir)
+            else:
+                fdir = "."
+            lockf = None
+            tmpname = None
+            try:
+                lockf = open(fname + ".lock", 'a')
+                if fcntl:
+                    fcntl.flock(lockf.fileno(), fcntl.LOCK_EX)
+
+                # Merge our changes into what is on disk now: the newest entry for each AM wins
+                merged = self._read_getversion_cache_file()
+                for url in self.GetVersionCacheDirty:
+                    if not self.GetVersionCache.has_key(url):
+                        continue
+                    mine = self.GetVersionCache[url]
+                    theirs = merged.get(url)
+                    if not isinstance(theirs, dict) or theirs.get('timestamp', datetime.datetime.min) <= mine['timestamp']:
+                        merged[url] = mine
+
+                (fd, tmpname) = tempfile.mkstemp(dir=fdir, prefix=os.path.basename(fname) + ".")
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(merged, f, cls=DateTimeAwareJSONEncoder)
+                if os.name == 'nt' and os.path.exists(fname):
+                    # Windows rename won't replace an existing file
+                    os.remove(fname)
+                os.rename(tmpname, fname)
+                tmpname = None
+                self.GetVersionCache = merged
+                self.GetVersionCacheDirty = set()
+                self.logger.debug("Wrote GetVersionCache to %s", fname)
+            except Exception, e:
+                self.logger.error("Failed to write GetVersion cache: %s", e)
+            finally:
+                if tmpname and os.path.exists(tmpname):
+                    os.remove(tmpname)
+                if lockf:
+                    # Closing the file releases the lock
+                    lockf.close()
+
+    def _read_getversion_cache_file(self):
+        '''Return the GetVersion cache from the JSON encoded file, or an empty dictionary'''
+        fname = self.opts.getversionCacheName
+        if not os.path.exists(fname) or os.path.getsize(fname) < 1:
+            return {}
+        with open(fname, 'r') as f:
+            cache = json.load(f, encoding='ascii', cls=DateTimeAwareJSONDecoder)
+        if not isinstance(cache, dict):
+            return {}
+        return cache
 
     def _load_getversion_cache(self):
         '''Load GetVersion cache from JSON encoded file, if any'''
@@ -495,27 +560,40 @@ class AMCallHandler(object):
         if self.opts.noCacheFiles:
             self.logger.debug("Per option noCacheFiles, not loading get version cache")
             return
-        #client url->
-        #      timestamp (a datetime.datetime)
-        #      version struct, including code/value/etc as appropriate
-        #      urn
-        #      url
-        #      lasterror
-        if not os.path.exists(self.opts.getversionCacheName) or os.path.getsize(self.opts.getversionCacheName) < 1:
-            return
         try:
-            with open(self.opts.getversionCacheName, 'r') as f:
-                self.GetVersionCache = json.load(f, encoding='ascii', cls=DateTimeAwareJSONDecoder)
+            self.GetVersionCache = self._read_getversion_cache_file()
             self.logger.debug("Read GetVersionCache from %s", self.opts.getversionCacheName)
         except Exception, e:
             self.logger.error("Failed to read GetVersion cache: %s", e)
 
-    # FIXME: This saves every time we add to the cache. Is that right?
+    def _getversion_cache_ttl(self):
+        '''Seconds that a new GetVersion cache entry is good for, per --GetVersionCacheAge'''
+        try:
+            return int(float(self.opts.GetVersionCacheAge) * 24 * 60 * 60)
+        except Exception:
+            return 7 * 24 * 60 * 60
+
+    def _is_getversion_cache_expired(self, cachedVersion):
+        '''Is this GetVersion cache entry past its own TTL, or older than --GetVersionCacheAge allows?'''
+        timestamp = cachedVersion.get('timestamp')
+        if not isinstance(timestamp, datetime.datetime):
+            return True
+        if cachedVersion.has_key('ttl') and cachedVersion['ttl'] is not None:
+            try:
+                if timestamp + datetime.timedelta(seconds=int(cachedVersion['ttl'])) < datetime.datetime.utcnow():
+                    return True
+            except (OverflowError, ValueError, TypeError):
+                return True
+        if self.opts.GetVersionCacheOldestDate and timestamp < self.opts.GetVersionCacheOldestDate:
+            return True
+        return False
+
     def _cache_getversion(self, client, thisVersion, error=None):
         '''Add to Cache the GetVersion output for this AM.
         If this was an error, don't over-write any existing good result, but record the error message
 
-        This methods both loads and saves the cache from file.
+        This methods loads the cache from file if needed. Changes are saved
+        when the command is done (see _save_getversion_cache).
         '''
         # url, urn, timestamp, apiversion, rspecversions (type version, type version, ..), credtypes (type version, ..), single_alloc, allocate, last error and message
         res = {}
@@ -527,6 +605,7 @@ class AMCallHandler(object):
             res['timestamp'] = datetime.datetime.min
         else:
             res['timestamp'] = datetime.datetime.utcnow()
+        res['ttl'] = self._getversion_cache_ttl()
         res['version'] = thisVersion
         if client is not None and client.urn is not None and str(client.urn).strip() != "":
             res['urn'] = client.urn
@@ -539,20 +618,21 @@ class AMCallHandler(object):
         else:
             res['url'] = "unspecified_AM_URL"
         res['error'] = error
-        if self.GetVersionCache is None:
-            # Read the file as serialized JSON
-            self._load_getversion_cache()
-        if error:
-            # On error, leave existing data alone - just record the last error
-            if self.GetVersionCache.has_key(client.url):
-                self.GetVersionCache[client.url]['lasterror'] = error
-            self.logger.debug("Added GetVersion error output to cache for %s: %s", client.url, error)
-        else:
-            self.GetVersionCache[client.url] = res
-            self.logger.debug("Added GetVersion success output to cache for %s", client.url)
-
-        # Write the file as serialized JSON
-        self._save_getversion_cache()
+        # AMs may be called in parallel (see _call_clients)
+        with self.cacheLock:
+            if self.GetVersionCache is None:
+                # Read the file as serialized JSON
+                self._load_getversion_cache()
+            if error:
+                # On error, leave existing data alone - just record the last error
+                if self.GetVersionCache.has_key(client.url):
+                    self.GetVersionCache[client.url]['lasterror'] = error
+                    self.GetVersionCacheDirty.add(client.url)
+                self.logger.debug("Added GetVersion error output to cache for %s: %s", client.url, error)
+            else:
+                self.GetVersionCache[client.url] = res
+                self.GetVersionCacheDirty.add(client.url)
+                self.logger.debug("Added GetVersion success output to cache for %s", client.url)
 
     def _get_cached_getversion(self, client):
         '''Get GetVersion from cache or this AM, if any.'''
@@ -781,6 +861,60 @@ class AMCallHandler(object):
         #self.logger.debug("Doing SSL/XMLRPC call to %s invoking %s with args %r", client.url, op, args)
         return _do_ssl(self.framework, None, msg, getattr(client, op), *args), client
 
+    def _call_clients(self, clientList, func):
+        '''Call func(client) for each of the given clients. Generates
+        (client, return value of func) in clientList order.
+        func does the work for one aggregate, and returns what that adds to
+        the results of the command: it must not change state shared between
+        clients. The caller adds each return value to its results in turn.
+
+        With --parallel N and 2 or more clients, up to N clients are called at
+        once from a pool of threads, and all calls are done before the first is
+        generated. Log messages and output of each call are held, and emitted
+        as that client is generated, so they stay grouped per aggregate in the
+        usual order. Framework (clearinghouse) calls are made one at a time.
+        If func raised an exception, it is raised when that client is reached.'''
+        maxThreads = getattr(self.opts, 'parallel', 1)
+        if not maxThreads or maxThreads <= 1 or len(clientList) < 2:
+            for client in clientList:
+                yield (client, func(client))
+            return
+
+        # Set up the caches before using threads
+        if self.GetVersionCache is None:
+            self._load_getversion_cache()
+        if not hasattr(self, 'gvValueCache'):
+            self.gvValueCache = dict()
+
+        capture = ThreadLogCapture()
+
+        def callHoldingOutput(client):
+            held = capture.hold()
+            try:
+                try:
+                    return (held, func(client), None)
+                except:
+                    return (held, None, sys.exc_info())
+            finally:
+                capture.release()
+
+        self.logger.debug("Calling %d aggregates using up to %d threads", len(clientList), maxThreads)
+        framework = self.framework
+        self.framework = SerializedCalls(framework)
+        capture.install()
+        try:
+            results = run_in_parallel(callHoldingOutput, clientList, maxThreads)
+        finally:
+            capture.uninstall()
+            self.framework = framework
+
+        for (client, ((held, ret, excinfo), unused)) in zip(clientList, results):
+            replay_log_records(held)
+            if excinfo is not None:
+                raise excinfo[0], excinfo[1], excinfo[2]
+            yield (client, ret)
+    # End of _call_clients
+
     # FIXME: Must still factor dev vs exp
     # For experimenters: If exactly 1 AM, then show only the value slot, formatted nicely, printed to STDOUT.
     # If it fails, show only why
@@ -1154,8 +1288,31 @@ class AMCallHandler(object):
             creds = _maybe_add_abac_creds(self.framework, cred)
             creds = self._maybe_add_creds_from_files(creds)
 
-        # Connect to each available GENI AM to list their resources
-        for client in clientList:
+        # Message separators, as this loop has always added them
+        def addSkipped(mymessage, text):
+            if mymessage:
+                if not mymessage.endswith('.'):
+                    mymessage += ".\n"
+                else:
+                    mymessage += "\n"
+            return mymessage + text
+        def addNoResources(mymessage, text):
+            if mymessage != "":
+                if mymessage.endswith('.'):
+                    mymessage += ' '
+                else:
+                    mymessage += ". "
+            return mymessage + text
+        def addSentence(mymessage, text):
+            if mymessage != "":
+                mymessage += ". "
+            return mymessage + text
+
+        # List the resources at one AM. Returns the messages to add to mymessage
+        # (as (add function, text)), and if the AM was called, the client called
+        # (maybe with a corrected URL), the result and whether it gave an RSpec
+        def listResourcesAt(client):
+            messages = []
             if creds is None or len(creds) == 0:
                 self.logger.debug("Have null or empty credential list in call to ListResources!")
             rspec = None
@@ -1163,13 +1320,6 @@ class AMCallHandler(object):
             (ver, newc, validMsg) = self._checkValidClient(client)
             if newc is None:
                 if validMsg and validMsg != '':
-                    if not mymessage:
-                        mymessage = ""
-                    else:
-                        if not mymessage.endswith('.'):
-                            mymessage += ".\n"
-                        else:
-                            mymyessage += "\n"
                     if "Operation timed out" in validMsg:
                         validMsg = validMsg[validMsg.find("Operation timed out"):]
                     elif "Unknown socket error" in validMsg:
@@ -1178,31 +1328,24 @@ class AMCallHandler(object):
                         validMsg = validMsg[validMsg.find("Server does not trust"):]
                     elif "Your user certificate" in validMsg:
                         validMsg = validMsg[validMsg.find("Your user certificate"):]
-                    mymessage += "Skipped AM %s: %s" % (client.str, validMsg)
+                    messages.append((addSkipped, "Skipped AM %s: %s" % (client.str, validMsg)))
 
                 # Theoretically could remove this client from clients list, but currently 
                 # nothing uses client list after this, so no need.
                 # Plus, editing the client list inside the loop is bad
-                continue
+                return (messages, None, None, False)
             elif newc.url != client.url:
                 if ver != self.opts.api_version:
                     if numClients == 1:
                         self._raise_omni_error("Can't do ListResources: AM %s speaks only AM API v%d, not %d. Try calling Omni with the -V%d option." % (client.str, ver, self.opts.api_version, ver))
                     self.logger.warn("AM %s doesn't speak API version %d. Try the AM at %s and tell Omni to use API version %d, using the option '-V%d'.", client.str, self.opts.api_version, newc.url, ver, ver)
 
-                    if not mymessage:
-                        mymessage = ""
-                    else:
-                        if not mymessage.endswith('.'):
-                            mymessage += ".\n"
-                        else:
-                            mymyessage += "\n"
-                    mymessage += "Skipped AM %s: speaks only API v%d, not %d. Try -V%d option." % (client.str, ver, self.opts.api_version, ver)
+                    messages.append((addSkipped, "Skipped AM %s: speaks only API v%d, not %d. Try -V%d option." % (client.str, ver, self.opts.api_version, ver)))
                     # Theoretically could remove this client from clients list, but currently 
                     # nothing uses client list after this, so no need.
                     # Plus, editing the client list inside the loop is bad
 
-                    continue
+                    return (messages, None, None, False)
 #                    raise BadClientException(client, mymessage)
 #                    self.logger.warn("Changing API version to %d. Is this going to work?", ver)
 #                    # FIXME: changing the api_version is not a great idea if
@@ -1223,65 +1366,55 @@ class AMCallHandler(object):
                     self._raise_omni_error("Can't do ListResources: AM %s speaks only AM API v%d, not %d. Try calling Omni with the -V%d option." % (client.str, ver, self.opts.api_version, ver))
                 self.logger.warn("AM %s speaks API version %d, not %d. Rerun with option '-V%d'.", client.str, ver, self.opts.api_version, ver)
 
-                if not mymessage:
-                    mymessage = ""
-                else:
-                    if not mymessage.endswith('.'):
-                        mymessage += ".\n"
-                    else:
-                        mymessage += "\n"
-                mymessage += "Skipped AM %s: speaks only API v%d, not %d. Try -V%d option." % (client.str, ver, self.opts.api_version, ver)
+                messages.append((addSkipped, "Skipped AM %s: speaks only API v%d, not %d. Try -V%d option." % (client.str, ver, self.opts.api_version, ver)))
 
                 # Theoretically could remove this client from clients list, but currently 
                 # nothing uses client list after this, so no need.
                 # Plus, editing the client list inside the loop is bad
-                continue
+                return (messages, None, None, False)
 
             self.logger.debug("Connecting to AM: %s at %s", client.urn, client.url)
 
 #---
 # In Dev mode, just use the requested type/version - don't check what is supported
             try:
-                (options, mymessage) = self._selectRSpecVersion(slicename, client, mymessage, options)
+                (callOptions, rspecMessage) = self._selectRSpecVersion(slicename, client, "", deepcopy(options))
+                if rspecMessage:
+                    messages.append((addSentence, rspecMessage))
             except BadClientException, bce:
-                if not mymessage:
-                    mymessage = ""
-                else:
-                    if not mymessage.endswith('.'):
-                        mymessage += ".\n"
-                    else:
-                        mymessage += "\n"
                 if bce.validMsg and bce.validMsg != '':
-                    mymessage += bce.validMsg
-                    if not mymessage.endswith('.'):
-                        mymessage += ". "
+                    text = bce.validMsg
+                    if not text.endswith('.'):
+                        text += ". "
+                    messages.append((addSkipped, text))
                 # mymessage += "AM %s doesn't advertise matching RSpec versions" % client.url
                 self.logger.warn(message + "... continuing with next AM")
 
                 # Theoretically could remove this client from clients list, but currently 
                 # nothing uses client list after this, so no need.
                 # Plus, editing the client list inside the loop is bad
-                continue
+                return (messages, None, None, False)
 
-            options = self._build_options("ListResources", slicename, options)
+            callOptions = self._build_options("ListResources", slicename, callOptions)
 
             # Done constructing options to ListResources
 #-----
 
-            self.logger.debug("Doing listresources with %d creds, options %r", len(creds), options)
-            (resp, message) = _do_ssl(self.framework, None, ("List Resources at %s" % (client.url)), client.ListResources, creds, options)
+            self.logger.debug("Doing listresources with %d creds, options %r", len(creds), callOptions)
+            (resp, amMessage) = _do_ssl(self.framework, None, ("List Resources at %s" % (client.url)), client.ListResources, creds, callOptions)
 
             # Decompress the RSpec before sticking it in retItem
+            success = False
             if resp and (self.opts.api_version == 1 or (self.opts.api_version > 1 and isinstance(resp, dict) and resp.has_key('value') and isinstance(resp['value'], str))):
                 if self.opts.api_version > 1:
                     origRSpec = resp['value']
                 else:
                     origRSpec = resp
-                rspec = self._maybeDecompressRSpec(options, origRSpec)
+                rspec = self._maybeDecompressRSpec(callOptions, origRSpec)
                 if rspec and rspec != origRSpec:
                     self.logger.debug("Decompressed RSpec")
                 if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
-                    successCnt += 1
+                    success = True
                     doPretty = (slicename is not None) # True on Manifests
                     if doPretty and rspec.count('\n') > 10:
                         # Are there newlines in the manifest already? Then set it false. Good enough.
@@ -1293,12 +1426,7 @@ class AMCallHandler(object):
                     rspec = rspec_util.getPrettyRSpec(rspec, doPretty)
                 else:
                     self.logger.warn("Didn't get a valid RSpec!")
-                    if mymessage != "":
-                        if mymessage.endswith('.'):
-                            mymessage += ' '
-                        else:
-                            mymessage += ". "
-                    mymessage += "No resources from AM %s: %s" % (client.str, message)
+                    messages.append((addNoResources, "No resources from AM %s: %s" % (client.str, amMessage)))
                 if self.opts.api_version > 1:
                     resp['value']=rspec
                 else:
@@ -1306,15 +1434,19 @@ class AMCallHandler(object):
             else:
                 self.logger.warn("No resource listing returned!")
                 self.logger.debug("Return struct missing proper rspec in value element!")
-                if mymessage != "":
-                    if mymessage.endswith('.'):
-                        mymessage += ' '
-                    else:
-                        mymessage += ". "
-                mymessage += "No resources from AM %s: %s" % (client.str, message)
+                messages.append((addNoResources, "No resources from AM %s: %s" % (client.str, amMessage)))
+            return (messages, client, resp, success)
 
+        # Connect to each available GENI AM to list their resources
+        for (client, (messages, calledClient, resp, success)) in self._call_clients(clientList, listResourcesAt):
+            for (add, text) in messages:
+                mymessage = add(mymessage, text)
+            if calledClient is None:
+                continue
+            if success:
+                successCnt += 1
             # Return for tools is the full code/value/output triple
-            rspecs[(client.urn, client.url)] = resp
+            rspecs[(calledClient.urn, calledClient.url)] = resp
         # End of loop over clients
 
         if self.numOrigClients > 0:
@@ -1606,14 +1738,19 @@ class AMCallHandler(object):
             descripMsg = "%d slivers in slice %s" % (len(slivers), urn)
         op = 'Describe'
         msg = "Describe %s at " % (descripMsg)
-        for client in clientList:
+
+        # Describe the slice at one AM. Returns the text to add to retVal, the
+        # client called (maybe with a corrected URL) and its result, or None
+        # for both if the AM was skipped, and whether this AM succeeded
+        def describeAt(client):
+            retVal = ""
             args = [urnsarg, creds]
             try:
                 # Do per client check for rspec version to use and properly fill in geni_rspec_version
                 mymessage = ""
-                (options, mymessage) = self._selectRSpecVersion(name, client, mymessage, options)
-                args.append(options)
-                self.logger.debug("Doing describe of %s, %d creds, options %r", descripMsg, len(creds), options)
+                (callOptions, mymessage) = self._selectRSpecVersion(name, client, mymessage, deepcopy(options))
+                args.append(callOptions)
+                self.logger.debug("Doing describe of %s, %d creds, options %r", descripMsg, len(creds), callOptions)
                 ((status, message), client) = self._api_call(client,
                                                    msg + str(client.url),
                                                    op, args)
@@ -1628,13 +1765,13 @@ class AMCallHandler(object):
                     retVal += "Describe skipping AM %s. No matching RSpec version or wrong AM API version - check logs" % (client.str)
                 if numClients == 1:
                     self._raise_omni_error("\nDescribe failed: " + retVal)
-                continue
+                return (retVal, None, None, False)
 
 # FIXME: Factor this next chunk into helper method?
             # Decompress the RSpec before sticking it in retItem
             rspec = None
             if status and isinstance(status, dict) and status.has_key('value') and isinstance(status['value'], dict) and status['value'].has_key('geni_rspec'):
-                rspec = self._maybeDecompressRSpec(options, status['value']['geni_rspec'])
+                rspec = self._maybeDecompressRSpec(callOptions, status['value']['geni_rspec'])
                 if rspec and rspec != status['value']['geni_rspec']:
                     self.logger.debug("Decompressed RSpec")
                 if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
@@ -1647,7 +1784,7 @@ class AMCallHandler(object):
                 self.logger.debug("Return struct missing geni_rspec element!")
 
             # Return for tools is the full code/value/output triple
-            retItem[client.url] = status
+            result = status
 
             # Get the dict describe result out of the result (accounting for API version diffs, ABAC)
             (status, message) = self._retrieve_value(status, message, self.framework)
@@ -1656,7 +1793,7 @@ class AMCallHandler(object):
                 if message is None or message.strip() == "":
                     message = "(no reason given)"
                 retVal += fmt % (descripMsg, client.str, message)
-                continue # go to next AM
+                return (retVal, client, result, False) # go to next AM
 
             missingSlivers = self._findMissingSlivers(status, slivers)
             if len(missingSlivers) > 0:
@@ -1694,9 +1831,16 @@ class AMCallHandler(object):
                 retVal += "Saved description of %s at AM %s to file %s. \n" % (descripMsg, client.str, filename)
             # Only count it as success if no slivers were missing
             if len(missingSlivers) == 0 and len(sliverFails.keys()) == 0:
+                return (retVal, client, result, True)
+            retVal += " - with %d slivers missing and %d slivers with errors. \n" % (len(missingSlivers), len(sliverFails.keys()))
+            return (retVal, client, result, False)
+
+        for (client, (text, calledClient, result, success)) in self._call_clients(clientList, describeAt):
+            retVal += text
+            if calledClient is not None:
+                retItem[calledClient.url] = result
+            if success:
                 successCnt+=1
-            else:
-                retVal += " - with %d slivers missing and %d slivers with errors. \n" % (len(missingSlivers), len(sliverFails.keys()))
 
         # FIXME: Return the status if there was only 1 client?
         if numClients > 0:
@@ -2281,15 +2425,18 @@ class AMCallHandler(object):
             else:
                 self.logger.warn(msg + " Consider running with --best-effort in future.")
 
-        # Loop over clients doing operation
-        for client in clientList:
+        # Provision at one AM. Returns the text to add to retVal, the client
+        # called (maybe with a corrected URL) and its result, or None for both
+        # if the AM was skipped, and whether this AM succeeded
+        def provisionAt(client):
+            retVal = ""
             args = [urnsarg, creds]
             self.logger.info("%s %s at %s", op, descripMsg, client.str)
             try:
                 mymessage = ""
-                (options, mymessage) = self._selectRSpecVersion(slicename, client, mymessage, options)
-                args.append(options)
-                self.logger.debug("Doing Provision at %s with urns %s, %d creds, options %s", client.str, urnsarg, len(creds), options)
+                (callOptions, mymessage) = self._selectRSpecVersion(slicename, client, mymessage, deepcopy(options))
+                args.append(callOptions)
+                self.logger.debug("Doing Provision at %s with urns %s, %d creds, options %s", client.str, urnsarg, len(creds), callOptions)
                 ((result, message), client) = self._api_call(client,
                                                   ("Provision %s at %s" % (descripMsg, client.url)),
                                                   op,
@@ -2305,7 +2452,7 @@ class AMCallHandler(object):
                     retVal += "Skipped aggregate %s. (Unreachable? Doesn't speak AM API v%d? Check the log messages, and try calling 'getversion' to check AM status and API versions supported.).\n" % (client.str, self.opts.api_version)
                 if numClients == 1:
                     self._raise_omni_error("\nProvision failed: " + retVal)
-                continue
+                return (retVal, None, None, False)
 
             # Make the RSpec more pretty-printed
             if result and isinstance(result, dict) and result.has_key('value') and isinstance(result['value'], dict) and result['value'].has_key('geni_rspec'):
@@ -2319,7 +2466,6 @@ class AMCallHandler(object):
                 self.logger.debug("Return struct missing geni_rspec element!")
 
             # Pull out the result
-            retItem[ client.url ] = result
             (realresult, message) = self._retrieve_value(result, message, self.framework)
 
             badSlivers = self._getSliverAllocStates(realresult, 'geni_provisioned')
@@ -2399,8 +2545,7 @@ class AMCallHandler(object):
                         retVal += " First sliver expiration: %s" % orderedDates[0].isoformat()
 
                 self.logger.debug("Provision %s result: %s" %  (descripMsg, prettyResult))
-                if len(missingSlivers) == 0 and len(sliverFails.keys()) == 0:
-                    successCnt += 1
+                return (retVal, client, result, len(missingSlivers) == 0 and len(sliverFails.keys()) == 0)
             else:
                 # Failure
                 if message is None or message.strip() == "":
@@ -2408,6 +2553,15 @@ class AMCallHandler(object):
                 retVal = "Provision of %s at %s failed: %s" % (descripMsg, client.str, message)
                 self.logger.warn(retVal)
                 retVal += "\n"
+                return (retVal, client, result, False)
+
+        # Loop over clients doing operation
+        for (client, (text, calledClient, result, success)) in self._call_clients(clientList, provisionAt):
+            retVal += text
+            if calledClient is not None:
+                retItem[ calledClient.url ] = result
+            if success:
+                successCnt += 1
         # Done loop over clients
 
         if numClients == 0:
@@ -2587,8 +2741,11 @@ class AMCallHandler(object):
             else:
                 self.logger.warn(msg + " Consider running with --best-effort in future.")
 
-        # Do poa action on each client
-        for client in clientList:
+        # Do the poa action at one AM. Returns the text to add to retVal, the
+        # client called (maybe with a corrected URL) and its result, or None
+        # for both if the AM was skipped, and whether this AM succeeded
+        def poaAt(client):
+            retVal = ""
             self.logger.info("%s %s at %s", op, descripMsg, client.str)
             try:
                 ((result, message), client) = self._api_call(client,
@@ -2602,9 +2759,8 @@ class AMCallHandler(object):
                     retVal += "Skipped aggregate %s. (Unreachable? Doesn't speak AM API v%d? Check the log messages, and try calling 'getversion' to check AM status and API versions supported.).\n" % (client.str, self.opts.api_version)
                 if numClients == 1:
                     self._raise_omni_error("\nPerformOperationalAction failed: " + retVal)
-                continue
+                return (retVal, None, None, False)
 
-            retItem[ client.url ] = result
             (realresult, message) = self._retrieve_value(result, message, self.framework)
 
             if realresult is None:
@@ -2614,6 +2770,7 @@ class AMCallHandler(object):
                 msg = "PerformOperationalAction %s at %s failed: %s \n" % (descripMsg, client.str, message)
                 retVal += msg
                 self.logger.warn(msg)
+                return (retVal, client, result, False)
             else:
                 # Success
                 missingSlivers = self._findMissingSlivers(realresult, slivers)
@@ -2678,8 +2835,15 @@ class AMCallHandler(object):
                     retVal += ' ' + prettyResult + '\n'
                 else:
                     retVal += ' \n'
-                if len(missingSlivers) == 0 and len(sliverFails.keys()) == 0:
-                    successCnt += 1
+                return (retVal, client, result, len(missingSlivers) == 0 and len(sliverFails.keys()) == 0)
+
+        # Do poa action on each client
+        for (client, (text, calledClient, result, success)) in self._call_clients(clientList, poaAt):
+            retVal += text
+            if calledClient is not None:
+                retItem[ calledClient.url ] = result
+            if success:
+                successCnt += 1
         # Done loop over clients
 
         self.logger.debug("POA %s result: %s", descripMsg, json.dumps(retItem, indent=2))
@@ -3073,7 +3237,12 @@ class AMCallHandler(object):
         numClients = len(clientList)
         retItem = dict()
         msg = "Renew %s at " % (descripMsg)
-        for client in clientList:
+
+        # Renew at one AM. Returns the text to add to retVal, the client called
+        # (maybe with a corrected URL) and its result, or None for both if the
+        # AM was skipped, and whether this AM succeeded
+        def renewAt(client):
+            retVal = ""
             try:
                 ((res, message), client) = self._api_call(client, msg + client.url, op,
                                                 args)
@@ -3084,8 +3253,8 @@ class AMCallHandler(object):
                     retVal += "Skipped aggregate %s. (Unreachable? Doesn't speak AM API v%d? Check the log messages, and try calling 'getversion' to check AM status and API versions supported.).\n" % (client.str, self.opts.api_version)
                 if numClients == 1:
                     self._raise_omni_error("\nRenew failed: " + retVal)
-                continue
-            retItem[client.url] = res
+                return (retVal, None, None, False)
+            result = res
 
             # Get the boolean result out of the result (accounting for API version diffs, ABAC)
             (res, message) = self._retrieve_value(res, message, self.framework)
@@ -3099,6 +3268,7 @@ class AMCallHandler(object):
                 if numClients == 1:
                     retVal += prStr + "\n"
                 self.logger.warn(prStr)
+                return (retVal, client, result, False)
             else:
                 prStr = "Renewed %s at %s until %s (UTC)" % (descripMsg, (client.str if client.nick else client.urn), time_with_tz.isoformat())
                 self.logger.info(prStr)
@@ -3107,16 +3277,16 @@ class AMCallHandler(object):
                 # For each that did, did any fail?
                 missingSlivers = self._findMissingSlivers(res, slivers)
                 if len(missingSlivers) > 0:
-                    msg = " - but %d slivers from request missing in result?!" % len(missingSlivers)
-                    self.logger.warn(msg)
+                    missingMsg = " - but %d slivers from request missing in result?!" % len(missingSlivers)
+                    self.logger.warn(missingMsg)
                     self.logger.debug("%s", missingSlivers)
-                    prStr += msg
+                    prStr += missingMsg
 
                 sliverFails = self._didSliversFail(res)
                 for sliver in sliverFails.keys():
                     self.logger.warn("Sliver %s reported error: %s", sliver, sliverFails[sliver])
                 if len(sliverFails.keys()) > 0:
-                    prStr += " - with %d slivers reporting errors!" % len(sliverFails.key())
+                    prStr += " - with %d slivers reporting errors!" % len(sliverFails.keys())
 
                 (orderedDates, sliverExps) = self._getSliverExpirations(res, time)
                 if len(orderedDates) == 1 and orderedDates[0] == time:
@@ -3125,21 +3295,21 @@ class AMCallHandler(object):
                     self.logger.warn("Slivers expire on %r, not as requested %r", orderedDates[0].isoformat(), time_with_tz.isoformat())
 #                    self.logger.warn("timedelta: %r", time - orderedDates[0])
                 elif len(orderedDates) == 0:
-                    msg = " 0 Slivers reported results!"
-                    self.logger.warn(msg)
-                    retVal += msg
+                    noneMsg = " 0 Slivers reported results!"
+                    self.logger.warn(noneMsg)
+                    retVal += noneMsg
                 else:
                     firstTime = None
                     firstCount = 0
                     if sliverExps.has_key(time):
-                        expectedCount = sliverExps[time]
+                        expectedCount = len(sliverExps[time])
                     else:
                         expectedCount = 0
-                    for time in orderedDates:
-                        if time == requestedExpiration or time - requestedExpiration < datetime.timedelta.resolution:
+                    for expTime in orderedDates:
+                        if expTime == time or expTime - time < datetime.timedelta.resolution:
                             continue
-                        firstTime = time
-                        firstCount = len(sliverExps[time])
+                        firstTime = expTime
+                        firstCount = len(sliverExps[expTime])
                         break
                     self.logger.warn("Slivers do not all expire as requested: %d as requested (%r), but %d expire on %r, and others at %d other times", expectedCount, time_with_tz.isoformat(), firstCount, firstTime.isoformat(), len(orderedDates) - 2)
 
@@ -3147,8 +3317,8 @@ class AMCallHandler(object):
                     # record results in SA database
                     try:
                         agg_urn = self._getURNForClient(client)
-                        slivers = self._getSliverResultList(res)
-                        for sliver in slivers:
+                        retSlivers = self._getSliverResultList(res)
+                        for sliver in retSlivers:
                             if isinstance(sliver, dict) and \
                                     sliver.has_key('geni_sliver_urn') and \
                                     sliver.has_key('geni_expires'):
@@ -3191,8 +3361,14 @@ class AMCallHandler(object):
                     retVal += "Saved renewal on %s at AM %s to file %s. \n" % (descripMsg, client.str, filename)
                 if numClients == 1:
                     retVal += prStr + "\n"
-                if len(sliverFails.keys()) == 0 and len(missingSlivers) == 0:
-                    successCnt += 1
+                return (retVal, client, result, len(sliverFails.keys()) == 0 and len(missingSlivers) == 0)
+
+        for (client, (text, calledClient, result, success)) in self._call_clients(clientList, renewAt):
+            retVal += text
+            if calledClient is not None:
+                retItem[calledClient.url] = result
+            if success:
+                successCnt += 1
         # End of loop over clients
 
         if numClients == 0:
@@ -3279,8 +3455,11 @@ class AMCallHandler(object):
 
         msg = "%s of %s at " % (op, urn)
 
-        # Call SliverStatus on each client
-        for client in clientList:
+        # Call SliverStatus at one AM. Returns the text to add to retVal, the
+        # client called (maybe with a corrected URL) and its status, or None
+        # for both if the AM was skipped, and whether this AM succeeded
+        def sliverStatusAt(client):
+            retVal = ""
             try:
                 ((rawstatus, message), client) = self._api_call(client,
                                                    msg + str(client.url),
@@ -3292,7 +3471,7 @@ class AMCallHandler(object):
                     retVal += "Skipped aggregate %s. (Unreachable? Doesn't speak AM API v%d? Check the log messages, and try calling 'getversion' to check AM status and API versions supported.).\n" % (client.str, self.opts.api_version)
                 if numClients == 1:
                     self._raise_omni_error("\nSliverStatus failed: " + retVal)
-                continue
+                return (retVal, None, None, False)
 
             rawResult = rawstatus
             amapiError = None
@@ -3326,9 +3505,9 @@ class AMCallHandler(object):
                         prettyResult = pprint.pformat(status)
 
                     if status.has_key('geni_status'):
-                        msg = "Slice %s at AM %s has overall SliverStatus: %s"% (name, client.str, status['geni_status'])
-                        self.logger.info(msg)
-                        retVal += msg + ".\n "
+                        statusMsg = "Slice %s at AM %s has overall SliverStatus: %s"% (name, client.str, status['geni_status'])
+                        self.logger.info(statusMsg)
+                        retVal += statusMsg + ".\n "
                         # FIXME: Do this even if many AMs?
 
                     exps = expires_from_status(status, self.logger)
@@ -3337,16 +3516,16 @@ class AMCallHandler(object):
                         # FIXME: Sort and take first?
                         exps = exps.sort()
                         outputstr = exps[0].isoformat()
-                        msg = "Resources in slice %s at AM %s expire at %d different times. First expiration is %s UTC" % (name, client.str, len(exps), outputstr)
+                        expMsg = "Resources in slice %s at AM %s expire at %d different times. First expiration is %s UTC" % (name, client.str, len(exps), outputstr)
                     elif len(exps) == 0:
                         self.logger.debug("Failed to parse a sliver expiration from status")
-                        msg = None
+                        expMsg = None
                     else:
                         outputstr = exps[0].isoformat()
-                        msg = "Resources in slice %s at AM %s expire at %s UTC" % (name, client.str, outputstr)
-                    if msg:
-                        self.logger.info(msg)
-                        retVal += msg + ".\n "
+                        expMsg = "Resources in slice %s at AM %s expire at %s UTC" % (name, client.str, outputstr)
+                    if expMsg:
+                        self.logger.info(expMsg)
+                        retVal += expMsg + ".\n "
 
                     # #634: Get the sliverinfo
                     # Then sync these up: create an entry if there isn't one, or update it with the correct expiration
@@ -3470,8 +3649,7 @@ class AMCallHandler(object):
                 _printResults(self.opts, self.logger, header, prettyResult, filename)
                 if filename:
                     retVal += "Saved sliverstatus on %s at AM %s to file %s. \n" % (name, client.str, filename)
-                retItem[ client.url ] = status
-                successCnt+=1
+                return (retVal, client, status, True)
             else:
                 # #634:
                 # delete any sliver_infos for this am/slice
@@ -3518,7 +3696,6 @@ class AMCallHandler(object):
 
                 # FIXME: Put the message error in retVal?
                 # FIXME: getVersion uses None as the value in this case. Be consistent
-                retItem[ client.url ] = False
                 if message is None or message.strip() == "":
                     if status is None:
                         message = "(no reason given, missing result)"
@@ -3529,6 +3706,15 @@ class AMCallHandler(object):
                     else:
                         message = "(no reason given, empty result)"
                 retVal += "\nFailed to get SliverStatus on %s at AM %s: %s\n" % (name, client.str, message)
+                return (retVal, client, False, False)
+
+        # Call SliverStatus on each client
+        for (client, (text, calledClient, status, success)) in self._call_clients(clientList, sliverStatusAt):
+            retVal += text
+            if calledClient is not None:
+                retItem[ calledClient.url ] = status
+            if success:
+                successCnt+=1
         # End of loop over clients
 
         # FIXME: Return the status if there was only 1 client?
@@ -3629,7 +3815,12 @@ class AMCallHandler(object):
         # Do Status at all clients
         op = 'Status'
         msg = "Status of %s at " % (descripMsg)
-        for client in clientList:
+
+        # Do Status at one AM. Returns the text to add to retVal, the client
+        # called (maybe with a corrected URL) and its result, or None for both
+        # if the AM was skipped, and whether this AM succeeded
+        def statusAt(client):
+            retVal = ""
             try:
                 ((status, message), client) = self._api_call(client,
                                                    msg + str(client.url),
@@ -3641,9 +3832,9 @@ class AMCallHandler(object):
                     retVal += "Skipped aggregate %s. (Unreachable? Doesn't speak AM API v%d? Check the log messages, and try calling 'getversion' to check AM status and API versions supported.).\n" % (client.str, self.opts.api_version)
                 if numClients == 1:
                     self._raise_omni_error("\nStatus failed: " + retVal)
-                continue
+                return (retVal, None, None, False)
 
-            retItem[client.url] = status
+            result = status
             # Get the dict status out of the result (accounting for API version diffs, ABAC)
             (status, message) = self._retrieve_value(status, message, self.framework)
 
@@ -3659,7 +3850,7 @@ class AMCallHandler(object):
                 # Also note that if not geni_best_effort
                 # that a failure may mean only part failed
                 doDelete = False
-                raw = retItem[client.url]
+                raw = result
                 code = -1
                 if raw is not None and isinstance(raw, dict) and raw.has_key('code') and isinstance(raw['code'], dict) and 'geni_code' in raw['code']:
                     code = raw['code']['geni_code']
@@ -3706,7 +3897,7 @@ class AMCallHandler(object):
                 if message is None or message.strip() == "":
                     message = "(no reason given)"
                 retVal += fmt % (descripMsg, client.str, message)
-                continue
+                return (retVal, client, result, False)
             # End of block to handle got no good status (got an error)
 
             missingSlivers = self._findMissingSlivers(status, slivers)
@@ -3729,17 +3920,17 @@ class AMCallHandler(object):
             # Summarize sliver expiration
             (orderedDates, sliverExps) = self._getSliverExpirations(status, None)
             if len(orderedDates) == 1:
-                msg = "All slivers expire on %r." % orderedDates[0].isoformat()
-                self.logger.info(msg)
+                expMsg = "All slivers expire on %r." % orderedDates[0].isoformat()
+                self.logger.info(expMsg)
             elif len(orderedDates) == 0:
-                msg = "0 Slivers reported results!"
-                self.logger.warn(msg)
+                expMsg = "0 Slivers reported results!"
+                self.logger.warn(expMsg)
             else:
                 firstTime = orderedDates[0]
                 firstCount = len(sliverExps[firstTime])
-                msg = "Slivers expire on %d times, next is %d at %r, and others at %d other times." % (len(orderedDates), firstCount, firstTime.isoformat(), len(orderedDates) - 1)
-                self.logger.info(msg)
-            retVal += "  " + msg + "\n"
+                expMsg = "Slivers expire on %d times, next is %d at %r, and others at %d other times." % (len(orderedDates), firstCount, firstTime.isoformat(), len(orderedDates) - 1)
+                self.logger.info(expMsg)
+            retVal += "  " + expMsg + "\n"
 
             # Summarize overall status
             # Get all statuses in a hash (value is count)
@@ -3808,8 +3999,7 @@ class AMCallHandler(object):
             if len(sliverFails.keys()) > 0:
                 retVal += " - %d slivers failed?! \n" % len(sliverFails.keys())
             retVal += statusMsg
-            if len(missingSlivers) == 0 and len(sliverFails.keys()) == 0:
-                successCnt+=1
+            success = len(missingSlivers) == 0 and len(sliverFails.keys()) == 0
 
             # Now sync up slivers with CH
             if not self.opts.noExtraCHCalls:
@@ -3955,7 +4145,14 @@ class AMCallHandler(object):
                     self.logger.debug("Not syncing slivers with CH - no valid AM URN known")
             else:
                 self.logger.debug("Per commandline option, not syncing slivers with clearinghouse.")
+            return (retVal, client, result, success)
 
+        for (client, (text, calledClient, result, success)) in self._call_clients(clientList, statusAt):
+            retVal += text
+            if calledClient is not None:
+                retItem[calledClient.url] = result
+            if success:
+                successCnt+=1
         # End of loop over clients
 
         # FIXME: Return the status if there was only 1 client?
@@ -4249,7 +4446,12 @@ class AMCallHandler(object):
         op = 'Delete'
         msg = "Delete of %s at " % (descripMsg)
         retItem = {}
-        for client in clientList:
+
+        # Delete at one AM. Returns the text for retVal, the client called
+        # (maybe with a corrected URL) and its result, or None for both if the
+        # AM was skipped, and whether this AM succeeded
+        def deleteAt(client):
+            retVal = ""
             try:
                 ((result, message), client) = self._api_call(client,
                                                    msg + str(client.url),
@@ -4261,9 +4463,7 @@ class AMCallHandler(object):
                     retVal += "Skipped aggregate %s. (Unreachable? Doesn't speak AM API v%d? Check the log messages, and try calling 'getversion' to check AM status and API versions supported.).\n" % (client.str, self.opts.api_version)
                 if numClients == 1:
                     self._raise_omni_error("\nDelete failed: " + retVal)
-                continue
-
-            retItem[client.url] = result
+                return (retVal, None, None, False)
 
             (realres, message) = self._retrieve_value(result, message, self.framework)
             someSliversFailed = False
@@ -4353,11 +4553,10 @@ class AMCallHandler(object):
                 if filename:
                     retVal += "Saved deletion of %s at AM %s to file %s. \n" % (descripMsg, client.str, filename)
 
-                if len(sliverFails.keys()) == 0:
-                    successCnt += 1
+                return (retVal, client, result, len(sliverFails.keys()) == 0)
             else:
                 doDelete = False
-                raw = retItem[client.url]
+                raw = result
                 code = -1
                 if raw is not None and isinstance(raw, dict) and raw.has_key('code') and isinstance(raw['code'], dict) and 'geni_code' in raw['code']:
                     code = raw['code']['geni_code']
@@ -4404,6 +4603,18 @@ class AMCallHandler(object):
                 self.logger.warn(prStr)
                 if numClients == 1:
                     retVal = prStr
+                return (retVal, client, result, False)
+
+        for (client, (text, calledClient, result, success)) in self._call_clients(clientList, deleteAt):
+            # With a single AM, its result replaces the slice expiration message
+            if numClients == 1:
+                retVal = text
+            else:
+                retVal += text
+            if calledClient is not None:
+                retItem[calledClient.url] = result
+            if success:
+                successCnt += 1
         # loop over all clients
 
         if numClients == 0:
@@ -5485,7 +5696,13 @@ class AMCallHandler(object):
         (clientList, message) = self._getclients()
         numClients = len(clientList)
         retItem = {}
-        for client in clientList:
+
+        # Get the sliver expirations at one AM. Returns the text to add to
+        # retVal, the client called (maybe with a corrected URL), and the
+        # expirations found there, or None if there are none
+        def expirationsAt(client):
+            retVal = ""
+            message = None
             # What kind of AM is this? Which function do I call?
             # For now, always use status or sliverstatus
             # Known AMs all do something in status.
@@ -5516,7 +5733,7 @@ class AMCallHandler(object):
                     (status, message) = self._retrieve_value(status, message, self.framework)
                 except Exception, e:
                     self.logger.debug("Failed to get sliverstatus to get sliver expiration from %s: %s", client.str, e)
-                    retItem[client.url] = None
+                expItem = None
 
                 # Parse the expiration and print / add to retVal
                 if status and isinstance(status, dict):
@@ -5533,9 +5750,8 @@ class AMCallHandler(object):
                     else:
                         outputstr = exps[0].isoformat()
                         msg = "Resources in slice %s at AM %s expire at %s UTC" % (name, client.str, outputstr)
-                    retItem[client.url] = exps
+                    expItem = exps
                 else:
-                    retItem[client.url] = None
                     msg = "Malformed or failed to get status from %s, cannot find sliver expiration" % client.str
                     if message is None or message.strip() == "":
                         if status is None:
@@ -5556,6 +5772,7 @@ class AMCallHandler(object):
                 if msg:
                     self.logger.info(msg)
                     retVal += msg + ".\n "
+                return (retVal, client, expItem)
             else:
                 # Doing APIv3
                 urnsarg, slivers = self._build_urns(urn)
@@ -5578,11 +5795,8 @@ class AMCallHandler(object):
                     (status, message) = self._retrieve_value(status, message, self.framework)
                 except Exception, e:
                     self.logger.debug("Failed to get status to get sliver expiration from %s: %s", client.str, e)
-                    retItem[client.url] = None
 
                 if not status:
-                    retItem[client.url] = None
-
                     if message and "protogeni AM code: 12: No such slice here" in message:
                         # PG says this AM has no resources here
                         msg = "No resources at %s in slice %s" % (client.str, name)
@@ -5596,11 +5810,10 @@ class AMCallHandler(object):
                         if message is None or message.strip() == "":
                             message = "(no reason given)"
                         retVal += fmt % (descripMsg, client.str, message)
-                    continue
+                    return (retVal, client, None)
 
                 # Summarize sliver expiration
                 (orderedDates, sliverExps) = self._getSliverExpirations(status, None)
-                retItem[client.url] = orderedDates
                 if len(orderedDates) == 1:
                     msg = "Resources in slice %s at AM %s expire at %s UTC" % (name, client.str, orderedDates[0])
                 elif len(orderedDates) == 0:
@@ -5612,7 +5825,12 @@ class AMCallHandler(object):
                 if msg:
                     self.logger.info(msg)
                     retVal += msg + ".\n "
+                return (retVal, client, orderedDates)
             # End of block to handle APIv3 AM
+
+        for (client, (text, calledClient, expItem)) in self._call_clients(clientList, expirationsAt):
+            retVal += text
+            retItem[calledClient.url] = expItem
         # End of loop over AMs
 
         if numClients == 0:
@@ -87,7 +87,11 @@ class CallHandler(object):
             if msg is None:
                 msg = ""
 
-            (message, val) = getattr(self.amhandler,call)(args[1:])
+            try:
+                (message, val) = getattr(self.amhandler,call)(args[1:])
+            finally:
+                # Save any new GetVersion results, once per command
+                self.amhandler._save_getversion_cache()
             if message is None:
                 message = ""
             return (msg+message, val)
@@ -54,12 +54,161 @@ PATH_ID = 'id'
 
 # FIXME: As in RSpecParser, check use of getAttribute vs getAttributeNS and localName vs nodeName
 
+# _replaceChildAt depends on minidom internals: it edits childNodes and
+# the sibling links itself, and calls minidom's private _clear_id_cache,
+# as minidom's own replaceChild does. If this minidom has no
+# _clear_id_cache, fall back to the slow replaceChild.
+try:
+    from xml.dom.minidom import _clear_id_cache
+except ImportError:
+    _clear_id_cache = None
+
+def _replaceChildAt(parent, index, newChild, oldChild):
+    '''Do parent.replaceChild(newChild, oldChild), where oldChild is
+    parent.childNodes[index] (a position noted while scanning the children).
+    minidom's replaceChild (like insertBefore and removeChild) finds oldChild
+    by comparing it to each earlier child, which is slow for the thousands of
+    top level nodes and links of a big topology: replacing each of 5000
+    children takes 35s with replaceChild and 0.15s here.'''
+    if _clear_id_cache is None or \
+            index is None or index >= len(parent.childNodes) or \
+            parent.childNodes[index] is not oldChild or \
+            newChild.parentNode is not None or \
+            newChild.nodeType == Node.DOCUMENT_FRAGMENT_NODE:
+        return parent.replaceChild(newChild, oldChild)
+    parent.childNodes[index] = newChild
+    newChild.parentNode = parent
+    oldChild.parentNode = None
+    _clear_id_cache(parent)
+    newChild.nextSibling = oldChild.nextSibling
+    newChild.previousSibling = oldChild.previousSibling
+    oldChild.nextSibling = None
+    oldChild.previousSibling = None
+    if newChild.previousSibling:
+        newChild.previousSibling.nextSibling = newChild
+    if newChild.nextSibling:
+        newChild.nextSibling.previousSibling = newChild
+    return oldChild
+
+class ManifestIndex(object):
+    '''Index of the elements of one manifest (or request) DOM that the combiner
+    looks up, built in a single pass over the DOM: top level nodes and links by
+    client_id, the stitching paths by ID, the hops of each path by
+    (path ID, hop ID), and the hop links of each path by (path ID, link ID).
+    Lookups return the same element the old scans of the DOM found.
+    An index of a DOM that is then edited must be kept up to date
+    with addPath and setHop.'''
+
+    def __init__(self, dom):
+        self.dom = dom
+        self.nodes = [] # node elements in document order
+        self.nodesByClientId = {} # client_id -> list of node elements
+        self.links = [] # link elements in document order
+        self.linksByClientId = {} # client_id -> list of link elements
+        self.paths = {} # path ID -> first path element with that ID
+        self.hops = {} # (path ID, hop ID) -> first hop element on that path
+        self.hopLinks = {} # (path ID, link ID) -> hop link element on that path
+
+        # The rspec element: the document element, or else its first rspec child
+        self.rspec = None
+        doc_root = dom.documentElement
+        if doc_root.nodeType == Node.ELEMENT_NODE and \
+                doc_root.localName == defs.RSPEC_TAG:
+            self.rspec = doc_root
+        for child in doc_root.childNodes:
+            if child.nodeType != Node.ELEMENT_NODE:
+                continue
+            if child.localName == defs.NODE_TAG:
+                self.nodes.append(child)
+                self.nodesByClientId.setdefault(child.getAttribute(CLIENT_ID), []).append(child)
+            elif child.localName == defs.LINK_TAG:
+                self.links.append(child)
+                self.linksByClientId.setdefault(child.getAttribute(CLIENT_ID), []).append(child)
+            elif child.localName == defs.RSPEC_TAG and self.rspec is None:
+                self.rspec = child
+
+        # The stitching element: first stitching child of an rspec child of the document
+        self.stitching = None
+        for child in dom.childNodes:
+            if child.nodeType == Node.ELEMENT_NODE and \
+                    child.localName == defs.RSPEC_TAG:
+                for child2 in child.childNodes:
+                    if child2.nodeType == Node.ELEMENT_NODE and \
+                            child2.localName == defs.STITCHING_TAG:
+                        self.stitching = child2
+                        break
+                break
+        if self.stitching is not None:
+            for child in self.stitching.childNodes:
+                if child.nodeType == Node.ELEMENT_NODE and \
+                        child.localName == defs.PATH_TAG:
+                    self.addPath(child)
+
+    def addPath(self, path):
+        '''Index a path element (just appended to the stitching element), unless
+        an earlier path has the same ID'''
+        path_id = path.getAttribute(PATH_ID)
+        if self.paths.has_key(path_id):
+            return
+        self.paths[path_id] = path
+        for hop in path.childNodes:
+            if hop.nodeType != Node.ELEMENT_NODE or hop.localName != HOP:
+                continue
+            hop_id = hop.getAttribute(HOP_ID)
+            if not self.hops.has_key((path_id, hop_id)):
+                self.hops[(path_id, hop_id)] = hop
+            # The first matching link of the last hop that has one wins
+            hop_link_ids = set()
+            for link in hop.childNodes:
+                if link.nodeType != Node.ELEMENT_NODE or link.localName != LINK:
+                    continue
+                link_id = link.getAttribute(LINK_ID)
+                if link_id in hop_link_ids:
+                    continue
+                hop_link_ids.add(link_id)
+                self.hopLinks[(path_id, link_id)] = link
+
+    def setHop(self, path_id, hop_id, hop):
+        '''Note that the given hop element replaced (or was appended as)
+        the hop with the given ID on the indexed path with the given ID'''
+        self.hops[(path_id, hop_id)] = hop
+
+    def findPath(self, path_id):
+        return self.paths.get(path_id)
+
+    def findHop(self, path_id, hop_id):
+        return self.hops.get((path_id, hop_id))
+
+    def findHopLink(self, path_id, link_id):
+        return self.hopLinks.get((path_id, link_id))
+
 class ManifestRSpecCombiner:
 
     # Constructor
     def __init__(self, useReqs=False):
         self.logger = logging.getLogger('stitch.ManifestRSpecCombiner')
         self.useReqs = useReqs
+        # ManifestIndex of each AM manifest DOM, by id of the DOM
+        self._indexes = {}
+
+    # Return the DOM to combine from this AM: its manifest,
+    # or when combining requests and the AM has no manifest, its request
+    def getAMDom(self, am, dom_template):
+        if self.useReqs and not am.manifestDom:
+            if not am.requestDom:
+                am.requestDom = am.getEditedRSpecDom(dom_template)
+            return am.requestDom
+        return am.manifestDom
+
+    # Return the ManifestIndex of an AM's DOM, building it the first time.
+    # AM DOMs are not edited while combining. Do not use this for the
+    # template, which is.
+    def getIndex(self, am_dom):
+        index = self._indexes.get(id(am_dom))
+        if index is None or index.dom is not am_dom:
+            index = ManifestIndex(am_dom)
+            self._indexes[id(am_dom)] = index
+        return index
 
     # Combine the manifest, replacing elements in the dom_template
     # with the appropriate pieces from the manifests
@@ -68,12 +217,14 @@ class ManifestRSpecCombiner:
     #    dom_template is a dom object into which to replace selected
     #      components from the aggregate doms
     def combine(self, ams_list, dom_template):
+        self._indexes = {}
         self.combineNodes(ams_list, dom_template)
         self.combineLinks(ams_list, dom_template)
         self.combineHops(ams_list, dom_template)
         self.combineNSes(ams_list, dom_template)
         self.combineOthers(ams_list, dom_template)
         self.addAggregateDetails(ams_list, dom_template)
+        self._indexes = {}
 #        self.logger.debug("After addAggDets, man is %s", stripBlankLines(dom_template.toprettyxml(encoding="utf-8")))
         return dom_template
 
@@ -81,7 +232,7 @@ class ManifestRSpecCombiner:
         # Add to the base any top level elements not already there
         doc_root = dom_template.documentElement
         children = doc_root.childNodes
-        template_kids = []
+        template_kids = set()
         # Find all the client_ids for nodes in the template too
         rspec_node = None
         if doc_root.nodeType == Node.ELEMENT_NODE and \
@@ -108,33 +259,18 @@ class ManifestRSpecCombiner:
                 cstr = ""
             if cstr == "":
                 continue
-            template_kids.append(cstr)
+            template_kids.add(cstr)
 #            self.logger.debug("Template had element: '%s'...", cstr[:min(len(cstr), 60)])
 
         for am in ams_list:
-            if self.useReqs and not am.manifestDom:
-                if not am.requestDom:
-                    am.requestDom = am.getEditedRSpecDom(dom_template)
-                am_manifest_dom = am.requestDom
-            else:
-                am_manifest_dom = am.manifestDom
+            am_manifest_dom = self.getAMDom(am, dom_template)
             if am_manifest_dom == dom_template:
                 continue
             if am_manifest_dom is None:
                 self.logger.debug("%s had no manifest DOM", am)
                 continue
 
-            am_doc_root = am_manifest_dom.documentElement
-            am_rspec_node = None
-            if am_doc_root.nodeType == Node.ELEMENT_NODE and \
-                    am_doc_root.localName == defs.RSPEC_TAG:
-                am_rspec_node = am_doc_root
-            else:
-                for child in am_doc_root.childNodes:
-                    if child.nodeType == Node.ELEMENT_NODE and \
-                            child.localName == defs.RSPEC_TAG:
-                        am_rspec_node = child
-                        break
+            am_rspec_node = self.getIndex(am_manifest_dom).rspec
             if am_rspec_node is None:
                 self.logger.debug("Couldn't find %s rspec node!", am)
                 continue
@@ -193,29 +329,14 @@ class ManifestRSpecCombiner:
             self.logger.debug("Couldn't find rspec in template!")
             return
         for am in ams_list:
-            if self.useReqs and not am.manifestDom:
-                if not am.requestDom:
-                    am.requestDom = am.getEditedRSpecDom(dom_template)
-                am_manifest_dom = am.requestDom
-            else:
-                am_manifest_dom = am.manifestDom
+            am_manifest_dom = self.getAMDom(am, dom_template)
             if am_manifest_dom == dom_template:
                 continue
             if am_manifest_dom is None:
                 self.logger.debug("%s had no manifest DOM", am)
                 continue
 
-            am_doc_root = am_manifest_dom.documentElement
-            am_rspec_node = None
-            if am_doc_root.nodeType == Node.ELEMENT_NODE and \
-                    am_doc_root.localName == defs.RSPEC_TAG:
-                am_rspec_node = am_doc_root
-            else:
-                for child in am_doc_root.childNodes:
-                    if child.nodeType == Node.ELEMENT_NODE and \
-                            child.localName == defs.RSPEC_TAG:
-                        am_rspec_node = child
-                        break
+            am_rspec_node = self.getIndex(am_manifest_dom).rspec
             if am_rspec_node is None:
                 self.logger.debug("Couldn't find %s rspec node!", am)
                 continue
@@ -275,21 +396,22 @@ class ManifestRSpecCombiner:
 
         # Set up a dictionary mapping node by component_manager_id
         template_nodes_by_cmid={}
-        template_node_cids=[]
+        template_node_cids=set()
+        # Position of each template node among the children of the root
+        template_node_positions={}
         doc_root = dom_template.documentElement
         children = doc_root.childNodes
         # Find all the client_ids for nodes in the template too
-        for child in children:
+        for (position, child) in enumerate(children):
             if child.nodeType == Node.ELEMENT_NODE and \
                     child.localName == defs.NODE_TAG:
+                template_node_positions[id(child)] = position
                 cmid = child.getAttribute(COMPONENT_MGR_ID)
                 if not template_nodes_by_cmid.has_key(cmid):
                     template_nodes_by_cmid[cmid] = []
                 template_nodes_by_cmid[cmid].append(child)
                 cid = child.getAttribute(CLIENT_ID)
-                key = cid + cmid
-                if not key in template_node_cids:
-                    template_node_cids.append(key)
+                template_node_cids.add(cid + cmid)
 
 #        print "DICT = " + str(template_nodes_by_cmid)
         
@@ -297,12 +419,7 @@ class ManifestRSpecCombiner:
         # Match the manifest from a given AMs manifest if that AM's urn is the 
         # component_manager_id attribute on that node and the client_ids match
         for am in ams_list:
-            if self.useReqs and not am.manifestDom:
-                if not am.requestDom:
-                    am.requestDom = am.getEditedRSpecDom(dom_template)
-                am_manifest_dom = am.requestDom
-            else:
-                am_manifest_dom = am.manifestDom
+            am_manifest_dom = self.getAMDom(am, dom_template)
 
             if am_manifest_dom is None:
                 self.logger.debug("%s had no manifest DOM", am)
@@ -312,76 +429,72 @@ class ManifestRSpecCombiner:
             if doc_root == am_doc_root:
                 self.logger.debug("combineNodes Skipping manifest from template AM %s", am)
                 continue
+            am_index = self.getIndex(am_manifest_dom)
 
             # For each node in this AMs manifest for which this AM
             # is the component manager, if that client_id
             # was not in the template, then append this node
-            for child in am_doc_root.childNodes:
-                if child.nodeType == Node.ELEMENT_NODE and \
-                        child.localName == defs.NODE_TAG:
-                    cid = child.getAttribute(CLIENT_ID)
-                    cmid = child.getAttribute(COMPONENT_MGR_ID)
-                    key = cid + cmid
-                    # self.logger.debug("Found possible node to add. client_id: %s; comp_mgr: %s; from AM: %s", cid, cmid, am)
-                    if key not in template_node_cids:
-                        if cmid in am.urn_syns:
-                            # self.logger.debug(".... adding it")
-                            self.logger.debug("Adding missing node client_id: %s; comp_mgr: %s; from AM: %s", cid, cmid, am)
-                            doc_root.appendChild(child.cloneNode(True))
-                        # For reservation from ExoSM the AM manifest lists a cmid for a specific rack, so different than request or any urn_syn on the ExoSM
-                        # Ticket #780
-                        elif ':' in cmid[len('urn:publicid:IDN+'):cmid.find('+authority')]:
-                            self.logger.debug("Node %s cmid %s shows it is from a sub-AM. See if the parent would be a match (so need to add the node) at %s", cid, cmid, am)
-                            # If the CM on this node had a sub-site, then count it as new from here
-                            # if no other AM claims that CM and there is no node with the trimmed (less specific) cmid in the template
-
-                            # if there is an am with cmid as a urn_syn but not this am: continue
-                            thatAM = objects.Aggregate.findDontMake(cmid)
-                            if thatAM is not None and thatAM != am:
-                                self.logger.debug("Node cmid belongs to someone else: %s, %s", cmid, thatAM)
-                                continue
+            for child in am_index.nodes:
+                cid = child.getAttribute(CLIENT_ID)
+                cmid = child.getAttribute(COMPONENT_MGR_ID)
+                key = cid + cmid
+                # self.logger.debug("Found possible node to add. client_id: %s; comp_mgr: %s; from AM: %s", cid, cmid, am)
+                if key not in template_node_cids:
+                    if cmid in am.urn_syns:
+                        # self.logger.debug(".... adding it")
+                        self.logger.debug("Adding missing node client_id: %s; comp_mgr: %s; from AM: %s", cid, cmid, am)
+                        doc_root.appendChild(child.cloneNode(True))
+                    # For reservation from ExoSM the AM manifest lists a cmid for a specific rack, so different than request or any urn_syn on the ExoSM
+                    # Ticket #780
+                    elif ':' in cmid[len('urn:publicid:IDN+'):cmid.find('+authority')]:
+                        self.logger.debug("Node %s cmid %s shows it is from a sub-AM. See if the parent would be a match (so need to add the node) at %s", cid, cmid, am)
+                        # If the CM on this node had a sub-site, then count it as new from here
+                        # if no other AM claims that CM and there is no node with the trimmed (less specific) cmid in the template
+
+                        # if there is an am with cmid as a urn_syn but not this am: continue
+                        thatAM = objects.Aggregate.findDontMake(cmid)
+                        if thatAM is not None and thatAM != am:
+                            self.logger.debug("Node cmid belongs to someone else: %s, %s", cmid, thatAM)
+                            continue
 
-                            # Produce the cmid urn...exogeni.net+authority+am from urn...exogeni.net:site+authority+am
-                            cmidTrim = cmid[:cmid.find('+authority')]
-                            cmidTrim = cmidTrim[:cmidTrim.find(':', len('urn:publicid:IDN+'))]
-                            cmidTrim += cmid[cmid.find('+authority'):]
+                        # Produce the cmid urn...exogeni.net+authority+am from urn...exogeni.net:site+authority+am
+                        cmidTrim = cmid[:cmid.find('+authority')]
+                        cmidTrim = cmidTrim[:cmidTrim.find(':', len('urn:publicid:IDN+'))]
+                        cmidTrim += cmid[cmid.find('+authority'):]
 
-                            key2 = cid + cmidTrim
-                            if key2 not in template_node_cids and (cmid in am.urn_syns or cmidTrim in am.urn_syns):
-                                self.logger.debug("Adding missing node from a sub-AM client_id: %s; comp_mgr: %s; from AM: %s", cid, cmid, am)
-                                doc_root.appendChild(child.cloneNode(True))
+                        key2 = cid + cmidTrim
+                        if key2 not in template_node_cids and (cmid in am.urn_syns or cmidTrim in am.urn_syns):
+                            self.logger.debug("Adding missing node from a sub-AM client_id: %s; comp_mgr: %s; from AM: %s", cid, cmid, am)
+                            doc_root.appendChild(child.cloneNode(True))
             # Now do the node replacing as necessary
             for urn in am.urn_syns:
                 if template_nodes_by_cmid.has_key(urn):
                     for template_node in template_nodes_by_cmid[urn]:
                         template_client_id = template_node.getAttribute(CLIENT_ID)
-                        for child in am_doc_root.childNodes:
-                            if child.nodeType == Node.ELEMENT_NODE and \
-                                    child.localName == defs.NODE_TAG:
-                                child_cmid = child.getAttribute(COMPONENT_MGR_ID)
-                                child_client_id = child.getAttribute(CLIENT_ID)
-                                if child_client_id == template_client_id:
-                                    if child_cmid == urn:
-                                        self.logger.debug(("Replacing template for node %s (" % template_client_id) + str(template_node) + (") with that from %s" % am) + " (" + str(child) + "). Node comp_mgr ID: " + child_cmid)
-                                        doc_root.replaceChild(child.cloneNode(True), template_node)
-                                    elif ':' in child_cmid[len('urn:publicid:IDN+'):child_cmid.find('+authority')] and child_cmid not in am.urn_syns:
-                                        self.logger.debug("Node %s cmid %s shows it is from a sub-AM. See if the parent would be a match (so must replace the node) at %s", child_client_id, child_cmid, am)
-                                        # If the CM on this node had a sub-site, then try comparing the non-root cmid with that in the template.
-                                        # if no other AM claims that CM and there is no node with the trimmed (less specific) cmid in the template
-
-                                        # if there is an am with cmid as a urn_syn but not this am: continue
-                                        thatAM = objects.Aggregate.findDontMake(child_cmid)
-                                        if thatAM is not None and thatAM != am:
-                                            self.logger.debug("Node cmid belongs to someone else: %s, %s", child_cmid, thatAM)
-                                            continue
+                        for child in am_index.nodesByClientId.get(template_client_id, []):
+                            child_cmid = child.getAttribute(COMPONENT_MGR_ID)
+                            child_client_id = child.getAttribute(CLIENT_ID)
+                            if child_cmid == urn:
+                                self.logger.debug(("Replacing template for node %s (" % template_client_id) + str(template_node) + (") with that from %s" % am) + " (" + str(child) + "). Node comp_mgr ID: " + child_cmid)
+                                _replaceChildAt(doc_root, template_node_positions[id(template_node)], child.cloneNode(True), template_node)
+                            elif ':' in child_cmid[len('urn:publicid:IDN+'):child_cmid.find('+authority')] and child_cmid not in am.urn_syns:
+                                self.logger.debug("Node %s cmid %s shows it is from a sub-AM. See if the parent would be a match (so must replace the node) at %s", child_client_id, child_cmid, am)
+                                # If the CM on this node had a sub-site, then try comparing the non-root cmid with that in the template.
+                                # if no other AM claims that CM and there is no node with the trimmed (less specific) cmid in the template
+
+                                # if there is an am with cmid as a urn_syn but not this am: continue
+                                thatAM = objects.Aggregate.findDontMake(child_cmid)
+                                if thatAM is not None and thatAM != am:
+                                    self.logger.debug("Node cmid belongs to someone else: %s, %s", child_cmid, thatAM)
+                                    continue
 
-                                        # Produce the cmid urn...exogeni.net+authority+am from urn...exogeni.net:site+authority+am
-                                        cmidTrim = child_cmid[:child_cmid.find('+authority')]
-                                        cmidTrim = cmidTrim[:cmidTrim.find(':', len('urn:publicid:IDN+'))]
-                                        cmidTrim += child_cmid[child_cmid.find('+authority'):]
-                                        if cmidTrim == urn:
-                                            self.logger.debug(("Replacing template for super AM (like EG-SM) node %s (" % template_client_id) + str(template_node) + (") with that from %s" % am) + " (" + str(child) + "). Node comp_mgr ID: " + child_cmid)
-                                            doc_root.replaceChild(child.cloneNode(True), template_node)
+                                # Produce the cmid urn...exogeni.net+authority+am from urn...exogeni.net:site+authority+am
+                                cmidTrim = child_cmid[:child_cmid.find('+authority')]
+                                cmidTrim = cmidTrim[:cmidTrim.find(':', len('urn:publicid:IDN+'))]
+                                cmidTrim += child_cmid[child_cmid.find('+authority'):]
+                                if cmidTrim == urn:
+                                    self.logger.debug(("Replacing template for super AM (like EG-SM) node %s (" % template_client_id) + str(template_node) + (") with that from %s" % am) + " (" + str(child) + "). Node comp_mgr ID: " + child_cmid)
+                                    _replaceChildAt(doc_root, template_node_positions[id(template_node)], child.cloneNode(True), template_node)
 
     def combineLinks(self, ams_list, dom_template):
         '''Replace each link in dom_template with matching link from (an) AM with same URN.
@@ -394,7 +507,7 @@ class ManifestRSpecCombiner:
         docAM = None
         children = doc_root.childNodes
         # Collect the link client_ids in the template
-        template_link_cids=[]
+        template_link_cids=set()
         for child in children:
             if child.nodeType == Node.ELEMENT_NODE and \
                     child.localName == defs.LINK_TAG:
@@ -402,17 +515,12 @@ class ManifestRSpecCombiner:
                 # Get first 'component_manager' child element
 #                print "LINK = " + str(link) + " " + cmid
                 client_id = str(link.getAttribute(CLIENT_ID))
-                template_link_cids.append(client_id)
+                template_link_cids.add(client_id)
 
         # loop over AMs. If an AM has a link client_id not in template_link_ids
         # and the link has that AM as a component_manager, then append this link to the template
         for agg in ams_list:
-            if self.useReqs and not agg.manifestDom:
-                if not agg.requestDom:
-                    agg.requestDom = agg.getEditedRSpecDom(dom_template)
-                man = agg.requestDom
-            else:
-                man = agg.manifestDom
+            man = self.getAMDom(agg, dom_template)
             if man is None:
                 self.logger.debug("%s had no manifest DOM", agg)
                 continue
@@ -421,11 +529,7 @@ class ManifestRSpecCombiner:
                 self.logger.debug("combineLinks Skipping manifest from %s - same as template", agg)
                 docAM = agg
                 continue
-            man_kids = man_root.childNodes
-            for link2 in man_kids:
-                if link2.nodeType != Node.ELEMENT_NODE or \
-                        link2.localName != defs.LINK_TAG:
-                    continue
+            for link2 in self.getIndex(man).links:
                 cid = link2.getAttribute(CLIENT_ID)
                 # If the manifest has this link, then we're good
                 if cid in template_link_cids:
@@ -446,12 +550,12 @@ class ManifestRSpecCombiner:
                 if myLink:
 #                    self.logger.debug("Adding link %s (%s)", cid, link2.toxml(encoding="utf-8"))
                     doc_root.appendChild(link2.cloneNode(True))
-                    template_link_cids.append(cid)
+                    template_link_cids.add(cid)
         # Done adding links from AMs not in template
 
         # Now go through the links in the template, swapping in info from the appropriate manifest RSpecs
         children = doc_root.childNodes
-        for child in children:
+        for (position, child) in enumerate(children):
             if child.nodeType == Node.ELEMENT_NODE and \
                     child.localName == defs.LINK_TAG:
                 link = child
@@ -525,12 +629,7 @@ class ManifestRSpecCombiner:
 #                    else:
 #                        self.logger.debug("Looking at AM %s for link %s", agg.urn, client_id)
 
-                    if self.useReqs and not agg.manifestDom:
-                        if not agg.requestDom:
-                            agg.requestDom = agg.getEditedRSpecDom(dom_template)
-                        man = agg.requestDom
-                    else:
-                        man = agg.manifestDom
+                    man = self.getAMDom(agg, dom_template)
                     if man is None:
                         self.logger.debug("%s had no manifest DOM", agg)
                         continue
@@ -538,10 +637,8 @@ class ManifestRSpecCombiner:
                         self.logger.debug("combineLinks Skipping manifest from %s - same as template", agg)
                         continue
                     self.logger.debug("combineLinks Considering manifest from %s", agg)
-                    for link2 in man.documentElement.childNodes:
-                        if link2.nodeType != Node.ELEMENT_NODE or \
-                                link2.localName != defs.LINK_TAG:
-                            continue
+                    # Only this AM's links with the same client_id can match
+                    for link2 in self.getIndex(man).linksByClientId.get(client_id, []):
                         # If this is a manifest link and all irefs have
                         # manifest info, then this link is done. Move on.
                         # FIXME: This means we do not add the link sliver_id
@@ -701,7 +798,7 @@ class ManifestRSpecCombiner:
                                         comment_element = dom_template.createComment(comment_text)
                                         link2Clone.insertBefore(comment_element, link2Clone.firstChild)
 
-                                doc_root.replaceChild(link2Clone, link)
+                                _replaceChildAt(doc_root, position, link2Clone, link)
                                 needSwap = False
 
                                 link = link2Clone
@@ -859,12 +956,7 @@ class ManifestRSpecCombiner:
             for am in ams_list:
                 if len(am.hops) > 0:
                     self.logger.debug("Template DOM had no stitching node. Using stitching node from %s", am)
-                    if self.useReqs and not am.manifestDom:
-                        if not am.requestDom:
-                            am.requestDom = am.getEditedRSpecDom(dom_template)
-                        am_manifest_dom = am.requestDom
-                    else:
-                        am_manifest_dom = am.manifestDom
+                    am_manifest_dom = self.getAMDom(am, dom_template)
                     newStitch = self.getStitchingElement(am_manifest_dom)
                     break
             if newStitch is not None:
@@ -890,16 +982,15 @@ class ManifestRSpecCombiner:
                 return
         # End of block to handle have no stitching template
 
+        # The template is edited below, so index it here and keep
+        # the index up to date as paths and hops are swapped in
+        template_index = ManifestIndex(dom_template)
+
         for am in ams_list:
             if am.dcn:
                 self.logger.debug("Pulling hops from a DCN AM: %s", am)
 
-            if self.useReqs and not am.manifestDom:
-                if not am.requestDom:
-                    am.requestDom = am.getEditedRSpecDom(dom_template)
-                am_manifest_dom = am.requestDom
-            else:
-                am_manifest_dom = am.manifestDom
+            am_manifest_dom = self.getAMDom(am, dom_template)
             if am_manifest_dom == dom_template:
                 self.logger.debug("AM %s's manifest is the dom_template- no need to do combineHops here.", am)
                 continue
@@ -908,7 +999,8 @@ class ManifestRSpecCombiner:
                 self.logger.debug("%s had no manifest DOM", am)
                 continue
 
-            amStitch = self.getStitchingElement(am_manifest_dom)
+            am_index = self.getIndex(am_manifest_dom)
+            amStitch = am_index.stitching
             if amStitch == template_stitching:
                 self.logger.debug("%s's stitching element is same as the template. No need to combine.", am)
                 continue
@@ -929,18 +1021,20 @@ class ManifestRSpecCombiner:
                     continue
                 if hop.aggregate != am:
                     self.logger.error("%s says AM is %s, but expected %s", hop, hop.aggregate, am)
-                template_path = self.findPathByID(template_stitching, path_id)
+                template_path = template_index.findPath(path_id)
                 if template_path is None:
                     self.logger.debug("Cannot find path %s in template manifest", path_id)
                     # Find it on the AM and append it to the template
-                    am_path = self.findPathByID(amStitch, path_id)
-                    template_stitching.appendChild(am_path.cloneNode(True))
+                    am_path = am_index.findPath(path_id)
+                    new_path = am_path.cloneNode(True)
+                    template_stitching.appendChild(new_path)
+                    template_index.addPath(new_path)
                     self.logger.debug(" ... added it from this AM")
                     continue
                 #self.logger.debug("Found path %s in template manifest: %s", path_id, template_path.toxml(encoding="utf-8"))
                 #                print "AGG " + str(am) + " HID " + str(hop_id)
                 if not am.isEG:
-                    res = self.replaceHopOrAddElement(template_path, self.getStitchingElement(am_manifest_dom), hop_id, path_id)
+                    res = self.replaceHopOrAddElement(template_index, am_index, hop_id, path_id)
 #                    for child in template_path.childNodes:
 #                        if child.nodeType == Node.ELEMENT_NODE and \
 #                                child.localName == HOP and \
@@ -951,7 +1045,7 @@ class ManifestRSpecCombiner:
                     link_id = hop._hop_link.urn
                     # FIXME: the hop_id, link_id and path_id are from the AM manifest. Is that right?
                     # And for EG is the manifest the new one, after getting a sliverstatus? Is that needed?
-                    if not self.replaceHopLinkElement(template_path, amStitch, hop_id, path_id, link_id):
+                    if not self.replaceHopLinkElement(template_index, am_index, hop_id, path_id, link_id):
                         # failed to find the hop in the am to replace the element in the template. So instead, edit the element in the template
                         # to have the proper updated avail/suggested values
                         # If am.hops only has 1 hop on this path and it isn't in the template at all, then this is a case where I want to do the edit
@@ -1113,31 +1207,21 @@ class ManifestRSpecCombiner:
 
     # Replace the hop element in the template DOM with the hop element 
     # from the aggregate DOM that has the given HOP ID
-    def replaceHopOrAddElement(self, template_path, am_stitching, hop_id, path_id):
-        template_hop = None
-
-        for child in template_path.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and \
-                    child.localName == HOP and \
-                    child.getAttribute(HOP_ID) == hop_id:
-                template_hop = child
-                break
+    # Takes the ManifestIndex of the template and of the aggregate DOM
+    def replaceHopOrAddElement(self, template_index, am_index, hop_id, path_id):
+        template_path = template_index.findPath(path_id)
+        template_hop = template_index.findHop(path_id, hop_id)
         if template_hop is None:
             # This used to be an error and return, cause it means we can't replace
             # So now instead we will do an add
             self.logger.info("Cannot find hop %s in template manifest path %s - will add it", hop_id, path_id)
 
         # Find the path for the given path_id (there may be more than one)
-        am_path = self.findPathByID(am_stitching, path_id)
+        am_path = am_index.findPath(path_id)
 
         am_hop = None
         if am_path is not None:
-            for child in am_path.childNodes:
-                if child.nodeType == Node.ELEMENT_NODE and \
-                        child.localName == HOP and \
-                        child.getAttribute(HOP_ID) == hop_id:
-                    am_hop = child
-                    break
+            am_hop = am_index.findHop(path_id, hop_id)
         else:
             self.logger.error("Cannot find path %s in AM's stitching extension when looking to use AM's version of hop %s", path_id, hop_id)
             # self.logger.debug("%s" % am_stitching)
@@ -1145,10 +1229,14 @@ class ManifestRSpecCombiner:
 
         if am_hop is not None and template_hop is not None:
 #            self.logger.debug("Replacing " + template_hop.toxml(encoding="utf-8") + " with " + am_hop.toxml(encoding="utf-8"))
-            template_path.replaceChild(am_hop.cloneNode(True), template_hop)
+            new_hop = am_hop.cloneNode(True)
+            template_path.replaceChild(new_hop, template_hop)
+            template_index.setHop(path_id, hop_id, new_hop)
         elif am_hop is not None:
             self.logger.debug("Instead of replacing hop, will add")
-            template_path.appendChild(am_hop.cloneNode(True))
+            new_hop = am_hop.cloneNode(True)
+            template_path.appendChild(new_hop)
+            template_index.setHop(path_id, hop_id, new_hop)
         else:
             self.logger.error ("Can't replace hop %s from path %s in template: AM HOP %s TEMPLATE HOP %s" % (hop_id, path_id, am_hop, template_hop))
             return False
@@ -1158,25 +1246,22 @@ class ManifestRSpecCombiner:
     # Replace the hop link element in the template DOM with the hop link element 
     # from the aggregate DOM that has the given HOP LINK ID
     # For use with EG AMs
+    # Takes the ManifestIndex of the template and of the aggregate DOM
     # Return true if it did a replace, else False
-    def replaceHopLinkElement(self, template_path, am_stitching, template_hop_id, path_id, link_id):
+    def replaceHopLinkElement(self, template_index, am_index, template_hop_id, path_id, link_id):
+        template_path = template_index.findPath(path_id)
         template_link = None
-        template_hop = None
+        template_hop = template_index.findHop(path_id, template_hop_id)
 
-        for child in template_path.childNodes:
-            if child.nodeType == Node.ELEMENT_NODE and \
-                    child.localName == HOP and \
-                    child.getAttribute(HOP_ID) == template_hop_id:
-                template_hop = child
-                for child2 in child.childNodes:
-                    if child2.nodeType == Node.ELEMENT_NODE and \
-                            child2.localName == LINK:
-                        template_link = child2
-                        break
-                if template_link is None:
-                    self.logger.warn("Did not find stitching hop %s's link in template manifest RSpec for path '%s'", template_hop_id, path_id)
-                    return
-                break
+        if template_hop is not None:
+            for child2 in template_hop.childNodes:
+                if child2.nodeType == Node.ELEMENT_NODE and \
+                        child2.localName == LINK:
+                    template_link = child2
+                    break
+            if template_link is None:
+                self.logger.warn("Did not find stitching hop %s's link in template manifest RSpec for path '%s'", template_hop_id, path_id)
+                return
         if template_hop is None:
             if "exogeni.net" in link_id:
                 self.logger.debug("Failed to find hop in template by hop_id '%s' on path '%s' in template; hop_link is exogeni (%s)", template_hop_id, path_id, link_id)
@@ -1211,19 +1296,11 @@ class ManifestRSpecCombiner:
                 return False
 
         # Find the path for the given path_id (there may be more than one)
-        am_path = self.findPathByID(am_stitching, path_id)
+        am_path = am_index.findPath(path_id)
 
         am_link = None
         if am_path is not None:
-            for child in am_path.childNodes:
-                if child.nodeType == Node.ELEMENT_NODE and \
-                        child.localName == HOP:
-                    for child2 in child.childNodes:
-                        if child2.nodeType == Node.ELEMENT_NODE and \
-                                child2.localName == LINK and \
-                                child2.getAttribute(LINK_ID) == link_id:
-                            am_link = child2
-                            break
+            am_link = am_index.findHopLink(path_id, link_id)
             if am_link is None:
                 self.logger.debug("Did not find HopLink '%s' in AM's Man RSpec, though found AM's path '%s' (usually harmless; happens 2+ times for ExoGENI aggregates)", link_id, path_id)
                 return False
@@ -27,23 +27,91 @@ from __future__ import absolute_import
 
 import logging
 import sys
+from StringIO import StringIO
 from xml.dom.minidom import parseString, getDOMImplementation
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 
 from . import objects
 from .utils import StitchingError
 from . import defs
 
+def _localName(tag):
+    '''Strip the {namespace} from an ElementTree tag'''
+    if tag[:1] == '{':
+        return tag[tag.find('}') + 1:]
+    return tag
+
+class _TextNode(object):
+    '''The text at the start of an ElementTree element, as a DOM text node'''
+    localName = None
+
+    def __init__(self, text):
+        self.nodeValue = unicode(text)
+        self.data = self.nodeValue
+
+class _ElementNode(object):
+    '''An ElementTree element, with the part of the DOM element interface
+    that the fromDOM methods of the stitching objects use.
+    childNodes lists only the child elements, and getElementsByTagName
+    matches the local name (ElementTree does not keep namespace prefixes).'''
+
+    def __init__(self, element):
+        self._element = element
+        self.localName = _localName(element.tag)
+        self.nodeValue = None
+
+    def getAttribute(self, name):
+        value = self._element.get(name)
+        if value is None:
+            return ''
+        return unicode(value)
+
+    def hasAttribute(self, name):
+        return self._element.attrib.has_key(name)
+
+    @property
+    def childNodes(self):
+        return [_ElementNode(child) for child in self._element]
+
+    @property
+    def firstChild(self):
+        if self._element.text:
+            return _TextNode(self._element.text)
+        if len(self._element) > 0:
+            return _ElementNode(self._element[0])
+        return None
+
+    def getElementsByTagName(self, name):
+        if hasattr(self._element, 'iter'):
+            elements = self._element.iter()
+        else:
+            # Python 2.6
+            elements = self._element.getiterator()
+        return [_ElementNode(element) for element in elements
+                if element is not self._element and _localName(element.tag) == name]
+
 class RSpecParser:
 
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, streaming=False):
         self.logger = logger if logger else logging.getLogger('stitch')
+        # Parse with parseStream instead of building a DOM of the whole RSpec
+        self.streaming = streaming
 
     def parse(self, data):
+        if self.streaming:
+            return self.parseStream(data)
         try:
             dom = parseString(data)
         except Exception, e:
             self.logger.error("Failed to parse rspec: %s", e)
             raise StitchingError("Failed to parse rspec: %s" % e)
+        return self.parseDOM(dom)
+
+    def parseDOM(self, dom):
+        '''Parse an RSpec that is already a DOM. Return an RSpec object whose dom is the given DOM.'''
         rspecs = dom.getElementsByTagName(defs.RSPEC_TAG)
         if len(rspecs) != 1:
             raise StitchingError("Expected 1 rspec tag, got %d" % (len(rspecs)))
@@ -75,7 +143,10 @@ class RSpecParser:
             else:
 #                self.logger.debug("Skipping '%s' node", child.nodeName)
                 pass
+        return self.makeRSpec(nodes, links, stitching)
 
+    def makeRSpec(self, nodes, links, stitching):
+        '''Return an RSpec object for the given parsed Nodes, Links and Stitching'''
         # Create the object version of the rspec
         rspec = objects.RSpec(stitching)
         rspec.links = links
@@ -103,6 +174,81 @@ class RSpecParser:
         stitching = objects.Stitching(last_update_time, paths)
         return stitching
 
+    def parseStream(self, data):
+        '''Parse the rspec from the stream of iterparse events, without building
+        a DOM of the whole RSpec. Each main body node and link and each
+        stitching path is parsed into an object when its end tag is read, and
+        then its elements are freed. The RSpec's dom is parsed from the data
+        only if something uses it. Note that stitcher makes each aggregate's
+        request by editing a copy of that dom, so for an expanded request the
+        whole DOM is still built, when the first reservation is made.
+        Return an RSpec object for use in driving stitching.'''
+        links = []
+        nodes = []
+        stitching = None
+        rspecCount = 0
+        rspecElement = None
+        rspecDepth = None
+        rspecDone = False
+        stitchingElement = None
+        stitchingPaths = None
+        stitchingUpdateTime = None
+        depth = 0
+        xml = data
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        events = ElementTree.iterparse(StringIO(xml), events=("start", "end"))
+        while True:
+            try:
+                (event, element) = events.next()
+            except StopIteration:
+                break
+            except Exception, e:
+                self.logger.error("Failed to parse rspec: %s", e)
+                raise StitchingError("Failed to parse rspec: %s" % e)
+            name = _localName(element.tag)
+            if event == "start":
+                depth += 1
+                if name == defs.RSPEC_TAG:
+                    rspecCount += 1
+                    if rspecElement is None:
+                        rspecElement = element
+                        rspecDepth = depth
+                elif not rspecDone and rspecDepth is not None and depth == rspecDepth + 1 and \
+                        name == defs.STITCHING_TAG:
+                    stitchingElement = element
+                    stitchingPaths = []
+                    stitchingUpdateTime = element.get(defs.LAST_UPDATE_TIME_TAG, '')
+                continue
+
+            # End of an element
+            depth -= 1
+            if rspecDone or rspecDepth is None:
+                continue
+            if element is rspecElement:
+                rspecDone = True
+            elif element is stitchingElement:
+                stitching = objects.Stitching(stitchingUpdateTime, stitchingPaths)
+                stitchingElement = None
+                del rspecElement[:]
+            elif stitchingElement is not None:
+                if depth == rspecDepth + 1 and name == defs.PATH_TAG:
+                    stitchingPaths.append(objects.Path.fromDOM(_ElementNode(element)))
+                    # Done with this path's elements
+                    del stitchingElement[:]
+            elif depth == rspecDepth:
+                if name == defs.LINK_TAG:
+                    links.append(objects.Link.fromDOM(_ElementNode(element)))
+                elif name == defs.NODE_TAG:
+                    nodes.append(objects.Node.fromDOM(_ElementNode(element)))
+                # Done with this child of the rspec
+                del rspecElement[:]
+        if rspecCount != 1:
+            raise StitchingError("Expected 1 rspec tag, got %d" % (rspecCount))
+        rspec = self.makeRSpec(nodes, links, stitching)
+        rspec.setDomXML(xml)
+        return rspec
+
 if __name__ == "__main__":
     if len(sys.argv) <= 1:
         print "Usage RspecParser <file.xml> [<out.xml>]"
@@ -22,6 +22,9 @@
 #----------------------------------------------------------------------
 '''Utility classes to represent a VLAN tag and a VLAN range'''
 
+import bisect
+import heapq
+
 class VLAN( int ):
     # VLANs are [0, 4095] (inclusive)
     # Worry about reserved VLANs? 0, 1, 4095?
@@ -47,40 +50,78 @@ class VLAN( int ):
     def maxvlan(cls):
         return cls.__maxvlan
 
-class VLANRange( set ):
-    '''A set of ints or VLANs representing a range of VLAN tags.'''
+class VLANRange(object):
+    '''A set of ints or VLANs representing a range of VLAN tags.
+
+    Supports the usual set operations (in, len, iteration, &, |, -, ^,
+    <=, union, intersection, difference, isdisjoint, add, discard, ...).
+    The tags are kept as a sorted list of disjoint, non adjacent
+    (low, high) intervals, so 'any' is a single interval and set
+    operations cost O(number of intervals), not O(number of tags).'''
+
     def __init__( self, vlan=None ):
+        self._intervals = [] # sorted list of inclusive (low, high) tuples
         if vlan is None:
-            super( VLANRange, self).__init__()
+            return
+        elif isinstance(vlan, VLANRange):
+            self._intervals = list(vlan._intervals)
         elif isinstance(vlan, VLAN) or isinstance(vlan, int):
-            super( VLANRange, self).__init__([vlan])
+            self._intervals = [(int(vlan), int(vlan))]
         elif isinstance(vlan, list) or isinstance(vlan, tuple):
-            retRange = VLANRange()
             for item in vlan:
-                newItem = VLAN(item)
-                retRange.add( newItem )
-            super( VLANRange, self).__init__(vlan)
-        elif isinstance(vlan, set):
-            super( VLANRange, self).__init__(vlan)
-        elif isinstance(vlan, VLANRange):
-            super( VLANRange, self).__init__(vlan)
+                VLAN(item)
+            self._intervals = VLANRange._intervalsFromTags(vlan)
+        elif isinstance(vlan, set) or isinstance(vlan, frozenset):
+            self._intervals = VLANRange._intervalsFromTags(vlan)
         else:
             raise TypeError("Value must be one of 'int', 'VLAN', or 'VLANRange' instead is '%s'" % type(vlan))
 
-        
     @classmethod
     def _isValidVLAN( cls, other ):
         if isinstance(other, VLANRange) or isinstance(other, VLAN):
             return True
         else:
             return False
-    
-    # Inherit from parent object (set):
-    #   __contains__, __sub__, __and__, __eq__
-    # FIXME: set has no __add__. There is __and__ or add, but no __add__. What is intended here?
-#    def __add__( self, other ):
-#        newRange = VLANRange( other )
-#        super( VLANRange, self).__add__(newRange)                    
+
+    @classmethod
+    def _fromIntervals( cls, intervals ):
+        # intervals must already be sorted, disjoint and non adjacent
+        newObj = cls()
+        newObj._intervals = intervals
+        return newObj
+
+    @staticmethod
+    def _intervalsFromTags( tags ):
+        intervals = []
+        for tag in sorted(set([int(tag) for tag in tags])):
+            if intervals and intervals[-1][1] + 1 == tag:
+                intervals[-1] = (intervals[-1][0], tag)
+            else:
+                intervals.append((tag, tag))
+        return intervals
+
+    @staticmethod
+    def _normalize( intervals, isSorted=False ):
+        '''Sort the (low, high) intervals and merge overlapping or adjacent ones'''
+        if not isSorted:
+            intervals = sorted(intervals)
+        out = []
+        for (low, high) in intervals:
+            if out and low <= out[-1][1] + 1:
+                if high > out[-1][1]:
+                    out[-1] = (out[-1][0], high)
+            else:
+                out.append((low, high))
+        return out
+
+    @classmethod
+    def _coerce( cls, other ):
+        if isinstance(other, VLANRange):
+            return other
+        if isinstance(other, VLAN) or isinstance(other, int) or isinstance(other, set) \
+                or isinstance(other, frozenset) or isinstance(other, list) or isinstance(other, tuple):
+            return cls(other)
+        return None
 
     @classmethod
     def fromString( cls, stringIn ):
@@ -89,19 +130,19 @@ class VLANRange( set ):
         #   any
         #   1-20
         #   1-20, 454, 700-801
-        newObj = VLANRange()
+        newObj = cls()
 
         inputs = str(stringIn).strip()
         if inputs == "":
             return newObj
+        intervals = []
         items = inputs.split(",")
         for item in items:
             splitItem = item.split("-")
             parsedItems = [parse.strip().lower() for parse in splitItem]
-#            print parsedItems
             minValue = -1
             maxValue = -1
-            if len(parsedItems) == 1:                
+            if len(parsedItems) == 1:
                 first = parsedItems[0]
                 try:
                     minValue = int(first)
@@ -121,51 +162,247 @@ class VLANRange( set ):
                     raise ValueError("Both values must be integers instead received %s " % str(item))
             else:
                 raise ValueError("Range should contain at most 2 values instead received %s " % str(item))
-#            print minValue, maxValue
-            for newVLAN in xrange(minValue,maxValue+1):
-                newObj.add( newVLAN )
+            if minValue <= maxValue:
+                intervals.append((minValue, maxValue))
+        newObj._intervals = cls._normalize(intervals)
         return newObj
 
+    def intervals( self ):
+        '''Return the sorted list of inclusive (low, high) tuples of tags in this range'''
+        return list(self._intervals)
+
     def __str__( self ):
-        out = ""
-        if len(self) == 0:
-            return out
-        hasNum = False
-        min = VLAN.maxvlan()+1
-        max = VLAN.minvlan()-1
-        for num in sorted(self):
-            if min <= VLAN.maxvlan() and (max+1) == num:
-                max = num
-                continue
-            elif min <= VLAN.maxvlan() and num > max+1:
-                if hasNum:
-                    out += ','
-                if max > min+1:
-                    out += str(min)+'-'+str(max)
-                    hasNum = True
-                else:
-                    out += str(min)
-                    hasNum = True
-                    if max > min:
-                        out += ',' + str(max)
-                min = num
-                max = num
-                continue
+        if len(self._intervals) == 1 and self._intervals[0] == (VLAN.minvlan(), VLAN.maxvlan()):
+            return 'any'
+        out = []
+        for (low, high) in self._intervals:
+            if high > low+1:
+                out.append(str(low)+'-'+str(high))
+            elif high > low:
+                out.append(str(low)+','+str(high))
             else:
-                min = num
-                max = num
-        if hasNum:
-            out += ','
-        if min == VLAN.minvlan() and max == VLAN.maxvlan():
-            out = 'any'
-        elif max > min+1:
-            out += str(min)+'-'+str(max)
-        else:
-            out += str(min)
-            if max > min:
-                out += ',' + str(max)
+                out.append(str(low))
+        return ','.join(out)
+
+    def __repr__( self ):
+        return "VLANRange.fromString('%s')" % str(self)
+
+    # Container protocol
+
+    def __len__( self ):
+        count = 0
+        for (low, high) in self._intervals:
+            count += high - low + 1
+        return count
+
+    def __nonzero__( self ):
+        return len(self._intervals) > 0
+
+    def __iter__( self ):
+        for (low, high) in self._intervals:
+            for tag in xrange(low, high+1):
+                yield tag
+
+    def __contains__( self, tag ):
+        try:
+            tag = int(tag)
+        except (TypeError, ValueError):
+            return False
+        # Last interval starting at or before tag
+        idx = bisect.bisect_left(self._intervals, (tag+1,)) - 1
+        return idx >= 0 and self._intervals[idx][0] <= tag <= self._intervals[idx][1]
+
+    # Comparisons
+
+    def __eq__( self, other ):
+        otherRange = VLANRange._coerce(other)
+        if otherRange is None:
+            return NotImplemented
+        return self._intervals == otherRange._intervals
+
+    def __ne__( self, other ):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    # Like set, a VLANRange can change so is not hashable
+    __hash__ = None
+
+    def issubset( self, other ):
+        otherRange = VLANRange._coerce(other)
+        return len(self._difference(self._intervals, otherRange._intervals)) == 0
+
+    def issuperset( self, other ):
+        return VLANRange._coerce(other).issubset(self)
+
+    def isdisjoint( self, other ):
+        otherRange = VLANRange._coerce(other)
+        return len(self._intersection(self._intervals, otherRange._intervals)) == 0
+
+    def __le__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.issubset(other)
+
+    def __ge__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.issuperset(other)
+
+    def __lt__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.issubset(other) and self != other
+
+    def __gt__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.issuperset(other) and self != other
+
+    # Set algebra: each is a merge of the two sorted interval lists
+
+    @staticmethod
+    def _intersection( a, b ):
+        out = []
+        i = 0
+        j = 0
+        while i < len(a) and j < len(b):
+            low = max(a[i][0], b[j][0])
+            high = min(a[i][1], b[j][1])
+            if low <= high:
+                out.append((low, high))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
         return out
 
+    @staticmethod
+    def _union( a, b ):
+        return VLANRange._normalize(heapq.merge(a, b), isSorted=True)
+
+    @staticmethod
+    def _difference( a, b ):
+        out = []
+        j = 0
+        for (low, high) in a:
+            while j < len(b) and b[j][1] < low:
+                j += 1
+            k = j
+            while k < len(b) and b[k][0] <= high:
+                if b[k][0] > low:
+                    out.append((low, b[k][0]-1))
+                low = b[k][1]+1
+                if low > high:
+                    break
+                k += 1
+            if low <= high:
+                out.append((low, high))
+        return out
+
+    def intersection( self, *others ):
+        intervals = self._intervals
+        for other in others:
+            intervals = self._intersection(intervals, VLANRange._coerce(other)._intervals)
+        return VLANRange._fromIntervals(intervals)
+
+    def union( self, *others ):
+        intervals = self._intervals
+        for other in others:
+            intervals = self._union(intervals, VLANRange._coerce(other)._intervals)
+        return VLANRange._fromIntervals(list(intervals))
+
+    def difference( self, *others ):
+        intervals = self._intervals
+        for other in others:
+            intervals = self._difference(intervals, VLANRange._coerce(other)._intervals)
+        return VLANRange._fromIntervals(list(intervals))
+
+    def symmetric_difference( self, other ):
+        otherRange = VLANRange._coerce(other)
+        return self.difference(otherRange).union(otherRange.difference(self))
+
+    def copy( self ):
+        return VLANRange._fromIntervals(list(self._intervals))
+
+    def __and__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.intersection(other)
+
+    def __or__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.union(other)
+
+    def __sub__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.difference(other)
+
+    def __xor__( self, other ):
+        if VLANRange._coerce(other) is None:
+            return NotImplemented
+        return self.symmetric_difference(other)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def __rsub__( self, other ):
+        otherRange = VLANRange._coerce(other)
+        if otherRange is None:
+            return NotImplemented
+        return otherRange.difference(self)
+
+    # Changing the range in place
+
+    def add( self, tag ):
+        tag = int(tag)
+        self._intervals = self._union(self._intervals, [(tag, tag)])
+
+    def discard( self, tag ):
+        tag = int(tag)
+        if tag in self:
+            self._intervals = self._difference(self._intervals, [(tag, tag)])
+
+    def remove( self, tag ):
+        if tag not in self:
+            raise KeyError(tag)
+        self.discard(tag)
+
+    def pop( self ):
+        if not self._intervals:
+            raise KeyError('pop from an empty VLANRange')
+        tag = self._intervals[0][0]
+        self.discard(tag)
+        return tag
+
+    def clear( self ):
+        self._intervals = []
+
+    def update( self, *others ):
+        self._intervals = self.union(*others)._intervals
+
+    def intersection_update( self, *others ):
+        self._intervals = self.intersection(*others)._intervals
+
+    def difference_update( self, *others ):
+        self._intervals = self.difference(*others)._intervals
+
+    def __ior__( self, other ):
+        self.update(other)
+        return self
+
+    def __iand__( self, other ):
+        self.intersection_update(other)
+        return self
+
+    def __isub__( self, other ):
+        self.difference_update(other)
+        return self
+
 
 if __name__ == "__main__":
     print "\nSome operations on VLANRanges...\n"
@@ -24,60 +24,71 @@
 
 from __future__ import absolute_import
 
+import copy
 import datetime
 import logging
-import time
+import Queue
+import sys
+import threading
 
 from .utils import StitchingRetryAggregateNewVlanError, StitchingRetryAggregateNewVlanImmediatelyError, StitchingError, StitchingStoppedError
 from .objects import Aggregate
+from .polling import PollScheduler
 
 class Launcher(object):
 
+    # Seconds between checks for a finished allocation, so the
+    # main thread still notices Ctrl-C while aggregates are allocating
+    RESULT_POLL_INTERVAL_SECS = 1
+
     def __init__(self, options, slicename, aggs=[], timeoutTime=datetime.datetime.max, logger=None):
         self.aggs = aggs # Aggregate objects
         self.opts = options # Omni options
         self.slicename = slicename
         self.timeoutTime = timeoutTime
         self.logger = logger or logging.getLogger('stitch.launcher')
+        self.poller = None # PollScheduler used by the aggregates during launch
+        self.failedAggs = [] # Aggregates whose allocation raised a StitchingError
 
     def launch(self, rspec, scsCallCount):
         '''The main loop for stitching: keep looking for AMs that are not complete, then 
-        make a reservation there.'''
+        make a reservation there.
+        With the --parallel option, aggregates that do not depend on each other
+        make their reservations at the same time (see _launch_concurrent).
+        Waits at the aggregates are scheduled by a PollScheduler; see
+        self.poller.getStats() for the time spent waiting vs calling aggregates.'''
+        self.poller = PollScheduler()
+        for agg in self.aggs:
+            agg.poller = self.poller
+        try:
+            maxThreads = getattr(self.opts, 'parallel', 1)
+            if maxThreads and maxThreads > 1 and len(self.aggs) > 1:
+                return self._launch_concurrent(rspec, scsCallCount, maxThreads)
+            return self._launch_serial(rspec, scsCallCount)
+        finally:
+            # Cut short any waits of allocations still running
+            self.poller.stop()
+            for agg in self.aggs:
+                agg.poller = None
+            stats = self.poller.getStats()
+            self.logger.info("Spent %d seconds waiting for aggregates, and %d seconds in aggregate calls",
+                             stats['sleep'], stats['call'])
+
+    def _launch_serial(self, rspec, scsCallCount):
+        '''Allocate at one ready aggregate at a time'''
         lastAM = None
         while not self._complete():
-            if datetime.datetime.utcnow() >= self.timeoutTime:
-                msg = "Reservation attempt timed out after %d minutes." % self.opts.timeout
-                raise StitchingError(msg)
+            self._check_timeout()
             ready_aggs = self._ready_aggregates()
             if len(ready_aggs) == 0 and not self._complete():
-                self.logger.debug("Error! No ready aggregates and not all complete!")
-                for agg in self.aggs:
-                    if not agg.completed:
-                        self.logger.debug("%s is not complete but also not ready. inProcess=%s, depsComplete=%s", agg, agg.inProcess, agg.dependencies_complete)
-                raise StitchingError("Internal stitcher error: No aggregates are ready to allocate but not all are complete?")
-
-            if self.opts.noTransitAMs:
-                allTransit = True
-                for agg in ready_aggs:
-                    if agg.userRequested:
-                        allTransit = False
-                        break
-                if allTransit:
-                    self.logger.debug("Only transit AMs are now ready to allocate - will stop")
-                    incompleteAMs = 0
-                    for agg in self.aggs:
-                        if not agg.completed:
-                            incompleteAMs += 1
-                        if agg.userRequested and agg.manifestDom is None:
-                            self.logger.debug("WARN: Some non transit AMs not done, like %s", agg)
-                    raise StitchingStoppedError("Per commandline option, stopping reservation before doing transit AMs. %d AM(s) not reserved." % incompleteAMs)
+                self._no_ready_aggregates()
+
+            self._check_transit(ready_aggs)
 
             self.logger.debug("\nThere are %d ready aggregates: %s",
                               len(ready_aggs), ready_aggs)
             for agg in ready_aggs:
-                if datetime.datetime.utcnow() >= self.timeoutTime:
-                    msg = "Reservation attempt timed out after %d minutes." % self.opts.timeout
-                    raise StitchingError(msg)
+                self._check_timeout()
 
                 lastAM = agg
                 # FIXME: Need a timeout mechanism on AM calls
@@ -85,38 +96,182 @@ class Launcher(object):
                     agg.allocate(self.opts, self.slicename, rspec.dom, scsCallCount)
                 except StitchingRetryAggregateNewVlanError, se:
                     self.logger.info("Will put %s back in the pool to allocate. Got: %s", agg, se)
-
-                    # Aggregate.BUSY_POLL_INTERVAL_SEC = 10 # dossl does 10
-                    # Aggregate.PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS = 30
-                    # Use the v3 AM sleep by default.
-                    # But if any v2 AMs have (or have had) reservations, then use that sleep
-                    secs = Aggregate.PAUSE_FOR_V3_AM_TO_FREE_RESOURCES_SECS
-                    for agg2 in self.aggs:
-                        if agg2.api_version == 2 and secs < Aggregate.PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS and agg2.triedRes:
-                            secs = Aggregate.PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS
-                    if not isinstance(se, StitchingRetryAggregateNewVlanImmediatelyError):
-                        if agg.dcn:
-                            secs = Aggregate.PAUSE_FOR_DCN_AM_TO_FREE_RESOURCES_SECS
-
-                    if datetime.datetime.utcnow() + datetime.timedelta(seconds=secs) >= self.timeoutTime:
-                        # We'll time out. So quit now.
-                        self.logger.debug("After planned sleep for %d seconds we will time out", secs)
-                        msg = "Reservation attempt timing out after %d minutes." % self.opts.timeout
-                        raise StitchingError(msg)
-
-                    self.logger.info("Pausing for %d seconds for Aggregates to free up resources...\n\n", secs)
-                    time.sleep(secs)
+                    self._pause_before_retry(agg, se)
 
                     # After this exception/retry, the list of ready aggregates may have changed
                     # For example, when we locally work back a bit to handle vlan unavailable
                     # So break out of this for loop, to make the while re-calculate the list of ready_aggs
                     break
+                except StitchingError:
+                    self.failedAggs.append(agg)
+                    raise
 
             # FIXME: Do we need to sleep?
 
         self.logger.info("All aggregates are complete.")
         return lastAM
 
+    def _launch_concurrent(self, rspec, scsCallCount, maxThreads):
+        '''Like launch, but run the allocations at up to maxThreads
+        ready aggregates at once. An aggregate is started as soon as
+        all the aggregates it depends on have their manifests.
+
+        When an aggregate must be retried with a new VLAN, no new allocations
+        are started; once the running ones finish, pause as usual for the
+        aggregates to free resources, then carry on.
+        On any other error, wait for the running allocations to finish,
+        then raise that error.'''
+        results = Queue.Queue() # of (agg, sys.exc_info() or None)
+        running = [] # Aggregates allocating on a worker thread
+        lastAM = None
+        retry = None # (agg, exception) for first aggregate to retry with a new VLAN
+        error = None # sys.exc_info() of the first fatal error
+
+        while True:
+            if error is None and retry is None and not self._complete():
+                try:
+                    self._check_timeout()
+                    ready_aggs = [agg for agg in self._ready_aggregates() if agg not in running]
+                    if len(running) == 0:
+                        if len(ready_aggs) == 0:
+                            self._no_ready_aggregates()
+                        self._check_transit(ready_aggs)
+                    if ready_aggs and len(running) < maxThreads:
+                        self.logger.debug("\nThere are %d ready aggregates: %s. Already allocating at %d: %s",
+                                          len(ready_aggs), ready_aggs, len(running), running)
+                    for agg in ready_aggs[:max(0, maxThreads - len(running))]:
+                        self._start_allocate(agg, rspec, scsCallCount, results)
+                        running.append(agg)
+                except StitchingError:
+                    error = sys.exc_info()
+                    self.poller.stop()
+
+            if len(running) == 0:
+                if error is not None:
+                    raise error[0], error[1], error[2]
+                if retry is not None:
+                    self._mark_stale_complete()
+                    self._pause_before_retry(retry[0], retry[1])
+                    retry = None
+                    continue
+                if self._complete():
+                    break
+                # Nothing running and not complete: the loop above
+                # either starts something or raises
+                continue
+
+            try:
+                (agg, exc_info) = results.get(True, self.RESULT_POLL_INTERVAL_SECS)
+            except Queue.Empty:
+                continue
+            running.remove(agg)
+            lastAM = agg
+            if exc_info is None:
+                continue
+            if isinstance(exc_info[1], StitchingRetryAggregateNewVlanError):
+                self.logger.info("Will put %s back in the pool to allocate. Got: %s", agg, exc_info[1])
+                if retry is None:
+                    retry = (agg, exc_info[1])
+            elif error is None:
+                if isinstance(exc_info[1], StitchingError):
+                    self.failedAggs.append(agg)
+                error = exc_info
+                # Stop waits at the other aggregates, so they finish quickly
+                self.poller.stop()
+                if running:
+                    self.logger.debug("Allocation at %s failed: waiting for %d other aggregate(s) to finish: %s",
+                                      agg, len(running), running)
+            else:
+                if isinstance(exc_info[1], StitchingError):
+                    self.failedAggs.append(agg)
+                self.logger.debug("Allocation at %s also failed: %s", agg, exc_info[1])
+
+        self.logger.info("All aggregates are complete.")
+        return lastAM
+
+    def _start_allocate(self, agg, rspec, scsCallCount, results):
+        '''Start allocating at the given aggregate on a new thread.
+        Put (agg, None) on the results queue when done, or (agg, sys.exc_info()) on error.'''
+        # Omni calls write the parsed arguments into the options object,
+        # so each thread needs its own. Logging was already configured
+        # by the stitcher, so do not reconfigure it from several threads at once.
+        opts = copy.copy(self.opts)
+        opts.noLoggingConfiguration = True
+
+        def allocate():
+            try:
+                agg.allocate(opts, self.slicename, rspec.dom, scsCallCount)
+                results.put((agg, None))
+            except:
+                results.put((agg, sys.exc_info()))
+
+        self.logger.debug("Starting allocation at %s", agg)
+        t = threading.Thread(target=allocate, name="allocate-%s" % (agg.nick or agg.urn))
+        t.setDaemon(True)
+        t.start()
+
+    def _mark_stale_complete(self):
+        '''An aggregate that finished allocating while another aggregate's
+        VLAN retry deleted a reservation it depends on must be redone.'''
+        for agg in self.aggs:
+            if agg.completed and not agg.dependencies_complete:
+                self.logger.debug("%s depends on an aggregate that must be redone: will redo it", agg)
+                agg.completed = False
+
+    def _check_timeout(self):
+        if datetime.datetime.utcnow() >= self.timeoutTime:
+            msg = "Reservation attempt timed out after %d minutes." % self.opts.timeout
+            raise StitchingError(msg)
+
+    def _no_ready_aggregates(self):
+        self.logger.debug("Error! No ready aggregates and not all complete!")
+        for agg in self.aggs:
+            if not agg.completed:
+                self.logger.debug("%s is not complete but also not ready. inProcess=%s, depsComplete=%s", agg, agg.inProcess, agg.dependencies_complete)
+        raise StitchingError("Internal stitcher error: No aggregates are ready to allocate but not all are complete?")
+
+    def _check_transit(self, ready_aggs):
+        '''Per the --noTransitAMs option, stop if only transit AMs are ready to allocate.'''
+        if not self.opts.noTransitAMs:
+            return
+        allTransit = True
+        for agg in ready_aggs:
+            if agg.userRequested:
+                allTransit = False
+                break
+        if allTransit:
+            self.logger.debug("Only transit AMs are now ready to allocate - will stop")
+            incompleteAMs = 0
+            for agg in self.aggs:
+                if not agg.completed:
+                    incompleteAMs += 1
+                if agg.userRequested and agg.manifestDom is None:
+                    self.logger.debug("WARN: Some non transit AMs not done, like %s", agg)
+            raise StitchingStoppedError("Per commandline option, stopping reservation before doing transit AMs. %d AM(s) not reserved." % incompleteAMs)
+
+    def _pause_before_retry(self, agg, se):
+        '''Sleep to let aggregates free resources, before retrying agg which raised se.'''
+        # Aggregate.BUSY_POLL_INTERVAL_SEC = 10 # dossl does 10
+        # Aggregate.PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS = 30
+        # Use the v3 AM sleep by default.
+        # But if any v2 AMs have (or have had) reservations, then use that sleep
+        secs = Aggregate.PAUSE_FOR_V3_AM_TO_FREE_RESOURCES_SECS
+        for agg2 in self.aggs:
+            if agg2.api_version == 2 and secs < Aggregate.PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS and agg2.triedRes:
+                secs = Aggregate.PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS
+        if not isinstance(se, StitchingRetryAggregateNewVlanImmediatelyError):
+            if agg.dcn:
+                secs = Aggregate.PAUSE_FOR_DCN_AM_TO_FREE_RESOURCES_SECS
+
+        if datetime.datetime.utcnow() + datetime.timedelta(seconds=secs) >= self.timeoutTime:
+            # We'll time out. So quit now.
+            self.logger.debug("After planned sleep for %d seconds we will time out", secs)
+            msg = "Reservation attempt timing out after %d minutes." % self.opts.timeout
+            raise StitchingError(msg)
+
+        self.logger.info("Pausing for %d seconds for Aggregates to free up resources...\n\n", secs)
+        self.poller.sleep(None, secs)
+
     # ready implies not in process and not completed
     def _ready_aggregates(self):
         return [a for a in self.aggs if a.ready]
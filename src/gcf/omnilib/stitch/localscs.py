@@ -0,0 +1,774 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''A local stand-in for the Stitching Computation Service (SCS) and for
+the aggregates it stitches between, for testing and timing stitcher
+without any network services.
+
+The SCS answers GetVersion, ListAggregates and ComputePath over a
+synthetic topology of aggregates joined by links, each end of which is
+a stitching hop with its own VLAN tag availability. The fake aggregates
+answer GetVersion, CreateSliver, DeleteSliver and SliverStatus, give
+out VLAN tags on their hops, and refuse tags another slice holds.
+Each aggregate can be given a latency, added to every reservation call.
+
+Run this module (with gcf on the PYTHONPATH) to serve a topology over
+XMLRPC (http only), then run stitcher against it:
+  python -m gcf.omnilib.stitch.localscs --aggregates 5 --fakeModeDir /tmp/fake
+  stitcher.py --fakeModeDir /tmp/fake --fileDir /tmp/fake/ \\
+     --scsURL http://localhost:8081/geni/xmlrpc createsliver myslice /tmp/fake/request.xml
+Or time stitcher runs over several topology sizes:
+  python -m gcf.omnilib.stitch.localscs --benchmark --slice myslice --sizes 2,5,10 -- -c omni_config
+
+Stitcher calls these fake aggregates (through Aggregate.callLocalFakeAM)
+when --fakeModeDir names a directory written by this module.
+'''
+
+from __future__ import absolute_import
+
+import json
+import optparse
+import os
+import random
+import SocketServer
+import subprocess
+import sys
+import threading
+import time
+import xmlrpclib
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from xml.dom.minidom import parseString, Node as XMLNode
+
+try:
+    from . import defs
+    from .VLANRange import VLANRange
+    from ...geni.util import rspec_schema
+except:
+    from gcf.omnilib.stitch import defs
+    from gcf.omnilib.stitch.VLANRange import VLANRange
+    from gcf.geni.util import rspec_schema
+
+# File in the fake mode directory naming the local SCS and fake aggregates
+CONFIG_FILENAME = 'localscs.json'
+# Sample request RSpec written to the fake mode directory
+REQUEST_FILENAME = 'request.xml'
+
+SCS_PATH = '/geni/xmlrpc'
+AM_PATH_PREFIX = '/am/'
+
+STITCH_NS = defs.STITCH_V1_NS + '/'
+
+# RSpec tags and attributes
+CLIENT_ID_TAG = 'client_id'
+COMPONENT_MANAGER_ID_TAG = 'component_manager_id'
+COMPONENT_MANAGER_TAG = 'component_manager'
+INTERFACE_TAG = 'interface'
+INTERFACE_REF_TAG = 'interface_ref'
+HOP_TAG = 'hop'
+
+# AM API return codes used by the fake aggregates
+SUCCESS = 0
+BADARGS = 1
+SEARCHFAILED = 12
+VLAN_UNAVAILABLE = 24
+
+def _result(value, code=SUCCESS, output=""):
+    return dict(code=dict(geni_code=code, am_type='gcf'), value=value, output=output)
+
+def _elements(parent, localName):
+    '''Child elements of parent with the given local name'''
+    return [c for c in parent.childNodes if c.nodeType == XMLNode.ELEMENT_NODE and
+            (c.localName or c.nodeName) == localName]
+
+def _text(parent, localName):
+    '''Stripped text of the first element with the given local name under parent, or None'''
+    for e in parent.getElementsByTagName('*'):
+        if (e.localName or e.nodeName) == localName:
+            return "".join([t.data for t in e.childNodes if t.nodeType == XMLNode.TEXT_NODE]).strip()
+    return None
+
+def _setText(parent, localName, text):
+    for e in parent.getElementsByTagName('*'):
+        if (e.localName or e.nodeName) == localName:
+            for t in list(e.childNodes):
+                e.removeChild(t)
+            e.appendChild(parent.ownerDocument.createTextNode(text))
+            return
+
+class TopologyHop(object):
+    '''One end of an inter-aggregate link: a stitching hop at an aggregate.'''
+    def __init__(self, urn, agg, peer_agg, vlans, busy):
+        self.urn = urn
+        self.agg = agg
+        self.peer_agg = peer_agg
+        self.vlans = vlans # VLANRange the hop advertises
+        self.busy = busy # VLANRange held by other slices, not advertised to the SCS
+
+class TopologyAggregate(object):
+    '''An aggregate in the synthetic topology'''
+    def __init__(self, name, producer=False, latency=0.0):
+        self.name = name
+        self.urn = "urn:publicid:IDN+%s.example.net+authority+am" % name
+        self.url = None # Set when served
+        self.producer = producer
+        self.latency = latency
+        self.hops = [] # TopologyHops at this aggregate
+
+class SyntheticTopology(object):
+    '''Aggregates joined by links. Each link end is a hop with its own VLAN tag availability.
+
+    The JSON form is:
+    {"aggregates": [{"name": "am0", "producer": true, "latency": 0.5}, ...],
+     "links": [{"aggregates": ["am0", "am1"], "vlans": "1000-1099", "busy": "1000-1009"}, ...]}
+    "vlans" and "busy" may instead be objects giving a range per aggregate name.
+    A path picks VLAN tags at its first producer aggregate (or its first aggregate);
+    the other aggregates on the path import the tag from their neighbor nearer that one.
+    '''
+
+    def __init__(self):
+        self.aggregates = [] # in order
+        self._byName = {}
+        self._byURN = {}
+        self._hops = {} # hop URN -> TopologyHop
+        self._links = [] # (TopologyHop, TopologyHop)
+
+    @classmethod
+    def chain(cls, count, vlans="1000-1099", busyFraction=0.0, latency=0.0, seed=None):
+        '''Aggregates am0..amN-1 in a line, am0 picking the tags.
+        busyFraction of the tags on each link are held by another slice, at both ends,
+        except at am0: like a real SCS, we know what the tag picker has,
+        and stitcher cannot retry when the aggregate that picked the tag rejects it.'''
+        rand = random.Random(seed)
+        topo = cls()
+        for i in range(count):
+            topo.addAggregate("am%d" % i, producer=(i == 0), latency=latency)
+        for i in range(count - 1):
+            tags = list(VLANRange.fromString(vlans))
+            held = VLANRange(rand.sample(tags, int(len(tags) * busyFraction)))
+            busy = {}
+            for name in ("am%d" % i, "am%d" % (i+1)):
+                if name != "am0":
+                    busy[name] = held
+            topo.addLink("am%d" % i, "am%d" % (i+1), vlans, busy)
+        return topo
+
+    @classmethod
+    def fromJSON(cls, struct):
+        topo = cls()
+        for a in struct['aggregates']:
+            topo.addAggregate(a['name'], a.get('producer', False), float(a.get('latency', 0.0)))
+        for l in struct['links']:
+            (a1, a2) = l['aggregates']
+            topo.addLink(a1, a2, l.get('vlans', '1-4094'), l.get('busy', ''))
+        return topo
+
+    def addAggregate(self, name, producer=False, latency=0.0):
+        agg = TopologyAggregate(name, producer, latency)
+        self.aggregates.append(agg)
+        self._byName[name] = agg
+        self._byURN[agg.urn] = agg
+        return agg
+
+    def addLink(self, name1, name2, vlans, busy=None):
+        '''Join two aggregates. vlans and busy are VLAN range strings or VLANRanges,
+        or dicts of those by aggregate name.'''
+        def _range(spec, name):
+            if isinstance(spec, dict):
+                spec = spec.get(name, '')
+            if spec is None or spec == '':
+                return VLANRange()
+            if isinstance(spec, VLANRange):
+                return spec.copy()
+            return VLANRange.fromString(str(spec))
+        agg1 = self._byName[name1]
+        agg2 = self._byName[name2]
+        hop1 = TopologyHop("urn:publicid:IDN+%s.example.net+interface+%s:to-%s" % (name1, name1, name2),
+                           agg1, agg2, _range(vlans, name1), _range(busy, name1))
+        hop2 = TopologyHop("urn:publicid:IDN+%s.example.net+interface+%s:to-%s" % (name2, name2, name1),
+                           agg2, agg1, _range(vlans, name2), _range(busy, name2))
+        for hop in (hop1, hop2):
+            hop.agg.hops.append(hop)
+            self._hops[hop.urn] = hop
+        self._links.append((hop1, hop2))
+
+    def toJSON(self):
+        aggs = [dict(name=a.name, producer=a.producer, latency=a.latency) for a in self.aggregates]
+        links = [dict(aggregates=[h1.agg.name, h2.agg.name],
+                      vlans={h1.agg.name: str(h1.vlans), h2.agg.name: str(h2.vlans)},
+                      busy={h1.agg.name: str(h1.busy), h2.agg.name: str(h2.busy)})
+                 for (h1, h2) in self._links]
+        return dict(aggregates=aggs, links=links)
+
+    def findAggregate(self, urn):
+        return self._byURN.get(urn)
+
+    def findHop(self, urn):
+        return self._hops.get(urn)
+
+    def findPath(self, fromAgg, toAgg, excludedHops=()):
+        '''Return the hops on a shortest path between the two aggregates,
+        avoiding the excluded hop URNs, or None.'''
+        if fromAgg is toAgg:
+            return []
+        # Breadth first search over aggregates
+        previous = {fromAgg.name: None}
+        queue = [fromAgg]
+        while queue:
+            agg = queue.pop(0)
+            if agg is toAgg:
+                break
+            for hop in agg.hops:
+                peerHop = self._peer(hop)
+                if hop.urn in excludedHops or peerHop.urn in excludedHops:
+                    continue
+                if peerHop.agg.name not in previous:
+                    previous[peerHop.agg.name] = (hop, peerHop)
+                    queue.append(peerHop.agg)
+        if toAgg.name not in previous:
+            return None
+        hops = []
+        agg = toAgg
+        while previous[agg.name]:
+            (hop, peerHop) = previous[agg.name]
+            hops[0:0] = [hop, peerHop]
+            agg = hop.agg
+        return hops
+
+    def _peer(self, hop):
+        for (h1, h2) in self._links:
+            if h1 is hop:
+                return h2
+            if h2 is hop:
+                return h1
+        return None
+
+class LocalSCS(object):
+    '''The Stitching Computation Service methods, over a SyntheticTopology'''
+
+    def __init__(self, topology, seed=None):
+        self.topology = topology
+        self._random = random.Random(seed)
+
+    def GetVersion(self):
+        return _result(dict(code_tag='localscs', interface_version='1.0'))
+
+    def ListAggregates(self):
+        aggs = {}
+        for agg in self.topology.aggregates:
+            aggs[agg.name] = dict(urn=agg.urn, url=agg.url)
+        return _result(dict(geni_aggregate_list=aggs))
+
+    def ComputePath(self, arg):
+        '''Expand the request RSpec with a stitching path for each link between
+        2 aggregates, and return it with the workflow data.'''
+        try:
+            dom = parseString(arg['request_rspec'])
+        except Exception, e:
+            return _result(None, BADARGS, "Failed to parse request RSpec: %s" % e)
+        options = arg.get('request_options', {}) or {}
+        profile = options.get('geni_routing_profile', {}) or {}
+        rspec = dom.documentElement
+
+        # Map interface client_id to aggregate URN
+        ifcAggs = {}
+        for node in _elements(rspec, defs.NODE_TAG):
+            for ifc in _elements(node, INTERFACE_TAG):
+                ifcAggs[ifc.getAttribute(CLIENT_ID_TAG)] = node.getAttribute(COMPONENT_MANAGER_ID_TAG)
+
+        stitchings = _elements(rspec, defs.STITCHING_TAG)
+        if stitchings:
+            stitching = stitchings[0]
+        else:
+            stitching = dom.createElementNS(STITCH_NS, defs.STITCHING_TAG)
+            stitching.setAttribute('xmlns', STITCH_NS)
+            rspec.appendChild(stitching)
+        stitching.setAttribute('lastUpdateTime', time.strftime("%Y%m%d:%H:%M:%S", time.gmtime()))
+
+        workflow = {}
+        suggestedOnHop = {} # hop URN -> VLANRange suggested for earlier paths
+        for link in _elements(rspec, defs.LINK_TAG):
+            linkId = link.getAttribute(CLIENT_ID_TAG)
+            if _elements(link, 'link_shared_vlan') or [t for t in _elements(link, 'link_type')
+                                                        if t.getAttribute('name').lower() in ('gre-tunnel', 'egre-tunnel', 'gre', 'egre')]:
+                continue
+            aggURNs = []
+            for iref in _elements(link, INTERFACE_REF_TAG):
+                urn = ifcAggs.get(iref.getAttribute(CLIENT_ID_TAG))
+                if urn and urn not in aggURNs:
+                    aggURNs.append(urn)
+            if len(aggURNs) < 2:
+                continue
+            if len(aggURNs) > 2:
+                return _result(None, SEARCHFAILED, "Link %s: cannot stitch a link between %d aggregates" % (linkId, len(aggURNs)))
+            aggs = [self.topology.findAggregate(urn) for urn in aggURNs]
+            if None in aggs:
+                return _result(None, SEARCHFAILED, "Link %s: unknown aggregate %s" % (linkId, aggURNs[aggs.index(None)]))
+
+            # Hop exclusions for this path: whole hops, or some VLAN tags on a hop
+            excludedHops = []
+            excludedTags = {}
+            pathOptions = profile.get(linkId, {}) or {}
+            for exclude in pathOptions.get('hop_exclusion_list', []) or []:
+                if '=' in exclude:
+                    (hopURN, tags) = exclude.split('=', 1)
+                    excludedTags[hopURN] = excludedTags.get(hopURN, VLANRange()) | VLANRange.fromString(tags)
+                else:
+                    excludedHops.append(exclude)
+
+            hops = self.topology.findPath(aggs[0], aggs[1], excludedHops)
+            if not hops:
+                return _result(None, SEARCHFAILED, "Link %s: Cannot find the set of paths for the RequestTopology." % linkId)
+
+            # Without VLAN translation, all hops on the path need the same tag
+            avails = [h.vlans - excludedTags.get(h.urn, VLANRange()) for h in hops]
+            common = avails[0].intersection(*avails[1:])
+            for h in hops:
+                common = common - suggestedOnHop.get(h.urn, VLANRange())
+            if not common:
+                return _result(None, SEARCHFAILED, "Link %s: No common VLAN tag available on the path." % linkId)
+            suggested = self._random.choice(list(common))
+            for h in hops:
+                suggestedOnHop.setdefault(h.urn, VLANRange()).add(suggested)
+
+            for agg in [h.agg for h in hops]:
+                if agg.urn not in [cm.getAttribute('name') for cm in _elements(link, COMPONENT_MANAGER_TAG)]:
+                    cm = dom.createElement(COMPONENT_MANAGER_TAG)
+                    cm.setAttribute('name', agg.urn)
+                    link.appendChild(cm)
+
+            for oldPath in _elements(stitching, defs.PATH_TAG):
+                if oldPath.getAttribute('id') == linkId:
+                    stitching.removeChild(oldPath)
+            stitching.appendChild(self._pathElement(dom, linkId, hops, avails, suggested))
+            workflow[linkId] = dict(dependencies=self._dependencies(hops))
+
+        return _result(dict(service_rspec=dom.toxml(), workflow_data=workflow))
+
+    def _pathElement(self, dom, linkId, hops, avails, suggested):
+        path = dom.createElement(defs.PATH_TAG)
+        path.setAttribute('id', linkId)
+        gid = dom.createElement('globalId')
+        gid.appendChild(dom.createTextNode("urn:publicid:IDN+localscs+path+%s" % linkId))
+        path.appendChild(gid)
+        for (idx, hop) in enumerate(hops):
+            if idx + 1 < len(hops):
+                nextHop = str(idx + 2)
+            else:
+                nextHop = 'null'
+            xml = ('<hop id="%d"><link id="%s"><trafficEngineeringMetric>10</trafficEngineeringMetric>'
+                   '<capacity>1000000</capacity><switchingCapabilityDescriptor><switchingcapType>l2sc</switchingcapType>'
+                   '<encodingType>ethernet</encodingType><switchingCapabilitySpecificInfo><switchingCapabilitySpecificInfo_L2sc>'
+                   '<interfaceMTU>9000</interfaceMTU><vlanRangeAvailability>%s</vlanRangeAvailability>'
+                   '<suggestedVLANRange>%d</suggestedVLANRange><vlanTranslation>false</vlanTranslation>'
+                   '</switchingCapabilitySpecificInfo_L2sc></switchingCapabilitySpecificInfo></switchingCapabilityDescriptor>'
+                   '</link><nextHop>%s</nextHop></hop>') % (idx + 1, hop.urn, avails[idx], suggested, nextHop)
+            path.appendChild(dom.importNode(parseString(xml).documentElement, True))
+        return path
+
+    def _dependencies(self, hops):
+        '''Workflow dependencies for a path: each hop at an aggregate other than the
+        one that picks the tag imports it from the adjacent hop of its neighbor
+        nearer that aggregate.'''
+        aggOrder = []
+        for hop in hops:
+            if hop.agg not in aggOrder:
+                aggOrder.append(hop.agg)
+        producers = [a for a in aggOrder if a.producer]
+        if producers:
+            root = producers[0]
+        else:
+            root = aggOrder[0]
+        rootIdx = aggOrder.index(root)
+
+        def _entry(hop, imports):
+            return dict(hop_urn=hop.urn, aggregate_urn=hop.agg.urn, aggregate_url=hop.agg.url,
+                        import_vlans=imports)
+
+        deps = []
+        for (idx, hop) in enumerate(hops):
+            aggIdx = aggOrder.index(hop.agg)
+            if aggIdx == rootIdx:
+                entry = _entry(hop, False)
+                entry['dependencies'] = []
+            else:
+                if aggIdx > rootIdx:
+                    # Last hop before this aggregate's first hop
+                    first = min([i for i in range(len(hops)) if hops[i].agg is hop.agg])
+                    dependsOn = hops[first - 1]
+                else:
+                    last = max([i for i in range(len(hops)) if hops[i].agg is hop.agg])
+                    dependsOn = hops[last + 1]
+                entry = _entry(hop, True)
+                dep = _entry(dependsOn, aggOrder.index(dependsOn.agg) != rootIdx)
+                entry['dependencies'] = [dep]
+            deps.append(entry)
+        return deps
+
+class FakeAggregate(object):
+    '''An aggregate that gives out VLAN tags on its hops in the SyntheticTopology'''
+
+    def __init__(self, topoAgg, lock):
+        self.agg = topoAgg
+        self._lock = lock # Shared by all fake aggregates
+        self.slivers = {} # slice URN -> [(hop URN, tag)]
+        self.inUse = {} # hop URN -> {tag: slice URN}
+
+    def _sleep(self):
+        if self.agg.latency > 0:
+            time.sleep(self.agg.latency)
+
+    def GetVersion(self, options=None):
+        return _result(dict(geni_api=2, geni_am_type='gcf',
+                            geni_api_versions={'2': self.agg.url},
+                            geni_request_rspec_versions=[dict(type='GENI', version='3', schema='', namespace='',
+                                                              extensions=[defs.STITCH_V1_NS])],
+                            geni_ad_rspec_versions=[dict(type='GENI', version='3', schema='', namespace='',
+                                                         extensions=[defs.STITCH_V1_NS])]))
+
+    def CreateSliver(self, slice_urn, credentials, rspec, users=None, options=None):
+        self._sleep()
+        try:
+            dom = parseString(rspec)
+        except Exception, e:
+            return _result(False, BADARGS, "Failed to parse request RSpec: %s" % e)
+        self._lock.acquire()
+        try:
+            # A new request replaces any earlier reservation by this slice
+            self._release(slice_urn)
+            tags = [] # (hop URN, tag) given to this request
+            hopElements = []
+            for path in dom.getElementsByTagName('*'):
+                if (path.localName or path.nodeName) != defs.PATH_TAG:
+                    continue
+                pathId = path.getAttribute('id')
+                mine = []
+                for hopElt in _elements(path, HOP_TAG):
+                    links = _elements(hopElt, defs.LINK_TAG)
+                    if links:
+                        hop = self._findHop(links[0].getAttribute('id'))
+                        if hop:
+                            mine.append((hopElt, hop))
+                if not mine:
+                    continue
+                # No VLAN translation: all this aggregate's hops on the path share the tag
+                free = None
+                for (hopElt, hop) in mine:
+                    avail = VLANRange.fromString(_text(hopElt, 'vlanRangeAvailability') or 'any') & hop.vlans
+                    avail = avail - hop.busy - VLANRange(self.inUse.get(hop.urn, {}).keys()) - \
+                        VLANRange([t for (u, t) in tags if u == hop.urn])
+                    if free is None:
+                        free = avail
+                    else:
+                        free = free & avail
+                suggested = _text(mine[0][0], 'suggestedVLANRange') or 'any'
+                if suggested.lower() == 'any':
+                    if not free:
+                        return _result(False, VLAN_UNAVAILABLE,
+                                       "Could not find a free vlan tag for %s" % pathId)
+                    tag = iter(free).next()
+                else:
+                    tag = int(suggested)
+                    if tag not in free:
+                        return _result(False, VLAN_UNAVAILABLE,
+                                       "vlan tag %d for %s not available on %s" % (tag, pathId, self.agg.urn))
+                for (hopElt, hop) in mine:
+                    tags.append((hop.urn, tag))
+                    hopElements.append((hopElt, tag))
+            for (hopElt, tag) in hopElements:
+                _setText(hopElt, 'suggestedVLANRange', str(tag))
+                _setText(hopElt, 'vlanRangeAvailability', str(tag))
+            for (urn, tag) in tags:
+                self.inUse.setdefault(urn, {})[tag] = slice_urn
+            self.slivers[slice_urn] = tags
+        finally:
+            self._lock.release()
+        rspec = dom.documentElement
+        rspec.setAttribute('type', 'manifest')
+        rspec.setAttributeNS(rspec_schema.XSI, 'xsi:schemaLocation',
+                             _schemaLocation(rspec_schema.GENI_3_MAN_SCHEMA))
+        return _result(dom.toxml())
+
+    def _findHop(self, urn):
+        for hop in self.agg.hops:
+            if hop.urn == urn:
+                return hop
+        return None
+
+    def _release(self, slice_urn):
+        for (urn, tag) in self.slivers.pop(slice_urn, []):
+            self.inUse.get(urn, {}).pop(tag, None)
+
+    def DeleteSliver(self, slice_urn, credentials, options=None):
+        self._sleep()
+        self._lock.acquire()
+        try:
+            had = self.slivers.has_key(slice_urn)
+            self._release(slice_urn)
+        finally:
+            self._lock.release()
+        if not had:
+            return _result(False, SEARCHFAILED, "No sliver for slice %s at %s" % (slice_urn, self.agg.urn))
+        return _result(True)
+
+    def SliverStatus(self, slice_urn, credentials, options=None):
+        if not self.slivers.has_key(slice_urn):
+            return _result(None, SEARCHFAILED, "No sliver for slice %s at %s" % (slice_urn, self.agg.urn))
+        return _result(dict(geni_urn=slice_urn, geni_status='ready', geni_resources=[]))
+
+    def RenewSliver(self, slice_urn, credentials, expiration_time, options=None):
+        return _result(True)
+
+class LocalStitchingServer(object):
+    '''Serves a LocalSCS and a FakeAggregate per topology aggregate over XMLRPC,
+    counting the calls to each.'''
+
+    def __init__(self, topology, host='localhost', port=8081, seed=None):
+        self.topology = topology
+        self.url = "http://%s:%d" % (host, port)
+        for agg in topology.aggregates:
+            agg.url = self.url + AM_PATH_PREFIX + agg.name
+        self.scs = LocalSCS(topology, seed)
+        lock = threading.RLock()
+        self.ams = {}
+        for agg in topology.aggregates:
+            self.ams[agg.name] = FakeAggregate(agg, lock)
+        self.calls = {} # (target, method) -> count
+        self._countLock = threading.Lock()
+        self._server = _ThreadedXMLRPCServer((host, port), self)
+
+    @property
+    def scsURL(self):
+        return self.url + SCS_PATH
+
+    def dispatch(self, path, method, params):
+        if path == SCS_PATH:
+            target = 'scs'
+            obj = self.scs
+        elif path.startswith(AM_PATH_PREFIX) and self.ams.has_key(path[len(AM_PATH_PREFIX):]):
+            target = path[len(AM_PATH_PREFIX):]
+            obj = self.ams[target]
+        else:
+            raise xmlrpclib.Fault(1, "No such service: %s" % path)
+        if method.startswith('_') or not hasattr(obj, method):
+            raise xmlrpclib.Fault(1, "No such method: %s" % method)
+        self._countLock.acquire()
+        try:
+            self.calls[(target, method)] = self.calls.get((target, method), 0) + 1
+        finally:
+            self._countLock.release()
+        return getattr(obj, method)(*params)
+
+    def callCounts(self, method):
+        '''Total calls of this method, over the SCS and all fake aggregates'''
+        return sum([c for ((t, m), c) in self.calls.items() if m == method])
+
+    def writeConfig(self, fakeModeDir, links=1):
+        '''Write the file that tells stitcher about the fake aggregates, and a
+        sample request with stitched links between the first and last aggregates.'''
+        if not os.path.isdir(fakeModeDir):
+            os.makedirs(fakeModeDir)
+        config = dict(scs_url=self.scsURL,
+                      aggregates=dict([(a.urn, a.url) for a in self.topology.aggregates]))
+        with open(os.path.join(fakeModeDir, CONFIG_FILENAME), 'w') as f:
+            json.dump(config, f, indent=2)
+        with open(os.path.join(fakeModeDir, REQUEST_FILENAME), 'w') as f:
+            f.write(sampleRequest(self.topology.aggregates[0], self.topology.aggregates[-1], links))
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        '''Serve from a background thread'''
+        t = threading.Thread(target=self._server.serve_forever, name="localscs")
+        t.setDaemon(True)
+        t.start()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    # Any path: the server dispatches on it
+    rpc_paths = ()
+
+    def _dispatch(self, method, params):
+        return self.server.stitching.dispatch(self.path, method, params)
+
+    def log_message(self, format, *args):
+        pass
+
+class _ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, stitching):
+        SimpleXMLRPCServer.__init__(self, addr, requestHandler=_RequestHandler,
+                                    logRequests=False, allow_none=True)
+        self.stitching = stitching
+
+def _schemaLocation(schema):
+    '''xsi:schemaLocation of a GENI v3 RSpec of the given schema, with the stitching extension'''
+    return "%s %s %s" % (rspec_schema.GENI_3_NAMESPACE, schema, defs.STITCH_V1_SCHEMA)
+
+def sampleRequest(agg1, agg2, links=1):
+    '''A request RSpec with one node at each aggregate, and the given number of links between them'''
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<rspec xmlns="%s" xmlns:xsi="%s" xsi:schemaLocation="%s" type="request">' %
+             (rspec_schema.GENI_3_NAMESPACE, rspec_schema.XSI, _schemaLocation(rspec_schema.GENI_3_REQ_SCHEMA))]
+    for (name, agg) in (('left', agg1), ('right', agg2)):
+        ifcs = "".join(['<interface client_id="%s:if%d"/>' % (name, i) for i in range(links)])
+        parts.append('<node client_id="%s" component_manager_id="%s" exclusive="false">'
+                     '<sliver_type name="default-vm"/>%s</node>' % (name, agg.urn, ifcs))
+    for i in range(links):
+        parts.append('<link client_id="link%d"><component_manager name="%s"/><component_manager name="%s"/>'
+                     '<interface_ref client_id="left:if%d"/><interface_ref client_id="right:if%d"/>'
+                     '<property source_id="left:if%d" dest_id="right:if%d" capacity="20000"/>'
+                     '<property source_id="right:if%d" dest_id="left:if%d" capacity="20000"/></link>' %
+                     (i, agg1.urn, agg2.urn, i, i, i, i, i, i))
+    parts.append('</rspec>')
+    return "\n".join(parts)
+
+class LocalFakeAMs(object):
+    '''Client side used by stitcher in fake mode: calls the fake aggregates
+    named in the localscs.json of the fake mode directory.'''
+
+    _loaded = {} # fakeModeDir -> LocalFakeAMs or None
+
+    @classmethod
+    def load(cls, fakeModeDir):
+        '''The LocalFakeAMs for this directory, or None if it has no localscs.json'''
+        if not cls._loaded.has_key(fakeModeDir):
+            fakeAMs = None
+            fname = os.path.join(os.path.expanduser(fakeModeDir), CONFIG_FILENAME)
+            if os.path.exists(fname):
+                with open(fname, 'r') as f:
+                    fakeAMs = cls(json.load(f))
+            cls._loaded[fakeModeDir] = fakeAMs
+        return cls._loaded[fakeModeDir]
+
+    def __init__(self, config):
+        self.urls = set(config.get('aggregates', {}).values())
+
+    def handles(self, url):
+        return url in self.urls
+
+    def call(self, url, args, opName, slicename):
+        '''Make the AM API call that these omni args and operation name describe.
+        Return the AM API return struct.'''
+        server = xmlrpclib.ServerProxy(url, allow_none=True)
+        if opName in ('createsliver', 'allocate'):
+            with open(args[-1], 'r') as f:
+                rspec = f.read()
+            return server.CreateSliver(slicename, [], rspec, [], {})
+        elif opName in ('deletesliver', 'delete'):
+            return server.DeleteSliver(slicename, [], {})
+        elif opName in ('sliverstatus', 'status'):
+            return server.SliverStatus(slicename, [], {})
+        elif opName in ('renewsliver', 'renew'):
+            return server.RenewSliver(slicename, [], args[-1], {})
+        elif opName == 'getversion':
+            return server.GetVersion({})
+        # Provision, performoperationalaction and the like just succeed
+        return _result(True)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="%prog [options] [-- stitcher options for --benchmark]")
+    parser.add_option("--aggregates", type="int", default=5,
+                      help="Number of aggregates in a chain topology (default %default)")
+    parser.add_option("--topology", default=None,
+                      help="JSON file describing the topology, instead of a chain of --aggregates")
+    parser.add_option("--vlans", default="1000-1099",
+                      help="VLAN tags available on each hop of a chain topology (default %default)")
+    parser.add_option("--busy", type="float", default=0.1,
+                      help="Fraction of the tags on each link of a chain topology already held by another slice (default %default)")
+    parser.add_option("--latency", type="float", default=0.5,
+                      help="Seconds added to each reservation call at each aggregate of a chain topology (default %default)")
+    parser.add_option("--links", type="int", default=1,
+                      help="Number of stitched links in the sample request (default %default)")
+    parser.add_option("--seed", type="int", default=None,
+                      help="Random seed for busy and suggested tags")
+    parser.add_option("--port", type="int", default=8081,
+                      help="Port to serve on (default %default)")
+    parser.add_option("--fakeModeDir", default=None,
+                      help="Write localscs.json and request.xml here, for stitcher --fakeModeDir")
+    parser.add_option("--benchmark", default=False, action="store_true",
+                      help="Time stitcher reserving the sample request on chain topologies of each of --sizes aggregates")
+    parser.add_option("--sizes", default="2,5,10",
+                      help="Comma separated aggregate counts to benchmark (default %default)")
+    parser.add_option("--slice", default="localscs",
+                      help="Slice name to use with --benchmark (default %default)")
+    parser.add_option("--stitcher", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "stitcher.py"),
+                      help="Path to stitcher.py for --benchmark")
+    (opts, args) = parser.parse_args(argv)
+
+    if not opts.benchmark:
+        if opts.topology:
+            with open(opts.topology, 'r') as f:
+                topology = SyntheticTopology.fromJSON(json.load(f))
+        else:
+            topology = SyntheticTopology.chain(opts.aggregates, opts.vlans, opts.busy, opts.latency, opts.seed)
+        server = LocalStitchingServer(topology, port=opts.port, seed=opts.seed)
+        if opts.fakeModeDir:
+            server.writeConfig(opts.fakeModeDir, opts.links)
+            print "Wrote %s and %s in %s" % (CONFIG_FILENAME, REQUEST_FILENAME, opts.fakeModeDir)
+        print "Local SCS at %s, %d aggregates:" % (server.scsURL, len(topology.aggregates))
+        for agg in topology.aggregates:
+            print "  %s %s" % (agg.urn, agg.url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        for key in sorted(server.calls.keys()):
+            print "%s %s: %d calls" % (key[0], key[1], server.calls[key])
+        return 0
+
+    import tempfile
+    import shutil
+    print "%8s %10s %8s %12s %12s %6s" % ("AMs", "seconds", "SCS", "reservations", "deletions", "exit")
+    for size in [int(s) for s in opts.sizes.split(',')]:
+        topology = SyntheticTopology.chain(size, opts.vlans, opts.busy, opts.latency, opts.seed)
+        server = LocalStitchingServer(topology, port=opts.port, seed=opts.seed)
+        fakeDir = tempfile.mkdtemp(prefix="localscs-")
+        try:
+            server.writeConfig(fakeDir, opts.links)
+            server.start()
+            cmd = [sys.executable, opts.stitcher, '--fakeModeDir', fakeDir, '--fileDir', fakeDir + os.sep,
+                   '--scsURL', server.scsURL] + args + \
+                ['createsliver', opts.slice, os.path.join(fakeDir, REQUEST_FILENAME)]
+            start = time.time()
+            with open(os.path.join(fakeDir, 'stitcher.out'), 'w') as out:
+                code = subprocess.call(cmd, stdout=out, stderr=subprocess.STDOUT)
+            secs = time.time() - start
+            print "%8d %10.1f %8d %12d %12d %6d" % (size, secs, server.callCounts('ComputePath'),
+                                                  server.callCounts('CreateSliver'),
+                                                  server.callCounts('DeleteSliver'), code)
+        finally:
+            server.shutdown()
+            shutil.rmtree(fakeDir, True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -47,7 +47,7 @@ from ... import oscript as omni
 
 from ..util import naiveUTC
 from ..util.handler_utils import _construct_output_filename, _printResults, _naiveUTCFromString, \
-    expires_from_status, expires_from_rspec, _load_cred
+    expires_from_status, expires_from_rspec, _load_cred, _canonicalAggURN
 from ..util.dossl import is_busy_reply
 from ..util.credparsing import get_cred_exp
 from ..util.omnierror import OmniError, AMAPIError
@@ -179,12 +179,21 @@ class Aggregate(object):
     # Hold all instances. One instance per URN.
     aggs = dict()
 
+    # The same instances by canonical URN (see _canonicalAggURN), so find
+    # matches URN synonyms with one lookup. Rebuilt if aggs is replaced.
+    _aggsByURN = dict()
+    _indexedAggs = aggs
+
     # FIXME: Move these constants up higher
     MAX_TRIES = 10 # Max times to try allocating here. Compare with allocateTries
     BUSY_MAX_TRIES = 5 # dossl does 3
     BUSY_POLL_INTERVAL_SEC = 10 # dossl does 10
     SLIVERSTATUS_MAX_TRIES = 10
     SLIVERSTATUS_POLL_INTERVAL_SEC = 30 # Xi says 10secs is short if ION is busy; per ticket 1045, even 20 may be too short
+    # With a PollScheduler, sliverstatus polls back off from the min to the max interval
+    SLIVERSTATUS_POLL_MIN_INTERVAL_SEC = 20
+    SLIVERSTATUS_POLL_MAX_INTERVAL_SEC = 90
+    BUSY_POLL_MAX_INTERVAL_SEC = 40
     PAUSE_FOR_AM_TO_FREE_RESOURCES_SECS = 30
     PAUSE_FOR_V3_AM_TO_FREE_RESOURCES_SECS = 15 # When its a V3 AM and we just allocated, should be quicker to free the resources
     # See DCN_AM_RETRY_INTERVAL_SECS for the DCN AM equiv of PAUSE_FOR_AM_TO_FREE...
@@ -200,20 +209,20 @@ class Aggregate(object):
 
     @classmethod
     def find(cls, urn, make=True):
-        if not urn in cls.aggs:
-            syns = Aggregate.urn_syns(urn)
-            found = False
-            for urn2 in syns:
-                if urn2 in cls.aggs:
-                    found = True
-                    urn = urn2
-                    break
-            if not found:
-                if not make:
-                    return None
-                m = cls(urn)
-                cls.aggs[urn] = m
-        return cls.aggs[urn]
+        if cls._indexedAggs is not cls.aggs:
+            cls._aggsByURN = dict()
+            for (urn2, agg) in cls.aggs.items():
+                cls._aggsByURN.setdefault(_canonicalAggURN(urn2), agg)
+            cls._indexedAggs = cls.aggs
+        key = _canonicalAggURN(urn)
+        agg = cls._aggsByURN.get(key)
+        if agg is None:
+            if not make:
+                return None
+            agg = cls(urn)
+            cls.aggs[urn] = agg
+            cls._aggsByURN[key] = agg
+        return agg
 
     @classmethod
     def findDontMake(cls, urn):
@@ -226,6 +235,8 @@ class Aggregate(object):
     @classmethod
     def clearCache(cls):
         cls.aggs = dict()
+        cls._aggsByURN = dict()
+        cls._indexedAggs = cls.aggs
 
     @classmethod
     def urn_syns_helper(cls, urn, urn_syns):
@@ -386,6 +397,7 @@ class Aggregate(object):
         self.inProcess = False
         self.completed = False
         self.userRequested = False
+        self.poller = None # PollScheduler while the Launcher runs
         self._hops = set()
         self._paths = set()
         self._dependsOn = set() # of Aggregate objects
@@ -425,6 +437,9 @@ class Aggregate(object):
         # Last failure message (used for logging at end of run)
         self.lastError = None
 
+        # With --incrementalRetry, keep this AM's reservation when going back to the SCS
+        self.keepReservation = False
+
         # FIXME: See stitchhandler.saveAggregateState whenever a new attribute is added here
 
         # Ugly hack
@@ -566,7 +581,7 @@ class Aggregate(object):
                 raise StitchingError(msg)
 
             self.logger.info("Pausing %d seconds to let aggregate free resources...", sleepSecs)
-            time.sleep(sleepSecs)
+            self._pause(sleepSecs)
         # end of block to delete a previous reservation
 
         if alreadyDone:
@@ -956,7 +971,11 @@ class Aggregate(object):
 
         if self.slicecred is None:
             self.slicecred = _load_cred(MyHandler(self.logger, opts), opts.slicecredfile)
-        sliceexp = get_cred_exp(self.logger, self.slicecred)
+        if self.slicecred:
+            sliceexp = get_cred_exp(self.logger, self.slicecred)
+        else:
+            # No slice credential (as in fake mode): like confirmSliceOK, do not limit by slice expiration
+            sliceexp = datetime.datetime.max
         sliceExpFromNow = naiveUTC(sliceexp) - now
         minDays = max(sliceExpFromNow.days, 1) # Start out going for 1 day from now at least
         newExpires = naiveUTC(sliceexp)
@@ -2583,15 +2602,18 @@ class Aggregate(object):
         status = 'unknown'
         while tries < self.SLIVERSTATUS_MAX_TRIES:
             # Pause before calls to sliverstatus
-            if datetime.datetime.utcnow() + datetime.timedelta(seconds=self.SLIVERSTATUS_POLL_INTERVAL_SEC) >= self.timeoutTime:
+            pollSecs = self._pollInterval('status', self.SLIVERSTATUS_POLL_INTERVAL_SEC,
+                                          self.SLIVERSTATUS_POLL_MIN_INTERVAL_SEC,
+                                          self.SLIVERSTATUS_POLL_MAX_INTERVAL_SEC)
+            if datetime.datetime.utcnow() + datetime.timedelta(seconds=pollSecs) >= self.timeoutTime:
                 # We'll time out. So quit now.
-                self.logger.debug("After planned sleep for %d seconds we will time out", self.SLIVERSTATUS_POLL_INTERVAL_SEC)
+                self.logger.debug("After planned sleep for %d seconds we will time out", pollSecs)
                 msg = "Reservation attempt timing out after %d minutes." % opts.timeout
                 self.lastError = msg
                 raise StitchingError(msg)
 
-            self.logger.info("Pausing %d seconds to let circuit become ready...", self.SLIVERSTATUS_POLL_INTERVAL_SEC)
-            time.sleep(self.SLIVERSTATUS_POLL_INTERVAL_SEC)
+            self.logger.info("Pausing %d seconds to let circuit become ready...", pollSecs)
+            self._pause(pollSecs)
 
             # generate args for sliverstatus
             if self.api_version == 2:
@@ -2757,6 +2779,8 @@ class Aggregate(object):
                     else:
                         self.logger.info("%s is (still) %s at %s. Had error message: %s", opName, status, self, dcnerror)
         # End of while loop getting sliverstatus
+        # Done polling status at this AM: a later retry starts polling quickly again
+        self._resetPolling('status')
 
         if status not in ('ready', 'geni_allocated', 'geni_provisioned', 'geni_ready'):
             for entry in circuitIDs.keys():
@@ -4110,6 +4134,10 @@ class Aggregate(object):
                 if not noError:
                     self.logger.error("Failed to %s at %s: %s", opName, self, e)
                     raise StitchingError(e) # FIXME: Right way to re-raise?
+        else:
+            # Release the tags held at the fake aggregates served by localscs.py
+            self.callLocalFakeAM(opts, omniargs, opName, slicename)
+            text = "Success: Fake %s at %s" % (opName, self)
 
         self.inProcess = False
         # FIXME: Fake mode delete results from a file?
@@ -4310,14 +4338,16 @@ class Aggregate(object):
             try:
                 ctr = ctr + 1
                 if opts.fakeModeDir:
-                    (text, result) = self.fakeAMAPICall(args, opts, opName, slicename, ctr)
+                    (text, result) = self._timedCall(self.fakeAMAPICall, args, opts, opName, slicename, ctr)
                 else:
-                    (text, result) = self.doOmniCall(args, opts, suppressLogs)
+                    (text, result) = self._timedCall(self.doOmniCall, args, opts, suppressLogs)
                 break # Not an error - breakout of loop
             except AMAPIError, ae:
                 if is_busy_reply(ae.returnstruct):
                     self.logger.debug("%s got BUSY doing %s", self, opName)
-                    time.sleep(self.BUSY_POLL_INTERVAL_SEC)
+                    self._pause(self._pollInterval('busy', self.BUSY_POLL_INTERVAL_SEC,
+                                                   self.BUSY_POLL_INTERVAL_SEC,
+                                                   self.BUSY_POLL_MAX_INTERVAL_SEC))
                     busyCtr = busyCtr + 1
                     if busyCtr == self.BUSY_MAX_TRIES:
                         raise ae
@@ -4327,8 +4357,34 @@ class Aggregate(object):
                     raise ae
         if busyCtr > 0:
             self.logger.info(" ... done.")
+        self._resetPolling('busy')
         return (text, result)
 
+    def _pollInterval(self, kind, defaultSecs, minSecs, maxSecs):
+        '''Seconds to wait before the next attempt of the given kind.
+        Backs off from minSecs to maxSecs when running under a PollScheduler,
+        else is always defaultSecs.'''
+        if self.poller:
+            return self.poller.nextInterval(self, kind, minSecs, maxSecs)
+        return defaultSecs
+
+    def _resetPolling(self, kind=None):
+        # Done waiting for this kind of thing: next wait is short again
+        if self.poller:
+            self.poller.reset(self, kind)
+
+    def _pause(self, secs):
+        # Wait, letting the PollScheduler (if any) cut the wait short
+        if self.poller:
+            self.poller.sleep(self, secs)
+        else:
+            time.sleep(secs)
+
+    def _timedCall(self, func, *args):
+        if self.poller:
+            return self.poller.timedCall(self, func, *args)
+        return func(*args)
+
     # suppressLogs makes Omni part log at WARN and up only
     def doOmniCall(self, args, opts, suppressLogs=False):
         # spawn a thread if threading
@@ -4345,12 +4401,33 @@ class Aggregate(object):
 #                logging.disable(logging.NOTSET)
         return res
 
+    def callLocalFakeAM(self, opts, args, opName, slicename):
+        '''In fake mode, if this is one of the fake aggregates served by
+        localscs.py (named in the localscs.json of the fake mode directory),
+        make the call these omni args describe there and return the AM API
+        return struct. Otherwise return None.'''
+        if not opts.fakeModeDir:
+            return None
+        # Only fake mode needs the local fake aggregates
+        from .localscs import LocalFakeAMs
+        fakeAMs = LocalFakeAMs.load(opts.fakeModeDir)
+        if not fakeAMs or not fakeAMs.handles(self.url):
+            return None
+        return fakeAMs.call(self.url, args, opName, slicename)
+
     # This needs to handle createsliver, allocate, sliverstatus, listresources at least
     # FIXME FIXME: Need more fake result files and to clean this all up! ****
     def fakeAMAPICall(self, args, opts, opName, slicename, ctr):
         # FIXME: Take scsCallCount as well?
         self.logger.info("Doing FAKE %s at %s", opName, self)
 
+        # If this is one of the fake aggregates served by localscs.py, call it
+        resultJSON = self.callLocalFakeAM(opts, args, opName, slicename)
+        if resultJSON is not None:
+            if resultJSON["code"]["geni_code"] != 0:
+                raise AMAPIError("Fake failure doing %s at %s: %s" % (opName, self.url, resultJSON["output"]), resultJSON)
+            return ("Fake %s at %s" % (opName, self.url), resultJSON["value"])
+
         # FIXME: Maybe take the request filename and make a -p arg for finding the canned files?
         # Or if I really use the scs, save the SCS in a file with the -p so I can find it here?
 
@@ -4541,10 +4618,29 @@ class RSpec(GENIObject):
         self._nodes = []
         self._links = [] # Main body links
         # DOM used to construct this: edits to objects are not reflected here
-        self.dom = None
+        self._dom = None
+        # XML to parse into that DOM when first used, if not parsed already
+        self._domXML = None
         # Note these are not Aggregate objects to avoid any loops
         self.amURNs = set() # AMs mentioned in the RSpec
 
+    @property
+    def dom(self):
+        if self._dom is None and self._domXML is not None:
+            self._dom = parseString(self._domXML)
+            self._domXML = None
+        return self._dom
+
+    @dom.setter
+    def dom(self, dom):
+        self._dom = dom
+        self._domXML = None
+
+    def setDomXML(self, xml):
+        '''Parse the DOM used to construct this from the given XML only when it is first used'''
+        self._dom = None
+        self._domXML = xml
+
     @property
     def nodes(self):
         return self._nodes
@@ -0,0 +1,118 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''Schedule the waits of stitching aggregates: polling for a circuit
+to become ready, retrying after a BUSY error, and pausing for an
+aggregate to free resources.'''
+
+from __future__ import absolute_import
+
+import logging
+import random
+import threading
+import time
+
+from .utils import StitchingError
+
+class PollScheduler(object):
+    '''Shared by the aggregates of one stitching launch (see Launcher).
+
+    Repeated waits of one kind at one aggregate back off exponentially
+    (with random jitter, so aggregates polled at the same time drift
+    apart), until the aggregate reaches a terminal state and calls reset.
+    All waits can be cut short with stop(), for example because another
+    aggregate failed and stitching is giving up; the waiting aggregate
+    then gets a StitchingError.
+
+    The scheduler also adds up the time each aggregate spent waiting
+    and the time it spent in AM API calls, for tuning the intervals.'''
+
+    BACKOFF_FACTOR = 1.5
+    JITTER = 0.2 # Intervals vary randomly by up to this fraction
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger('stitch.polling')
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._random = random.Random()
+        self._waits = dict() # (agg URN, kind) -> # of waits since last reset
+        self._sleepSecs = dict() # agg URN -> seconds spent waiting
+        self._callSecs = dict() # agg URN -> seconds spent in AM API calls
+
+    def nextInterval(self, agg, kind, minSecs, maxSecs):
+        '''Return how many seconds agg should wait before its next attempt
+        of the given kind (EG 'status' or 'busy'): minSecs the first time,
+        growing by BACKOFF_FACTOR each time up to maxSecs, plus or minus jitter.'''
+        with self._lock:
+            key = (agg.urn, kind)
+            waits = self._waits.get(key, 0)
+            self._waits[key] = waits + 1
+            jitter = self._random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        secs = min(maxSecs, minSecs * (self.BACKOFF_FACTOR ** waits))
+        return max(1, int(round(secs * jitter)))
+
+    def reset(self, agg, kind=None):
+        '''agg is done with waits of the given kind (or all kinds):
+        the next wait starts again at the minimum interval.'''
+        with self._lock:
+            for key in self._waits.keys():
+                if key[0] == agg.urn and (kind is None or key[1] == kind):
+                    del self._waits[key]
+
+    def sleep(self, agg, secs):
+        '''Wait secs seconds on behalf of agg (which may be None).
+        Raise StitchingError if the scheduler is stopped meanwhile.'''
+        start = time.time()
+        self._stopped.wait(secs)
+        self._add(self._sleepSecs, agg, time.time() - start)
+        if self._stopped.isSet():
+            raise StitchingError("Stopped waiting at %s: stitching is stopping" % (agg or "aggregates"))
+
+    def timedCall(self, agg, func, *args, **kwargs):
+        '''Call func, adding the time it takes to agg's time in AM API calls'''
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._add(self._callSecs, agg, time.time() - start)
+
+    def stop(self):
+        '''Cut short all current and future waits'''
+        self._stopped.set()
+
+    def _add(self, totals, agg, secs):
+        urn = None
+        if agg is not None:
+            urn = agg.urn
+        with self._lock:
+            totals[urn] = totals.get(urn, 0) + secs
+
+    def getStats(self):
+        '''Return a dictionary with the total seconds spent waiting ('sleep')
+        and calling aggregates ('call'), and by aggregate URN
+        ('sleepByAM' and 'callByAM'; waits not on behalf of one
+        aggregate are under None).'''
+        with self._lock:
+            return dict(sleep=sum(self._sleepSecs.values()),
+                        call=sum(self._callSecs.values()),
+                        sleepByAM=dict(self._sleepSecs),
+                        callByAM=dict(self._callSecs))
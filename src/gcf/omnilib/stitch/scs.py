@@ -26,10 +26,14 @@
 
 from __future__ import absolute_import
 
+import hashlib
 import json
+import os
 import os.path
 import pprint
+import re
 import sys
+import time
 import urllib
 import xmlrpclib
 
@@ -37,12 +41,12 @@ try:
     from .utils import StitchingError, StitchingServiceFailedError
     from ..xmlrpc.client import make_client
 
-    from ..util.json_encoding import DateTimeAwareJSONDecoder
+    from ..util.json_encoding import DateTimeAwareJSONDecoder, DateTimeAwareJSONEncoder
 except:
     from gcf.omnilib.stitch.utils import StitchingError, StitchingServiceFailedError
     from gcf.omnilib.xmlrpc.client import make_client
 
-    from gcf.omnilib.util.json_encoding import DateTimeAwareJSONDecoder
+    from gcf.omnilib.util.json_encoding import DateTimeAwareJSONDecoder, DateTimeAwareJSONEncoder
 
 # Tags used in the options to the SCS
 HOP_EXCLUSION_TAG = 'hop_exclusion_list'
@@ -132,11 +136,14 @@ class Service(object):
             print pp.pformat(result)
         return result
 
-    def ComputePath(self, slice_urn, request_rspec, options, savedFile=None):
+    def ComputePath(self, slice_urn, request_rspec, options, savedFile=None, cache=None):
         """Invoke the XML-RPC service with the request rspec.
         Create an SCS PathInfo from the result.
+        If a ComputePathCache is supplied, use a saved result for the same
+        request and options if there is one, and save any new successful result.
         """
         result = None
+        cacheKey = None
         if savedFile and os.path.exists(savedFile) and os.path.getsize(savedFile) > 0:
             # read it in
             try:
@@ -148,6 +155,9 @@ class Service(object):
                 import traceback
                 print "ERROR", e, traceback.format_exc()
                 raise
+        elif cache is not None:
+            cacheKey = cache.key(self.url, request_rspec, options)
+            result = cache.get(cacheKey)
         if result is None:
             server = make_client(self.url, keyfile=self.key, certfile=self.cert, verbose=self.verbose, timeout=self.timeout)
             arg = dict(slice_urn=slice_urn, request_rspec=request_rspec,
@@ -165,7 +175,10 @@ class Service(object):
         self.result = result # save the raw result for stitchhandler to print
         geni_result = Result(result) # parse result
         if geni_result.isSuccess():
-            return PathInfo(geni_result.value())
+            pathInfo = PathInfo(geni_result.value())
+            if cacheKey is not None:
+                cache.put(cacheKey, result)
+            return pathInfo
         else:
                 # when there is no route I seem to get:
 #{'geni_code': 3} MxTCE ComputeWorker return error message ' Action_ProcessRequestTopology_MP2P::Finish() Cannot find the set of paths for the RequestTopology. '.
@@ -174,6 +187,110 @@ class Service(object):
             else:
                 raise StitchingServiceFailedError("ComputePath invocation failed: %s" % geni_result.errorString(), self.result)
 
+class ComputePathCache(object):
+    '''Successful ComputePath results saved on disk, one JSON file per
+    request, keyed by a hash of the SCS URL, the request RSpec
+    (ignoring formatting, comments and the generated / expires times)
+    and the SCS options. Results older than the TTL are not used.'''
+
+    # Formatting and attributes of the request RSpec that do not change the
+    # computed paths, and so are dropped before computing the cache key
+    _COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+    _BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+    _TIMESTAMP_ATTR_RE = re.compile(r'\s(?:generated|expires)=("[^"]*"|\'[^\']*\')')
+
+    def __init__(self, cacheDir, ttl, logger=None):
+        '''cacheDir: directory for the saved results; ttl: seconds a result may be used'''
+        self.cacheDir = os.path.normpath(os.path.expanduser(cacheDir))
+        self.ttl = ttl
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+
+    def canonicalRSpec(self, request_rspec):
+        '''Return the request RSpec string without comments, whitespace between tags
+        or the generated and expires attributes.'''
+        if isinstance(request_rspec, unicode):
+            request_rspec = request_rspec.encode('utf-8')
+        rspec = self._COMMENT_RE.sub('', request_rspec)
+        rspec = self._BETWEEN_TAGS_RE.sub('><', rspec)
+        rspec = self._TIMESTAMP_ATTR_RE.sub('', rspec)
+        return rspec.strip()
+
+    def canonicalOptions(self, options):
+        '''Return the options struct as a string, with keys and hop lists sorted'''
+        def _sortLists(value):
+            if isinstance(value, dict):
+                return dict((k, _sortLists(v)) for (k, v) in value.items())
+            if isinstance(value, (list, tuple)):
+                return sorted([_sortLists(v) for v in value])
+            return value
+        return json.dumps(_sortLists(options), sort_keys=True, cls=DateTimeAwareJSONEncoder)
+
+    def key(self, url, request_rspec, options):
+        '''Return the cache key for a ComputePath call'''
+        h = hashlib.sha1()
+        h.update(str(url).strip().lower())
+        h.update('\0')
+        h.update(self.canonicalRSpec(request_rspec))
+        h.update('\0')
+        h.update(self.canonicalOptions(options))
+        return h.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.cacheDir, "scs-%s.json" % key)
+
+    def get(self, key):
+        '''Return the saved raw ComputePath result for this key, or None
+        if there is none or it is older than the TTL.'''
+        fname = self._filename(key)
+        try:
+            age = time.time() - os.path.getmtime(fname)
+        except OSError:
+            self.misses += 1
+            return None
+        if age > self.ttl:
+            self.misses += 1
+            self._debug("Cached SCS result %s is %d seconds old: not using it", fname, age)
+            try:
+                os.unlink(fname)
+            except OSError:
+                pass
+            return None
+        try:
+            with open(fname, 'r') as f:
+                result = json.loads(f.read(), encoding='ascii', cls=DateTimeAwareJSONDecoder)
+        except Exception, e:
+            self.misses += 1
+            self._debug("Failed to read cached SCS result %s: %s", fname, e)
+            return None
+        self.hits += 1
+        self._debug("Using cached SCS result %s (%d seconds old)", fname, age)
+        return result
+
+    def put(self, key, result):
+        '''Save a raw ComputePath result. Failures to save are only logged.'''
+        fname = self._filename(key)
+        tmpname = "%s.%d.tmp" % (fname, os.getpid())
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            with open(tmpname, 'w') as f:
+                f.write(json.dumps(result, encoding='ascii', cls=DateTimeAwareJSONEncoder))
+            # Rename so other stitcher runs never read a partial file
+            os.rename(tmpname, fname)
+            self._debug("Saved SCS result in %s", fname)
+        except Exception, e:
+            self._debug("Failed to save SCS result in %s: %s", fname, e)
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
+    def _debug(self, msg, *args):
+        if self.logger:
+            self.logger.debug(msg, *args)
+
 class PathInfo(object):
     '''Hold the SCS expanded RSpec and workflow data'''
     SERVICE_RSPEC = 'service_rspec'
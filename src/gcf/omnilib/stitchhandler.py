@@ -34,6 +34,7 @@ import os
 import string
 import sys
 import time
+from xml.dom.minidom import parseString
 
 from .. import oscript as omni
 from .util import OmniError, naiveUTC
@@ -41,6 +42,7 @@ from .util import credparsing as credutils
 from .util.files import readFile
 from .util import handler_utils
 from .util.json_encoding import DateTimeAwareJSONEncoder
+from .util.parallel import ThreadLogCapture, replay_log_records, run_in_parallel
 
 from . import stitch
 from .stitch import defs
@@ -94,6 +96,9 @@ class StitchingHandler(object):
         self.slicecred = None # Cached slice credential to avoid re-fetching
         self.savedSliceCred = None # path to file with slice cred if any
         self.parsedURNNewAggs = [] # Aggs added from parsed URNs
+        self.scsCache = None # Saved SCS ComputePath results, if using --scsCacheTTL
+        self.keptResCount = 0 # With --incrementalRetry, reservations kept when going back to the SCS
+        self.redoneResCount = 0 # With --incrementalRetry, aggregates redone when going back to the SCS
 
         # Get the framework
         if not self.opts.debug:
@@ -223,7 +228,7 @@ class StitchingHandler(object):
         # Parse the RSpec
         requestString = ""
         if request:
-            self.rspecParser = RSpecParser(self.logger)
+            self.rspecParser = RSpecParser(self.logger, streaming=self.opts.streamRSpecs)
             self.parsedUserRequest = None
             try:
                 # read the rspec into a string, and add it to the rspecs dict
@@ -337,6 +342,10 @@ class StitchingHandler(object):
             if not "geni-scs.net.internet2.edu:8443" in self.opts.scsURL:
                 self.logger.info("Using SCS at %s", self.opts.scsURL)
             self.scsService = scs.Service(self.opts.scsURL, key=self.framework.key, cert=self.framework.cert, timeout=self.opts.ssltimeout, verbose=self.opts.verbosessl)
+            if self.opts.scsCacheTTL > 0:
+                cacheDir = prependFilePrefix(self.opts.fileDir, self.opts.scsCacheDir)
+                self.logger.debug("Reusing SCS results up to %d minutes old from %s", self.opts.scsCacheTTL, cacheDir)
+                self.scsCache = scs.ComputePathCache(cacheDir, self.opts.scsCacheTTL * 60, self.logger)
         self.scsCalls = 0
         if self.isStitching and self.opts.noSCS:
             self.logger.info("Not calling SCS on stitched topology per commandline option.")
@@ -357,6 +366,9 @@ class StitchingHandler(object):
             # Passing in the request as a DOM - after allowing edits as necessary. OK?
             lastAM = self.mainStitchingLoop(sliceurn, self.parsedUserRequest.getLinkEditedDom())
 
+            if self.opts.incrementalRetry and self.scsCalls > 1:
+                self.logger.info("Retries kept %d existing reservation(s) and redid %d aggregate(s)", self.keptResCount, self.redoneResCount)
+
             # Construct and save out a combined manifest
             combinedManifest, filename, retVal = self.getAndSaveCombinedManifest(lastAM)
 
@@ -495,7 +507,7 @@ class StitchingHandler(object):
             am.timeoutTime = self.config['timeoutTime']
 
             am.userRequested = True
-        self.rspecParser = RSpecParser(self.logger)
+        self.rspecParser = RSpecParser(self.logger, streaming=self.opts.streamRSpecs)
 
     def doDelete(self):
         # Do delete at APIv3 AMs and deletesliver at v2 only AMs and combine the results
@@ -549,15 +561,8 @@ class StitchingHandler(object):
         retStruct = dict()
 
         # Now actually get the manifest for each AM
-        for am in self.ams_to_process:
-            opts_copy = copy.deepcopy(self.opts)
-            opts_copy.aggregate = [(am.nick if am.nick else am.url)]
-            self.logger.info("Gathering current reservations at %s...", am)
-            rspec = None
-            try:
-                rspec = am.listResources(opts_copy, self.slicename)
-            except StitchingError, se:
-                self.logger.debug("Failed to list current reservation: %s", se)
+        manifests = self.fetchManifests(self.ams_to_process)
+        for (am, (rspec, parseDom, manifestDom)) in zip(self.ams_to_process, manifests):
             if am.api_version == 2:
                 retStruct[(am.urn,am.url)] = rspec
             else:
@@ -579,7 +584,10 @@ class StitchingHandler(object):
             am.setSliverExpirations(handler_utils.expires_from_rspec(rspec, self.logger))
 
             # Fill in more data structures using this RSpec to the extent it helps
-            parsedMan = self.rspecParser.parse(rspec)
+            if parseDom is None:
+                parsedMan = self.rspecParser.parse(rspec)
+            else:
+                parsedMan = self.rspecParser.parseDOM(parseDom)
             if self.parsedUserRequest is None:
                 self.parsedUserRequest = parsedMan
             if self.parsedSCSRSpec is None:
@@ -595,28 +603,19 @@ class StitchingHandler(object):
             if am.isExoSM:
                 for urn in parsedMan.amURNs:
                     # self.logger.debug("Man from %s had AM URN %s", am, urn)
-                    if urn in Aggregate.aggs:
+                    if Aggregate.findDontMake(urn) is not None:
                         # self.logger.debug("Already is an AM")
                         continue
-                    syns = Aggregate.urn_syns(urn)
-                    found = False
-                    for urn2 in syns:
-                        if urn2 in Aggregate.aggs:
-                            found = True
-                            urn = urn2
-                            # self.logger.debug(".. which is an AM under syn %s", urn)
-                            break
-                    if not found:
-                        if not (urn.strip().lower().endswith("+cm") or urn.strip().lower().endswith("+am")):
-                            # Doesn't look like an AM URN. Skip it.
-                            self.logger.debug("URN parsed from man doesn't look like an AM URN: %s", urn)
-                            continue
-                        # self.logger.debug("... is not any existing AM")
-                        urnO = URN(urn=urn)
-                        urnAuth = urnO.getAuthority()
-                        if urnAuth.startswith("exogeni.net"):
-                            # self.logger.debug("Is an ExoGENI URN. Since this is the exoSM, add it as a urn syn")
-                            am.urn_syns.append(urn)
+                    if not (urn.strip().lower().endswith("+cm") or urn.strip().lower().endswith("+am")):
+                        # Doesn't look like an AM URN. Skip it.
+                        self.logger.debug("URN parsed from man doesn't look like an AM URN: %s", urn)
+                        continue
+                    # self.logger.debug("... is not any existing AM")
+                    urnO = URN(urn=urn)
+                    urnAuth = urnO.getAuthority()
+                    if urnAuth.startswith("exogeni.net"):
+                        # self.logger.debug("Is an ExoGENI URN. Since this is the exoSM, add it as a urn syn")
+                        am.urn_syns.append(urn)
                 # end of loop over AM URNs
             # End of block to handle ExoSM
 
@@ -629,8 +628,9 @@ class StitchingHandler(object):
 
             # Parse the manifest and fill in the manifest suggested/range values
             try:
-                from xml.dom.minidom import parseString
-                am.manifestDom = parseString(rspec)
+                if manifestDom is None:
+                    manifestDom = parseString(rspec)
+                am.manifestDom = manifestDom
                 am.requestDom = am.manifestDom
 
                 # Fill in the manifest values on hops
@@ -1007,6 +1007,82 @@ class StitchingHandler(object):
         # end of if self.isBound
     # End of cleanDashAArgs
 
+    def fetchManifests(self, aggs):
+        '''Get the current manifest for the slice at each of the given aggregates.
+        Return a list in the order of aggs of (manifest RSpec string, DOM to parse into
+        stitching objects, DOM to save as the AM's manifest), with None for anything we failed to get.
+        With --parallel N, call up to N aggregates at once. Each manifest is parsed on the thread
+        that got it, while other aggregates are still answering, so this takes about as long as
+        the slowest aggregate. Log messages from each aggregate are logged together, in aggregate order.'''
+        threaded = False
+        maxThreads = getattr(self.opts, 'parallel', 1)
+        if maxThreads and maxThreads > 1 and len(aggs) > 1:
+            threaded = True
+
+        def fetch(am):
+            opts_copy = copy.deepcopy(self.opts)
+            opts_copy.aggregate = [(am.nick if am.nick else am.url)]
+            if threaded:
+                # Logging was already configured; do not reconfigure it from several threads
+                opts_copy.noLoggingConfiguration = True
+            self.logger.info("Gathering current reservations at %s...", am)
+            rspec = None
+            try:
+                rspec = am.listResources(opts_copy, self.slicename)
+            except StitchingError, se:
+                self.logger.debug("Failed to list current reservation: %s", se)
+            if rspec is None:
+                return (None, None, None)
+            # The stitching objects and the combined manifest each need their own DOM
+            # If parsing fails, parsing again later reports the error
+            parseDom = None
+            manifestDom = None
+            if not self.rspecParser.streaming:
+                try:
+                    parseDom = parseString(rspec)
+                except Exception, e:
+                    self.logger.debug("Failed to parse manifest from %s: %s", am, e)
+                    return (rspec, None, None)
+            try:
+                manifestDom = parseString(rspec)
+            except Exception, e:
+                self.logger.debug("Failed to parse manifest from %s: %s", am, e)
+            return (rspec, parseDom, manifestDom)
+
+        if not threaded:
+            return [fetch(am) for am in aggs]
+
+        capture = ThreadLogCapture()
+        heldRecords = dict() # AM URL -> held log records
+
+        def fetchHoldingLogs(am):
+            heldRecords[am.url] = capture.hold()
+            try:
+                return fetch(am)
+            finally:
+                capture.release()
+
+        self.logger.debug("Gathering manifests from %d aggregates using up to %d threads", len(aggs), maxThreads)
+        capture.install()
+        try:
+            results = run_in_parallel(fetchHoldingLogs, aggs, maxThreads)
+        finally:
+            capture.uninstall()
+
+        manifests = []
+        error = None
+        for (am, (ret, excinfo)) in zip(aggs, results):
+            replay_log_records(heldRecords.get(am.url))
+            if excinfo is not None:
+                if error is None:
+                    error = excinfo
+                ret = (None, None, None)
+            manifests.append(ret)
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return manifests
+    # End of fetchManifests
+
     def getAndSaveCombinedManifest(self, lastAM):
         # Construct a unified manifest and save it to a file
         # Used in doStitching
@@ -1382,7 +1458,12 @@ class StitchingHandler(object):
         # Save off existing Aggregate object state
         parsedURNExistingAggs = [] # Existing aggs that came from a parsed URN, not in workflow
         self.parsedURNNewAggs = [] # New aggs created not from workflow
+        keptAggs = [] # Existing aggs whose reservation we kept (--incrementalRetry)
         if existingAggs:
+            for agg in existingAggs:
+                if agg.keepReservation:
+                    keptAggs.append(agg)
+
             # Copy existingAggs.hops.vlans_unavailable to workflow_parser.aggs.hops.vlans_unavailable? Other state?
             self.saveAggregateState(existingAggs, workflow_parser.aggs)
 
@@ -1454,6 +1535,11 @@ class StitchingHandler(object):
         parsedURNExistingAggs = []
         self.parsedURNNewAggs = []
 
+        # Delete any reservations we kept that the new SCS answer does not let us reuse
+        if len(keptAggs) > 0:
+            self.checkKeptReservations(keptAggs)
+        keptAggs = []
+
         # Add extra info about the aggregates to the AM objects
         self.add_am_info(self.ams_to_process)
 
@@ -1542,9 +1628,19 @@ class StitchingHandler(object):
                                 self.logger.warn("You have a reservation at %s", am)
                     raise StitchingError("Stitching reservation failed %d times. Last error: %s" % (self.scsCalls, se))
                 self.logger.warn("Stitching failed but will retry: %s", se)
+                # Per --incrementalRetry, only delete the reservations that depend on the failure
+                redoAggs = None
+                if self.opts.incrementalRetry:
+                    redoAggs = self.markReservationsToKeep(launcher)
                 success = False
                 try:
-                    (delRetText, delRetStruct) = self.deleteAllReservations(launcher)
+                    if redoAggs is None:
+                        (delRetText, delRetStruct) = self.deleteAllReservations(launcher)
+                    else:
+                        class DumbLauncher():
+                            def __init__(self, agglist):
+                                self.aggs = agglist
+                        (delRetText, delRetStruct) = self.deleteAllReservations(DumbLauncher(redoAggs))
                     hadFail = False
                     for url in delRetStruct.keys():
                         if not delRetStruct[url]:
@@ -1845,6 +1941,11 @@ class StitchingHandler(object):
         # Check current VLAN tag availability before doing allocations
         # Loop over AMs. If I update an AM, then go to AMs that depend on it and intersect there (but don't redo avail query), and recurse.
         for am in self.ams_to_process:
+            # A reservation we kept already holds its VLAN tags
+            if am.keepReservation:
+                self.logger.debug("Not checking VLAN availability at %s: keeping existing reservation", am)
+                continue
+
             # If doing the avail query at this AM doesn't work or wouldn't help or we did it recently, move on
             if not am.doAvail(self.opts):
                 self.logger.debug("Not checking VLAN availability at %s", am)
@@ -2484,7 +2585,7 @@ class StitchingHandler(object):
         if self.opts.savedSCSResults:
             self.logger.debug("** Not actually calling SCS, using results from '%s'", self.opts.savedSCSResults)
         try:
-            scsResponse = self.scsService.ComputePath(sliceurn, requestString, scsOptions, self.opts.savedSCSResults)
+            scsResponse = self.scsService.ComputePath(sliceurn, requestString, scsOptions, self.opts.savedSCSResults, self.scsCache)
         except StitchingError as e:
             self.logger.debug("Error from slice computation service: %s", e)
             raise 
@@ -2526,6 +2627,8 @@ class StitchingHandler(object):
         # Done SCS call error handling
 
         self.logger.debug("SCS successfully returned.");
+        if self.scsCache:
+            self.logger.debug("SCS result cache: %d hits, %d misses", self.scsCache.hits, self.scsCache.misses)
 
         if self.opts.debug:
             scsresfile = prependFilePrefix(self.opts.fileDir, "scs-result.json")
@@ -2592,7 +2695,11 @@ class StitchingHandler(object):
         if existingAggs and len(existingAggs) > 0:
             for agg in existingAggs:
                 for hop in agg.hops:
-                    if hop.excludeFromSCS or (hop.vlans_unavailable and len(hop.vlans_unavailable) > 0):
+                    # If we are keeping the reservation here, exclude all VLAN tags but the one we have
+                    tagsNotReserved = None
+                    if agg.keepReservation and hop._hop_link.vlan_suggested_manifest:
+                        tagsNotReserved = VLANRange.fromString("any") - hop._hop_link.vlan_suggested_manifest
+                    if hop.excludeFromSCS or tagsNotReserved or (hop.vlans_unavailable and len(hop.vlans_unavailable) > 0):
                         # get path and ensure a pathStruct object
                         path = hop._path.id
                         if profile.has_key(path):
@@ -2612,6 +2719,8 @@ class StitchingHandler(object):
                         # Add to the excludes list
                         if hop.excludeFromSCS:
                             excludes.append(urn)
+                        elif tagsNotReserved:
+                            excludes.append(urn + "=" + str(tagsNotReserved))
                         elif hop.vlans_unavailable and len(hop.vlans_unavailable) > 0:
                             excludes.append(urn + "=" + str(hop.vlans_unavailable))
 
@@ -3152,7 +3261,12 @@ class StitchingHandler(object):
 
             try:
                 self.logger.debug("Getting extra AM info from Omni for AM %s", agg)
-                (text, version) = omni.call(omniargs, options_copy)
+                # The fake aggregates served by localscs.py do not speak SSL
+                fakeVersion = agg.callLocalFakeAM(self.opts, omniargs, 'getversion', self.slicename)
+                if fakeVersion is not None:
+                    version = {agg.url: fakeVersion}
+                else:
+                    (text, version) = omni.call(omniargs, options_copy)
                 aggurl = agg.url
                 if isinstance (version, dict) and version.has_key(aggurl) and isinstance(version[aggurl], dict) \
                         and version[aggurl].has_key('value') and isinstance(version[aggurl]['value'], dict):
@@ -3781,11 +3895,163 @@ class StitchingHandler(object):
                 # FIXME: correct?
                 agg.url = oldAgg.url
                 agg.urn_syns = copy.deepcopy(oldAgg.urn_syns)
+
+                # Per --incrementalRetry, reuse the reservation we kept here if the new
+                # SCS answer still has the same hops with the same VLAN tags
+                if oldAgg.keepReservation:
+                    if self.sameReservedHops(oldAgg, agg):
+                        self.logger.debug("Reusing existing reservation at %s", agg)
+                        agg.keepReservation = True
+                        oldAgg.keepReservation = False
+                        agg.completed = True
+                        agg.manifestDom = oldAgg.manifestDom
+                        agg.requestDom = oldAgg.requestDom
+                        agg.rspecfileName = oldAgg.rspecfileName
+                        agg.pgLogUrl = oldAgg.pgLogUrl
+                        agg.sliverExpirations = oldAgg.sliverExpirations
+                        agg.triedRes = oldAgg.triedRes
+                        agg.editedRequest = oldAgg.editedRequest
+                        for hop in agg.hops:
+                            for oldHop in oldAgg.hops:
+                                if hop.urn == oldHop.urn and hop._path.id == oldHop._path.id:
+                                    hop.globalId = oldHop.globalId
+                                    hop._hop_link.vlan_suggested_manifest = oldHop._hop_link.vlan_suggested_manifest
+                                    hop._hop_link.vlan_range_manifest = oldHop._hop_link.vlan_range_manifest
+                                    break
+                    else:
+                        self.logger.info("New SCS path changed hops or VLAN tags at %s: cannot keep existing reservation", agg)
                 break # out of loop over oldAggs, cause we found the new 'agg'
             # Loop over oldAggs
         # Loop over newAggs
     # End of saveAggregateState
 
+    def markReservationsToKeep(self, launcher):
+        '''For --incrementalRetry: After a circuit failure, mark the aggregates whose reservations
+        we can keep when going back to the SCS, and return the aggregates that must be deleted and redone.
+        Those are the aggregates that failed, the aggregates with hops that their hops take VLAN tags from,
+        and any aggregates with hops that depend on or take VLAN tags from hops at aggregates being redone.
+        Return None if we cannot tell which aggregates failed, so everything must be redone.'''
+        for agg in launcher.aggs:
+            agg.keepReservation = False
+        if len(launcher.failedAggs) == 0:
+            self.logger.debug("Don't know which aggregate failed: will redo all aggregates")
+            return None
+
+        redoAggs = set()
+        redoHops = set()
+
+        # The failed hops need new VLAN tags, so the hops they import tags from do too
+        toRedo = []
+        for agg in launcher.failedAggs:
+            for hop in agg.hops:
+                toRedo.append(hop)
+                while hop.import_vlans and hop.import_vlans_from:
+                    hop = hop.import_vlans_from
+                    toRedo.append(hop)
+
+        # Then redo every hop at an aggregate being redone,
+        # and every hop that depends on a hop being redone
+        while len(toRedo) > 0:
+            while len(toRedo) > 0:
+                hop = toRedo.pop()
+                if hop in redoHops:
+                    continue
+                redoHops.add(hop)
+                if hop.aggregate and hop.aggregate not in redoAggs:
+                    redoAggs.add(hop.aggregate)
+                    toRedo.extend(hop.aggregate.hops)
+            for agg in launcher.aggs:
+                for hop in agg.hops:
+                    if hop in redoHops:
+                        continue
+                    if hop.import_vlans_from in redoHops:
+                        toRedo.append(hop)
+                        continue
+                    for dep in hop.dependsOn:
+                        if dep in redoHops:
+                            toRedo.append(hop)
+                            break
+        for agg in launcher.failedAggs:
+            redoAggs.add(agg)
+
+        kept = 0
+        for agg in launcher.aggs:
+            if agg not in redoAggs and agg.completed and agg.manifestDom:
+                agg.keepReservation = True
+                kept += 1
+        self.logger.info("Keeping reservations at %d aggregate(s); redoing %d aggregate(s) from the SCS", kept, len(launcher.aggs) - kept)
+        return [agg for agg in launcher.aggs if not agg.keepReservation]
+    # End of markReservationsToKeep
+
+    def sameReservedHops(self, oldAgg, agg):
+        '''Does the new aggregate object have the same hops as the old one, with the
+        VLAN tags we reserved at the old one still allowed?'''
+        if len(agg.hops) != len(oldAgg.hops):
+            return False
+        for hop in agg.hops:
+            found = False
+            for oldHop in oldAgg.hops:
+                if hop.urn == oldHop.urn and hop._path.id == oldHop._path.id:
+                    found = True
+                    break
+            if not found:
+                return False
+            tag = oldHop._hop_link.vlan_suggested_manifest
+            if not tag or not tag <= hop._hop_link.vlan_range_request:
+                return False
+        return True
+
+    def checkKeptReservations(self, keptAggs):
+        '''For --incrementalRetry: Delete the reservations we kept from the last attempt that
+        we are not reusing: those the new SCS answer dropped or changed, and those that now
+        depend on aggregates that we are redoing.'''
+        # A kept reservation cannot depend on an aggregate being redone
+        changed = True
+        while changed:
+            changed = False
+            for agg in self.ams_to_process:
+                if not agg.keepReservation:
+                    continue
+                mustRedo = False
+                for dep in agg.dependsOn:
+                    if not dep.keepReservation:
+                        mustRedo = True
+                        break
+                for hop in agg.hops:
+                    if hop.import_vlans_from and hop.import_vlans_from.aggregate and not hop.import_vlans_from.aggregate.keepReservation:
+                        mustRedo = True
+                        break
+                if mustRedo:
+                    self.logger.info("%s now depends on an aggregate being redone: cannot keep existing reservation", agg)
+                    agg.keepReservation = False
+                    agg.completed = False
+                    changed = True
+
+        # Old aggregates still marked were not reused. New aggregates with a manifest but
+        # not marked were reused but then had to be dropped.
+        toDelete = [agg for agg in keptAggs if agg.keepReservation]
+        for agg in self.ams_to_process:
+            if agg.manifestDom and not agg.keepReservation:
+                toDelete.append(agg)
+        if len(toDelete) > 0:
+            class DumbLauncher():
+                def __init__(self, agglist):
+                    self.aggs = agglist
+            (delRetText, delRetStruct) = self.deleteAllReservations(DumbLauncher(toDelete))
+            for agg in toDelete:
+                agg.keepReservation = False
+                if agg.manifestDom:
+                    raise StitchingError("Failed to delete reservation at %s that the new SCS path no longer uses" % agg)
+
+        kept = 0
+        for agg in self.ams_to_process:
+            if agg.keepReservation:
+                kept += 1
+        self.keptResCount += kept
+        self.redoneResCount += len(self.ams_to_process) - kept
+        self.logger.info("Kept reservations at %d aggregate(s); will reserve at %d aggregate(s)", kept, len(self.ams_to_process) - kept)
+    # End of checkKeptReservations
+
     def ensureSliverType(self):
         # DCN AMs seem to insist that there is at least one sliver_type specified one one node
         # So if we have a DCN AM, add one if needed
@@ -95,6 +95,52 @@ def _extractURL(logger, url):
 #        logger.debug("Extracted %s from %s", url, orig)
     return url
 
+def _canonicalAggURN(urn):
+    '''Return the form of an aggregate URN used to compare aggregate URNs.
+    Ignores surrounding whitespace, a trailing cm vs am, and ExoGENI
+    vmsite vs Net. (Equal str and unicode URNs already compare and hash the same.)'''
+    if urn is None:
+        return None
+    urn = urn.strip()
+    if urn.endswith('cm'):
+        urn = urn[:-2] + 'am'
+    return urn.replace('vmsite', 'Net')
+
+# Index of the aggregate nicknames table, as (table, index)
+_aggNickIndex = None
+
+def _getAggNickIndex(config):
+    '''Return the index of the aggregate nicknames table (see _rebuildAggNickIndex),
+    building it the first time a table is used. A table that is changed in place
+    must be re-indexed with _rebuildAggNickIndex.'''
+    index = _aggNickIndex
+    if index is not None and index[0] is config['aggregate_nicknames']:
+        return index[1]
+    return _rebuildAggNickIndex(config)
+
+def _rebuildAggNickIndex(config):
+    '''Build and return an index of the aggregate nicknames table: dicts of nicknames by canonical
+    URN ('urn'), by URL ('url'), by stripped URL ('strippedurl') and by URL without
+    its scheme and host prefix ('extracted', see _extractURL), plus the table position of
+    each nickname ('pos'). Lists of nicknames are in table order.
+    Call this whenever the table is loaded or changed.'''
+    global _aggNickIndex
+    nicknames = config['aggregate_nicknames']
+    byURN = {}
+    byURL = {}
+    byStrippedURL = {}
+    byExtractedURL = {}
+    pos = {}
+    for nick, (urn, url) in nicknames.items():
+        pos[nick] = len(pos)
+        byURN.setdefault(_canonicalAggURN(urn), []).append(nick)
+        byURL.setdefault(url, []).append(nick)
+        byStrippedURL.setdefault(url.strip(), []).append(nick)
+        byExtractedURL.setdefault(_extractURL(None, url), []).append(nick)
+    index = dict(urn=byURN, url=byURL, strippedurl=byStrippedURL, extracted=byExtractedURL, pos=pos)
+    _aggNickIndex = (nicknames, index)
+    return index
+
 # Is nick better than retNick? Prefer non-empty and site-type and shorter nicknames
 def _isBetterNick(retNick, nick, logger=None):
     if not nick:
@@ -122,12 +168,14 @@ def _isBetterNick(retNick, nick, logger=None):
 # Lookup aggregate nickname by aggregate_urn or aggregate_url
 def _lookupAggNick(handler, aggregate_urn_or_url):
     retNick = None
-    for nick, (urn, url) in handler.config['aggregate_nicknames'].items():
-        # Case 1
-        if aggregate_urn_or_url == urn or aggregate_urn_or_url == url:
-#            handler.logger.debug("For urn/url %s found match: %s=%s,%s", aggregate_urn_or_url, nick, urn, url)
-            if _isBetterNick(retNick, nick, handler.logger):
-                retNick = nick
+    index = _getAggNickIndex(handler.config)
+    # Case 1: URN (ignoring cm/am and vmsite/Net differences) or URL matches
+    nicks = set(index['urn'].get(_canonicalAggURN(aggregate_urn_or_url), []))
+    nicks.update(index['url'].get(aggregate_urn_or_url, []))
+    for nick in sorted(nicks, key=index['pos'].get):
+#        handler.logger.debug("For urn/url %s found match: %s", aggregate_urn_or_url, nick)
+        if _isBetterNick(retNick, nick, handler.logger):
+            retNick = nick
     if retNick is not None:
         return retNick
     for nick, (urn, url) in handler.config['aggregate_nicknames'].items():
@@ -139,12 +187,11 @@ def _lookupAggNick(handler, aggregate_urn_or_url):
     if retNick is not None:
         return retNick
     aggregate_urn_or_url = _extractURL(handler.logger, aggregate_urn_or_url)
-    for nick, (urn, url) in handler.config['aggregate_nicknames'].items():
+    for nick in index['extracted'].get(aggregate_urn_or_url, []):
         # Case 3
-        if _extractURL(handler.logger,url) == aggregate_urn_or_url:
-#            handler.logger.debug("Queried & trimmed %s is end of url %s for nick %s", aggregate_urn_or_url, url, nick)
-            if _isBetterNick(retNick, nick, handler.logger):
-                retNick = nick
+#        handler.logger.debug("Queried & trimmed %s is end of url for nick %s", aggregate_urn_or_url, nick)
+        if _isBetterNick(retNick, nick, handler.logger):
+            retNick = nick
     if retNick is not None:
         return retNick
     for nick, (urn, url) in handler.config['aggregate_nicknames'].items():
@@ -171,8 +218,10 @@ def _lookupAggURNFromURLInNicknames(logger, config, agg_url):
     # take row where extractURL exact match extractURL in cache
     nagg_url = _extractURL(logger, agg_url)
     if agg_url:
-        for nick, (amURN, amURL) in config['aggregate_nicknames'].items():
-            if agg_url.strip() == amURL.strip() and amURN.strip() != '':
+        index = _getAggNickIndex(config)
+        for nick in index['strippedurl'].get(agg_url.strip(), []):
+            (amURN, amURL) = config['aggregate_nicknames'][nick]
+            if amURN.strip() != '':
                 if _isBetterNick(retNick, nick, logger):
                     urn = amURN.strip()
 #                    logger.debug("Supplied AM URL %s is URN %s according to configured aggregate nicknames (matches URL %s, nick %s T1)", agg_url, urn, amURL, nick)
@@ -191,8 +240,9 @@ def _lookupAggURNFromURLInNicknames(logger, config, agg_url):
             logger.debug("Supplied AM URL %s is URN %s according to configured aggregate nicknames (nick %s T2)", agg_url, urn, retNick)
             return urn
 
-        for nick, (amURN, amURL) in config['aggregate_nicknames'].items():
-            if nagg_url == amURL.strip() and amURN.strip() != '':
+        for nick in index['strippedurl'].get(nagg_url, []):
+            (amURN, amURL) = config['aggregate_nicknames'][nick]
+            if amURN.strip() != '':
                 if _isBetterNick(retNick, nick, logger):
                     urn = amURN.strip()
 #                    logger.debug("Supplied AM URL %s is URN %s according to configured aggregate nicknames (matches %s T3)", agg_url, urn, amURL)
@@ -201,9 +251,9 @@ def _lookupAggURNFromURLInNicknames(logger, config, agg_url):
             logger.debug("Supplied AM URL %s is URN %s according to configured aggregate nicknames (nick %s T3)", agg_url, urn, retNick)
             return urn
 
-        for nick, (amURN, amURL) in config['aggregate_nicknames'].items():
-            extr_nick_url = _extractURL(logger, amURL)
-            if nagg_url == extr_nick_url and amURN.strip() != '':
+        for nick in index['extracted'].get(nagg_url, []):
+            (amURN, amURL) = config['aggregate_nicknames'][nick]
+            if amURN.strip() != '':
                 if _isBetterNick(retNick, nick, logger):
                     urn = amURN.strip()
 #                    logger.debug("Supplied AM URL %s is URN %s according to configured aggregate nicknames (matches %s T4)", agg_url, urn, amURL)
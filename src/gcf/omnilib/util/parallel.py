@@ -0,0 +1,178 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''
+Helpers for making calls to several servers at once from a bounded
+pool of threads, while keeping log output grouped per server.
+'''
+
+from __future__ import absolute_import
+
+import logging
+import sys
+import threading
+import Queue
+
+class ThreadLogCapture(logging.Filter):
+    '''Logging filter that holds log records emitted by registered
+    worker threads instead of letting the handlers emit them.
+    Text those threads write to sys.stdout is held along with the records.
+    The held records and text can later be replayed (in order) from the main thread
+    using replay_log_records.
+    Install it on all current handlers (and sys.stdout) with install(),
+    and remove it with uninstall().'''
+
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self._buffers = dict() # thread ident -> list of held records and text (or None to discard)
+        self._handlers = []
+        self._stdout = None
+
+    def install(self):
+        '''Add this filter to every handler of every known logger,
+        and hold what worker threads print'''
+        loggers = [logging.getLogger()]
+        for logger in logging.Logger.manager.loggerDict.values():
+            if isinstance(logger, logging.Logger):
+                loggers.append(logger)
+        for logger in loggers:
+            for handler in logger.handlers:
+                if handler not in self._handlers:
+                    handler.addFilter(self)
+                    self._handlers.append(handler)
+        if self._stdout is None:
+            self._stdout = sys.stdout
+            sys.stdout = _HeldStream(self, self._stdout)
+
+    def uninstall(self):
+        '''Remove this filter from all handlers it was added to'''
+        for handler in self._handlers:
+            handler.removeFilter(self)
+        self._handlers = []
+        if self._stdout is not None:
+            sys.stdout = self._stdout
+            self._stdout = None
+
+    def hold(self, discard=False):
+        '''Start holding log records from the current thread.
+        Return the list that the records will be added to.
+        If discard is True, records are dropped instead.'''
+        buf = []
+        if discard:
+            buf = None
+        self._buffers[threading.currentThread().ident] = buf
+        return buf
+
+    def release(self):
+        '''Stop holding log records from the current thread'''
+        self._buffers.pop(threading.currentThread().ident, None)
+
+    def filter(self, record):
+        ident = threading.currentThread().ident
+        if not self._buffers.has_key(ident):
+            return True
+        buf = self._buffers[ident]
+        # A record passes through every handler: only hold it once
+        if buf is not None and (len(buf) == 0 or buf[-1] is not record):
+            buf.append(record)
+        return False
+
+    def write(self, text, stream):
+        '''Hold text written to stdout by a held thread, else write it to stream'''
+        ident = threading.currentThread().ident
+        if not self._buffers.has_key(ident):
+            stream.write(text)
+        elif self._buffers[ident] is not None:
+            self._buffers[ident].append(text)
+
+class _HeldStream(object):
+    '''Stands in for sys.stdout while a ThreadLogCapture is installed'''
+    def __init__(self, capture, stream):
+        self._capture = capture
+        self._stream = stream
+
+    def write(self, text):
+        self._capture.write(text, self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+def replay_log_records(records):
+    '''Emit the given held log records through the loggers that created them,
+    and print any held text'''
+    if not records:
+        return
+    for record in records:
+        if isinstance(record, basestring):
+            sys.stdout.write(record)
+        else:
+            logging.getLogger(record.name).handle(record)
+
+class SerializedCalls(object):
+    '''Proxy for an object whose methods are not safe to call from several
+    threads at once (like one holding a single XMLRPC connection):
+    calls its methods one at a time. Other attributes are passed through.'''
+
+    def __init__(self, obj):
+        self._obj = obj
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+def run_in_parallel(func, items, maxThreads):
+    '''Call func(item) on each of the given items, using at most maxThreads threads.
+    Return a list in the same order as items, where each entry is a tuple of
+    (return value of func, sys.exc_info() if func raised an exception else None).
+    Returns only after all calls have completed.'''
+    items = list(items)
+    results = [None] * len(items)
+    work = Queue.Queue()
+    for (index, item) in enumerate(items):
+        work.put((index, item))
+
+    def worker():
+        while True:
+            try:
+                (index, item) = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = (func(item), None)
+            except:
+                results[index] = (None, sys.exc_info())
+
+    threads = []
+    for i in range(max(1, min(maxThreads, len(items)))):
+        t = threading.Thread(target=worker, name="parallel-%d" % i)
+        t.setDaemon(True)
+        threads.append(t)
+        t.start()
+    for t in threads:
+        t.join()
+    return results
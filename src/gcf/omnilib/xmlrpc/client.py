@@ -25,10 +25,110 @@ import httplib
 import os
 import socket
 import ssl
+import threading
+import time
 import urllib
 import xmlrpclib
 
-class SafeTransportWithCert(xmlrpclib.SafeTransport):
+class ConnectionPool(object):
+    '''Process wide pool of idle HTTP/1.1 keep-alive connections to XMLRPC servers,
+    so that repeated calls to the same server (from any client) re-use an
+    existing SSL connection instead of doing a new SSL handshake each time.
+    Connections are keyed by server host and port, client certificate and
+    SSL settings. Connections idle for more than idle_timeout seconds are closed,
+    and at most max_per_host idle connections are kept for each key.'''
+
+    def __init__(self, max_per_host=4, idle_timeout=15):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle = dict() # key -> list of (time put in pool, connection)
+        self._lock = threading.Lock()
+
+    def _evict(self, key, now):
+        '''Close and drop idle connections for this key that are too old. Call with lock held.'''
+        entries = self._idle.get(key, [])
+        while entries and now - entries[0][0] > self.idle_timeout:
+            entries.pop(0)[1].close()
+        if not entries and self._idle.has_key(key):
+            del self._idle[key]
+
+    def get(self, key):
+        '''Return an idle connection for this key (most recently used first), or None'''
+        with self._lock:
+            self._evict(key, time.time())
+            entries = self._idle.get(key)
+            if not entries:
+                return None
+            conn = entries.pop()[1]
+            if not entries:
+                del self._idle[key]
+            return conn
+
+    def put(self, key, conn):
+        '''Return a connection to the pool for re-use, if it is still open
+        and there is room. Otherwise close it.'''
+        if conn is None:
+            return
+        # httplib closes the connection if the server said it would close it
+        if getattr(conn, 'sock', None) is None:
+            conn.close()
+            return
+        with self._lock:
+            now = time.time()
+            self._evict(key, now)
+            entries = self._idle.setdefault(key, [])
+            if len(entries) >= self.max_per_host:
+                conn.close()
+                return
+            entries.append((now, conn))
+
+    def clear(self):
+        '''Close all idle connections'''
+        with self._lock:
+            for entries in self._idle.values():
+                for (t, conn) in entries:
+                    conn.close()
+            self._idle = dict()
+
+# The pool shared by all clients made by make_client and make_client_m2crypto
+connection_pool = ConnectionPool()
+
+class PooledTransportMixin:
+    '''Mixin for xmlrpclib Transports that get their connection from
+    connection_pool, and give it back after each call.
+    Classes using this set self._poolKey in make_connection and get
+    any pooled connection with _get_pooled_connection.
+    Python 2.6 xmlrpclib does not do keep-alive, so there this does nothing.'''
+
+    _poolKey = None
+
+    def _get_pooled_connection(self, key):
+        self._poolKey = key
+        if not hasattr(xmlrpclib.Transport, 'single_request'):
+            return None
+        return connection_pool.get(key)
+
+    def _release_connection(self):
+        '''Give the current connection back to the pool'''
+        if self._connection and self._connection[1] is not None:
+            connection_pool.put(self._poolKey, self._connection[1])
+        self._connection = (None, None)
+
+    def single_request(self, host, handler, request_body, verbose=0):
+        try:
+            ret = xmlrpclib.Transport.single_request(self, host, handler, request_body, verbose)
+        except xmlrpclib.Fault:
+            # A fault is a complete response, so the connection can be re-used
+            self._release_connection()
+            raise
+        except:
+            # The connection may be in the middle of a response: do not re-use it
+            self.close()
+            raise
+        self._release_connection()
+        return ret
+
+class SafeTransportWithCert(PooledTransportMixin, xmlrpclib.SafeTransport):
     '''Sample client for talking XMLRPC over SSL supplying
     a client X509 identity certificate.'''
 
@@ -60,6 +160,14 @@ class SafeTransportWithCert(xmlrpclib.SafeTransport):
             return self._connection[1]
         #conn = xmlrpclib.SafeTransport.make_connection(self, host_tuple)
         chost, self._extra_headers, x509 = self.get_host_info(host_tuple)
+        # Re-use an idle connection to this server with this cert and SSL settings if any
+        conn = self._get_pooled_connection((chost, self.__x509.get('cert_file'), self.__x509.get('key_file'),
+                                            self.ssl_version, self.ciphers))
+        if conn is not None:
+            if self._timeout and conn.sock is not None:
+                conn.sock.settimeout(self._timeout)
+            self._connection = host_tuple, conn
+            return conn
         # HTTPSConnection instead of HTTPS is python issue6267 of June 2009 - before the 2.7 maint branch
         import sys
         if sys.version_info < (2,7,0):
@@ -134,7 +242,7 @@ class TLS1P26HTTPS(httplib.HTTPS):
                  strict=None):
         httplib.HTTPS.__init__(self, host, port, key_file, cert_file, strict)
 
-class SafeTransportNoCert(xmlrpclib.SafeTransport):
+class SafeTransportNoCert(PooledTransportMixin, xmlrpclib.SafeTransport):
     # A standard SafeTransport that honors the requested SSL timeout
     def __init__(self, use_datetime=0, timeout=None, ssl_version=ssl.PROTOCOL_TLSv1, ciphers=None):
         # Ticket #776: As of Python 2.7.9, server certs are verified by default.
@@ -158,6 +266,13 @@ class SafeTransportNoCert(xmlrpclib.SafeTransport):
             return self._connection[1]
         #conn = xmlrpclib.SafeTransport.make_connection(self, host_tuple)
         chost, self._extra_headers, x509 = self.get_host_info(host_tuple)
+        # Re-use an idle connection to this server with these SSL settings if any
+        conn = self._get_pooled_connection((chost, None, None, self.ssl_version, self.ciphers))
+        if conn is not None:
+            if self._timeout and conn.sock is not None:
+                conn.sock.settimeout(self._timeout)
+            self._connection = host_tuple, conn
+            return conn
         import sys
         if sys.version_info < (2,7,0):
             self._connection = host_tuple, TLS1P26HTTPS(chost, None, **(x509 or {}))
@@ -244,7 +359,7 @@ import socket
 import sys
 import M2Crypto.SSL
 
-class SafeTransportWithCertM2Crypto(xmlrpclib.SafeTransport):
+class SafeTransportWithCertM2Crypto(PooledTransportMixin, xmlrpclib.SafeTransport):
 
     def __init__(self, use_datetime=0, ssl_context=None,
                  timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
@@ -265,8 +380,11 @@ class SafeTransportWithCertM2Crypto(xmlrpclib.SafeTransport):
             # it is handled by the SSL Context. This one liner
             # avoids an eclipse warning
             _ = x509
-            conn = ContextHTTPSConnectionM2Crypto(chost, context=self._ssl_context,
-                                          timeout=self._timeout)
+            # Re-use an idle connection to this server using this SSL Context if any
+            conn = self._get_pooled_connection((chost, self._ssl_context, self._timeout))
+            if conn is None:
+                conn = ContextHTTPSConnectionM2Crypto(chost, context=self._ssl_context,
+                                              timeout=self._timeout)
             # Cache the result for Python 2.7
             self._connection = host, conn
             return self._connection[1]
@@ -119,7 +119,7 @@ import urllib2
 
 from .omnilib.util import OmniError, AMAPIError
 from .omnilib.handler import CallHandler
-from .omnilib.util.handler_utils import validate_url, printNicknames
+from .omnilib.util.handler_utils import validate_url, printNicknames, _rebuildAggNickIndex
 
 # Explicitly import framework files so py2exe is happy
 from .omnilib.frameworks import framework_apg
@@ -427,6 +427,8 @@ def load_aggregate_nicknames( config, confparser, filename, logger, opts ):
 #            else:
 #                logger.debug("Loaded aggregate nickname '%s' from file '%s'." % (key, filename))
             config['aggregate_nicknames'][key] = temp
+    # Nickname lookups use an index of the table
+    _rebuildAggNickIndex(config)
     return config
 
 def load_omni_defaults( config, confparser, filename, logger, opts ):
@@ -1170,7 +1172,7 @@ def getParser():
     # This causes setting options.GetVersionCacheOldestDate
     gvgroup.add_option("--GetVersionCacheAge", dest='GetVersionCacheAge',
                       default=7,
-                      help="Age in days of GetVersion cache info before refreshing (default is %default)")
+                      help="Age in days of GetVersion cache info before refreshing, and the lifetime of new cache entries (default is %default)")
     gvgroup.add_option("--GetVersionCacheName", dest='getversionCacheName',
                       default="~/.gcf/get_version_cache.json",
                       help="File where GetVersion info will be cached, default is %default")
@@ -1221,6 +1223,8 @@ def getParser():
                       help="In AM API v2, if an AM returns a non-0 (failure) result code, raise an AMAPIError. Default is %default. For use by scripts.")
     devgroup.add_option("--maxBusyRetries", default=4, action="store", type="int",
                       help="Max times to retry AM or CH calls on getting a 'busy' error. Default: %default")
+    devgroup.add_option("--parallel", default=1, action="store", type="int", metavar="N",
+                      help="Call up to N aggregates at once for commands that act on multiple aggregates (listresources, describe, provision, poa, renew, sliverstatus, status, delete, print_sliver_expirations). Results and output are still reported per aggregate in the usual order. Stitcher reserves at up to N aggregates at once that do not depend on each other, and gets the manifests of an existing slice from up to N aggregates at once. Default: %default (call aggregates one at a time)")
     devgroup.add_option("--no-compress", dest='geni_compressed', 
                       default=True, action="store_false",
                       help="Do not compress returned values")
@@ -708,7 +708,8 @@ class Certificate:
     # a trusted root, then an exception is thrown.
     # Also require that parents are CAs.
     #
-    # @param Trusted_certs is a list of certificates that are trusted.
+    # @param Trusted_certs is a list of certificates that are trusted,
+    #    or a TrustStore of trusted certificates.
     #
 
     def verify_chain(self, trusted_certs = None):
@@ -722,8 +723,15 @@ class Certificate:
             raise CertExpired(self.get_printable_subject(), "client cert")
 
         # if this cert is signed by a trusted_cert, then we are set
-        for trusted_cert in trusted_certs:
-            if self.is_signed_by_cert(trusted_cert):
+        if hasattr(trusted_certs, 'get_candidate_signers'):
+            # A TrustStore: only check the roots that could have issued this cert
+            candidates = trusted_certs.get_candidate_signers(self)
+            is_signed_by = trusted_certs.is_signed_by
+        else:
+            candidates = trusted_certs
+            is_signed_by = lambda cert, signer: cert.is_signed_by_cert(signer)
+        for trusted_cert in candidates:
+            if is_signed_by(self, trusted_cert):
                 # verify expiration of trusted_cert ?
                 if not trusted_cert.cert.has_expired():
                     logger.debug("verify_chain: YES. Cert %s signed by trusted cert %s"%(
@@ -740,7 +748,7 @@ class Certificate:
             raise CertMissingParent(self.get_printable_subject() + ": Issuer %s is not one of the %d trusted roots, and cert has no parent." % (self.get_issuer(), len(trusted_certs)))
 
         # if it wasn't signed by the parent...
-        if not self.is_signed_by_cert(self.parent):
+        if not is_signed_by(self, self.parent):
             logger.debug("verify_chain: NO. %s is not signed by parent %s, but by %s"%\
                              (self.get_printable_subject(), 
                               self.parent.get_printable_subject(), 
@@ -51,6 +51,7 @@ from ..util.xrn import urn_to_hrn, hrn_authfor_hrn
 from .credential_legacy import CredentialLegacy
 from .rights import Right, Rights, determine_rights
 from .gid import GID
+from .xmlsig import get_signature_verifier
 
 # 2 weeks, in seconds 
 DEFAULT_CREDENTIAL_LIFETIME = 86400 * 31
@@ -846,7 +847,7 @@ class Credential(object):
     # . ensure that an xmlrpc client's gid matches a credential gid, that
     #   must be done elsewhere
     #
-    # @param trusted_certs: The certificates of trusted CA certificates
+    # @param trusted_certs: The filenames of trusted CA certificates, or a TrustStore
     def verify(self, trusted_certs=None, schema=None, trusted_certs_required=True):
         if not self.xml:
             self.decode()
@@ -870,7 +871,12 @@ class Credential(object):
         ok_trusted_certs = []
         # If caller explicitly passed in None that means skip cert chain validation.
         # Strange and not typical
-        if trusted_certs is not None:
+        if trusted_certs is not None and hasattr(trusted_certs, 'get_root_cert_files'):
+            # A preloaded TrustStore
+            trusted_certs.check_reload()
+            trusted_cert_objects = trusted_certs
+            trusted_certs = trusted_certs.get_root_cert_files()
+        elif trusted_certs is not None:
             for f in trusted_certs:
                 try:
                     # Failures here include unreadable files
@@ -894,11 +900,6 @@ class Credential(object):
         if self.get_expiration() < datetime.datetime.utcnow():
             raise CredentialNotVerifiable("Credential %s expired at %s" % (self.get_summary_tostring(), self.expiration.isoformat()))
 
-        # Verify the signatures
-        filename = self.save_to_random_tmp_file()
-        if trusted_certs is not None:
-            cert_args = " ".join(['--trusted-pem %s' % x for x in trusted_certs])
-
         # If caller explicitly passed in None that means skip cert chain validation.
         # - Strange and not typical
         if trusted_certs is not None:
@@ -914,26 +915,19 @@ class Credential(object):
         for ref in parentRefs:
             refs.append("Sig_%s" % ref)
 
+        # Verify the signatures, using xmlsec1 or the native verifier
+        # (see xmlsig.set_signature_verifier)
+        verifier = get_signature_verifier()
+        xml = self.save_to_string(save_parents=True)
         for ref in refs:
             # If caller explicitly passed in None that means skip xmlsec1 validation.
             # Strange and not typical
             if trusted_certs is None:
                 break
 
-#            print "Doing %s --verify --node-id '%s' %s %s 2>&1" % \
-#                (self.xmlsec_path, ref, cert_args, filename)
-            verified = os.popen('%s --verify --node-id "%s" %s %s 2>&1' \
-                            % (self.xmlsec_path, ref, cert_args, filename)).read()
-            if not verified.strip().startswith("OK"):
-                # xmlsec errors have a msg= which is the interesting bit.
-                mstart = verified.find("msg=")
-                msg = ""
-                if mstart > -1 and len(verified) > 4:
-                    mstart = mstart + 4
-                    mend = verified.find('\\', mstart)
-                    msg = verified[mstart:mend]
-                raise CredentialNotVerifiable("xmlsec1 error verifying cred %s using Signature ID %s: %s %s" % (self.get_summary_tostring(), ref, msg, verified.strip()))
-        os.remove(filename)
+            error = verifier.verify(xml, ref, trusted_certs, trusted_cert_objects)
+            if error is not None:
+                raise CredentialNotVerifiable("Error verifying cred %s using Signature ID %s: %s" % (self.get_summary_tostring(), ref, error))
 
         # Verify the parents (delegation)
         if self.parent:
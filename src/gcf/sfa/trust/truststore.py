@@ -0,0 +1,189 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+##
+# A TrustStore holds the trusted root certificates loaded from a file
+# or directory, indexed by subject name and subject key identifier.
+#
+# It can be used anywhere a list of trusted certificate objects is
+# accepted (it is iterable and has a length). Certificate.verify_chain
+# uses the index to find the root that could have signed a certificate,
+# instead of trying a signature check against every trusted root, and
+# remembers the result of each signature check.
+##
+
+from __future__ import absolute_import
+
+import os
+import threading
+
+from ..util.sfalogging import logger
+from .gid import GID
+
+def _normalize_keyid(keyid):
+    if keyid is None:
+        return None
+    keyid = keyid.strip().upper()
+    if keyid == "":
+        return None
+    return keyid
+
+def _subject_key_id(cert):
+    '''Return the normalized subjectKeyIdentifier of the cert, or None'''
+    try:
+        return _normalize_keyid(cert.get_extension('subjectKeyIdentifier'))
+    except LookupError:
+        return None
+
+def _authority_key_id(cert):
+    '''Return the normalized key id from the authorityKeyIdentifier of the cert, or None'''
+    try:
+        aki = cert.get_extension('authorityKeyIdentifier')
+    except LookupError:
+        return None
+    if aki is None:
+        return None
+    # Value is like 'keyid:AB:CD:...\n', possibly followed by DirName and serial lines
+    for line in aki.splitlines():
+        line = line.strip()
+        if line.startswith('keyid:'):
+            return _normalize_keyid(line[len('keyid:'):])
+    return None
+
+def _subject_name(x509):
+    return tuple(x509.get_subject().get_components())
+
+def _issuer_name(x509):
+    return tuple(x509.get_issuer().get_components())
+
+class TrustStore(object):
+    '''The trusted root certificates from a file or directory of PEM files,
+    indexed for certificate chain verification.
+    The roots are reloaded when the file or directory modification time changes.'''
+
+    # Maximum number of remembered signature checks
+    MAX_VERIFIED_PAIRS = 10000
+
+    def __init__(self, root_cert_fileordir, ignore_files=None):
+        if root_cert_fileordir is None:
+            raise Exception("Missing Root certs argument")
+        self.root_cert_fileordir = os.path.expanduser(root_cert_fileordir)
+        self.ignore_files = ignore_files or []
+        self._lock = threading.RLock()
+        self._mtime = None
+        self.load()
+
+    def _get_mtime(self):
+        try:
+            return os.path.getmtime(self.root_cert_fileordir)
+        except OSError:
+            return None
+
+    def load(self):
+        '''(Re)load the trusted roots and rebuild the indexes'''
+        self._lock.acquire()
+        try:
+            self._mtime = self._get_mtime()
+            if os.path.isdir(self.root_cert_fileordir):
+                files = [os.path.join(self.root_cert_fileordir, f) for f in sorted(os.listdir(self.root_cert_fileordir))
+                         if f not in self.ignore_files]
+            elif os.path.isfile(self.root_cert_fileordir):
+                files = [self.root_cert_fileordir]
+            else:
+                raise Exception("Couldn't find Root certs in %s" % self.root_cert_fileordir)
+
+            certs = []
+            cert_files = []
+            by_subject = {}
+            by_keyid = {}
+            for f in files:
+                if not os.path.isfile(f):
+                    continue
+                try:
+                    # Failures here include unreadable files
+                    # or non PEM files
+                    cert = GID(filename=f)
+                except Exception, exc:
+                    logger.error("Failed to load trusted cert from %s: %r" % (f, exc))
+                    continue
+                certs.append(cert)
+                cert_files.append(f)
+                by_subject.setdefault(_subject_name(cert.cert), []).append(cert)
+                keyid = _subject_key_id(cert)
+                if keyid:
+                    by_keyid.setdefault(keyid, []).append(cert)
+
+            self._certs = certs
+            self._cert_files = cert_files
+            self._by_subject = by_subject
+            self._by_keyid = by_keyid
+            self._verified = {}
+            logger.debug("Loaded %d trusted roots from %s" % (len(certs), self.root_cert_fileordir))
+        finally:
+            self._lock.release()
+
+    def check_reload(self):
+        '''Reload the trusted roots if the file or directory has been modified.
+        Return True if they were reloaded.'''
+        if self._get_mtime() == self._mtime:
+            return False
+        logger.info("Trusted roots in %s changed: reloading" % self.root_cert_fileordir)
+        self.load()
+        return True
+
+    def get_root_certs(self):
+        '''Return the list of trusted root certificate (GID) objects'''
+        return list(self._certs)
+
+    def get_root_cert_files(self):
+        '''Return the filenames of the trusted roots that loaded successfully'''
+        return list(self._cert_files)
+
+    def __iter__(self):
+        return iter(self._certs)
+
+    def __len__(self):
+        return len(self._certs)
+
+    def get_candidate_signers(self, cert):
+        '''Return the trusted roots that could have signed the given certificate:
+        those whose subject key identifier matches the cert's authority key identifier,
+        or else those whose subject name is the cert's issuer name.'''
+        keyid = _authority_key_id(cert)
+        if keyid and self._by_keyid.has_key(keyid):
+            return list(self._by_keyid[keyid])
+        return list(self._by_subject.get(_issuer_name(cert.cert), []))
+
+    def is_signed_by(self, cert, signer):
+        '''Return True if signer signed cert, remembering the answer'''
+        key = (cert.cert.digest('sha1'), signer.cert.digest('sha1'))
+        result = self._verified.get(key)
+        if result is None:
+            result = bool(cert.is_signed_by_cert(signer))
+            self._lock.acquire()
+            try:
+                if len(self._verified) >= self.MAX_VERIFIED_PAIRS:
+                    self._verified = {}
+                self._verified[key] = result
+            finally:
+                self._lock.release()
+        return result
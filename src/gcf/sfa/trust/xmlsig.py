@@ -0,0 +1,391 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+##
+# Verifies XML signatures (as on signed credentials).
+#
+# Two backends are available:
+#  - xmlsec1: write the XML to a temp file and run the xmlsec1 program (the default)
+#  - native: canonicalize and check digests and RSA signatures in process,
+#    using lxml and pyOpenSSL (or M2Crypto). Falls back to xmlsec1 when lxml
+#    is not available, or for signatures using unsupported algorithms.
+#
+# Select the backend with set_signature_verifier, for example from
+# the signature_verifier setting in the [global] section of gcf_config.
+##
+
+from __future__ import absolute_import
+
+import base64
+import hashlib
+import os
+import subprocess
+from tempfile import mkstemp
+
+HAVELXML = False
+try:
+    from lxml import etree
+    HAVELXML = True
+except:
+    pass
+
+from OpenSSL import crypto
+from M2Crypto import X509
+
+from ..util.sfalogging import logger
+from .certificate import Certificate
+
+DSIG_NS = "http://www.w3.org/2000/09/xmldsig#"
+EXC_C14N_NS = "http://www.w3.org/2001/10/xml-exc-c14n#"
+XML_NS = "{http://www.w3.org/XML/1998/namespace}"
+XML_ID = XML_NS + "id"
+
+ENVELOPED_SIGNATURE = "http://www.w3.org/2000/09/xmldsig#enveloped-signature"
+
+# Canonicalization algorithm -> (exclusive, with comments)
+C14N_METHODS = {
+    "http://www.w3.org/TR/2001/REC-xml-c14n-20010315" : (False, False),
+    "http://www.w3.org/TR/2001/REC-xml-c14n-20010315#WithComments" : (False, True),
+    "http://www.w3.org/2001/10/xml-exc-c14n#" : (True, False),
+    "http://www.w3.org/2001/10/xml-exc-c14n#WithComments" : (True, True),
+    }
+
+# Digest algorithm -> hashlib constructor
+DIGEST_METHODS = {
+    "http://www.w3.org/2000/09/xmldsig#sha1" : hashlib.sha1,
+    "http://www.w3.org/2001/04/xmlenc#sha256" : hashlib.sha256,
+    "http://www.w3.org/2001/04/xmldsig-more#sha384" : hashlib.sha384,
+    "http://www.w3.org/2001/04/xmlenc#sha512" : hashlib.sha512,
+    }
+
+# Signature algorithm -> OpenSSL digest name
+SIGNATURE_METHODS = {
+    "http://www.w3.org/2000/09/xmldsig#rsa-sha1" : "sha1",
+    "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256" : "sha256",
+    "http://www.w3.org/2001/04/xmldsig-more#rsa-sha384" : "sha384",
+    "http://www.w3.org/2001/04/xmldsig-more#rsa-sha512" : "sha512",
+    }
+
+def find_xmlsec1():
+    '''Return the path to the xmlsec1 binary, or '' if not found'''
+    paths = ['/usr/bin','/usr/local/bin','/bin','/opt/bin','/opt/local/bin']
+    for path in paths:
+        if os.path.isfile(path + '/' + 'xmlsec1'):
+            return path + '/' + 'xmlsec1'
+    return ''
+
+class SignatureVerifier(object):
+    '''Base class for XML signature verification backends'''
+
+    name = None
+
+    ##
+    # Verify one XML signature in the given XML document.
+    #
+    # @param xml The XML document string
+    # @param node_id The xml:id of the Signature element to verify, or None for the first Signature
+    # @param trusted_cert_files Filenames of trusted root certificates
+    # @param trusted_cert_objects Certificate objects of the same trusted roots, if already loaded
+    # @return None if the signature verified, else a string describing why it did not
+    def verify(self, xml, node_id, trusted_cert_files, trusted_cert_objects=None):
+        raise NotImplementedError
+
+class Xmlsec1SignatureVerifier(SignatureVerifier):
+    '''Verify signatures by running the xmlsec1 program on a temp file'''
+
+    name = 'xmlsec1'
+
+    def __init__(self, xmlsec_path=None):
+        if xmlsec_path is None:
+            xmlsec_path = find_xmlsec1()
+        self.xmlsec_path = xmlsec_path
+
+    def verify(self, xml, node_id, trusted_cert_files, trusted_cert_objects=None):
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        fd, filename = mkstemp(suffix='cred', text=True)
+        try:
+            os.write(fd, xml)
+            os.close(fd)
+            args = [self.xmlsec_path, '--verify']
+            if node_id:
+                args += ['--node-id', node_id]
+            for f in trusted_cert_files:
+                args += ['--trusted-pem', f]
+            args.append(filename)
+            proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            verified = proc.communicate()[0]
+        finally:
+            os.remove(filename)
+        if proc.returncode == 0 and verified.strip().startswith("OK"):
+            return None
+        # xmlsec errors have a msg= which is the interesting bit.
+        mstart = verified.find("msg=")
+        msg = ""
+        if mstart > -1 and len(verified) > 4:
+            mstart = mstart + 4
+            mend = verified.find('\\', mstart)
+            msg = verified[mstart:mend]
+        return "xmlsec1 error using Signature ID %s: %s %s" % (node_id, msg, verified.strip())
+
+class UnsupportedSignature(Exception):
+    '''The native verifier cannot check this signature (unsupported algorithm)'''
+    pass
+
+class NativeSignatureVerifier(SignatureVerifier):
+    '''Verify enveloped signatures in process: canonicalize with lxml, check
+    the digest of each reference, check the RSA signature over the SignedInfo
+    using the certificate in the signature, and check that certificate
+    chains to a trusted root.
+    Falls back to xmlsec1 if lxml is missing or the signature uses an
+    algorithm not supported here.'''
+
+    name = 'native'
+
+    def __init__(self, fallback=None):
+        if fallback is None:
+            fallback = Xmlsec1SignatureVerifier()
+        self.fallback = fallback
+        if not HAVELXML:
+            logger.warn("lxml not available: verifying XML signatures with xmlsec1")
+
+    def verify(self, xml, node_id, trusted_cert_files, trusted_cert_objects=None):
+        if not HAVELXML:
+            return self.fallback.verify(xml, node_id, trusted_cert_files, trusted_cert_objects)
+        if trusted_cert_objects is None:
+            trusted_cert_objects = [Certificate(filename=f) for f in trusted_cert_files]
+        try:
+            return self._verify(xml, node_id, trusted_cert_objects)
+        except UnsupportedSignature, e:
+            logger.debug("Using xmlsec1 to verify signature %s: %s" % (node_id, e))
+            return self.fallback.verify(xml, node_id, trusted_cert_files, trusted_cert_objects)
+
+    def _verify(self, xml, node_id, trusted_certs):
+        if isinstance(xml, unicode):
+            xml = xml.encode('utf-8')
+        try:
+            root = etree.fromstring(xml, self._parser())
+        except etree.XMLSyntaxError, e:
+            return "Malformed XML: %s" % e
+        # Credentials have no DTD, and entities are not expanded
+        if root.getroottree().docinfo.doctype:
+            return "XML with a DOCTYPE is not accepted"
+
+        # Find the Signature to verify
+        sigs = root.iter("{%s}Signature" % DSIG_NS)
+        if node_id:
+            sigs = [sig for sig in sigs if sig.get(XML_ID) == node_id]
+        else:
+            sigs = list(sigs)[:1]
+        if len(sigs) != 1:
+            return "Found %d signatures with ID %s" % (len(sigs), node_id)
+        sig = sigs[0]
+
+        signed_info = sig.find("{%s}SignedInfo" % DSIG_NS)
+        if signed_info is None:
+            return "Signature %s has no SignedInfo" % node_id
+
+        # Canonicalize the SignedInfo before the enveloped signature
+        # is removed from the document, so it keeps its namespace context
+        c14n_method = signed_info.find("{%s}CanonicalizationMethod" % DSIG_NS)
+        if c14n_method is None:
+            return "Signature %s has no CanonicalizationMethod" % node_id
+        signed_info_c14n = self._canonicalize(signed_info, c14n_method)
+
+        sig_method = signed_info.find("{%s}SignatureMethod" % DSIG_NS)
+        if sig_method is None:
+            return "Signature %s has no SignatureMethod" % node_id
+        sig_alg = sig_method.get("Algorithm")
+        if not SIGNATURE_METHODS.has_key(sig_alg):
+            raise UnsupportedSignature("signature method %s" % sig_alg)
+
+        sig_value = sig.findtext("{%s}SignatureValue" % DSIG_NS)
+        if not sig_value or sig_value.strip() == "":
+            return "Signature %s has no SignatureValue" % node_id
+        sig_value = base64.b64decode("".join(sig_value.split()))
+
+        # Find the signer: the certificate in the signature whose key made the signature
+        certs = []
+        for cert_text in sig.iter("{%s}X509Certificate" % DSIG_NS):
+            if cert_text.text and cert_text.text.strip() != "":
+                certs.append(Certificate(string=cert_text.text.strip()))
+        signer = None
+        for cert in certs:
+            if self._rsa_verify(cert, sig_value, signed_info_c14n, SIGNATURE_METHODS[sig_alg]):
+                signer = cert
+                break
+        if signer is None:
+            return "Signature %s SignatureValue does not verify with any of the %d certificates in the signature" % (node_id, len(certs))
+
+        # The signer must chain to a trusted root, using the other certificates
+        # in the signature as intermediates
+        chain = signer
+        for cert in certs:
+            if cert is not signer:
+                chain.set_parent(cert)
+                chain = cert
+        chain.set_parent(None)
+        try:
+            signer.verify_chain(trusted_certs)
+        except Exception, e:
+            return "Signature %s signer %s is not trusted: %s" % (node_id, signer.get_printable_subject(), e)
+
+        # Check the digest of each referenced element
+        removed_signature = False
+        for reference in signed_info.findall("{%s}Reference" % DSIG_NS):
+            transforms = reference.findall("{%s}Transforms/{%s}Transform" % (DSIG_NS, DSIG_NS))
+            c14n_transform = None
+            for transform in transforms:
+                alg = transform.get("Algorithm")
+                if alg == ENVELOPED_SIGNATURE:
+                    if not removed_signature:
+                        self._remove_element(sig)
+                        removed_signature = True
+                elif C14N_METHODS.has_key(alg):
+                    c14n_transform = transform
+                else:
+                    raise UnsupportedSignature("transform %s" % alg)
+
+            uri = reference.get("URI")
+            if uri is None or uri == "":
+                target = root.getroottree()
+            elif uri.startswith("#") and not uri.startswith("#xpointer("):
+                targets = [el for el in root.iter() if el.get(XML_ID) == uri[1:]]
+                if len(targets) != 1:
+                    return "Signature %s Reference URI %s matches %d elements" % (node_id, uri, len(targets))
+                target = targets[0]
+            else:
+                raise UnsupportedSignature("reference URI %s" % uri)
+
+            # Same document references never include comments
+            digest_input = self._canonicalize(target, c14n_transform, no_comments=True)
+
+            digest_method = reference.find("{%s}DigestMethod" % DSIG_NS)
+            digest_alg = None
+            if digest_method is not None:
+                digest_alg = digest_method.get("Algorithm")
+            if not DIGEST_METHODS.has_key(digest_alg):
+                raise UnsupportedSignature("digest method %s" % digest_alg)
+            digest_value = reference.findtext("{%s}DigestValue" % DSIG_NS)
+            if not digest_value:
+                return "Signature %s Reference %s has no DigestValue" % (node_id, uri)
+            if base64.b64decode("".join(digest_value.split())) != DIGEST_METHODS[digest_alg](digest_input).digest():
+                return "Signature %s digest of Reference %s does not match" % (node_id, uri)
+
+        return None
+
+    def _parser(self):
+        '''An XML parser that does not expand entities, read DTDs or use the
+        network, so credentials cannot make us read local files or URLs (XXE).
+        lxml parsers are not thread safe, so make one per document.'''
+        return etree.XMLParser(resolve_entities=False, no_network=True,
+                               huge_tree=False, load_dtd=False)
+
+    def _canonicalize(self, node, method_element, no_comments=False):
+        '''Canonicalize the given element or tree with the algorithm named in the given
+        CanonicalizationMethod or Transform element (inclusive C14N 1.0 if None).'''
+        (exclusive, with_comments) = (False, False)
+        prefixes = None
+        if method_element is not None:
+            alg = method_element.get("Algorithm")
+            if not C14N_METHODS.has_key(alg):
+                raise UnsupportedSignature("canonicalization method %s" % alg)
+            (exclusive, with_comments) = C14N_METHODS[alg]
+            if exclusive:
+                inclusive = method_element.find("{%s}InclusiveNamespaces" % EXC_C14N_NS)
+                if inclusive is not None and inclusive.get("PrefixList"):
+                    prefixes = inclusive.get("PrefixList").split()
+        if no_comments:
+            with_comments = False
+        if not isinstance(node, etree._ElementTree):
+            node = self._detach(node, not exclusive)
+        if prefixes:
+            return etree.tostring(node, method="c14n", exclusive=exclusive,
+                                  with_comments=with_comments, inclusive_ns_prefixes=prefixes)
+        return etree.tostring(node, method="c14n", exclusive=exclusive, with_comments=with_comments)
+
+    def _detach(self, element, inherit_xml_attributes):
+        '''Return a copy of the element in a document of its own, to canonicalize.
+        lxml canonicalizes an element inside a larger document wrongly (it undeclares
+        the default namespace on its children). Inclusive C14N 1.0 also gives the
+        element the xml:* attributes (such as xml:id) of its ancestors.'''
+        copy = etree.fromstring(etree.tostring(element, with_tail=False), self._parser())
+        if inherit_xml_attributes:
+            for ancestor in element.iterancestors():
+                for (name, value) in ancestor.attrib.items():
+                    if name.startswith(XML_NS) and copy.get(name) is None:
+                        copy.set(name, value)
+        return copy
+
+    def _remove_element(self, element):
+        '''Remove the element from its document, keeping the text that follows it'''
+        parent = element.getparent()
+        if parent is None:
+            return
+        if element.tail:
+            previous = element.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or "") + element.tail
+            else:
+                parent.text = (parent.text or "") + element.tail
+        parent.remove(element)
+
+    def _rsa_verify(self, cert, signature, data, digest_name):
+        '''Return True if signature is the signature of data with the key of cert'''
+        if hasattr(crypto, 'verify'):
+            try:
+                crypto.verify(cert.cert, signature, data, digest_name)
+                return True
+            except crypto.Error:
+                return False
+        # Older pyOpenSSL cannot verify signatures
+        pkey = X509.load_cert_string(cert.save_to_string(False)).get_pubkey()
+        pkey.reset_context(md=digest_name)
+        pkey.verify_init()
+        pkey.verify_update(data)
+        return pkey.verify_final(signature) == 1
+
+SIGNATURE_VERIFIERS = {
+    Xmlsec1SignatureVerifier.name : Xmlsec1SignatureVerifier,
+    NativeSignatureVerifier.name : NativeSignatureVerifier,
+    }
+
+_signature_verifier = None
+
+def set_signature_verifier(name):
+    '''Select the XML signature verification backend by name: xmlsec1 or native'''
+    global _signature_verifier
+    if name is None or name.strip() == "":
+        name = Xmlsec1SignatureVerifier.name
+    name = name.strip().lower()
+    if not SIGNATURE_VERIFIERS.has_key(name):
+        raise ValueError("Unknown signature verifier %s. Valid choices are: %s" % (name, ", ".join(SIGNATURE_VERIFIERS.keys())))
+    _signature_verifier = SIGNATURE_VERIFIERS[name]()
+    logger.info("Verifying XML signatures using %s" % name)
+    return _signature_verifier
+
+def get_signature_verifier():
+    '''Return the selected XML signature verification backend (xmlsec1 by default)'''
+    global _signature_verifier
+    if _signature_verifier is None:
+        _signature_verifier = Xmlsec1SignatureVerifier()
+    return _signature_verifier
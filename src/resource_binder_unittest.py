@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Unit tests of the MAX resource bindings of the ABAC authorizer,
+computed by a sweep line over sliver start and end times, against
+the computation by time bins they replaced.
+
+Usage: python resource_binder_unittest.py [-v]"""
+
+import datetime
+import random
+import unittest
+
+from gcf.geni.auth.resource_binder import MAX_ResourceMeasurementState
+
+TRIALS = 500
+
+def max_total_by_bins(entries):
+    '''The MAX computation that MAX_ResourceMeasurementState used before
+    Resource_Usage_Profile: a bin per pair of successive start/end times,
+    and each entry added to every bin it overlaps'''
+    time_boundaries = sorted(set([entry[0] for entry in entries] + \
+                                     [entry[1] for entry in entries]))
+    totals = [0 for i in range(len(time_boundaries)-1)]
+    max_total = 0
+    for entry_start, entry_end, value in entries:
+        for i in range(len(totals)):
+            no_overlap = entry_start >= time_boundaries[i+1] or \
+                entry_end <= time_boundaries[i]
+            if not no_overlap:
+                totals[i] = totals[i] + value
+                max_total = max(totals[i], max_total)
+    return max_total
+
+def random_entries(count, start, hours, max_value):
+    '''Random (start, end, value) entries, in hours from the given time'''
+    entries = []
+    for i in range(count):
+        entry_start = random.randint(0, hours)
+        entry_end = entry_start + random.randint(0, hours / 4 + 1)
+        entries.append((start + datetime.timedelta(hours=entry_start),
+                        start + datetime.timedelta(hours=entry_end),
+                        random.randint(1, max_value)))
+    return entries
+
+def max_state(entries):
+    state = MAX_ResourceMeasurementState('USER', 'NODE')
+    for entry_start, entry_end, value in entries:
+        state.update(entry_start, entry_end, value, None)
+    return state
+
+class MaxBindingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime.datetime.utcnow()
+
+    def hours(self, count):
+        return self.now + datetime.timedelta(hours=count)
+
+    def test_no_entries(self):
+        state = max_state([])
+        self.assertEqual(state.getBindings(), {'$USER_NODE_MAX' : '0'})
+        self.assertEqual(state.getMaxInWindow(self.hours(0), self.hours(1)), 0)
+
+    def test_end_not_included(self):
+        # One sliver ends as the next starts: they never overlap.
+        # A sliver that does not end after it starts counts for nothing
+        entries = [(self.hours(0), self.hours(2), 3),
+                   (self.hours(2), self.hours(4), 4),
+                   (self.hours(1), self.hours(1), 5)]
+        state = max_state(entries)
+        self.assertEqual(state.getBindings(), {'$USER_NODE_MAX' : '4'})
+        self.assertEqual(state.getMaxInWindow(self.hours(0), self.hours(2)), 3)
+        self.assertEqual(state.getMaxInWindow(self.hours(1), self.hours(3)), 4)
+        self.assertEqual(state.getMaxInWindow(self.hours(2), self.hours(4)), 4)
+        self.assertEqual(state.getMaxInWindow(self.hours(4), self.hours(9)), 0)
+        self.assertEqual(state.getMaxInWindow(self.hours(3), self.hours(3)), 0)
+
+    def test_same_as_bins(self):
+        for trial in range(TRIALS):
+            entries = random_entries(random.randint(0, 40), self.now,
+                                     random.randint(1, 100),
+                                     random.randint(1, 5))
+            state = max_state(entries)
+            expected = {'$USER_NODE_MAX' : str(max_total_by_bins(entries))}
+            self.assertEqual(state.getBindings(), expected, entries)
+            # The whole profile as a window
+            if entries:
+                window_start = min([entry[0] for entry in entries])
+                window_end = max([entry[1] for entry in entries])
+                self.assertEqual(str(state.getMaxInWindow(window_start,
+                                                          window_end)),
+                                 expected['$USER_NODE_MAX'], entries)
+
+    def test_window_same_as_bins(self):
+        # A random window against the entries clipped to it
+        for trial in range(TRIALS):
+            entries = random_entries(random.randint(0, 40), self.now,
+                                     random.randint(1, 100),
+                                     random.randint(1, 5))
+            state = max_state(entries)
+            window_start = self.hours(random.randint(0, 100))
+            window_end = window_start + \
+                datetime.timedelta(hours=random.randint(0, 50))
+            clipped = [(max(entry_start, window_start),
+                        min(entry_end, window_end), value) \
+                           for entry_start, entry_end, value in entries]
+            self.assertEqual(state.getMaxInWindow(window_start, window_end),
+                             max_total_by_bins(clipped), entries)
+
+    def test_many_same_as_bins(self):
+        entries = random_entries(2000, self.now, 24 * 365, 4)
+        self.assertEqual(max_state(entries).getBindings(),
+                         {'$USER_NODE_MAX' : str(max_total_by_bins(entries))})
+
+if __name__ == '__main__':
+    unittest.main()
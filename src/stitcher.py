@@ -135,6 +135,10 @@ def getParser():
     parser.add_option("--scsURL",
                       help="URL to the SCS service. Default: Value of 'scs_url' in omni_config or " + SCS_URL,
                       default=None)
+    parser.add_option("--scsCacheTTL", default=0, type="int",
+                      help="Reuse saved SCS path computations for the same request and options that are at most this many minutes old (default %default: always call the SCS)")
+    parser.add_option("--scsCacheDir", default="~/.gcf/scs-cache",
+                      help="Directory of saved SCS path computations used with --scsCacheTTL (default %default)")
     parser.add_option("--timeout", default=0, type="int",
                       help="Max minutes to allow stitcher to run before killing a reservation attempt (default %default minutes, 0 means no timeout).")
     parser.add_option("--noAvailCheck", default=False, action="store_true",
@@ -143,6 +147,8 @@ def getParser():
                       help="Generate and save an expanded request RSpec, but do no reservation.")
     parser.add_option("--noDeleteAtEnd", default=False, action="store_true",
                       help="On failure or Ctrl-C do not delete any reservations completed at some aggregates (default %default).")
+    parser.add_option("--incrementalRetry", default=False, action="store_true",
+                      help="When a circuit fails and stitcher goes back to the SCS, keep the reservations that do not depend on the failed aggregate, and redo only the rest (default %default).")
     parser.add_option("--noTransitAMs", default=False, action="store_true",
                       help="Do not reserve resources at intermediate / transit aggregates; allow experimenter to manually complete the circuit (default %default).")
     parser.add_option("--noSCS", default=False, action="store_true",
@@ -158,6 +164,8 @@ def getParser():
                       help="Developers only: Use GENI stitching, not ExoGENI stitching.")
     parser.add_option("--noEGStitchingOnLink", metavar="LINK_ID", action="append",
                       help="Developers only: Use GENI stitching on this particular link only, not ExoGENI stitching.")
+    parser.add_option("--streamRSpecs", default=False, action="store_true",
+                      help="Developers only: Parse RSpecs into stitching objects by streaming them, building a DOM of an RSpec only if it is used. Each aggregate's request is still made from a DOM of the whole expanded request.")
     #  parser.add_option("--script",
     #                    help="If supplied, a script is calling this",
     #                    action="store_true", default=False)
@@ -239,7 +247,8 @@ def call(argv, options=None):
     else:
         # We assume here that this routine has been called as a library
         # Have omni use our parser to parse the args, manipulating options as needed
-        options, args = omni.parse_args(argv, parser=getParser())
+        parser = getParser()
+        options, args = omni.parse_args(argv, parser=parser)
 
 
     # If there is no fileDir, then we try to write to the CWD. In some installations, that will
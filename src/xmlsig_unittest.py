@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+""" Unit tests of the native (in process) XML signature verifier,
+using slice credentials delegated 1, 3 and 5 deep.
+The credentials are signed with xmlsec1, which must be installed.
+
+Usage: python xmlsig_unittest.py [-v] [--write-credentials DIR]
+
+With --write-credentials, write the 1, 3 and 5 deep credentials and
+their trusted root to DIR (for timing with benchmarks/xmlsig_benchmark.py)
+and exit."""
+
+import base64
+import datetime
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+from gcf.geni.util.cert_util import create_cert
+from gcf.geni.util.cred_util import create_credential
+from gcf.sfa.trust.credential import Credential
+from gcf.sfa.trust.gid import GID
+from gcf.sfa.util.faults import CredentialNotVerifiable
+from gcf.sfa.trust import xmlsig
+
+AUTHORITY = "xmlsig-test"
+CHAIN_DEPTHS = (1, 3, 5)
+
+class RefuseFallback(xmlsig.SignatureVerifier):
+    '''Stands in for xmlsec1, so a test fails if the native verifier
+    does not check a signature itself'''
+    name = 'refuse'
+
+    def verify(self, xml, node_id, trusted_cert_files, trusted_cert_objects=None):
+        return "native verifier fell back to xmlsec1 for %s" % node_id
+
+class Fixtures(object):
+    '''Certificates, keys and credentials shared by the tests'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        (self.root_file, self.root_key) = \
+            self.make_cert("authority", "sa", None, None, True)
+        self.trusted = [self.root_file]
+        # An authority of the same name that is not trusted
+        (self.rogue_file, self.rogue_key) = \
+            self.make_cert("authority", "sa", None, None, True, "rogue-sa")
+        (self.slice_file, _) = self.make_cert("slice", "myslice",
+                                              self.root_file, self.root_key)
+        self.users = []
+        for i in range(max(CHAIN_DEPTHS) + 1):
+            self.users.append(self.make_cert("user", "user%d" % i,
+                                             self.root_file, self.root_key))
+        expiration = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        self.root_cred = create_credential(GID(filename=self.users[0][0]),
+                                           GID(filename=self.slice_file),
+                                           expiration, "slice",
+                                           self.root_key, self.root_file,
+                                           self.trusted, delegatable=True)
+        self.chains = {}
+        cred = self.root_cred
+        for depth in range(1, max(CHAIN_DEPTHS) + 1):
+            if depth > 1:
+                (owner_file, owner_key) = self.users[depth - 2]
+                cred = cred.delegate(self.users[depth - 1][0],
+                                     owner_key, owner_file)
+            self.chains[depth] = cred.save_to_string(save_parents=True)
+
+    def make_cert(self, urn_type, name, issuer_file, issuer_key, ca=False,
+                  filename=None):
+        urn = "urn:publicid:IDN+%s+%s+%s" % (AUTHORITY, urn_type, name)
+        (gid, keys) = create_cert(urn, issuer_key, issuer_file, ca)
+        if filename is None:
+            filename = name
+        cert_file = os.path.join(self.directory, filename + "-cert.pem")
+        key_file = os.path.join(self.directory, filename + "-key.pem")
+        gid.save_to_file(cert_file, save_parents=True)
+        keys.save_to_file(key_file)
+        return (cert_file, key_file)
+
+_fixtures = None
+
+def fixtures():
+    global _fixtures
+    if _fixtures is None:
+        _fixtures = Fixtures(tempfile.mkdtemp(prefix="xmlsig-test-"))
+    return _fixtures
+
+def signature_ids(xml):
+    return re.findall(r'<Signature[^>]*xml:id="([^"]*)"', xml)
+
+class NativeSignatureVerifierTest(unittest.TestCase):
+
+    def setUp(self):
+        if not xmlsig.HAVELXML:
+            self.skipTest("lxml not available")
+        if not xmlsig.find_xmlsec1():
+            self.skipTest("xmlsec1 is needed to sign test credentials")
+        self.fixtures = fixtures()
+        self.verifier = xmlsig.NativeSignatureVerifier(RefuseFallback())
+
+    def tearDown(self):
+        xmlsig.set_signature_verifier(xmlsig.Xmlsec1SignatureVerifier.name)
+
+    def verify_all(self, xml, trusted=None):
+        '''Return the errors verifying each signature in the XML'''
+        if trusted is None:
+            trusted = self.fixtures.trusted
+        errors = []
+        for node_id in signature_ids(xml):
+            error = self.verifier.verify(xml, node_id, trusted)
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    def test_chains_verify(self):
+        for depth in CHAIN_DEPTHS:
+            xml = self.fixtures.chains[depth]
+            self.assertEqual(len(signature_ids(xml)), depth)
+            self.assertEqual(self.verify_all(xml), [])
+
+    def test_credentials_verify(self):
+        xmlsig.set_signature_verifier(xmlsig.NativeSignatureVerifier.name)
+        for depth in CHAIN_DEPTHS:
+            cred = Credential(string=self.fixtures.chains[depth])
+            self.assertEqual(len(cred.get_credential_list()), depth)
+            self.assertTrue(cred.verify(self.fixtures.trusted))
+
+    def test_same_as_xmlsec1(self):
+        xmlsec1 = xmlsig.Xmlsec1SignatureVerifier()
+        for depth in CHAIN_DEPTHS:
+            xml = self.fixtures.chains[depth]
+            for node_id in signature_ids(xml):
+                self.assertEqual(xmlsec1.verify(xml, node_id,
+                                                self.fixtures.trusted), None)
+
+    def test_tampered_signature(self):
+        for depth in CHAIN_DEPTHS:
+            xml = self.fixtures.chains[depth]
+            values = re.findall(r"<SignatureValue>([^<]*)</SignatureValue>",
+                                xml)
+            for value in values:
+                raw = base64.b64decode("".join(value.split()))
+                flipped = raw[:10] + chr(ord(raw[10]) ^ 1) + raw[11:]
+                bad = xml.replace(value, base64.b64encode(flipped))
+                errors = self.verify_all(bad)
+                self.assertEqual(len(errors), 1)
+                self.assertTrue("does not verify" in errors[0], errors[0])
+
+    def test_tampered_credential(self):
+        for depth in CHAIN_DEPTHS:
+            xml = self.fixtures.chains[depth]
+            bad = xml.replace("<name>", "<name>x", 1)
+            errors = self.verify_all(bad)
+            self.assertTrue(len(errors) > 0)
+            for error in errors:
+                self.assertTrue("digest" in error, error)
+
+    def test_wrong_digest(self):
+        for depth in CHAIN_DEPTHS:
+            xml = self.fixtures.chains[depth]
+            for value in re.findall(r"<DigestValue>([^<]*)</DigestValue>",
+                                    xml):
+                bad = xml.replace(value, base64.b64encode("x" * 20))
+                errors = self.verify_all(bad)
+                # The digest is in the SignedInfo, so the signature breaks
+                self.assertEqual(len(errors), 1)
+
+    def test_untrusted_issuer(self):
+        for depth in CHAIN_DEPTHS:
+            xml = self.fixtures.chains[depth]
+            errors = self.verify_all(xml, [self.fixtures.rogue_file])
+            self.assertEqual(len(errors), depth)
+            for error in errors:
+                self.assertTrue("not trusted" in error, error)
+
+    def test_wrong_delegator(self):
+        # Delegated by a user who does not own the parent credential
+        parent = Credential(string=self.fixtures.chains[2])
+        (signer_file, signer_key) = self.fixtures.users[3]
+        cred = parent.delegate(self.fixtures.users[4][0], signer_key,
+                               signer_file)
+        xml = cred.save_to_string(save_parents=True)
+        # Each signature is good...
+        self.assertEqual(self.verify_all(xml), [])
+        # ...but the delegation is not
+        xmlsig.set_signature_verifier(xmlsig.NativeSignatureVerifier.name)
+        self.assertRaises(CredentialNotVerifiable,
+                          Credential(string=xml).verify,
+                          self.fixtures.trusted)
+
+    def test_no_external_entities(self):
+        secret_file = os.path.join(self.fixtures.directory, "secret")
+        f = open(secret_file, "w")
+        f.write("SECRET")
+        f.close()
+        xml = self.fixtures.chains[1]
+        xml = xml[xml.index("<signed-credential"):]
+        doctype = '<!DOCTYPE signed-credential [<!ENTITY e SYSTEM "file://%s">]>' % secret_file
+        xml = doctype + xml.replace("<name>", "<name>&e;", 1)
+        root = xmlsig.etree.fromstring(xml, self.verifier._parser())
+        self.assertFalse("SECRET" in xmlsig.etree.tostring(root))
+        errors = self.verify_all(xml)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue("DOCTYPE" in errors[0], errors[0])
+
+def write_credentials(directory):
+    f = fixtures()
+    roots = os.path.join(directory, "trusted_roots")
+    if not os.path.isdir(roots):
+        os.makedirs(roots)
+    shutil.copy(f.root_file, roots)
+    for depth in CHAIN_DEPTHS:
+        cred_file = os.path.join(directory, "cred-%d.xml" % depth)
+        out = open(cred_file, "w")
+        out.write(f.chains[depth])
+        out.close()
+        print cred_file
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--write-credentials':
+        write_credentials(sys.argv[2])
+        sys.exit(0)
+    try:
+        unittest.main()
+    finally:
+        if _fixtures is not None:
+            shutil.rmtree(_fixtures.directory)